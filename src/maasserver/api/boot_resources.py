@@ -10,7 +10,6 @@ __all__ = [
 ]
 
 import http.client
-import os
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -389,9 +388,7 @@ class BootResourceFileUploadHandler(OperationsHandler):
         if rfile.largefile.complete:
             raise MAASAPIBadRequest("Cannot upload to a complete file.")
 
-        with rfile.largefile.content.open("wb") as stream:
-            stream.seek(0, os.SEEK_END)
-
+        with rfile.largefile.open_content("ab") as stream:
             # Check that the uploading data will not make the file larger
             # than expected.
             current_size = stream.tell()
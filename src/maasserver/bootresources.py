@@ -15,8 +15,10 @@ __all__ = [
 ]
 
 from datetime import timedelta
+import http.client
 from operator import itemgetter
 import os
+import re
 from subprocess import CalledProcessError
 from textwrap import dedent
 import threading
@@ -24,7 +26,9 @@ import time
 
 from django.db import connection, connections
 from django.db.utils import load_backend
-from django.http import HttpResponse, StreamingHttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from simplestreams import util as sutil
 from simplestreams.mirrors import BasicMirrorWriter, UrlMirrorReader
 from simplestreams.objectstores import ObjectStore
@@ -52,9 +56,9 @@ from maasserver.enum import (
     BOOT_RESOURCE_TYPE,
     COMPONENT,
 )
+from maasserver.contentstore import get_filesystem_content_store
 from maasserver.eventloop import services
 from maasserver.exceptions import MAASAPINotFound
-from maasserver.fields import LargeObjectFile
 from maasserver.models import (
     BootResource,
     BootResourceFile,
@@ -129,9 +133,11 @@ class ConnectionWrapper:
     closed upon close of wrapper.
     """
 
-    def __init__(self, largeobject, alias="default"):
+    def __init__(self, largeobject, alias="default", offset=0, length=None):
         self.largeobject = largeobject
         self.alias = alias
+        self.offset = offset
+        self.remaining = length
         self._connection = None
         self._stream = None
 
@@ -156,15 +162,21 @@ class ConnectionWrapper:
             self._stream = self.largeobject.open(
                 "rb", connection=self._connection
             )
+            if self.offset != 0:
+                self._stream.seek(self.offset)
 
     def __iter__(self):
         return self
 
     def __next__(self):
         self._set_up()
-        data = self._stream.read(self.largeobject.block_size)
+        data = self._stream.read(
+            _get_read_size(self.largeobject.block_size, self.remaining)
+        )
         if len(data) == 0:
             raise StopIteration
+        if self.remaining is not None:
+            self.remaining -= len(data)
         return data
 
     def close(self):
@@ -180,6 +192,96 @@ class ConnectionWrapper:
             self._connection = None
 
 
+def _get_read_size(block_size, remaining):
+    """Return how much to read next, when `remaining` (if not None) bytes are
+    left to be read."""
+    if remaining is None:
+        return block_size
+    return min(block_size, remaining)
+
+
+class FileRangeWrapper:
+    """Reads `length` bytes from `offset` in a file, in blocks.
+
+    The file is closed upon close of the wrapper.
+    """
+
+    block_size = 1 << 20
+
+    def __init__(self, stream, offset, length):
+        self._stream = stream
+        self._stream.seek(offset)
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self._stream.read(
+            _get_read_size(self.block_size, self.remaining)
+        )
+        if len(data) == 0:
+            raise StopIteration
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        """Close the file."""
+        self._stream.close()
+
+
+def get_byte_range(request, etag, size):
+    """Return the range of bytes asked for in the Range header of `request`.
+
+    Only a single range is supported; a Range header asking for several
+    ranges, or that cannot be parsed, is ignored, as is one that is
+    conditional on an If-Range that doesn't match `etag`.
+
+    :param size: The size of the whole content.
+    :return: The first and last byte positions in the range, inclusive, or
+        None if the whole content should be returned.
+    :raise ValueError: If the range cannot be satisfied.
+    """
+    header = request.META.get("HTTP_RANGE")
+    if header is None:
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range is not None and if_range != etag:
+        return None
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    elif first == "":
+        # A suffix range: the last bytes of the content.
+        first, last = max(size - int(last), 0), size - 1
+        if first > last:
+            raise ValueError("Empty suffix range.")
+        return first, last
+    elif last == "":
+        first, last = int(first), size - 1
+    elif int(first) > int(last):
+        return None
+    else:
+        first, last = int(first), min(int(last), size - 1)
+    if first >= size:
+        raise ValueError("Range starts after the end of the content.")
+    return first, last
+
+
+class ContentFileResponse(FileResponse):
+    """Streams the content of a file stored in the filesystem.
+
+    No database connection is needed. The file is handed to the WSGI
+    server's `wsgi.file_wrapper` when there is one, which can send it
+    without copying it through Python; otherwise it is read in large blocks.
+    """
+
+    block_size = 1 << 20
+
+
 class SimpleStreamsHandler:
     """Simplestreams endpoint, that the racks talk to.
 
@@ -359,11 +461,56 @@ class SimpleStreamsHandler:
             rfile = resource_set.files.get(filename=filename)
         except BootResourceFile.DoesNotExist:
             raise MAASAPINotFound()
-        response = StreamingHttpResponse(
-            ConnectionWrapper(rfile.largefile.content),
-            content_type="application/octet-stream",
-        )
-        response["Content-Length"] = rfile.largefile.total_size
+        largefile = rfile.largefile
+        # The content of a file never changes, and is named by its SHA256.
+        etag = quote_etag(largefile.sha256)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        size = largefile.total_size
+        try:
+            byte_range = get_byte_range(request, etag, size)
+        except ValueError:
+            response = HttpResponse(
+                status=http.client.REQUESTED_RANGE_NOT_SATISFIABLE
+            )
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+        if byte_range is None:
+            offset, length = 0, size
+        else:
+            offset, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+        if largefile.stored_in_filesystem:
+            try:
+                stream = largefile.open_content()
+            except FileNotFoundError:
+                # Either not completely written yet, or missing from this
+                # region's storage.
+                raise MAASAPINotFound()
+            if byte_range is None:
+                response = ContentFileResponse(
+                    stream, content_type="application/octet-stream"
+                )
+            else:
+                response = StreamingHttpResponse(
+                    FileRangeWrapper(stream, offset, length),
+                    content_type="application/octet-stream",
+                )
+        else:
+            response = StreamingHttpResponse(
+                ConnectionWrapper(
+                    largefile.content, offset=offset, length=length
+                ),
+                content_type="application/octet-stream",
+            )
+        if byte_range is not None:
+            response.status_code = http.client.PARTIAL_CONTENT
+            response["Content-Range"] = "bytes %d-%d/%d" % (
+                byte_range + (size,)
+            )
+        response["Content-Length"] = length
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = etag
         return response
 
 
@@ -704,11 +851,7 @@ class BootResourceStore(ObjectStore):
         if largefile is None:
             # No largefile exist for this resource file in the database, so a
             # new one will be created to store the data for this file.
-            largeobject = LargeObjectFile()
-            largeobject.open().close()
-            largefile = LargeFile.objects.create(
-                sha256=sha256, total_size=total_size, content=largeobject
-            )
+            largefile = LargeFile.objects.create_file(sha256, total_size)
             needs_saving = True
             log.debug("New large file created {lf}.", lf=largefile)
 
@@ -769,6 +912,10 @@ class BootResourceStore(ObjectStore):
         # Ensure that the size of the largefile starts at zero.
         rfile.largefile.size = 0
         transactional(rfile.largefile.save)(update_fields=["size"])
+        if rfile.largefile.stored_in_filesystem:
+            # Start again from nothing, as for the size.
+            store = get_filesystem_content_store()
+            store.open_partial(rfile.largefile.sha256, "wb").close()
 
         @transactional
         def write_chunk():
@@ -777,9 +924,8 @@ class BootResourceStore(ObjectStore):
             This ensures that the content and the size is committed into the
             database per chunk. This makes the process be reported correctly.
             """
-            with rfile.largefile.content.open("wb") as stream:
+            with rfile.largefile.open_content("ab") as stream:
                 buf = reader.read(self.read_size)
-                stream.seek(0, 2)
                 stream.write(buf)
                 cksummer.update(buf)
                 buf_len = len(buf)
@@ -819,6 +965,10 @@ class BootResourceStore(ObjectStore):
             maaslog.error(msg)
             transactional(rfile.delete)()
         else:
+            if rfile.largefile.stored_in_filesystem:
+                # The content was verified as it was written, so it can be
+                # moved into place without reading it back.
+                store.commit(rfile.largefile.sha256, cksummer.hexdigest())
             log.debug("Finalized boot image {ident}.", ident=ident)
 
     def perform_write(self):
@@ -9,6 +9,7 @@ __all__ = [
     "get_boot_images",
     "get_boot_images_for",
     "get_common_available_boot_images",
+    "get_image_peers",
     "is_import_boot_images_running",
 ]
 
@@ -16,12 +17,23 @@ from collections import Sequence
 from functools import partial
 from urllib.parse import ParseResult, urlparse
 
+from django.db.models import Max
 from twisted.internet import reactor
-from twisted.internet.defer import DeferredList, DeferredSemaphore
+from twisted.internet.defer import (
+    DeferredList,
+    DeferredSemaphore,
+    inlineCallbacks,
+)
 from twisted.protocols.amp import UnhandledCommand
 from twisted.python.failure import Failure
 
-from maasserver.models import BootResource, RackController
+from maasserver.models import (
+    BootResource,
+    BootResourceSet,
+    Config,
+    RackController,
+    StaticIPAddress,
+)
 from maasserver.rpc import getAllClients, getClientFor
 from maasserver.utils.asynchronous import gather
 from maasserver.utils.orm import transactional
@@ -35,7 +47,8 @@ from provisioningserver.rpc.cluster import (
 )
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
 from provisioningserver.utils import flatten
-from provisioningserver.utils.twisted import asynchronous, synchronous
+from provisioningserver.utils.twisted import asynchronous, pause, synchronous
+from provisioningserver.utils.url import compose_URL
 
 log = LegacyLogger()
 
@@ -186,6 +199,50 @@ def get_boot_images_for(
     return matching_images
 
 
+@transactional
+def get_image_peers(system_id):
+    """Return where the rack controller `system_id` can download boot images
+    from, other than the region.
+
+    Peers are other rack controllers that have finished importing images
+    since the region's boot resources last changed, so hold a verified copy
+    of every file. Only peers with an address on a subnet shared with the
+    rack controller are used, so that images are copied between rack
+    controllers close to each other.
+
+    :return: A list of URLs, one per peer, under which the peer's images can
+        be found by their SHA256. Empty unless `boot_images_rack_peers` is
+        enabled.
+    """
+    if not Config.objects.get_config("boot_images_rack_peers"):
+        return []
+    last_changed = BootResourceSet.objects.aggregate(Max("updated"))[
+        "updated__max"
+    ]
+    if last_changed is None:
+        return []
+    rack = RackController.objects.get(system_id=system_id)
+    subnets = StaticIPAddress.objects.filter(
+        interface__node=rack, subnet__isnull=False, ip__isnull=False
+    ).values("subnet")
+    peers = RackController.objects.exclude(id=rack.id).filter(
+        last_image_sync__gte=last_changed
+    )
+    addresses = (
+        StaticIPAddress.objects.filter(
+            interface__node__in=peers, subnet__in=subnets, ip__isnull=False
+        )
+        .values_list("interface__node_id", "ip")
+        .order_by("interface__node_id", "ip")
+        .distinct()
+    )
+    urls = {}
+    for node_id, ip in addresses:
+        if ip and node_id not in urls:
+            urls[node_id] = compose_URL("http://:5248/images-cache/", ip)
+    return list(urls.values())
+
+
 undefined = object()
 
 
@@ -193,6 +250,10 @@ class RackControllersImporter:
     """Utility to help import boot resources from the region to rack
     controllers."""
 
+    # How often to check whether the first rack controller has finished
+    # importing, when rack controllers download images from each other.
+    IMPORT_POLL_INTERVAL = 10
+
     @staticmethod
     def _get_system_ids():
         racks = RackController.objects.all()
@@ -217,13 +278,23 @@ class RackControllersImporter:
         else:
             return None
 
+    @staticmethod
+    def _get_use_peers():
+        return Config.objects.get_config("boot_images_rack_peers")
+
     @classmethod
     @transactional
-    def new(cls, system_ids=undefined, sources=undefined, proxy=undefined):
+    def new(
+        cls,
+        system_ids=undefined,
+        sources=undefined,
+        proxy=undefined,
+        use_peers=undefined,
+    ):
         """Create a new importer.
 
-        Obtain values for `system_ids`, `sources` and `proxy` if they're not
-        provided. This MUST be called in a database thread.
+        Obtain values for `system_ids`, `sources`, `proxy` and `use_peers` if
+        they're not provided. This MUST be called in a database thread.
 
         :return: :class:`RackControllersImporter`
         """
@@ -231,6 +302,9 @@ class RackControllersImporter:
             cls._get_system_ids() if system_ids is undefined else system_ids,
             cls._get_sources() if sources is undefined else sources,
             cls._get_proxy() if proxy is undefined else proxy,
+            use_peers=(
+                cls._get_use_peers() if use_peers is undefined else use_peers
+            ),
         )
 
     @classmethod
@@ -254,13 +328,17 @@ class RackControllersImporter:
 
         return clock.callLater(delay, do_import)
 
-    def __init__(self, system_ids, sources, proxy=None):
+    def __init__(
+        self, system_ids, sources, proxy=None, use_peers=False, clock=reactor
+    ):
         """Create a new importer.
 
         :param system_ids: A sequence of rack controller system_id's.
         :param sources: A sequence of endpoints; see `ImportBootImages`.
         :param proxy: The HTTP/HTTPS proxy to use, or `None`
         :type proxy: :class:`urlparse.ParseResult` or string
+        :param use_peers: Whether rack controllers should download images
+            from each other; see `get_image_peers`.
         """
         super(RackControllersImporter, self).__init__()
         self.system_ids = tuple(flatten(system_ids))
@@ -272,16 +350,25 @@ class RackControllersImporter:
             self.proxy = proxy
         else:
             self.proxy = urlparse(proxy)
+        self.use_peers = use_peers
+        self.clock = clock
 
     @asynchronous
     def __call__(self, lock):
         """Ask the rack controllers to download the region's boot resources.
 
+        When rack controllers download images from each other, the first
+        rack controller is asked to import on its own. Once it has finished,
+        the others are asked, and can download from it.
+
         :param lock: A concurrency primitive to limit the number of rack
             controllers importing at one time.
         """
 
-        def sync_rack(system_id, sources, proxy):
+        def sync_rack(system_id, sources, proxy, peers=None):
+            # Peers are only passed when there are some, which rack
+            # controllers that don't know about them are fine with.
+            extra = {} if not peers else {"peers": peers}
             d = getClientFor(system_id, timeout=1)
             d.addCallback(
                 lambda client: client(
@@ -289,17 +376,74 @@ class RackControllersImporter:
                     sources=sources,
                     http_proxy=proxy,
                     https_proxy=proxy,
+                    **extra
                 )
             )
             return d
 
-        return DeferredList(
-            (
-                lock.run(sync_rack, system_id, self.sources, self.proxy)
-                for system_id in self.system_ids
-            ),
-            consumeErrors=True,
+        if not self.use_peers or len(self.system_ids) == 0:
+            return DeferredList(
+                (
+                    lock.run(sync_rack, system_id, self.sources, self.proxy)
+                    for system_id in self.system_ids
+                ),
+                consumeErrors=True,
+            )
+
+        def sync_rack_from_peers(system_id):
+            d = deferToDatabase(get_image_peers, system_id)
+            d.addCallback(
+                lambda peers: sync_rack(
+                    system_id, self.sources, self.proxy, peers
+                )
+            )
+            return d
+
+        def sync_seed(system_id):
+            d = sync_rack_from_peers(system_id)
+            d.addCallback(
+                lambda response: self._waitForImport(system_id).addCallback(
+                    lambda _: response
+                )
+            )
+            return d
+
+        def sync_others(seed_results):
+            d = DeferredList(
+                (
+                    lock.run(sync_rack_from_peers, system_id)
+                    for system_id in self.system_ids[1:]
+                ),
+                consumeErrors=True,
+            )
+            return d.addCallback(lambda results: seed_results + results)
+
+        d = DeferredList(
+            [lock.run(sync_seed, self.system_ids[0])], consumeErrors=True
         )
+        return d.addCallback(sync_others)
+
+    @inlineCallbacks
+    def _waitForImport(self, system_id):
+        """Wait for the rack controller `system_id` to finish importing.
+
+        Failures are logged; they mean the other rack controllers won't be
+        able to download from this one, not that they shouldn't import.
+        """
+        while True:
+            yield pause(self.IMPORT_POLL_INTERVAL, self.clock)
+            try:
+                client = yield getClientFor(system_id, timeout=1)
+                response = yield client(IsImportBootImagesRunning)
+            except Exception:
+                log.err(
+                    None,
+                    "Failed to wait for rack controller (%s) to import "
+                    "boot resources." % system_id,
+                )
+                return
+            if not response["running"]:
+                return
 
     @asynchronous
     def run(self, concurrency=1):
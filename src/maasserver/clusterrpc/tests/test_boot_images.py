@@ -5,11 +5,13 @@
 
 __all__ = []
 
+from datetime import timedelta
 import os
 import random
 from unittest.mock import ANY, call, MagicMock, sentinel
 from urllib.parse import urlparse
 
+from django.utils import timezone
 from testtools.matchers import (
     Equals,
     Is,
@@ -30,11 +32,13 @@ from maasserver.clusterrpc.boot_images import (
     get_boot_images,
     get_boot_images_for,
     get_common_available_boot_images,
+    get_image_peers,
     is_import_boot_images_running,
     RackControllersImporter,
 )
 from maasserver.clusterrpc.testing.boot_images import make_rpc_boot_image
-from maasserver.enum import BOOT_RESOURCE_TYPE
+from maasserver.enum import BOOT_RESOURCE_TYPE, IPADDRESS_TYPE
+from maasserver.models import RackController
 from maasserver.models.config import Config
 from maasserver.models.signals import bootsources
 from maasserver.rpc import getAllClients
@@ -62,6 +66,7 @@ from provisioningserver.boot.tftppath import compose_image_path
 from provisioningserver.rpc import boot_images
 from provisioningserver.rpc.cluster import (
     ImportBootImages,
+    IsImportBootImagesRunning,
     ListBootImages,
     ListBootImagesV2,
 )
@@ -405,6 +410,60 @@ class TestGetBootImagesFor(MAASTransactionServerTestCase):
         )
 
 
+class TestGetImagePeers(MAASServerTestCase):
+    """Tests for `get_image_peers`."""
+
+    def setUp(self):
+        super(TestGetImagePeers, self).setUp()
+        Config.objects.set_config("boot_images_rack_peers", True)
+        resource = factory.make_usable_boot_resource()
+        self.last_changed = resource.sets.first().updated
+
+    def make_rack(self, subnet, synced=True):
+        rack = factory.make_RackController()
+        interface = factory.make_Interface(node=rack, vlan=subnet.vlan)
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY,
+            interface=interface,
+            subnet=subnet,
+        )
+        if synced:
+            last_image_sync = timezone.now()
+        else:
+            last_image_sync = self.last_changed - timedelta(minutes=1)
+        RackController.objects.filter(id=rack.id).update(
+            last_image_sync=last_image_sync
+        )
+        return rack, ip.ip
+
+    def test__returns_peers_on_shared_subnet(self):
+        subnet = factory.make_Subnet()
+        rack, _ = self.make_rack(subnet, synced=False)
+        _, ip = self.make_rack(subnet)
+        self.assertEqual(
+            ["http://%s:5248/images-cache/" % ip],
+            get_image_peers(rack.system_id),
+        )
+
+    def test__ignores_peers_on_other_subnets(self):
+        rack, _ = self.make_rack(factory.make_Subnet(), synced=False)
+        self.make_rack(factory.make_Subnet())
+        self.assertEqual([], get_image_peers(rack.system_id))
+
+    def test__ignores_peers_not_synced_since_resources_changed(self):
+        subnet = factory.make_Subnet()
+        rack, _ = self.make_rack(subnet, synced=False)
+        self.make_rack(subnet, synced=False)
+        self.assertEqual([], get_image_peers(rack.system_id))
+
+    def test__returns_nothing_when_disabled(self):
+        Config.objects.set_config("boot_images_rack_peers", False)
+        subnet = factory.make_Subnet()
+        rack, _ = self.make_rack(subnet, synced=False)
+        self.make_rack(subnet)
+        self.assertEqual([], get_image_peers(rack.system_id))
+
+
 class TestRackControllersImporter(MAASServerTestCase):
     """Tests for `RackControllersImporter`."""
 
@@ -559,6 +618,13 @@ class TestRackControllersImporterNew(MAASServerTestCase):
         importer = RackControllersImporter.new(system_ids=[], sources=[])
         self.assertThat(importer, MatchesStructure(proxy=Equals(None)))
 
+    def test__new_obtains_use_peers(self):
+        Config.objects.set_config("boot_images_rack_peers", True)
+        importer = RackControllersImporter.new(
+            system_ids=[], sources=[], proxy=None
+        )
+        self.assertThat(importer, MatchesStructure(use_peers=Is(True)))
+
 
 class TestRackControllersImporterInAction(MAASTransactionServerTestCase):
     """Live tests for `RackControllersImporter`."""
@@ -610,6 +676,50 @@ class TestRackControllersImporterInAction(MAASTransactionServerTestCase):
             ),
         )
 
+    def test__calling_importer_with_peers_seeds_first_cluster(self):
+        rack_1 = factory.make_RackController()
+        rack_2 = factory.make_RackController()
+        peers = [factory.make_simple_http_url()]
+        self.patch(boot_images_module, "get_image_peers").side_effect = [
+            [],
+            peers,
+        ]
+        calls = []
+
+        def record(name, system_id, response):
+            def call(protocol, **kwargs):
+                calls.append((name, system_id, kwargs.get("peers")))
+                return succeed(response)
+
+            return call
+
+        for rack in (rack_1, rack_2):
+            conn = self.rpc.makeCluster(
+                rack, ImportBootImages, IsImportBootImagesRunning
+            )
+            conn.ImportBootImages.side_effect = record(
+                "import", rack.system_id, {}
+            )
+            conn.IsImportBootImagesRunning.side_effect = record(
+                "running", rack.system_id, {"running": False}
+            )
+
+        importer = RackControllersImporter.new(
+            [rack_1.system_id, rack_2.system_id], use_peers=True
+        )
+        importer.IMPORT_POLL_INTERVAL = 0
+        results = importer(lock=DeferredLock()).wait(5)
+
+        self.assertEqual([(True, {}), (True, {})], results)
+        self.assertEqual(
+            [
+                ("import", rack_1.system_id, None),
+                ("running", rack_1.system_id, None),
+                ("import", rack_2.system_id, peers),
+            ],
+            calls,
+        )
+
     def test__run_calls_importer_and_reports_results(self):
         # Some clusters that we'll ask to import resources.
         rack_1 = factory.make_RackController()
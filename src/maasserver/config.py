@@ -5,7 +5,7 @@
 
 __all__ = ["RegionConfiguration"]
 
-from formencode.validators import Int
+from formencode.validators import Int, OneOf
 
 from provisioningserver.config import (
     Configuration,
@@ -13,6 +13,7 @@ from provisioningserver.config import (
     ConfigurationMeta,
     ConfigurationOption,
 )
+from provisioningserver.path import get_tentative_data_path
 from provisioningserver.utils.config import (
     ExtendedURL,
     OneWayStringBool,
@@ -98,6 +99,25 @@ class RegionConfiguration(Configuration, metaclass=RegionConfigurationMeta):
         Int(if_missing=4, accept_python=False, min=1),
     )
 
+    # Boot resource storage options.
+    boot_resources_storage = ConfigurationOption(
+        "boot_resources_storage",
+        "Where the content of new boot resource files is stored: "
+        "'database' for PostgreSQL large objects, or 'filesystem' for files "
+        "in boot_resources_path. When using 'filesystem', all region "
+        "controllers must share the same boot_resources_path.",
+        OneOf(["database", "filesystem"], if_missing="database"),
+    )
+    boot_resources_path = ConfigurationOption(
+        "boot_resources_path",
+        "The directory holding the content of boot resource files stored in "
+        "the filesystem.",
+        UnicodeString(
+            if_missing=get_tentative_data_path("/var/lib/maas/image-storage"),
+            accept_python=False,
+        ),
+    )
+
     # Debug options.
     debug = ConfigurationOption(
         "debug",
@@ -0,0 +1,140 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Filesystem storage for the content of large files.
+
+The content of a `LargeFile` is kept either in the database, as a PostgreSQL
+large object referenced by its `content` field, or in a
+`FilesystemContentStore`, in which case its `content` is NULL. New files are
+stored where the `boot_resources_storage` region option says.
+"""
+
+__all__ = [
+    "ContentChecksumMismatch",
+    "FilesystemContentStore",
+    "get_filesystem_content_store",
+    "use_filesystem_content_store",
+]
+
+import hashlib
+import os
+
+from maasserver.config import RegionConfiguration
+
+
+class ContentChecksumMismatch(Exception):
+    """The content written does not have the expected SHA256."""
+
+
+class FilesystemContentStore:
+    """Content-addressed files in a directory.
+
+    Each file is named by the SHA256 of its content, in a subdirectory named
+    after the first two characters of it. Content is written to a partial
+    file next to its final path, and only renamed into place once its
+    checksum has been verified, so a file at its final path is always
+    complete and correct.
+    """
+
+    block_size = 1 << 20
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_path(self, sha256):
+        """Return the path of the complete content with `sha256`."""
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def get_partial_path(self, sha256):
+        """Return the path of the content with `sha256` being written."""
+        return self.get_path(sha256) + ".partial"
+
+    def exists(self, sha256):
+        """Return whether the complete content with `sha256` is stored."""
+        return os.path.isfile(self.get_path(sha256))
+
+    def open(self, sha256):
+        """Open the complete content with `sha256` for reading."""
+        return open(self.get_path(sha256), "rb")
+
+    def open_partial(self, sha256, mode="ab"):
+        """Open the content with `sha256` being written.
+
+        :param mode: "ab" to add to what has been written so far, or "wb" to
+            start again.
+        """
+        path = self.get_partial_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, mode)
+
+    def get_partial_size(self, sha256):
+        """Return how much of the content with `sha256` has been written."""
+        try:
+            return os.path.getsize(self.get_partial_path(sha256))
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, sha256, digest=None):
+        """Verify the content with `sha256` being written and move it into
+        place.
+
+        :param digest: The SHA256 of the written content, if it was worked
+            out while writing it. Otherwise the content is read back to work
+            it out.
+        :raise ContentChecksumMismatch: If the content does not match
+            `sha256`. The written content is discarded.
+        """
+        partial_path = self.get_partial_path(sha256)
+        with open(partial_path, "rb") as stream:
+            if digest is None:
+                hasher = hashlib.sha256()
+                for data in iter(lambda: stream.read(self.block_size), b""):
+                    hasher.update(data)
+                digest = hasher.hexdigest()
+            if digest != sha256:
+                os.remove(partial_path)
+                raise ContentChecksumMismatch(
+                    "Content for %s has SHA256 %s." % (sha256, digest)
+                )
+            os.fsync(stream.fileno())
+        path = self.get_path(sha256)
+        os.rename(partial_path, path)
+        # Make sure the rename itself survives a crash.
+        directory = os.open(os.path.dirname(path), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def put(self, sha256, stream):
+        """Store the content read from `stream`, which must have `sha256`.
+
+        :raise ContentChecksumMismatch: If the content does not match
+            `sha256`.
+        """
+        hasher = hashlib.sha256()
+        with self.open_partial(sha256, "wb") as partial:
+            for data in iter(lambda: stream.read(self.block_size), b""):
+                partial.write(data)
+                hasher.update(data)
+        self.commit(sha256, hasher.hexdigest())
+
+    def delete(self, sha256):
+        """Remove the content with `sha256`, complete or not."""
+        for path in (self.get_path(sha256), self.get_partial_path(sha256)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def use_filesystem_content_store():
+    """Return whether new files should be stored in the filesystem."""
+    with RegionConfiguration.open() as config:
+        return config.boot_resources_storage == "filesystem"
+
+
+def get_filesystem_content_store():
+    """Return the `FilesystemContentStore` of this region."""
+    with RegionConfiguration.open() as config:
+        return FilesystemContentStore(config.boot_resources_path)
@@ -6,13 +6,15 @@
 __all__ = ["configure_dhcp", "validate_dhcp_config"]
 
 from collections import defaultdict, namedtuple
+from copy import deepcopy
 from itertools import groupby
 from operator import itemgetter
 from typing import Iterable, Optional, Union
+from uuid import uuid4
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from netaddr import IPAddress, IPNetwork
 from twisted.internet.defer import inlineCallbacks
 from twisted.protocols import amp
@@ -33,6 +35,7 @@ from maasserver.models import (
     Config,
     DHCPSnippet,
     Domain,
+    Interface,
     RackController,
     Service,
     StaticIPAddress,
@@ -48,6 +51,8 @@ from provisioningserver.rpc.cluster import (
     ConfigureDHCPv4_V2,
     ConfigureDHCPv6,
     ConfigureDHCPv6_V2,
+    UpdateDHCPv4Hosts,
+    UpdateDHCPv6Hosts,
     ValidateDHCPv4Config,
     ValidateDHCPv4Config_V2,
     ValidateDHCPv6Config,
@@ -55,7 +60,10 @@ from provisioningserver.rpc.cluster import (
 )
 from provisioningserver.rpc.clusterservice import DHCP_TIMEOUT
 from provisioningserver.rpc.dhcp import downgrade_shared_networks
-from provisioningserver.rpc.exceptions import NoConnectionsAvailable
+from provisioningserver.rpc.exceptions import (
+    DHCPRevisionMismatch,
+    NoConnectionsAvailable,
+)
 from provisioningserver.utils import typed
 from provisioningserver.utils.network import get_source_address
 from provisioningserver.utils.text import split_string_list
@@ -64,6 +72,16 @@ from provisioningserver.utils.twisted import asynchronous, synchronous
 log = LegacyLogger()
 
 
+# The DHCP configuration each rack controller last acknowledged, as a
+# `PushedDHCPState`, by the system_id of the rack and the IP version. Only the
+# region process managing a rack controller pushes its DHCP configuration.
+_pushed_dhcp_state = {}
+
+PushedDHCPState = namedtuple(
+    "PushedDHCPState", ("revision", "settings", "hosts")
+)
+
+
 def get_omapi_key():
     """Return the OMAPI key for all DHCP servers that are ran by MAAS."""
     key = Config.objects.get_config("omapi_key")
@@ -321,27 +339,58 @@ def make_dhcp_snippet(dhcp_snippet):
 def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list = None):
     """Return list of host entries to create in the DHCP configuration for the
     given `subnets`.
+
+    The number of queries does not depend on the number of hosts.
     """
     if nodes_dhcp_snippets is None:
         nodes_dhcp_snippets = []
 
+    # Index the snippets by node instead of searching them for each host.
+    dhcp_snippets_by_node = defaultdict(list)
+    for dhcp_snippet in nodes_dhcp_snippets:
+        dhcp_snippets_by_node[dhcp_snippet.node_id].append(
+            make_dhcp_snippet(dhcp_snippet)
+        )
+
     def get_dhcp_snippets_for_interface(interface):
-        dhcp_snippets = list()
-        for dhcp_snippet in nodes_dhcp_snippets:
-            if dhcp_snippet.node == interface.node:
-                dhcp_snippets.append(make_dhcp_snippet(dhcp_snippet))
-        return dhcp_snippets
-
-    sips = StaticIPAddress.objects.filter(
-        alloc_type__in=[
-            IPADDRESS_TYPE.AUTO,
-            IPADDRESS_TYPE.STICKY,
-            IPADDRESS_TYPE.USER_RESERVED,
-        ],
-        subnet__in=subnets,
-        ip__isnull=False,
-        temp_expires_on__isnull=True,
-    ).order_by("id")
+        return list(dhcp_snippets_by_node.get(interface.node_id, []))
+
+    def make_host(interface, ip):
+        return {
+            "host": make_interface_hostname(interface),
+            "mac": str(interface.mac_address),
+            "ip": ip,
+            "dhcp_snippets": get_dhcp_snippets_for_interface(interface),
+        }
+
+    # Fetch the interfaces of all the addresses, their nodes, and the parents
+    # of bonds, in a query each.
+    sips = (
+        StaticIPAddress.objects.filter(
+            alloc_type__in=[
+                IPADDRESS_TYPE.AUTO,
+                IPADDRESS_TYPE.STICKY,
+                IPADDRESS_TYPE.USER_RESERVED,
+            ],
+            subnet__in=subnets,
+            ip__isnull=False,
+            temp_expires_on__isnull=True,
+        )
+        .order_by("id")
+        .prefetch_related(
+            Prefetch(
+                "interface_set",
+                queryset=Interface.objects.order_by("id")
+                .select_related("node")
+                .prefetch_related(
+                    Prefetch(
+                        "parents",
+                        queryset=Interface.objects.select_related("node"),
+                    )
+                ),
+            )
+        )
+    )
     hosts = []
     interface_ids = set()
     for sip in sips:
@@ -353,7 +402,7 @@ def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list = None):
             continue
 
         # Add all interfaces attached to this IP address.
-        for interface in sip.interface_set.order_by("id"):
+        for interface in sip.interface_set.all():
             # Only allow an interface to be in hosts once.
             if interface.id in interface_ids:
                 continue
@@ -368,37 +417,8 @@ def make_hosts_for_subnets(subnets, nodes_dhcp_snippets: list = None):
                     # from the bond.
                     if parent.mac_address != interface.mac_address:
                         interface_ids.add(parent.id)
-                        hosts.append(
-                            {
-                                "host": make_interface_hostname(parent),
-                                "mac": str(parent.mac_address),
-                                "ip": str(sip.ip),
-                                "dhcp_snippets": get_dhcp_snippets_for_interface(
-                                    parent
-                                ),
-                            }
-                        )
-                hosts.append(
-                    {
-                        "host": make_interface_hostname(interface),
-                        "mac": str(interface.mac_address),
-                        "ip": str(sip.ip),
-                        "dhcp_snippets": get_dhcp_snippets_for_interface(
-                            interface
-                        ),
-                    }
-                )
-            else:
-                hosts.append(
-                    {
-                        "host": make_interface_hostname(interface),
-                        "mac": str(interface.mac_address),
-                        "ip": str(sip.ip),
-                        "dhcp_snippets": get_dhcp_snippets_for_interface(
-                            interface
-                        ),
-                    }
-                )
+                        hosts.append(make_host(parent, str(sip.ip)))
+            hosts.append(make_host(interface, str(sip.ip)))
     return hosts
 
 
@@ -458,7 +478,7 @@ def make_subnet_config(
         "dhcp_snippets": [
             make_dhcp_snippet(dhcp_snippet)
             for dhcp_snippet in subnets_dhcp_snippets
-            if dhcp_snippet.subnet == subnet
+            if dhcp_snippet.subnet_id == subnet.id
         ],
     }
     if search_list is not None:
@@ -620,12 +640,12 @@ def get_dhcp_configure_for(
     subnets_dhcp_snippets = [
         dhcp_snippet
         for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.subnet is not None
+        if dhcp_snippet.subnet_id is not None
     ]
     nodes_dhcp_snippets = [
         dhcp_snippet
         for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.node is not None
+        if dhcp_snippet.node_id is not None
     ]
 
     # Generate the shared network configurations.
@@ -676,7 +696,9 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
     # 1 + (the number of DHCP snippets used in this VLAN) instead of
     # 1 + (the number of subnets in this VLAN) +
     #     (the number of nodes in this VLAN)
-    dhcp_snippets = DHCPSnippet.objects.filter(enabled=True)
+    dhcp_snippets = DHCPSnippet.objects.filter(enabled=True).select_related(
+        "value"
+    )
     # If we're testing a DHCP Snippet insert it into our list
     if test_dhcp_snippet is not None:
         dhcp_snippets = list(dhcp_snippets)
@@ -695,7 +717,7 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
     global_dhcp_snippets = [
         make_dhcp_snippet(dhcp_snippet)
         for dhcp_snippet in dhcp_snippets
-        if dhcp_snippet.node is None and dhcp_snippet.subnet is None
+        if dhcp_snippet.node_id is None and dhcp_snippet.subnet_id is None
     ]
 
     # Configure both DHCPv4 and DHCPv6 on the rack controller.
@@ -847,10 +869,9 @@ def configure_dhcp(rack_controller):
     ipv4_status, ipv6_status = SERVICE_STATUS.UNKNOWN, SERVICE_STATUS.UNKNOWN
 
     try:
-        yield _perform_dhcp_config(
+        yield _push_dhcp_config(
             client,
-            ConfigureDHCPv4_V2,
-            ConfigureDHCPv4,
+            4,
             failover_peers=config.failover_peers_v4,
             interfaces=interfaces_v4,
             shared_networks=config.shared_networks_v4,
@@ -877,10 +898,9 @@ def configure_dhcp(rack_controller):
         )
 
     try:
-        yield _perform_dhcp_config(
+        yield _push_dhcp_config(
             client,
-            ConfigureDHCPv6_V2,
-            ConfigureDHCPv6,
+            6,
             failover_peers=config.failover_peers_v6,
             interfaces=interfaces_v6,
             shared_networks=config.shared_networks_v6,
@@ -936,6 +956,76 @@ def configure_dhcp(rack_controller):
         raise ipv6_exc
 
 
+@asynchronous
+@inlineCallbacks
+def _push_dhcp_config(client, ip_version, *, hosts, **settings):
+    """Push a DHCP configuration to the rack controller behind `client`.
+
+    When only the hosts have changed since the configuration the rack
+    controller last acknowledged, only the changed hosts are sent. Otherwise,
+    or when the rack controller no longer has that configuration, the full
+    configuration is sent.
+
+    :param client: An RPC client.
+    :param ip_version: 4 or 6.
+    :param hosts: The hosts argument for `ConfigureDHCPv4_V2` or
+        `ConfigureDHCPv6_V2`.
+    :param settings: Remaining arguments for `ConfigureDHCPv4_V2` or
+        `ConfigureDHCPv6_V2`.
+    """
+    if ip_version == 4:
+        v2_command, v1_command = ConfigureDHCPv4_V2, ConfigureDHCPv4
+        update_command = UpdateDHCPv4Hosts
+    else:
+        v2_command, v1_command = ConfigureDHCPv6_V2, ConfigureDHCPv6
+        update_command = UpdateDHCPv6Hosts
+
+    # Whatever was pushed before no longer applies if this push fails.
+    key = client.ident, ip_version
+    pushed = _pushed_dhcp_state.pop(key, None)
+    state = PushedDHCPState(
+        uuid4().hex, deepcopy(settings), {host["mac"]: host for host in hosts}
+    )
+
+    if pushed is not None and pushed.settings == state.settings:
+        try:
+            yield client(
+                update_command,
+                _timeout=DHCP_TIMEOUT + 5,
+                base_revision=pushed.revision,
+                revision=state.revision,
+                remove=[mac for mac in pushed.hosts if mac not in state.hosts],
+                hosts=[
+                    host
+                    for mac, host in state.hosts.items()
+                    if pushed.hosts.get(mac) != host
+                ],
+            )
+        except DHCPRevisionMismatch as error:
+            log.msg(
+                "Sending the full DHCPv%d configuration to rack controller "
+                "'%s': %s" % (ip_version, client.ident, error)
+            )
+        except amp.UnhandledCommand:
+            # The rack controller is too old to apply changes.
+            pass
+        else:
+            _pushed_dhcp_state[key] = state
+            return
+
+    yield _perform_dhcp_config(
+        client,
+        v2_command,
+        v1_command,
+        hosts=hosts,
+        revision=state.revision,
+        **settings
+    )
+    # There is nothing to apply changes to once DHCP is stopped.
+    if len(settings["shared_networks"]) > 0:
+        _pushed_dhcp_state[key] = state
+
+
 def validate_dhcp_config(test_dhcp_snippet=None):
     """Validate a DHCPD config with uncommitted values.
 
@@ -1089,6 +1179,7 @@ def _perform_dhcp_config(
     def maybeDowngrade(failure):
         if failure.check(amp.UnhandledCommand):
             downgrade_shared_networks(shared_networks)
+            args.pop("revision", None)
             return call(v1_command)
         else:
             return failure
@@ -0,0 +1,159 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Work out which DNS zones are affected by recent DNS publications.
+
+Every change that affects DNS is recorded by a trigger as a
+`DNSPublication`, with a `source` describing the change. The sources written
+for the most frequent changes (addresses being allocated, released and
+linked to nodes or DNS resources, and DNS resources changing) identify the
+forward zone and the address involved, which is enough to regenerate only
+the zones they touch. Changes to DNS resources only name the resource, so
+its addresses are looked up to find the reverse zones holding its PTR
+records; a removed resource no longer has any, so all the zones are rebuilt
+for it, as for any other change.
+"""
+
+__all__ = ["DNSChanges", "get_dns_changes"]
+
+from functools import reduce
+from operator import or_
+import re
+
+import attr
+from django.db.models import Q
+from netaddr import AddrFormatError, IPAddress
+
+from maasserver.models.dnspublication import DNSPublication
+from maasserver.models.dnsresource import DNSResource
+from maasserver.models.domain import Domain
+
+# Zone (domain) names and host names never contain spaces, so `\S+` is
+# enough to pick them out of a publication's source.
+_DNS_CHANGE_PATTERNS = [
+    re.compile(
+        r"^zone (?P<domain>\S+) (?P<resource_change>added|removed|updated) "
+        r"resource (?P<resource>\S+)$"
+    ),
+    re.compile(
+        r"^ip (?P<ip>\S+) (?:linked to|unlinked from) resource \S+ "
+        r"on zone (?P<domain>\S+)$"
+    ),
+    re.compile(
+        r"^ip (?P<ip>\S+) (?:connected to|disconnected from) "
+        r"(?P<hostname>\S+) on \S+$"
+    ),
+    re.compile(r"^ip (?P<ip>\S+) changed to (?P<linked_ip>\S+)$"),
+    re.compile(
+        r"^ip (?P<linked_ip>\S+) (?:allocated|alloc_type changed to \d+)$"
+    ),
+    re.compile(r"^rack controller (?P<internal>\S+) (?:dis)?connected$"),
+]
+
+
+@attr.s
+class DNSChanges:
+    """The DNS zones affected by a set of publications."""
+
+    # All the zones must be rebuilt.
+    full = attr.ib(default=False)
+
+    # Names of the domains whose forward zones changed.
+    domains = attr.ib(default=attr.Factory(set))
+
+    # Addresses whose reverse zones changed.
+    ips = attr.ib(default=attr.Factory(set))
+
+    # The internal domain changed.
+    internal = attr.ib(default=False)
+
+    def __bool__(self):
+        return bool(self.full or self.domains or self.ips or self.internal)
+
+
+def _parse_ip(value):
+    try:
+        return IPAddress(value)
+    except (AddrFormatError, ValueError):
+        return None
+
+
+def get_dns_changes(previous_serial, current_serial):
+    """Return the `DNSChanges` published after `previous_serial`.
+
+    Only publications with a serial up to and including `current_serial`
+    are considered.
+    """
+    changes = DNSChanges()
+    if previous_serial is None or int(current_serial) < int(previous_serial):
+        # Nothing was published yet, or the serial has wrapped around.
+        changes.full = True
+        return changes
+    sources = DNSPublication.objects.filter(
+        serial__gt=previous_serial, serial__lte=current_serial
+    ).values_list("source", flat=True)
+    hostnames, linked_ips, resources = set(), set(), set()
+    for source in sources:
+        for pattern in _DNS_CHANGE_PATTERNS:
+            match = pattern.match(source)
+            if match is not None:
+                break
+        else:
+            changes.full = True
+            return changes
+        found = match.groupdict()
+        if "resource" in found:
+            if (
+                found["resource_change"] == "removed"
+                or found["resource"] == "NULL"
+            ):
+                # The addresses whose PTR records it had can't be told.
+                changes.full = True
+                return changes
+            resources.add((found["domain"], found["resource"]))
+        if "domain" in found:
+            changes.domains.add(found["domain"])
+        if "hostname" in found:
+            hostnames.add(found["hostname"])
+        if "internal" in found:
+            changes.internal = True
+        for key in ("ip", "linked_ip"):
+            if key in found:
+                ip = _parse_ip(found[key])
+                if ip is None:
+                    changes.full = True
+                    return changes
+                changes.ips.add(ip)
+                if key == "linked_ip":
+                    linked_ips.add(str(ip))
+    # The reverse zones of renamed or re-TTLed resources hold PTR records to
+    # them; look up their addresses for all of them at once.
+    if len(resources) != 0:
+        resource_ips = (
+            DNSResource.objects.filter(
+                reduce(
+                    or_,
+                    (
+                        Q(domain__name=domain, name=name)
+                        for domain, name in resources
+                    ),
+                ),
+                ip_addresses__ip__isnull=False,
+            )
+            .values_list("ip_addresses__ip", flat=True)
+            .distinct()
+        )
+        changes.ips.update(IPAddress(ip) for ip in resource_ips)
+    # Sources naming a host or only an address do not say which forward zone
+    # holds the address records; look that up for all of them at once.
+    if len(hostnames) != 0 or len(linked_ips) != 0:
+        changes.domains.update(
+            Domain.objects.filter(
+                Q(node__hostname__in=hostnames)
+                | Q(node__interface__ip_addresses__ip__in=linked_ips)
+                | Q(dnsresource__ip_addresses__ip__in=linked_ips)
+            )
+            .distinct()
+            .values_list("name", flat=True)
+        )
+    return changes
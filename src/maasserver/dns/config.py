@@ -3,13 +3,18 @@
 
 """DNS management module."""
 
-__all__ = ["dns_force_reload", "dns_update_all_zones"]
+__all__ = [
+    "dns_force_reload",
+    "dns_update_all_zones",
+    "dns_update_changed_zones",
+]
 
 from collections import defaultdict
 
 from django.conf import settings
-from netaddr import IPAddress
+from netaddr import IPAddress, IPNetwork
 
+from maasserver.dns.changes import get_dns_changes
 from maasserver.dns.zonegenerator import (
     InternalDomain,
     InternalDomainResourse,
@@ -25,10 +30,12 @@ from maasserver.models.subnet import Subnet
 from provisioningserver.dns.actions import (
     bind_reload,
     bind_reload_with_retries,
+    bind_reload_zones,
     bind_write_configuration,
     bind_write_options,
     bind_write_zones,
 )
+from provisioningserver.dns.zoneconfig import DNSReverseZoneConfig
 from provisioningserver.logger import get_maas_logger
 
 maaslog = get_maas_logger("dns")
@@ -103,6 +110,74 @@ def dns_update_all_zones(reload_retry=False, reload_timeout=2):
     return serial, reloaded, [domain.name for domain in domains]
 
 
+def dns_update_changed_zones(
+    previous_serial, reload_zones=True, reload_timeout=2
+):
+    """Update the zone files affected by publications since `previous_serial`.
+
+    Only the forward zones of the domains that changed and the reverse zones
+    holding the addresses that changed are regenerated; those zones get the
+    current serial and the others keep theirs. When a change cannot be
+    narrowed down to a set of zones, all of them are updated with
+    `dns_update_all_zones`.
+
+    :param previous_serial: The serial that was last published.
+    :param reload_zones: Ask BIND to reload only the zones that were
+        rewritten, one at a time. Otherwise BIND reloads all its zones.
+    :return: The current serial, whether BIND reloaded, and the names of the
+        domains that were updated.
+    """
+    if not is_dns_enabled():
+        return
+
+    serial = current_zone_serial()
+    changes = get_dns_changes(previous_serial, serial)
+    if changes.full:
+        return dns_update_all_zones(reload_timeout=reload_timeout)
+
+    default_ttl = Config.objects.get_config("default_dns_ttl")
+    domains = list(
+        Domain.objects.filter(authoritative=True, name__in=changes.domains)
+    )
+    # Subnets using RFC2317 are always included, as they provide the glue
+    # for the zones of the networks around them.
+    subnets = []
+    if len(changes.ips) != 0:
+        subnets = [
+            subnet
+            for subnet in Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
+            if subnet.rdns_mode == RDNS_MODE.RFC2317
+            or any(ip in IPNetwork(subnet.cidr) for ip in changes.ips)
+        ]
+    internal_domains = [get_internal_domain()] if changes.internal else []
+    zones = [
+        zone
+        for zone in ZoneGenerator(
+            domains,
+            subnets,
+            default_ttl,
+            serial,
+            internal_domains=internal_domains,
+        )
+        if not isinstance(zone, DNSReverseZoneConfig)
+        or any(
+            ip in info.subnetwork
+            for info in zone.zone_info
+            for ip in changes.ips
+        )
+    ]
+    bind_write_zones(zones)
+
+    if reload_zones:
+        reloaded = bind_reload_zones(
+            [info.zone_name for zone in zones for info in zone.zone_info]
+        )
+    else:
+        reloaded = bind_reload(timeout=reload_timeout)
+
+    return serial, reloaded, [domain.name for domain in domains]
+
+
 def get_upstream_dns():
     """Return the IP addresses of configured upstream DNS servers.
 
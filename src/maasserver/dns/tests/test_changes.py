@@ -0,0 +1,154 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.dns.changes`."""
+
+__all__ = []
+
+from netaddr import IPAddress
+
+from maasserver.dns.changes import DNSChanges, get_dns_changes
+from maasserver.enum import IPADDRESS_TYPE
+from maasserver.models.dnspublication import DNSPublication
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+
+
+class TestGetDNSChanges(MAASServerTestCase):
+    def publish(self, *sources):
+        serial = None
+        for source in sources:
+            serial = DNSPublication.objects.create(source=source).serial
+        return serial
+
+    def get_changes(self, *sources):
+        previous_serial = self.publish("previous")
+        return get_dns_changes(previous_serial, self.publish(*sources))
+
+    def test__full_without_previous_serial(self):
+        serial = self.publish("added zone example.com")
+        self.assertEqual(DNSChanges(full=True), get_dns_changes(None, serial))
+
+    def test__full_when_serial_wrapped_around(self):
+        serial = self.publish("previous")
+        self.assertEqual(
+            DNSChanges(full=True), get_dns_changes(serial + 1, serial)
+        )
+
+    def test__nothing_changed(self):
+        serial = self.publish("previous")
+        changes = get_dns_changes(serial, serial)
+        self.assertEqual(DNSChanges(), changes)
+        self.assertFalse(changes)
+
+    def test__full_for_unknown_change(self):
+        changes = self.get_changes(
+            "zone example.com added resource foo", "added zone example.org"
+        )
+        self.assertEqual(DNSChanges(full=True), changes)
+
+    def test__full_for_released_ip(self):
+        changes = self.get_changes("ip 10.0.0.1 released")
+        self.assertTrue(changes.full)
+
+    def test__ignores_publications_outside_range(self):
+        previous_serial = self.publish("added zone example.org")
+        serial = self.publish("zone example.com added resource foo")
+        self.publish("added zone example.net")
+        self.assertEqual(
+            DNSChanges(domains={"example.com"}),
+            get_dns_changes(previous_serial, serial),
+        )
+
+    def test__resource_change_affects_domain(self):
+        changes = self.get_changes(
+            "zone example.com updated resource foo",
+            "zone example.org added resource bar",
+        )
+        self.assertEqual(
+            DNSChanges(domains={"example.com", "example.org"}), changes
+        )
+
+    def test__resource_change_affects_its_ips(self):
+        domain = factory.make_Domain()
+        ips = [
+            factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.USER_RESERVED
+            )
+            for _ in range(2)
+        ]
+        resource = factory.make_DNSResource(domain=domain, ip_addresses=ips)
+        factory.make_DNSResource(
+            domain=domain,
+            ip_addresses=[
+                factory.make_StaticIPAddress(
+                    alloc_type=IPADDRESS_TYPE.USER_RESERVED
+                )
+            ],
+        )
+        changes = self.get_changes(
+            "zone %s updated resource %s" % (domain.name, resource.name)
+        )
+        self.assertEqual(
+            DNSChanges(
+                domains={domain.name}, ips={IPAddress(ip.ip) for ip in ips}
+            ),
+            changes,
+        )
+
+    def test__full_for_removed_resource(self):
+        changes = self.get_changes("zone example.com removed resource foo")
+        self.assertEqual(DNSChanges(full=True), changes)
+
+    def test__full_for_unnamed_resource(self):
+        changes = self.get_changes("zone example.com updated resource NULL")
+        self.assertEqual(DNSChanges(full=True), changes)
+
+    def test__resource_link_affects_domain_and_ip(self):
+        changes = self.get_changes(
+            "ip 10.0.0.1 linked to resource foo on zone example.com"
+        )
+        self.assertEqual(
+            DNSChanges(domains={"example.com"}, ips={IPAddress("10.0.0.1")}),
+            changes,
+        )
+
+    def test__node_link_affects_node_domain_and_ip(self):
+        domain = factory.make_Domain()
+        node = factory.make_Node(domain=domain)
+        changes = self.get_changes(
+            "ip 2001:db8::1 disconnected from %s on eth0" % node.hostname
+        )
+        self.assertEqual(
+            DNSChanges(domains={domain.name}, ips={IPAddress("2001:db8::1")}),
+            changes,
+        )
+
+    def test__allocated_ip_affects_domains_linked_to_ip(self):
+        domain = factory.make_Domain()
+        node = factory.make_Node_with_Interface_on_Subnet(domain=domain)
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY,
+            interface=node.get_boot_interface(),
+        )
+        resource_domain = factory.make_Domain()
+        factory.make_DNSResource(domain=resource_domain, ip_addresses=[ip])
+        changes = self.get_changes("ip %s allocated" % ip.ip)
+        self.assertEqual(
+            DNSChanges(
+                domains={domain.name, resource_domain.name},
+                ips={IPAddress(ip.ip)},
+            ),
+            changes,
+        )
+
+    def test__changed_ip_affects_both_ips(self):
+        changes = self.get_changes("ip 10.0.0.1 changed to 10.0.0.2")
+        self.assertEqual(
+            DNSChanges(ips={IPAddress("10.0.0.1"), IPAddress("10.0.0.2")}),
+            changes,
+        )
+
+    def test__rack_connection_affects_internal_domain(self):
+        changes = self.get_changes("rack controller rack1 connected")
+        self.assertEqual(DNSChanges(internal=True), changes)
@@ -12,14 +12,17 @@ import time
 from django.conf import settings
 import dns.resolver
 from netaddr import IPAddress
+from testtools.content import text_content
 from testtools.matchers import (
     Contains,
     Equals,
     FileContains,
+    GreaterThan,
     HasLength,
     Is,
     MatchesSetwise,
     MatchesStructure,
+    Not,
 )
 
 from maasserver.config import RegionConfiguration
@@ -28,6 +31,7 @@ from maasserver.dns.config import (
     current_zone_serial,
     dns_force_reload,
     dns_update_all_zones,
+    dns_update_changed_zones,
     get_internal_domain,
     get_resource_name_for_subnet,
     get_trusted_acls,
@@ -42,7 +46,8 @@ from maasserver.models.dnspublication import DNSPublication
 from maasserver.testing.config import RegionConfigurationFixture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.djangotestcase import count_queries
+from maastesting.matchers import MockCalledOnceWith, MockNotCalled
 from provisioningserver.dns.commands import get_named_conf, setup_dns
 from provisioningserver.dns.config import compose_config_path, DNSConfig
 from provisioningserver.dns.testing import (
@@ -406,6 +411,150 @@ class TestDNSConfigModifications(TestDNSServer):
         )
 
 
+class TestDNSUpdateChangedZones(MAASServerTestCase):
+    """Tests for `dns_update_changed_zones`."""
+
+    def setUp(self):
+        super(TestDNSUpdateChangedZones, self).setUp()
+        self.patch(settings, "DNS_CONNECT", True)
+        self.bind_write_zones = self.patch(
+            dns_config_module, "bind_write_zones"
+        )
+        self.bind_reload_zones = self.patch(
+            dns_config_module, "bind_reload_zones"
+        )
+        self.bind_reload_zones.return_value = True
+        self.bind_reload = self.patch(dns_config_module, "bind_reload")
+        self.bind_reload.return_value = True
+        self.patch(dns_config_module, "bind_reload_with_retries")
+        self.patch(dns_config_module, "bind_write_configuration")
+        self.patch(dns_config_module, "bind_write_options")
+        DNSPublication(source="Initial").save()
+
+    def make_domains(self, count):
+        """Make `count` domains, each with a node with a static address.
+
+        The addresses are kept in `static_ips`, keyed by domain name.
+        """
+        domains = []
+        self.static_ips = {}
+        for _ in range(count):
+            domain = factory.make_Domain()
+            subnet = factory.make_Subnet()
+            node = factory.make_Node_with_Interface_on_Subnet(
+                domain=domain, subnet=subnet
+            )
+            self.static_ips[domain.name] = factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.STICKY,
+                subnet=subnet,
+                interface=node.get_boot_interface(),
+            )
+            domains.append(domain)
+        return domains
+
+    def publish(self, source):
+        previous_serial = DNSPublication.objects.get_most_recent().serial
+        DNSPublication(source=source).save()
+        return previous_serial
+
+    def get_written_zone_names(self):
+        [zones], _ = self.bind_write_zones.call_args
+        return {info.zone_name for zone in zones for info in zone.zone_info}
+
+    def test_does_nothing_when_dns_disabled(self):
+        self.patch(settings, "DNS_CONNECT", False)
+        previous_serial = self.publish("added zone example.com")
+        self.assertIsNone(dns_update_changed_zones(previous_serial))
+        self.assertThat(self.bind_write_zones, MockNotCalled())
+
+    def test_updates_all_zones_when_change_is_unknown(self):
+        dns_update_all_zones = self.patch(
+            dns_config_module, "dns_update_all_zones"
+        )
+        previous_serial = self.publish("added zone example.com")
+        self.assertEqual(
+            dns_update_all_zones.return_value,
+            dns_update_changed_zones(previous_serial, reload_timeout=5),
+        )
+        self.assertThat(
+            dns_update_all_zones, MockCalledOnceWith(reload_timeout=5)
+        )
+
+    def test_writes_and_reloads_only_changed_forward_zone(self):
+        domain, _ = self.make_domains(2)
+        previous_serial = self.publish(
+            "zone %s updated resource foo" % domain.name
+        )
+        serial, reloaded, domains = dns_update_changed_zones(previous_serial)
+        self.assertEqual(current_zone_serial(), serial)
+        self.assertTrue(reloaded)
+        self.assertEqual([domain.name], domains)
+        self.assertEqual({domain.name}, self.get_written_zone_names())
+        self.assertThat(
+            self.bind_reload_zones, MockCalledOnceWith([domain.name])
+        )
+        self.assertThat(self.bind_reload, MockNotCalled())
+
+    def test_writes_forward_and_reverse_zones_for_changed_ip(self):
+        domain, other_domain = self.make_domains(2)
+        ip = self.static_ips[domain.name]
+        previous_serial = self.publish("ip %s allocated" % ip.ip)
+        _, _, domains = dns_update_changed_zones(previous_serial)
+        self.assertEqual([domain.name], domains)
+        zone_names = self.get_written_zone_names()
+        self.assertIn(domain.name, zone_names)
+        self.assertNotIn(other_domain.name, zone_names)
+        # The reverse zone holding the address is written too.
+        self.assertThat(zone_names - {domain.name}, Not(HasLength(0)))
+
+    def test_writes_internal_domain_when_rack_changes(self):
+        self.make_domains(1)
+        previous_serial = self.publish("rack controller rack connected")
+        dns_update_changed_zones(previous_serial)
+        self.assertEqual(
+            {get_internal_domain().name}, self.get_written_zone_names()
+        )
+
+    def test_reloads_all_zones_unless_reloading_zones(self):
+        (domain,) = self.make_domains(1)
+        previous_serial = self.publish(
+            "zone %s updated resource foo" % domain.name
+        )
+        dns_update_changed_zones(
+            previous_serial, reload_zones=False, reload_timeout=5
+        )
+        self.assertThat(self.bind_reload, MockCalledOnceWith(timeout=5))
+        self.assertThat(self.bind_reload_zones, MockNotCalled())
+
+    def test_benchmark_one_change_against_full_update(self):
+        domain = self.make_domains(20)[0]
+        previous_serial = self.publish(
+            "zone %s updated resource foo" % domain.name
+        )
+        full_queries, _ = count_queries(dns_update_all_zones)
+        full_zones = self.get_written_zone_names()
+        changed_queries, _ = count_queries(
+            dns_update_changed_zones, previous_serial
+        )
+        changed_zones = self.get_written_zone_names()
+        # Recorded for comparison when run with `--verbose`.
+        self.addDetail(
+            "benchmark",
+            text_content(
+                "full: %d queries, %d zones; changed: %d queries, %d zones"
+                % (
+                    full_queries,
+                    len(full_zones),
+                    changed_queries,
+                    len(changed_zones),
+                )
+            ),
+        )
+        self.assertEqual({domain.name}, changed_zones)
+        self.assertThat(len(full_zones), GreaterThan(40))
+        self.assertThat(full_queries, GreaterThan(changed_queries))
+
+
 class TestDNSDynamicIPAddresses(TestDNSServer):
     """Allocated nodes with IP addresses in the dynamic range get a DNS
     record.
@@ -104,6 +104,12 @@ def make_StatsService():
     return stats.StatsService()
 
 
+def make_SubnetsUtilisationStatsService():
+    from maasserver import stats
+
+    return stats.SubnetsUtilisationStatsService()
+
+
 def make_PrometheusService():
     from maasserver.prometheus import stats
 
@@ -168,6 +174,12 @@ def make_ReverseDNSService(postgresListener):
     return ReverseDNSService(postgresListener)
 
 
+def make_FreeRangeCacheService(postgresListener):
+    from maasserver.regiondservices.free_ranges import FreeRangeCacheService
+
+    return FreeRangeCacheService(postgresListener)
+
+
 def make_NetworkTimeProtocolService():
     from maasserver.regiondservices import ntp
 
@@ -297,6 +309,11 @@ class RegionEventLoop:
             "factory": make_StatsService,
             "requires": [],
         },
+        "subnet-stats": {
+            "only_on_master": False,
+            "factory": make_SubnetsUtilisationStatsService,
+            "requires": [],
+        },
         "prometheus": {
             "only_on_master": True,
             "factory": make_PrometheusService,
@@ -364,6 +381,11 @@ class RegionEventLoop:
             "factory": make_RackControllerService,
             "requires": ["ipc-worker", "postgres-listener-worker"],
         },
+        "free-range-cache": {
+            "only_on_master": False,
+            "factory": make_FreeRangeCacheService,
+            "requires": ["postgres-listener-worker"],
+        },
         "ntp": {
             "only_on_master": True,
             "factory": make_NetworkTimeProtocolService,
@@ -662,6 +662,25 @@ CONFIG_ITEMS = {
             ),
         },
     },
+    "boot_images_rack_peers": {
+        "default": False,
+        "form": forms.BooleanField,
+        "form_kwargs": {
+            "required": False,
+            "label": (
+                "Let rack controllers download boot images from other rack "
+                "controllers."
+            ),
+            "help_text": (
+                "When enabled, a rack controller importing boot images first "
+                "tries to download each file from other rack controllers "
+                "that share a subnet with it and already have the images, "
+                "rather than from the region. Checksums are still verified. "
+                "On a new import, one rack controller imports from the "
+                "region first."
+            ),
+        },
+    },
     "curtin_verbose": {
         "default": False,
         "form": forms.BooleanField,
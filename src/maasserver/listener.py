@@ -13,13 +13,19 @@ from django.db import connections
 from django.db.utils import load_backend
 from twisted.application.service import Service
 from twisted.internet import defer, error, interfaces, reactor, task
-from twisted.internet.defer import CancelledError, Deferred, succeed
+from twisted.internet.defer import (
+    CancelledError,
+    Deferred,
+    DeferredSemaphore,
+    succeed,
+)
 from twisted.internet.task import deferLater
 from twisted.internet.threads import deferToThread
 from twisted.logger import Logger
 from twisted.python.failure import Failure
 from zope.interface import implementer
 
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.utils.enum import map_enum
 from provisioningserver.utils.events import EventGroup
 from provisioningserver.utils.twisted import callOut, suppress, synchronous
@@ -65,18 +71,26 @@ class PostgresListenerService(Service, object):
         at all other times.
     """
 
-    # Seconds to wait to handle new notifications. When the notifications set
-    # is empty it will wait this amount of time to check again for new
-    # notifications.
+    # Seconds to wait to handle new notifications. Notifications received
+    # within this window are coalesced, so an object that is updated many
+    # times in the window is only handled once.
     HANDLE_NOTIFY_DELAY = 0.5
 
-    def __init__(self, alias="default"):
+    # Maximum number of handler calls running concurrently for a channel.
+    # Further notifications keep being coalesced until the handlers for the
+    # current window have all finished.
+    HANDLE_NOTIFY_CONCURRENCY = 4
+
+    def __init__(self, alias="default", prometheus_metrics=PROMETHEUS_METRICS):
         self.alias = alias
         self.listeners = defaultdict(list)
+        self.batchedListeners = defaultdict(list)
+        self.semaphores = {}
         self.autoReconnect = False
         self.connection = None
         self.connectionFileno = None
         self.notifications = set()
+        self.notificationsReceived = 0
         self.notifier = task.LoopingCall(self.handleNotifies)
         self.notifierDone = None
         self.connecting = None
@@ -84,6 +98,7 @@ class PostgresListenerService(Service, object):
         self.registeredChannels = False
         self.log = Logger(__name__, self)
         self.events = EventGroup("connected", "disconnected")
+        self.prometheus_metrics = prometheus_metrics
 
     def startService(self):
         """Start the listener."""
@@ -167,9 +182,15 @@ class PostgresListenerService(Service, object):
                         self.notifications.add(
                             (notify.channel, notify.payload)
                         )
+                        self.notificationsReceived += 1
                 # Delete the contents of the connection's notifies list so
                 # that we don't process them a second time.
                 del notifies[:]
+                self.prometheus_metrics.update(
+                    "maas_listener_notify_queue_depth",
+                    "set",
+                    value=len(self.notifications),
+                )
 
     def fileno(self):
         """Return the fileno of the connection."""
@@ -193,11 +214,13 @@ class PostgresListenerService(Service, object):
         finally:
             self.connectionFileno = None
 
-    def register(self, channel, handler):
+    def register(self, channel, handler, batched=False):
         """Register listening for notifications from a channel.
 
         When a notification is received for that `channel` the `handler` will
-        be called with the action and object id.
+        be called with the action and object id. When `batched` is True the
+        `handler` is instead called once per action with a list of all the
+        object ids notified for that action within `HANDLE_NOTIFY_DELAY`.
         """
         handlers = self.listeners[channel]
         if self.isSystemChannel(channel) and len(handlers) > 0:
@@ -211,6 +234,8 @@ class PostgresListenerService(Service, object):
             )
         else:
             handlers.append(handler)
+            if batched:
+                self.batchedListeners[channel].append(handler)
         if self.registeredChannels and self.connection:
             # Channels have already been registered. Register the
             # new channel on the already existing connection.
@@ -228,6 +253,8 @@ class PostgresListenerService(Service, object):
         handlers = self.listeners[channel]
         if handler in handlers:
             handlers.remove(handler)
+            if handler in self.batchedListeners[channel]:
+                self.batchedListeners[channel].remove(handler)
         else:
             raise PostgresListenerUnregistrationError(
                 "Handler is not registered on that channel '%s'." % channel
@@ -405,20 +432,43 @@ class PostgresListenerService(Service, object):
             return succeed(None)
 
     def handleNotifies(self, clock=reactor):
-        """Process all notify message in the notifications set."""
+        """Process all notify message in the notifications set.
 
-        def gen_notifications(notifications):
-            while len(notifications) != 0:
-                yield notifications.pop()
-
-        return task.coiterate(
-            self.handleNotify(notification, clock=clock)
-            for notification in gen_notifications(self.notifications)
+        The notifications are grouped by channel, and the handlers for each
+        channel are called with at most `HANDLE_NOTIFY_CONCURRENCY` calls in
+        flight. The returned `Deferred` fires once all of them have finished,
+        which holds off the next run of the notifier.
+        """
+        received, self.notificationsReceived = self.notificationsReceived, 0
+        batches = defaultdict(list)
+        while len(self.notifications) != 0:
+            channel, payload = self.notifications.pop()
+            batches[channel].append(payload)
+        self.prometheus_metrics.update(
+            "maas_listener_notify_queue_depth", "set", value=0
+        )
+        if len(batches) == 0:
+            return succeed(None)
+        handled = sum(len(payloads) for payloads in batches.values())
+        self.prometheus_metrics.update(
+            "maas_listener_notify_coalesce_ratio",
+            "set",
+            value=max(received, handled) / handled,
+        )
+        return defer.DeferredList(
+            [
+                self.handleNotifyBatch(channel, payloads, clock=clock)
+                for channel, payloads in batches.items()
+            ]
         )
 
     def handleNotify(self, notification, clock=reactor):
         """Process a notify message in the notifications set."""
         channel, payload = notification
+        return self.handleNotifyBatch(channel, [payload], clock=clock)
+
+    def handleNotifyBatch(self, channel, payloads, clock=reactor):
+        """Process the notify messages for `channel` with `payloads`."""
         try:
             channel, action = self.convertChannel(channel)
         except PostgresListenerNotifyError:
@@ -427,21 +477,36 @@ class PostgresListenerService(Service, object):
             self.log.failure(
                 "Failed to convert channel {channel!r}.", channel=channel
             )
-        else:
-            defers = []
-            handlers = self.listeners[channel]
-            # XXX: There could be an arbitrary number of listeners. Should we
-            # limit concurrency here? Perhaps even do one at a time.
-            for handler in handlers:
-                d = defer.maybeDeferred(handler, action, payload)
+            return succeed(None)
+        semaphore = self.getSemaphore(channel)
+        defers = []
+        for handler in self.listeners[channel]:
+            if handler in self.batchedListeners[channel]:
+                calls = [list(payloads)]
+            else:
+                calls = payloads
+            for payload in calls:
+                d = semaphore.run(handler, action, payload)
                 d.addErrback(
-                    lambda failure: self.log.failure(
-                        "Failure while handling notification to {channel!r}: "
-                        "{payload!r}",
-                        failure,
-                        channel=channel,
-                        payload=payload,
-                    )
+                    self._logHandlerFailure, channel=channel, payload=payload
                 )
                 defers.append(d)
-            return defer.DeferredList(defers)
+        return defer.DeferredList(defers)
+
+    def getSemaphore(self, channel):
+        """Return the semaphore limiting the handler calls for `channel`."""
+        semaphore = self.semaphores.get(channel)
+        if semaphore is None:
+            semaphore = self.semaphores[channel] = DeferredSemaphore(
+                self.HANDLE_NOTIFY_CONCURRENCY
+            )
+        return semaphore
+
+    def _logHandlerFailure(self, failure, channel, payload):
+        self.log.failure(
+            "Failure while handling notification to {channel!r}: "
+            "{payload!r}",
+            failure,
+            channel=channel,
+            payload=payload,
+        )
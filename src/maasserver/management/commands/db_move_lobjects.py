@@ -0,0 +1,93 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Django command: db_move_lobjects (moves large files out of the DB)."""
+
+__all__ = ["Command", "move_large_file"]
+
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maasserver.contentstore import (
+    ContentChecksumMismatch,
+    get_filesystem_content_store,
+    use_filesystem_content_store,
+)
+from maasserver.fields import LargeObjectFile
+from maasserver.models import LargeFile
+from maasserver.utils.orm import get_one, transactional
+
+
+@transactional
+def move_large_file(store, largefile_id):
+    """Move the content of a `LargeFile` from the database into `store`.
+
+    The large object is only removed once its content has been written to
+    the filesystem and its checksum verified, in the same transaction that
+    records the new location of the content.
+
+    :return: The moved `LargeFile`, or None if it no longer needs moving.
+    :raise ContentChecksumMismatch: If the content in the database does not
+        match its SHA256; it is left in the database.
+    """
+    largefile = get_one(
+        LargeFile.objects.filter(id=largefile_id).select_for_update()
+    )
+    if (
+        largefile is None
+        or largefile.stored_in_filesystem
+        or not largefile.complete
+    ):
+        return None
+    oid = largefile.content.oid
+    with largefile.content.open("rb") as stream:
+        store.put(largefile.sha256, stream)
+    largefile.content = None
+    largefile.save(update_fields=["content"])
+    LargeObjectFile(oid).unlink()
+    return largefile
+
+
+class Command(BaseCommand):
+    """Moves the content of large files, such as boot resources, out of the
+    database and into the filesystem.
+    """
+
+    help = dedent(
+        "Moves the content of boot resource files stored as large objects "
+        "in the database to boot_resources_path. The region must be "
+        "configured with boot_resources_storage set to 'filesystem'. Run "
+        "db_vacuum_lobjects afterwards to give the space back."
+    )
+
+    def handle(self, **options):
+        if not use_filesystem_content_store():
+            raise CommandError(
+                "boot_resources_storage must be set to 'filesystem' first."
+            )
+        store = get_filesystem_content_store()
+        largefile_ids = transactional(
+            lambda: list(
+                LargeFile.objects.filter(content__isnull=False)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+        )()
+        moved = failed = 0
+        for largefile_id in largefile_ids:
+            try:
+                largefile = move_large_file(store, largefile_id)
+            except ContentChecksumMismatch as error:
+                self.stderr.write("Not moved: %s" % error)
+                failed += 1
+            else:
+                if largefile is not None:
+                    self.stdout.write("Moved %s." % largefile)
+                    moved += 1
+        self.stdout.write("Moved %d large files." % moved)
+        if failed != 0:
+            raise CommandError(
+                "%d large files could not be moved, as their content does "
+                "not match their SHA256." % failed
+            )
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import maasserver.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("maasserver", "0201_merge_20191008_1426")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="largefile",
+            name="content",
+            field=maasserver.fields.LargeObjectField(blank=True, null=True),
+        )
+    ]
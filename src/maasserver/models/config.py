@@ -86,6 +86,7 @@ def get_default_config():
         # Images.
         "boot_images_auto_import": True,
         "boot_images_no_proxy": False,
+        "boot_images_rack_peers": False,
         # Third Party
         "enable_third_party_drivers": True,
         # Disk erasing.
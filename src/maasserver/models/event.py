@@ -24,7 +24,7 @@ from maasserver.fields import MAASIPAddressField
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.eventtype import EventType
 from maasserver.models.node import Node
-from maasserver.models.timestampedmodel import TimestampedModel
+from maasserver.models.timestampedmodel import now, TimestampedModel
 from maasserver.utils.dns import validate_hostname
 from provisioningserver.events import EVENT_DETAILS
 from provisioningserver.logger import get_maas_logger
@@ -89,6 +89,46 @@ class EventManager(Manager):
             created=created,
         )
 
+    def bulk_create_node_events(self, events):
+        """Create events for nodes in bulk.
+
+        Each event type is registered only once, and all the events are
+        inserted with a single query, instead of looking up the node and
+        registering the event type for every event.
+
+        :param events: An iterable of `(node, type_name, event_action,
+            event_description, created)` tuples. When `created` is `None`
+            the current time is used.
+        :return: A list of the created events.
+        """
+        event_types = {}
+        new_events = []
+        for node, type_name, action, description, created in events:
+            event_type = event_types.get(type_name)
+            if event_type is None:
+                event_type = event_types[
+                    type_name
+                ] = EventType.objects.register(
+                    type_name,
+                    EVENT_DETAILS[type_name].description,
+                    EVENT_DETAILS[type_name].level,
+                )
+            if created is None:
+                created = now()
+            new_events.append(
+                Event(
+                    type=event_type,
+                    node=node,
+                    node_system_id=node.system_id,
+                    node_hostname=node.hostname,
+                    action=action,
+                    description=description,
+                    created=created,
+                    updated=created,
+                )
+            )
+        return self.bulk_create(new_events)
+
     def create_node_event(
         self,
         system_id,
@@ -1288,25 +1288,34 @@ class Interface(CleanSave, TimestampedModel):
             exclude_addresses = set()
         else:
             exclude_addresses = set(exclude_addresses)
-        assigned_addresses = []
+        # Group the links by subnet, so that the addresses for each subnet
+        # are allocated together.
+        subnet_auto_ips = OrderedDict()
         for auto_ip in self.ip_addresses.filter(
             alloc_type=IPADDRESS_TYPE.AUTO
-        ):
+        ).order_by("id"):
             if not auto_ip.ip:
-                assigned_ip = self._claim_auto_ip(
-                    auto_ip,
-                    temp_expires_after=temp_expires_after,
-                    exclude_addresses=exclude_addresses,
+                subnet = self._get_auto_ip_subnet(auto_ip)
+                subnet_auto_ips.setdefault(subnet.id, (subnet, []))
+                subnet_auto_ips[subnet.id][1].append(auto_ip)
+        assigned_addresses = []
+        for subnet, auto_ips in subnet_auto_ips.values():
+            new_ips = StaticIPAddress.objects.allocate_many(
+                subnet,
+                len(auto_ips),
+                alloc_type=IPADDRESS_TYPE.AUTO,
+                exclude_addresses=exclude_addresses,
+            )
+            for auto_ip, new_ip in zip(auto_ips, new_ips):
+                assigned_ip = self._assign_auto_ip(
+                    auto_ip, new_ip, temp_expires_after=temp_expires_after
                 )
-                if assigned_ip is not None:
-                    assigned_addresses.append(assigned_ip)
-                    exclude_addresses.add(str(assigned_ip.ip))
+                assigned_addresses.append(assigned_ip)
+                exclude_addresses.add(str(assigned_ip.ip))
         return assigned_addresses
 
-    def _claim_auto_ip(
-        self, auto_ip, temp_expires_after=None, exclude_addresses=None
-    ):
-        """Claim an IP address for the `auto_ip`."""
+    def _get_auto_ip_subnet(self, auto_ip):
+        """Return the subnet to claim an IP address for the `auto_ip` from."""
         subnet = auto_ip.subnet
         if subnet is None:
             maaslog.error(
@@ -1317,14 +1326,10 @@ class Interface(CleanSave, TimestampedModel):
                 "Automatic IP address cannot be configured on interface %s "
                 "without an associated subnet." % self.get_name()
             )
+        return subnet
 
-        # Allocate a new IP address from the entire subnet, excluding already
-        # allocated addresses and ranges.
-        new_ip = StaticIPAddress.objects.allocate_new(
-            subnet=subnet,
-            alloc_type=IPADDRESS_TYPE.AUTO,
-            exclude_addresses=exclude_addresses,
-        )
+    def _assign_auto_ip(self, auto_ip, new_ip, temp_expires_after=None):
+        """Assign the newly-allocated `new_ip` to the `auto_ip`."""
         auto_ip.ip = new_ip.ip
         # Throw away the newly-allocated address and assign it to the old AUTO
         # address, so that the interface link IDs remain consistent.
@@ -6,11 +6,17 @@
 __all__ = ["LargeFile"]
 
 import hashlib
+import os
 
 from django.db.models import BigIntegerField, CharField, Manager
 from twisted.internet import reactor
 
 from maasserver import DefaultMeta
+from maasserver.contentstore import (
+    ContentChecksumMismatch,
+    get_filesystem_content_store,
+    use_filesystem_content_store,
+)
 from maasserver.fields import LargeObjectField, LargeObjectFile
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.timestampedmodel import TimestampedModel
@@ -33,6 +39,23 @@ class FileStorageManager(Manager):
         """Return file based on SHA256 value."""
         return get_one(self.filter(sha256=sha256))
 
+    def create_file(self, sha256, total_size):
+        """Create a file with no content yet.
+
+        Its content will be stored in the filesystem or the database,
+        depending on the `boot_resources_storage` region option.
+        """
+        if use_filesystem_content_store():
+            content = None
+        else:
+            # Create an empty large object. It must be opened and closed
+            # for the object to be created in the database.
+            content = LargeObjectFile()
+            content.open().close()
+        return self.create(
+            sha256=sha256, total_size=total_size, content=content
+        )
+
     def get_or_create_file_from_content(self, content):
         """Return file based on the content.
 
@@ -53,6 +76,12 @@ class FileStorageManager(Manager):
 
         length = 0
         content.seek(0)
+        if use_filesystem_content_store():
+            get_filesystem_content_store().put(hexdigest, content)
+            length = content.tell()
+            return self.create(
+                sha256=hexdigest, size=length, total_size=length, content=None
+            )
         objfile = LargeObjectFile()
         with objfile.open("wb") as objstream:
             for data in content:
@@ -77,7 +106,8 @@ class LargeFile(CleanSave, TimestampedModel):
     :ivar total_size: Final size of `content`. The data might currently
         be saving, so total_size could be larger than `size`. `size` should
         never be larger than `total_size`.
-    :ivar content: File data.
+    :ivar content: File data, or None if it is stored in the filesystem.
+        See `maasserver.contentstore`.
     """
 
     class Meta(DefaultMeta):
@@ -92,8 +122,9 @@ class LargeFile(CleanSave, TimestampedModel):
     total_size = BigIntegerField(editable=False)
 
     # content is stored directly in the database, in the large object storage.
-    # Max file storage size is 4TB.
-    content = LargeObjectField()
+    # Max file storage size is 4TB. When NULL the content is stored in the
+    # filesystem instead, named by its SHA256.
+    content = LargeObjectField(null=True, blank=True)
 
     def __str__(self):
         return "<LargeFile size=%d sha256=%s>" % (self.total_size, self.sha256)
@@ -111,15 +142,32 @@ class LargeFile(CleanSave, TimestampedModel):
         """`content` has been completely saved."""
         return self.total_size == self.size
 
+    @property
+    def stored_in_filesystem(self):
+        """`content` is stored in the filesystem, not the database."""
+        return self.content is None
+
     @property
     def valid(self):
         """All content has been written and stored SHA256 value is the same
         as the calculated SHA256 value stored in the database.
 
+        Content stored in the filesystem is only moved into place once its
+        SHA256 has been verified, which is done here if it is complete but
+        has not been moved yet.
+
         Note: Depending on the size of the file, this can take some time.
         """
         if not self.complete:
             return False
+        if self.stored_in_filesystem:
+            store = get_filesystem_content_store()
+            if not store.exists(self.sha256):
+                try:
+                    store.commit(self.sha256)
+                except (ContentChecksumMismatch, FileNotFoundError):
+                    return False
+            return True
         sha256 = hashlib.sha256()
         with self.content.open("rb") as stream:
             for data in stream:
@@ -127,6 +175,23 @@ class LargeFile(CleanSave, TimestampedModel):
         hexdigest = sha256.hexdigest()
         return hexdigest == self.sha256
 
+    def open_content(self, mode="rb"):
+        """Open `content`, wherever it is stored.
+
+        :param mode: "rb" to read the complete content, or "ab" to add to
+            the content written so far.
+        """
+        if self.stored_in_filesystem:
+            store = get_filesystem_content_store()
+            if mode == "rb":
+                return store.open(self.sha256)
+            return store.open_partial(self.sha256, mode)
+        elif mode == "rb":
+            return self.content.open("rb")
+        stream = self.content.open("wb")
+        stream.seek(0, os.SEEK_END)
+        return stream
+
     def delete(self, *args, **kwargs):
         """Delete this object.
 
@@ -5339,7 +5339,7 @@ class Node(CleanSave, TimestampedModel):
         from maasserver.clusterrpc.boot_images import (
             get_common_available_boot_images,
         )
-        from metadataserver.models import NodeUserData
+        from metadataserver.models import NodeCurtinUserData, NodeUserData
 
         if not user.has_perm(NodePermission.edit, self):
             # You can't start a node you don't own unless you're an admin.
@@ -5393,6 +5393,9 @@ class Node(CleanSave, TimestampedModel):
         # whether or not we can actually send power commands to the
         # node; the user may choose to start it manually.
         NodeUserData.objects.set_user_data(self, user_data)
+        # Curtin user data rendered for a previous deployment may no longer
+        # match the node's configuration.
+        NodeCurtinUserData.objects.invalidate(self)
 
         # Auto IP allocation and power on action are attached to the
         # post commit of the transaction.
@@ -9,6 +9,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.signals import post_delete, post_save
 
 from maasserver.models import IPRange
+from maasserver.models.subnet import free_range_cache
 from maasserver.utils.signals import SignalsManager
 
 signals = SignalsManager()
@@ -42,8 +43,15 @@ def post_delete_check_range_utilization(sender, instance, **kwargs):
     instance.subnet.update_allocation_notification()
 
 
+def invalidate_free_ranges(sender, instance, **kwargs):
+    """Forget the cached free ranges of the range's subnet."""
+    free_range_cache.invalidate(instance.subnet_id)
+
+
 signals.watch(post_save, post_save_check_range_utilization, sender=IPRange)
 signals.watch(post_delete, post_delete_check_range_utilization, sender=IPRange)
+signals.watch(post_save, invalidate_free_ranges, sender=IPRange)
+signals.watch(post_delete, invalidate_free_ranges, sender=IPRange)
 
 
 # Enable all signals by default.
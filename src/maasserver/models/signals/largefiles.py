@@ -7,6 +7,7 @@ __all__ = ["signals"]
 
 from django.db.models.signals import post_delete
 
+from maasserver.contentstore import get_filesystem_content_store
 from maasserver.models.largefile import (
     delete_large_object_content_later,
     LargeFile,
@@ -18,13 +19,16 @@ signals = SignalsManager()
 
 
 def delete_large_object(sender, instance, **kwargs):
-    """Delete the large object when the `LargeFile` is deleted.
+    """Delete the large object, or the file in the filesystem, when the
+    `LargeFile` is deleted.
 
     This is done using the `post_delete` signal instead of overriding delete
     on `LargeFile`, so it works correctly for both the model and `QuerySet`.
     """
     if instance.content is not None:
         post_commit_do(delete_large_object_content_later, instance.content)
+    else:
+        post_commit_do(get_filesystem_content_store().delete, instance.sha256)
 
 
 signals.watch(post_delete, delete_large_object, LargeFile)
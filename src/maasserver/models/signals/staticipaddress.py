@@ -5,7 +5,10 @@
 
 __all__ = ["signals"]
 
+from functools import partial
+
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.db.models.signals import (
     post_delete,
     post_init,
@@ -15,6 +18,7 @@ from django.db.models.signals import (
 )
 
 from maasserver.models import StaticIPAddress
+from maasserver.models.subnet import free_range_cache
 from maasserver.utils.signals import SignalsManager
 from provisioningserver.logger import LegacyLogger
 
@@ -126,6 +130,42 @@ def pre_save_prevent_conflicts(sender, instance, **kwargs):
 signals.watch(pre_save, pre_save_prevent_conflicts, sender=StaticIPAddress)
 
 
+def post_save_update_free_ranges(sender, instance, created, **kwargs):
+    """Keep the cached free ranges of the instance's subnet up to date, once
+    the change is committed.
+
+    This must run before `post_save_prevent_conflicts`, which forgets the
+    previous IP address.
+    """
+    if created or instance.__previous_ip != instance.ip:
+        if not created and instance.__previous_ip:
+            transaction.on_commit(
+                partial(
+                    free_range_cache.address_released, instance.__previous_ip
+                )
+            )
+        if instance.ip:
+            transaction.on_commit(
+                partial(free_range_cache.address_used, instance.ip)
+            )
+
+
+signals.watch(post_save, post_save_update_free_ranges, sender=StaticIPAddress)
+
+
+def post_delete_update_free_ranges(sender, instance, **kwargs):
+    """The instance's IP address is free again, once this is committed."""
+    if instance.ip:
+        transaction.on_commit(
+            partial(free_range_cache.address_released, instance.ip)
+        )
+
+
+signals.watch(
+    post_delete, post_delete_update_free_ranges, sender=StaticIPAddress
+)
+
+
 def post_save_prevent_conflicts(sender, instance, created, **kwargs):
     """ Fix up BMCs that had their SIP's nullified in pre_save.
 
@@ -12,3 +12,55 @@ Tests related to DNS resources are in:
 """
 
 __all__ = []
+
+from django.db import transaction
+
+from maasserver.enum import IPADDRESS_TYPE
+from maasserver.models.subnet import free_range_cache
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.matchers import MockCalledOnceWith, MockNotCalled
+
+
+class TestStaticIPAddressFreeRangesSignals(MAASServerTestCase):
+    def setUp(self):
+        super(TestStaticIPAddressFreeRangesSignals, self).setUp()
+        self.on_commit = self.patch(transaction, "on_commit")
+        self.address_used = self.patch(free_range_cache, "address_used")
+        self.address_released = self.patch(
+            free_range_cache, "address_released"
+        )
+
+    def commit(self):
+        for args, _ in self.on_commit.call_args_list:
+            args[0]()
+
+    def test_creating_address_updates_free_ranges_on_commit(self):
+        ip = factory.make_StaticIPAddress(alloc_type=IPADDRESS_TYPE.STICKY)
+        self.assertThat(self.address_used, MockNotCalled())
+        self.commit()
+        self.assertThat(self.address_used, MockCalledOnceWith(ip.ip))
+
+    def test_changing_address_updates_free_ranges_on_commit(self):
+        subnet = factory.make_Subnet()
+        ip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet
+        )
+        previous_ip = ip.ip
+        self.on_commit.reset_mock()
+        self.address_used.reset_mock()
+        ip.ip = factory.pick_ip_in_Subnet(subnet, but_not=[previous_ip])
+        ip.save()
+        self.assertThat(self.address_released, MockNotCalled())
+        self.assertThat(self.address_used, MockNotCalled())
+        self.commit()
+        self.assertThat(self.address_released, MockCalledOnceWith(previous_ip))
+        self.assertThat(self.address_used, MockCalledOnceWith(ip.ip))
+
+    def test_deleting_address_updates_free_ranges_on_commit(self):
+        ip = factory.make_StaticIPAddress(alloc_type=IPADDRESS_TYPE.STICKY)
+        self.on_commit.reset_mock()
+        ip.delete()
+        self.assertThat(self.address_released, MockNotCalled())
+        self.commit()
+        self.assertThat(self.address_released, MockCalledOnceWith(ip.ip))
@@ -34,6 +34,7 @@ from maasserver.enum import (
     IPADDRESS_FAMILY,
     IPADDRESS_TYPE,
     IPADDRESS_TYPE_CHOICES_DICT,
+    IPRANGE_TYPE,
 )
 from maasserver.exceptions import (
     StaticIPAddressOutOfRange,
@@ -43,8 +44,8 @@ from maasserver.fields import MAASIPAddressField
 from maasserver.models.cleansave import CleanSave
 from maasserver.models.config import Config
 from maasserver.models.domain import Domain
-from maasserver.models.subnet import Subnet
-from maasserver.models.timestampedmodel import TimestampedModel
+from maasserver.models.subnet import free_range_cache, Subnet
+from maasserver.models.timestampedmodel import now, TimestampedModel
 from maasserver.utils import orm
 from maasserver.utils.dns import get_ip_based_hostname
 from provisioningserver.utils.enum import map_enum_reverse
@@ -249,6 +250,140 @@ class StaticIPAddressManager(Manager):
             ipaddress.save()
             return ipaddress
 
+    def _claim_free_addresses(self, subnet, addresses, alloc_type, user):
+        """Claim those of `addresses` that are free, in a single statement.
+
+        Addresses already in use, including by transactions that have not yet
+        committed, are skipped rather than raising `IntegrityError`. Addresses
+        that are the gateway or a DNS server of `subnet`, the gateway of one
+        of its static routes, within one of its dynamic IP ranges, or outside
+        its reserved ranges if it is unmanaged, are skipped too, in case the
+        free ranges they came from are out of date.
+
+        :return: The claimed addresses, in the order given.
+        """
+        created = now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO maasserver_staticipaddress
+                    (created, updated, ip, alloc_type, subnet_id, user_id,
+                     lease_time)
+                SELECT %s, %s, candidate.ip, %s, subnet.id, %s, 0
+                FROM unnest(%s::inet[]) AS candidate (ip),
+                    maasserver_subnet AS subnet
+                WHERE subnet.id = %s
+                AND NOT EXISTS (
+                    SELECT 1 FROM maasserver_staticipaddress AS sip
+                    WHERE sip.ip = candidate.ip)
+                AND subnet.gateway_ip IS DISTINCT FROM candidate.ip
+                AND NOT candidate.ip = ANY(
+                    coalesce(subnet.dns_servers, '{}')::inet[])
+                AND NOT EXISTS (
+                    SELECT 1 FROM maasserver_staticroute AS route
+                    WHERE route.source_id = subnet.id
+                    AND route.gateway_ip = candidate.ip)
+                AND NOT EXISTS (
+                    SELECT 1 FROM maasserver_iprange AS iprange
+                    WHERE iprange.subnet_id = subnet.id
+                    AND candidate.ip BETWEEN iprange.start_ip
+                        AND iprange.end_ip
+                    AND (iprange.type = %s OR NOT subnet.managed))
+                AND (subnet.managed OR EXISTS (
+                    SELECT 1 FROM maasserver_iprange AS iprange
+                    WHERE iprange.subnet_id = subnet.id
+                    AND candidate.ip BETWEEN iprange.start_ip
+                        AND iprange.end_ip
+                    AND iprange.type = %s))
+                ON CONFLICT (ip) WHERE alloc_type != %s DO NOTHING
+                RETURNING host(ip)
+                """,
+                [
+                    created,
+                    created,
+                    alloc_type,
+                    None if user is None else user.id,
+                    addresses,
+                    subnet.id,
+                    IPRANGE_TYPE.DYNAMIC,
+                    IPRANGE_TYPE.RESERVED,
+                    IPADDRESS_TYPE.DISCOVERED,
+                ],
+            )
+            claimed = {IPAddress(ip) for ip, in cursor.fetchall()}
+        return [
+            address for address in addresses if IPAddress(address) in claimed
+        ]
+
+    def allocate_many(
+        self,
+        subnet,
+        count,
+        alloc_type=IPADDRESS_TYPE.AUTO,
+        user=None,
+        exclude_addresses=None,
+    ):
+        """Return a list of `count` new StaticIPAddresses from `subnet`.
+
+        Addresses are taken from the subnet's cached free ranges and claimed
+        together. Only if those run out, even after being worked out afresh,
+        is each remaining address allocated as by `allocate_new`, which
+        considers addresses of observed neighbours and raises
+        `StaticIPAddressExhaustion` if there are none left.
+
+        :param exclude_addresses: A list of addresses which MUST NOT be used.
+
+        See `allocate_new` for the other parameters.
+        """
+        self._verify_alloc_type(alloc_type, user)
+        exclude_addresses = set(
+            str(address) for address in exclude_addresses or ()
+        )
+        claimed = []
+        refresh = False
+        while len(claimed) < count:
+            candidates = free_range_cache.take(
+                subnet,
+                count - len(claimed),
+                exclude_addresses=exclude_addresses,
+                refresh=refresh,
+            )
+            if len(candidates) == 0:
+                if refresh:
+                    break
+                refresh = True
+                continue
+            try:
+                claimed += self._claim_free_addresses(
+                    subnet, candidates, alloc_type, user
+                )
+            finally:
+                free_range_cache.resolve(subnet, candidates)
+        ipaddresses = {
+            IPAddress(ipaddress.ip): ipaddress
+            for ipaddress in self.filter(alloc_type=alloc_type, ip__in=claimed)
+        }
+        ipaddresses = [ipaddresses[IPAddress(address)] for address in claimed]
+        if len(ipaddresses) != 0:
+            # Claiming bypasses the `post_save` signals, so update the
+            # subnet's allocation notification once for all of them.
+            subnet.update_allocation_notification()
+        exclude_addresses.update(claimed)
+        while len(ipaddresses) < count:
+            requested_address = subnet.get_next_ip_for_allocation(
+                exclude_addresses=exclude_addresses
+            )
+            ipaddresses.append(
+                self._attempt_allocation_of_free_address(
+                    IPAddress(requested_address),
+                    alloc_type,
+                    user=user,
+                    subnet=subnet,
+                )
+            )
+            exclude_addresses.add(requested_address)
+        return ipaddresses
+
     def allocate_new(
         self,
         subnet=None,
@@ -288,12 +423,14 @@ class StaticIPAddressManager(Manager):
                 )
 
         if requested_address is None:
-            requested_address = subnet.get_next_ip_for_allocation(
-                exclude_addresses=exclude_addresses
-            )
-            return self._attempt_allocation_of_free_address(
-                requested_address, alloc_type, user=user, subnet=subnet
+            [ipaddress] = self.allocate_many(
+                subnet,
+                1,
+                alloc_type=alloc_type,
+                user=user,
+                exclude_addresses=exclude_addresses,
             )
+            return ipaddress
         else:
             requested_address = IPAddress(requested_address)
             # Circular imports.
@@ -3,9 +3,11 @@
 
 """Model for subnets."""
 
-__all__ = ["create_cidr", "get_allocated_ips", "Subnet"]
+__all__ = ["create_cidr", "free_range_cache", "get_allocated_ips", "Subnet"]
 
 from operator import attrgetter
+import threading
+import time
 from typing import Iterable, Optional
 
 from django.contrib.postgres.fields import ArrayField
@@ -1047,3 +1049,162 @@ def get_allocated_ips(subnets):
         mapping[subnet_id].append((ip, alloc_type))
     for subnet in subnets:
         yield subnet, mapping[subnet.id]
+
+
+class _FreeRanges:
+    """The free addresses of a subnet, as `[first, last]` integer pairs."""
+
+    def __init__(self, key, network, ranges, expires):
+        self.key = key
+        self.network = network
+        self.ranges = ranges
+        self.expires = expires
+        # Addresses handed out but not yet claimed or found to be in use.
+        self.pending = set()
+
+    def take(self, count, exclude):
+        # Hand out addresses from the smallest range first, so that larger
+        # ranges are kept for applications that need them; this is the same
+        # heuristic used by `Subnet.get_next_ip_for_allocation`.
+        addresses = []
+        for first, last in sorted(
+            self.ranges, key=lambda free: (free[1] - free[0], free[0])
+        ):
+            address = first
+            while address <= last and len(addresses) < count:
+                if address not in self.pending and address not in exclude:
+                    addresses.append(address)
+                address += 1
+            if len(addresses) == count:
+                break
+        self.pending.update(addresses)
+        return addresses
+
+    def remove(self, address):
+        for index, (first, last) in enumerate(self.ranges):
+            if first <= address <= last:
+                remaining = []
+                if first < address:
+                    remaining.append([first, address - 1])
+                if address < last:
+                    remaining.append([address + 1, last])
+                self.ranges[index : index + 1] = remaining
+                return
+
+
+class FreeRangeCache:
+    """Cache of the free address ranges of subnets.
+
+    Working out the free ranges of a subnet means looking at all of its IP
+    ranges, allocated addresses, observed neighbours, gateways and static
+    routes. When many addresses are allocated from one subnet in quick
+    succession, the ranges are worked out once and then kept up to date as
+    addresses are claimed in this process. When an address is released, the
+    ranges of its subnet are worked out again: it may still be the subnet's
+    gateway, a DNS server, a static route's gateway or an observed
+    neighbour. Changes made by other processes are picked up when the entry
+    expires, when the subnet runs out of addresses, or when an IP range or
+    static route changes.
+
+    The addresses handed out are only candidates: they must be claimed in
+    the database, which checks that they are still free.
+    """
+
+    ttl = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def take(self, subnet, count, exclude_addresses=None, refresh=False):
+        """Return up to `count` addresses that are probably free in `subnet`.
+
+        The addresses are not handed out again until passed to `resolve`.
+
+        :param exclude_addresses: Addresses that must not be returned.
+        :param refresh: Work out the free ranges again, even if they are
+            cached.
+        """
+        exclude = {
+            int(IPAddress(address))
+            for address in exclude_addresses or ()
+            if address
+        }
+        key = subnet.updated
+        with self._lock:
+            entry = self._entries.get(subnet.id)
+        if (
+            refresh
+            or entry is None
+            or entry.key != key
+            or entry.expires <= time.monotonic()
+        ):
+            free_ranges = subnet.get_ipranges_not_in_use(with_neighbours=True)
+            entry = _FreeRanges(
+                key,
+                subnet.get_ipnetwork(),
+                [[free.first, free.last] for free in free_ranges],
+                time.monotonic() + self.ttl,
+            )
+            with self._lock:
+                self._prune()
+                self._entries[subnet.id] = entry
+        with self._lock:
+            return [
+                str(IPAddress(address, entry.network.version))
+                for address in entry.take(count, exclude)
+            ]
+
+    def resolve(self, subnet, addresses):
+        """Record that `addresses` from `take` are no longer free.
+
+        They have either been claimed or found to be in use already.
+        """
+        with self._lock:
+            entry = self._entries.get(subnet.id)
+            if entry is not None:
+                for address in addresses:
+                    address = int(IPAddress(address))
+                    entry.pending.discard(address)
+                    entry.remove(address)
+
+    def address_used(self, address):
+        """Record that `address` has been assigned."""
+        self._update(address, _FreeRanges.remove)
+
+    def address_released(self, address):
+        """Record that `address` is no longer assigned.
+
+        It isn't necessarily free, so the free ranges it belongs to are
+        forgotten rather than updated.
+        """
+        address = IPAddress(address)
+        with self._lock:
+            for subnet_id, entry in list(self._entries.items()):
+                if address in entry.network:
+                    del self._entries[subnet_id]
+
+    def invalidate(self, subnet_id=None):
+        """Forget the free ranges of `subnet_id`, or of all subnets."""
+        with self._lock:
+            if subnet_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(subnet_id, None)
+
+    def _update(self, address, update):
+        address = IPAddress(address)
+        with self._lock:
+            for entry in self._entries.values():
+                if address in entry.network:
+                    update(entry, int(address))
+
+    def _prune(self):
+        now = time.monotonic()
+        for subnet_id, entry in list(self._entries.items()):
+            if entry.expires <= now:
+                del self._entries[subnet_id]
+
+
+# The free ranges of subnets, shared by all threads in this process.
+free_range_cache = FreeRangeCache()
@@ -15,6 +15,8 @@ from maasserver.models import event as event_module
 from maasserver.models import EventType
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.utils.orm import reload_object
+from maastesting.djangotestcase import count_queries
 from provisioningserver.events import EVENT_TYPES
 
 
@@ -137,6 +139,57 @@ class EventTest(MAASServerTestCase):
         )
         self.assertIsNotNone(Event.objects.get(node=region))
 
+    def test_bulk_create_node_events_creates_events(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        created = factory.make_date()
+        events = Event.objects.bulk_create_node_events(
+            (
+                node,
+                EVENT_TYPES.NODE_INSTALL_EVENT,
+                "action-%s" % node.hostname,
+                "description-%s" % node.hostname,
+                created,
+            )
+            for node in nodes
+        )
+        self.assertEqual(3, len(events))
+        for node in nodes:
+            event = Event.objects.get(node=node)
+            self.assertEqual(EVENT_TYPES.NODE_INSTALL_EVENT, event.type.name)
+            self.assertEqual(node.system_id, event.node_system_id)
+            self.assertEqual(node.hostname, event.node_hostname)
+            self.assertEqual("action-%s" % node.hostname, event.action)
+            self.assertEqual(
+                "description-%s" % node.hostname, event.description
+            )
+            self.assertEqual(created, event.created)
+            self.assertEqual(created, event.updated)
+
+    def test_bulk_create_node_events_defaults_created_to_now(self):
+        node = factory.make_Node()
+        [event] = Event.objects.bulk_create_node_events(
+            [(node, EVENT_TYPES.NODE_INSTALL_EVENT, "", "", None)]
+        )
+        self.assertIsNotNone(reload_object(event).created)
+
+    def test_bulk_create_node_events_registers_each_event_type_once(self):
+        node = factory.make_Node()
+        type_names = [
+            EVENT_TYPES.NODE_INSTALL_EVENT,
+            EVENT_TYPES.NODE_INSTALL_EVENT_FAILED,
+        ]
+        for type_name in type_names:
+            EventType.objects.register(type_name, "", logging.INFO)
+        events = [
+            (node, type_name, "", "", None)
+            for type_name in type_names
+            for _ in range(10)
+        ]
+        count, _ = count_queries(Event.objects.bulk_create_node_events, events)
+        # One query to look up each event type, one to insert the events.
+        self.assertEqual(len(type_names) + 1, count)
+        self.assertEqual(20, Event.objects.filter(node=node).count())
+
     def test_register_event_and_event_type_handles_integrity_errors(self):
         # It's possible that two calls to
         # register_event_and_event_type() could arrive at more-or-less
@@ -9,7 +9,7 @@ from collections import Iterable
 import datetime
 import random
 import threading
-from unittest.mock import call
+from unittest.mock import ANY, call, Mock
 
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
@@ -3701,6 +3701,37 @@ class TestClaimAutoIPs(MAASTransactionServerTestCase):
             IPAddress(auto_ips[0].ip) + 1, IPAddress(auto_ips[1].ip)
         )
 
+    def test__allocates_addresses_from_the_same_subnet_together(self):
+        with transaction.atomic():
+            interface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
+            subnet = factory.make_ipv4_Subnet_with_IPRanges(
+                vlan=interface.vlan
+            )
+            for _ in range(2):
+                factory.make_StaticIPAddress(
+                    alloc_type=IPADDRESS_TYPE.AUTO,
+                    ip="",
+                    subnet=subnet,
+                    interface=interface,
+                )
+        allocate_many = self.patch(
+            StaticIPAddress.objects,
+            "allocate_many",
+            Mock(wraps=StaticIPAddress.objects.allocate_many),
+        )
+        with transaction.atomic():
+            observed = interface.claim_auto_ips()
+        self.assertEqual(2, len(observed))
+        self.assertThat(
+            allocate_many,
+            MockCalledOnceWith(
+                subnet,
+                2,
+                alloc_type=IPADDRESS_TYPE.AUTO,
+                exclude_addresses=ANY,
+            ),
+        )
+
     def test__claims_all_auto_ip_addresses_with_temp_expires_on(self):
         with transaction.atomic():
             interface = factory.make_Interface(INTERFACE_TYPE.PHYSICAL)
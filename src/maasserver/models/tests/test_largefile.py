@@ -5,7 +5,9 @@
 
 __all__ = []
 
+import hashlib
 from io import BytesIO
+import os
 from random import randint
 from unittest.mock import ANY, call
 
@@ -14,6 +16,7 @@ from django.db import transaction
 import psycopg2
 from testtools.matchers import (
     Equals,
+    GreaterThan,
     HasLength,
     Is,
     MatchesListwise,
@@ -21,16 +24,18 @@ from testtools.matchers import (
 )
 from twisted.internet.task import Clock
 
+from maasserver.contentstore import get_filesystem_content_store
 from maasserver.fields import LargeObjectFile
 from maasserver.models import largefile as largefile_module
 from maasserver.models import signals
 from maasserver.models.largefile import LargeFile
+from maasserver.testing.config import RegionConfigurationFixture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASServerTestCase,
     MAASTransactionServerTestCase,
 )
-from maasserver.utils.orm import post_commit_hooks
+from maasserver.utils.orm import post_commit_hooks, reload_object
 from maastesting.matchers import MockCalledOnceWith, MockCallsMatch
 
 
@@ -63,6 +68,43 @@ class TestLargeFileManager(MAASServerTestCase):
         self.assertEqual(content, written_content)
         self.assertEqual(len(content), largefile.size)
 
+    def test_create_file_stores_content_in_database_by_default(self):
+        self.useFixture(RegionConfigurationFixture())
+        largefile = LargeFile.objects.create_file(
+            factory.make_name("sha256"), 1024
+        )
+        self.assertFalse(largefile.stored_in_filesystem)
+        self.assertThat(largefile.content.oid, GreaterThan(0))
+        self.assertEqual(0, largefile.size)
+        self.assertEqual(1024, largefile.total_size)
+
+    def test_create_file_stores_content_in_filesystem(self):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_storage="filesystem")
+        )
+        largefile = LargeFile.objects.create_file(
+            factory.make_name("sha256"), 1024
+        )
+        self.assertTrue(largefile.stored_in_filesystem)
+        self.assertEqual(1024, reload_object(largefile).total_size)
+
+    def test_get_or_create_file_from_content_stores_in_filesystem(self):
+        self.useFixture(
+            RegionConfigurationFixture(
+                boot_resources_storage="filesystem",
+                boot_resources_path=self.make_dir(),
+            )
+        )
+        content = factory.make_bytes(1024)
+        largefile = LargeFile.objects.get_or_create_file_from_content(
+            BytesIO(content)
+        )
+        self.assertTrue(largefile.stored_in_filesystem)
+        with largefile.open_content() as stream:
+            self.assertEqual(content, stream.read())
+        self.assertEqual(len(content), largefile.size)
+        self.assertTrue(largefile.complete)
+
 
 class TestLargeFile(MAASServerTestCase):
     def test_content(self):
@@ -122,6 +164,14 @@ class TestLargeFile(MAASServerTestCase):
         largefile = factory.make_LargeFile()
         self.assertTrue(largefile.valid)
 
+    def test_open_content_reads_and_appends_in_database(self):
+        content = factory.make_bytes(size=1024)
+        largefile = factory.make_LargeFile(content[:512], size=1024)
+        with largefile.open_content("ab") as stream:
+            stream.write(content[512:])
+        with largefile.open_content() as stream:
+            self.assertEqual(content, stream.read())
+
     def test_delete_does_nothing_if_linked(self):
         largefile = factory.make_LargeFile()
         resource = factory.make_BootResource()
@@ -154,6 +204,59 @@ class TestLargeFile(MAASServerTestCase):
         )
 
 
+class TestLargeFileInFilesystem(MAASServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_path=self.make_dir())
+        )
+
+    def make_empty_LargeFile(self, content):
+        return LargeFile.objects.create(
+            sha256=hashlib.sha256(content).hexdigest(),
+            total_size=len(content),
+            content=None,
+        )
+
+    def test_open_content_reads_and_appends(self):
+        content = factory.make_bytes(size=1024)
+        largefile = self.make_empty_LargeFile(content)
+        self.assertTrue(largefile.stored_in_filesystem)
+        for start in (0, 512):
+            with largefile.open_content("ab") as stream:
+                stream.write(content[start : start + 512])
+        largefile.size = 1024
+        # The content can only be read once it has been verified.
+        self.assertRaises(FileNotFoundError, largefile.open_content)
+        self.assertTrue(largefile.valid)
+        with largefile.open_content() as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_valid_returns_False_when_content_doesnt_have_equal_sha256(self):
+        largefile = self.make_empty_LargeFile(factory.make_bytes(size=512))
+        with largefile.open_content("ab") as stream:
+            stream.write(factory.make_bytes(size=512))
+        largefile.size = 512
+        self.assertFalse(largefile.valid)
+
+    def test_valid_returns_True_when_content_has_equal_sha256(self):
+        largefile = factory.make_LargeFile(filesystem=True)
+        self.assertTrue(largefile.valid)
+
+    def test_valid_returns_False_when_complete_is_False(self):
+        largefile = factory.make_LargeFile(
+            factory.make_bytes(size=512), size=1024, filesystem=True
+        )
+        self.assertFalse(largefile.valid)
+
+    def test_deletes_content_after_commit(self):
+        largefile = factory.make_LargeFile(filesystem=True)
+        path = get_filesystem_content_store().get_path(largefile.sha256)
+        with post_commit_hooks:
+            largefile.delete()
+        self.assertFalse(os.path.exists(path))
+
+
 class TestDeleteLargeObjectContentLater(MAASTransactionServerTestCase):
     def test__schedules_unlink(self):
         # We're going to capture the delayed call that
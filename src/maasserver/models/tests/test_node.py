@@ -182,6 +182,7 @@ from metadataserver.enum import (
     SCRIPT_TYPE,
 )
 from metadataserver.models import (
+    NodeCurtinUserData,
     NodeKey,
     NodeUserData,
     ScriptResult,
@@ -8240,6 +8241,17 @@ class TestNode_Start(MAASTransactionServerTestCase):
         node.start(user, user_data=None)
         self.assertFalse(NodeUserData.objects.filter(node=node).exists())
 
+    def test__resets_curtin_user_data(self):
+        user = factory.make_User()
+        node = self.make_acquired_node_with_interface(
+            user, power_type="manual"
+        )
+        NodeCurtinUserData.objects.set_user_data(
+            node, factory.make_simple_http_url(), factory.make_string()
+        )
+        node.start(user)
+        self.assertFalse(NodeCurtinUserData.objects.filter(node=node).exists())
+
     def test__sets_to_deploying(self):
         user = factory.make_User()
         node = self.make_acquired_node_with_interface(
@@ -11,7 +11,7 @@ import threading
 from unittest.mock import sentinel
 
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from netaddr import IPAddress
 from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION
 from testtools import ExpectedException
@@ -47,7 +47,8 @@ from maasserver.models.staticipaddress import (
     HostnameIPMapping,
     StaticIPAddress,
 )
-from maasserver.models.subnet import Subnet
+from maasserver.models.subnet import free_range_cache, Subnet
+from maasserver.models.timestampedmodel import now
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASServerTestCase,
@@ -57,6 +58,7 @@ from maasserver.utils import orm
 from maasserver.utils.dns import get_ip_based_hostname
 from maasserver.utils.orm import reload_object, transactional
 from maasserver.websockets.base import dehydrate_datetime
+from maastesting.djangotestcase import count_queries
 
 
 class TestStaticIPAddressManager(MAASServerTestCase):
@@ -320,6 +322,8 @@ class TestStaticIPAddressManager(MAASServerTestCase):
         )
 
     def test_allocate_new_requests_retry_when_free_address_taken(self):
+        # Without cached free ranges addresses are allocated one at a time.
+        self.patch(free_range_cache, "take").return_value = []
         set_ip_address = self.patch(StaticIPAddress, "set_ip_address")
         set_ip_address.side_effect = orm.make_unique_violation()
         with orm.retry_context:
@@ -336,6 +340,7 @@ class TestStaticIPAddressManager(MAASServerTestCase):
             )
 
     def test_allocate_new_propagates_other_integrity_errors(self):
+        self.patch(free_range_cache, "take").return_value = []
         set_ip_address = self.patch(StaticIPAddress, "set_ip_address")
         set_ip_address.side_effect = orm.make_unique_violation()
         set_ip_address.side_effect.__cause__.pgcode = FOREIGN_KEY_VIOLATION
@@ -350,6 +355,144 @@ class TestStaticIPAddressManager(MAASServerTestCase):
             self.assertThat(orm.retry_context.stack._cm_pending, HasLength(0))
 
 
+class TestStaticIPAddressManagerAllocateMany(MAASServerTestCase):
+    """Tests for `StaticIPAddressManager.allocate_many`."""
+
+    def make_subnet(self):
+        return factory.make_Subnet(
+            cidr="10.0.0.0/24",
+            gateway_ip="10.0.0.1",
+            dns_servers=[],
+            managed=True,
+        )
+
+    def test_allocates_consecutive_addresses(self):
+        subnet = self.make_subnet()
+        ipaddresses = StaticIPAddress.objects.allocate_many(subnet, 3)
+        self.assertEqual(
+            ["10.0.0.2", "10.0.0.3", "10.0.0.4"],
+            [ipaddress.ip for ipaddress in ipaddresses],
+        )
+        self.assertThat(
+            ipaddresses,
+            AllMatch(
+                AfterPreprocessing(
+                    lambda ipaddress: (ipaddress.alloc_type, ipaddress.subnet),
+                    Equals((IPADDRESS_TYPE.AUTO, subnet)),
+                )
+            ),
+        )
+
+    def test_sets_user(self):
+        subnet = self.make_subnet()
+        user = factory.make_User()
+        ipaddresses = StaticIPAddress.objects.allocate_many(
+            subnet, 2, alloc_type=IPADDRESS_TYPE.USER_RESERVED, user=user
+        )
+        self.assertEqual([user, user], [sip.user for sip in ipaddresses])
+
+    def test_verifies_alloc_type(self):
+        self.assertRaises(
+            ValueError,
+            StaticIPAddress.objects.allocate_many,
+            sentinel.subnet,
+            1,
+            alloc_type=IPADDRESS_TYPE.DHCP,
+        )
+
+    def test_excludes_addresses(self):
+        subnet = self.make_subnet()
+        [ipaddress] = StaticIPAddress.objects.allocate_many(
+            subnet, 1, exclude_addresses=["10.0.0.2", IPAddress("10.0.0.3")]
+        )
+        self.assertEqual("10.0.0.4", ipaddress.ip)
+
+    def test_skips_addresses_taken_by_another_process(self):
+        subnet = self.make_subnet()
+        StaticIPAddress.objects.allocate_many(subnet, 1)
+        # Rows created in bulk bypass the signals that keep the cached free
+        # ranges of this process up to date.
+        StaticIPAddress.objects.bulk_create(
+            [
+                StaticIPAddress(
+                    ip="10.0.0.3",
+                    alloc_type=IPADDRESS_TYPE.STICKY,
+                    subnet=subnet,
+                    created=now(),
+                    updated=now(),
+                )
+            ]
+        )
+        [ipaddress] = StaticIPAddress.objects.allocate_many(subnet, 1)
+        self.assertEqual("10.0.0.4", ipaddress.ip)
+
+    def test_skips_addresses_in_new_dynamic_range(self):
+        subnet = self.make_subnet()
+        StaticIPAddress.objects.allocate_many(subnet, 1)
+        # Keep the cache from hearing about the new range.
+        self.patch(free_range_cache, "invalidate")
+        factory.make_IPRange(
+            subnet, "10.0.0.3", "10.0.0.5", alloc_type=IPRANGE_TYPE.DYNAMIC
+        )
+        [ipaddress] = StaticIPAddress.objects.allocate_many(subnet, 1)
+        self.assertEqual("10.0.0.6", ipaddress.ip)
+
+    def test_skips_stale_reserved_addresses(self):
+        subnet = self.make_subnet()
+        subnet.dns_servers = ["10.0.0.53"]
+        subnet.save()
+        factory.make_StaticRoute(source=subnet, gateway_ip="10.0.0.254")
+        # Free ranges worked out before any of these were reserved.
+        self.patch(free_range_cache, "take").return_value = [
+            "10.0.0.1",
+            "10.0.0.53",
+            "10.0.0.254",
+            "10.0.0.9",
+        ]
+        [ipaddress] = StaticIPAddress.objects.allocate_many(subnet, 1)
+        self.assertEqual("10.0.0.9", ipaddress.ip)
+
+    def test_reuses_released_addresses(self):
+        subnet = self.make_subnet()
+        ipaddresses = StaticIPAddress.objects.allocate_many(subnet, 2)
+        # The cache only hears of the release once it's committed.
+        self.patch(transaction, "on_commit").side_effect = lambda func: func()
+        ipaddresses[0].delete()
+        [ipaddress] = StaticIPAddress.objects.allocate_many(subnet, 1)
+        self.assertEqual("10.0.0.2", ipaddress.ip)
+
+    def test_falls_back_to_allocating_one_at_a_time(self):
+        subnet = self.make_subnet()
+        self.patch(free_range_cache, "take").return_value = []
+        ipaddresses = StaticIPAddress.objects.allocate_many(subnet, 2)
+        self.assertEqual(
+            ["10.0.0.2", "10.0.0.3"], [sip.ip for sip in ipaddresses]
+        )
+
+    def test_raises_when_addresses_exhausted(self):
+        subnet = self.make_subnet()
+        factory.make_IPRange(
+            subnet, "10.0.0.2", "10.0.0.253", alloc_type=IPRANGE_TYPE.RESERVED
+        )
+        self.assertRaises(
+            StaticIPAddressExhaustion,
+            StaticIPAddress.objects.allocate_many,
+            subnet,
+            2,
+        )
+
+    def test_claims_in_one_query(self):
+        subnet = self.make_subnet()
+        StaticIPAddress.objects.allocate_many(subnet, 1)
+        count_one, _ = count_queries(
+            StaticIPAddress.objects.allocate_many, subnet, 1
+        )
+        count_many, _ = count_queries(
+            StaticIPAddress.objects.allocate_many, subnet, 10
+        )
+        self.assertEqual(count_one, count_many)
+
+
 class TestStaticIPAddressManagerTransactional(MAASTransactionServerTestCase):
     """Transactional tests for `StaticIPAddressManager."""
 
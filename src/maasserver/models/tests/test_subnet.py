@@ -33,7 +33,13 @@ from maasserver.enum import (
 )
 from maasserver.exceptions import StaticIPAddressExhaustion
 from maasserver.models import Config, Notification, Space
-from maasserver.models.subnet import create_cidr, get_allocated_ips, Subnet
+from maasserver.models import subnet as subnet_module
+from maasserver.models.subnet import (
+    create_cidr,
+    FreeRangeCache,
+    get_allocated_ips,
+    Subnet,
+)
 from maasserver.models.timestampedmodel import now
 from maasserver.permissions import NodePermission
 from maasserver.testing.factory import factory, RANDOM, RANDOM_OR_NONE
@@ -1854,3 +1860,122 @@ class TestGetAllocatedIps(MAASServerTestCase):
             [(ip1.ip, ip1.alloc_type), (ip2.ip, ip2.alloc_type)], ips
         )
         self.assertEqual(0, queries)
+
+
+class TestFreeRangeCache(MAASServerTestCase):
+    """Tests for `FreeRangeCache`."""
+
+    def make_subnet(self):
+        # Addresses 10.0.0.2 to 10.0.0.6 are free.
+        return factory.make_Subnet(
+            cidr="10.0.0.0/29",
+            gateway_ip="10.0.0.1",
+            dns_servers=[],
+            managed=True,
+        )
+
+    def test_take_returns_free_addresses(self):
+        cache = FreeRangeCache()
+        self.assertEqual(
+            ["10.0.0.2", "10.0.0.3"], cache.take(self.make_subnet(), 2)
+        )
+
+    def test_take_prefers_smallest_range(self):
+        subnet = self.make_subnet()
+        factory.make_StaticIPAddress(
+            "10.0.0.5", alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet
+        )
+        cache = FreeRangeCache()
+        self.assertEqual(["10.0.0.6", "10.0.0.2"], cache.take(subnet, 2))
+
+    def test_take_does_not_return_pending_addresses(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 2)
+        self.assertEqual(["10.0.0.4"], cache.take(subnet, 1))
+
+    def test_take_skips_excluded_addresses(self):
+        cache = FreeRangeCache()
+        self.assertEqual(
+            ["10.0.0.3"],
+            cache.take(self.make_subnet(), 1, exclude_addresses=["10.0.0.2"]),
+        )
+
+    def test_take_returns_fewer_when_exhausted(self):
+        cache = FreeRangeCache()
+        self.assertThat(cache.take(self.make_subnet(), 10), HasLength(5))
+
+    def test_take_works_out_free_ranges_once(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 1)
+        count, _ = count_queries(cache.take, subnet, 1)
+        self.assertEqual(0, count)
+
+    def test_take_refresh_works_out_free_ranges_again(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 5)
+        self.assertEqual(["10.0.0.2"], cache.take(subnet, 1, refresh=True))
+
+    def test_take_works_out_free_ranges_again_when_expired(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 5)
+        monotonic = self.patch(subnet_module.time, "monotonic")
+        monotonic.return_value = 1e12
+        self.assertEqual(["10.0.0.2"], cache.take(subnet, 1))
+
+    def test_take_works_out_free_ranges_again_when_subnet_changes(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 5)
+        subnet.gateway_ip = "10.0.0.2"
+        subnet.save()
+        self.assertEqual(["10.0.0.1"], cache.take(subnet, 1))
+
+    def test_resolve_removes_addresses(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.resolve(subnet, cache.take(subnet, 2))
+        self.assertEqual(["10.0.0.4"], cache.take(subnet, 1))
+
+    def test_address_used_removes_address(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 0)
+        cache.address_used("10.0.0.2")
+        self.assertEqual(["10.0.0.3"], cache.take(subnet, 1))
+
+    def test_address_released_forgets_subnet(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.resolve(subnet, cache.take(subnet, 5))
+        cache.address_released("10.0.0.4")
+        self.assertEqual(["10.0.0.2"], cache.take(subnet, 1))
+
+    def test_address_released_does_not_free_reserved_address(self):
+        subnet = self.make_subnet()
+        ip = factory.make_StaticIPAddress(
+            "10.0.0.1", alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet
+        )
+        cache = FreeRangeCache()
+        cache.take(subnet, 0)
+        ip.delete()
+        cache.address_released("10.0.0.1")
+        # 10.0.0.1 is still the subnet's gateway.
+        self.assertNotIn("10.0.0.1", cache.take(subnet, 5))
+
+    def test_invalidate_forgets_subnet(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 5)
+        cache.invalidate(subnet.id)
+        self.assertEqual(["10.0.0.2"], cache.take(subnet, 1))
+
+    def test_invalidate_forgets_all_subnets(self):
+        subnet = self.make_subnet()
+        cache = FreeRangeCache()
+        cache.take(subnet, 5)
+        cache.invalidate()
+        self.assertEqual(["10.0.0.2"], cache.take(subnet, 1))
@@ -17,9 +17,11 @@ __all__ = [
 ]
 
 from collections import namedtuple
+import copy
 import json
 import os.path
 from pipes import quote
+import time
 from urllib.parse import urlencode, urlparse
 
 from crochet import TimeoutError
@@ -714,6 +716,87 @@ def compose_filename(elements):
     return "_".join(elements)
 
 
+class PreseedTemplateCache:
+    """Process-wide cache of preseed template files.
+
+    Template locations are listed, and templates read and compiled, once;
+    they are checked against the modification time of the location or file
+    on each use. Directories and files modified within `racy_interval`
+    seconds are not cached, as they could be modified again without their
+    modification time changing.
+    """
+
+    racy_interval = 2
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget all cached locations and templates."""
+        # Maps locations to (mtime, filenames).
+        self._locations = {}
+        # Maps file paths to (stat key, content, compiled template).
+        self._templates = {}
+
+    def _is_racy(self, stat):
+        return time.time() - stat.st_mtime < self.racy_interval
+
+    def list_location(self, location):
+        """Return the filenames in the template `location`."""
+        try:
+            stat = os.stat(location)
+        except OSError:
+            return frozenset()
+        cached = self._locations.get(location)
+        if cached is not None and cached[0] == stat.st_mtime_ns:
+            return cached[1]
+        try:
+            filenames = frozenset(os.listdir(location))
+        except OSError:
+            return frozenset()
+        if not self._is_racy(stat):
+            self._locations[location] = stat.st_mtime_ns, filenames
+        return filenames
+
+    def read(self, filepath):
+        """Return the content of the template at `filepath`.
+
+        :raise OSError: If the file can't be read.
+        """
+        stat = os.stat(filepath)
+        key = stat.st_mtime_ns, stat.st_size, stat.st_ino
+        cached = self._templates.get(filepath)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(filepath, "r", encoding="utf-8") as stream:
+            content = stream.read()
+        if not self._is_racy(stat):
+            self._templates[filepath] = key, content, None
+        return content
+
+    def compile(self, filepath, content, get_template):
+        """Return a `PreseedTemplate` of `content`, read from `filepath`.
+
+        Parsing is done once for content returned by `read`; each call
+        returns a copy, which looks up other templates with `get_template`.
+        """
+        cached = self._templates.get(filepath)
+        if cached is None or cached[1] is not content:
+            return PreseedTemplate(
+                content, name=filepath, get_template=get_template
+            )
+        key, _, template = cached
+        if template is None:
+            template = PreseedTemplate(content, name=filepath)
+            self._templates[filepath] = key, content, template
+        template = copy.copy(template)
+        template.get_template = get_template
+        return template
+
+
+preseed_template_cache = PreseedTemplateCache()
+
+
 def get_preseed_template(filenames):
     """Get the path and content for the first template found.
 
@@ -722,11 +805,14 @@ def get_preseed_template(filenames):
     assert not isinstance(filenames, (bytes, str))
     assert all(isinstance(filename, str) for filename in filenames)
     for location in settings.PRESEED_TEMPLATE_LOCATIONS:
+        existing = preseed_template_cache.list_location(location)
         for filename in filenames:
+            # Templates in subdirectories aren't listed; try them anyway.
+            if os.sep not in filename and filename not in existing:
+                continue
             filepath = os.path.join(location, filename)
             try:
-                with open(filepath, "r", encoding="utf-8") as stream:
-                    content = stream.read()
+                content = preseed_template_cache.read(filepath)
             except IOError:
                 pass  # Ignore.
             else:
@@ -788,9 +874,7 @@ def load_preseed_template(node, prefix, osystem="", release=""):
             raise TemplateNotFoundError(name)
         # This is where the closure happens: pass `get_template` when
         # instanciating PreseedTemplate.
-        return PreseedTemplate(
-            content, name=filepath, get_template=get_template
-        )
+        return preseed_template_cache.compile(filepath, content, get_template)
 
     return get_template(prefix, None, default=True)
 
@@ -16,7 +16,7 @@ from maasserver.stats import (
     get_kvm_pods_stats,
     get_maas_stats,
     get_machines_by_architecture,
-    get_subnets_utilisation_stats,
+    subnets_utilisation_stats,
 )
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
@@ -200,8 +200,9 @@ def update_prometheus_stats(metrics: PrometheusMetrics):
                 labels={"arches": arch},
             )
 
-    # Update metrics for subnets
-    for cidr, stats in get_subnets_utilisation_stats().items():
+    # Update metrics for subnets, from the snapshot kept up to date in the
+    # background.
+    for cidr, stats in subnets_utilisation_stats.get().items():
         for status in ("available", "unavailable"):
             metrics.update(
                 "maas_net_subnet_ip_count",
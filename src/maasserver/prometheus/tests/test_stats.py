@@ -22,6 +22,7 @@ from maasserver.prometheus.stats import (
     STATS_DEFINITIONS,
     update_prometheus_stats,
 )
+from maasserver.stats import SubnetsUtilisationStatsCache
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import (
     MAASServerTestCase,
@@ -180,7 +181,7 @@ class TestPrometheus(MAASServerTestCase):
                 "unavailable": 0,
             },
         }
-        mock_subnet_stats = self.patch(stats, "get_subnets_utilisation_stats")
+        mock_subnet_stats = self.patch(stats.subnets_utilisation_stats, "get")
         mock_subnet_stats.return_value = subnet_stats
         metrics = create_metrics(
             STATS_DEFINITIONS, registry=prometheus_client.CollectorRegistry()
@@ -205,6 +206,9 @@ class TestPrometheus(MAASServerTestCase):
         )
 
     def test_subnet_stats(self):
+        self.patch(
+            stats, "subnets_utilisation_stats", SubnetsUtilisationStatsCache()
+        )
         subnet = factory.make_Subnet(cidr="1.2.0.0/16", gateway_ip="1.2.0.254")
         factory.make_IPRange(
             subnet=subnet,
@@ -10,7 +10,10 @@ DNS:
     The regiond process listens for messages from Postgres on channel
     'sys_dns'. Any time a message is recieved on that channel the DNS is marked
     as requiring an update. Once marked for update the DNS configuration is
-    updated and bind9 is told to reload.
+    updated and bind9 is told to reload. After the first update only the zones
+    affected by the DNS publications since the last update are regenerated
+    and reloaded, unless the previous update failed or the connection to the
+    database was lost.
 
 Proxy:
     The regiond process listens for messages from Postgres on channel
@@ -36,7 +39,10 @@ from twisted.internet.task import LoopingCall
 from twisted.names.client import Resolver
 
 from maasserver import locks
-from maasserver.dns.config import dns_update_all_zones
+from maasserver.dns.config import (
+    dns_update_all_zones,
+    dns_update_changed_zones,
+)
 from maasserver.macaroon_auth import get_auth_info
 from maasserver.models.config import Config
 from maasserver.models.dnspublication import DNSPublication
@@ -87,6 +93,7 @@ class RegionControllerService(Service):
         self.processing.clock = self.clock
         self.processingDefer = None
         self.needsDNSUpdate = False
+        self.needsFullDNSUpdate = True
         self.needsProxyUpdate = False
         self.needsRBACUpdate = False
         self.postgresListener = postgresListener
@@ -127,6 +134,8 @@ class RegionControllerService(Service):
             return d
 
     def markAllForUpdate(self):
+        # Changes may have been missed while disconnected from the database.
+        self.needsFullDNSUpdate = True
         self.markDNSForUpdate(None, None)
         self.markProxyForUpdate(None, None)
         self.markRBACForUpdate(None, None)
@@ -175,12 +184,25 @@ class RegionControllerService(Service):
             if delay:
                 return pause(delay)
 
+        def _onDNSFailure(failure):
+            """Rebuild all the zones on the next update."""
+            self.needsFullDNSUpdate = True
+            return failure
+
         defers = []
         if self.needsDNSUpdate:
             self.needsDNSUpdate = False
-            d = deferToDatabase(transactional(dns_update_all_zones))
+            if self.needsFullDNSUpdate or self.previousSerial is None:
+                self.needsFullDNSUpdate = False
+                d = deferToDatabase(transactional(dns_update_all_zones))
+            else:
+                d = deferToDatabase(
+                    transactional(dns_update_changed_zones),
+                    self.previousSerial,
+                )
             d.addCallback(self._checkSerial)
             d.addCallback(self._logDNSReload)
+            d.addErrback(_onDNSFailure)
             # Order here matters, first needsDNSUpdate is set then pass the
             # failure onto `_onDNSReloadFailure` to do the correct thing
             # with the DNS server.
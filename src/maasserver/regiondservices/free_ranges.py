@@ -0,0 +1,44 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service that keeps the cached free ranges of subnets current."""
+
+__all__ = ["FreeRangeCacheService"]
+
+from twisted.application.service import Service
+
+from maasserver.models.subnet import free_range_cache
+
+# Changes to these make the free ranges of a subnet out of date. Their
+# notifications do not say which subnet was affected, so all the cached
+# ranges are forgotten; they change rarely compared to addresses.
+# Address changes are not listened for: they are checked when claimed.
+CHANNELS = ("iprange", "staticroute")
+
+
+class FreeRangeCacheService(Service):
+    """Forget the cached free ranges of subnets when they change elsewhere.
+
+    Addresses claimed and released by this process are tracked as it goes,
+    but changes to IP ranges and static routes made by any region process
+    are only heard of through the database.
+    """
+
+    def __init__(self, postgresListener=None):
+        super().__init__()
+        self.listener = postgresListener
+
+    def startService(self):
+        super().startService()
+        if self.listener is not None:
+            for channel in CHANNELS:
+                self.listener.register(channel, self.invalidate)
+
+    def stopService(self):
+        if self.listener is not None:
+            for channel in CHANNELS:
+                self.listener.unregister(channel, self.invalidate)
+        return super().stopService()
+
+    def invalidate(self, action=None, obj_id=None):
+        free_range_cache.invalidate()
@@ -0,0 +1,46 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the free range cache service."""
+
+__all__ = []
+
+from unittest.mock import call, Mock
+
+from maasserver.regiondservices import free_ranges
+from maasserver.regiondservices.free_ranges import FreeRangeCacheService
+from maastesting.matchers import MockCalledOnceWith, MockCallsMatch
+from maastesting.testcase import MAASTestCase
+
+
+class TestFreeRangeCacheService(MAASTestCase):
+    def test_registers_and_unregisters_channels(self):
+        listener = Mock()
+        service = FreeRangeCacheService(listener)
+        service.startService()
+        self.assertThat(
+            listener.register,
+            MockCallsMatch(
+                call("iprange", service.invalidate),
+                call("staticroute", service.invalidate),
+            ),
+        )
+        service.stopService()
+        self.assertThat(
+            listener.unregister,
+            MockCallsMatch(
+                call("iprange", service.invalidate),
+                call("staticroute", service.invalidate),
+            ),
+        )
+
+    def test_runs_without_listener(self):
+        service = FreeRangeCacheService()
+        service.startService()
+        service.stopService()
+
+    def test_invalidate_forgets_all_free_ranges(self):
+        invalidate = self.patch(free_ranges.free_range_cache, "invalidate")
+        service = FreeRangeCacheService()
+        service.invalidate("update", 1)
+        self.assertThat(invalidate, MockCalledOnceWith())
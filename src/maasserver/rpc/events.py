@@ -3,9 +3,20 @@
 
 """RPC helpers relating to events."""
 
-__all__ = ["register_event_type", "send_event", "send_event_mac_address"]
+__all__ = [
+    "register_event_type",
+    "send_event",
+    "send_event_mac_address",
+    "send_events",
+]
+
+from datetime import datetime
+
+from django.db.models import F
+from netaddr import AddrFormatError, EUI, IPAddress, mac_unix_expanded
 
 from maasserver.enum import INTERFACE_TYPE
+from maasserver.fields import MAC
 from maasserver.models import Event, EventType, Interface, Node
 from maasserver.utils.orm import transactional
 from provisioningserver.logger import LegacyLogger
@@ -129,3 +140,111 @@ def send_event_ip_address(ip_address, type_name, description, timestamp):
             description=description,
             created=timestamp,
         )
+
+
+def _get_event_nodes(events):
+    """Find the nodes for `events`, as sent with `SendEvents`.
+
+    :return: A function that returns the node for an event, or None.
+    """
+    node_fields = ("id", "system_id", "hostname")
+    system_ids, macs, ips = set(), set(), set()
+    for event in events:
+        if event.get("system_id") is not None:
+            system_ids.add(event["system_id"])
+        elif event.get("mac_address") is not None:
+            try:
+                mac = EUI(event["mac_address"], dialect=mac_unix_expanded)
+            except AddrFormatError:
+                continue
+            event["mac_address"] = str(mac)
+            macs.add(event["mac_address"])
+        elif event.get("ip_address") is not None:
+            try:
+                ip = IPAddress(event["ip_address"])
+            except (AddrFormatError, ValueError):
+                continue
+            event["ip_address"] = str(ip)
+            ips.add(event["ip_address"])
+
+    nodes_by_system_id = {
+        node.system_id: node
+        for node in Node.objects.filter(system_id__in=system_ids).only(
+            *node_fields
+        )
+    }
+    nodes_by_mac = {
+        MAC(node.event_mac).get_raw(): node
+        for node in Node.objects.filter(
+            interface__type=INTERFACE_TYPE.PHYSICAL,
+            interface__mac_address__in=macs,
+        )
+        .annotate(event_mac=F("interface__mac_address"))
+        .only(*node_fields)
+    }
+    nodes_by_ip = {}
+    for node in (
+        Node.objects.filter(interface__ip_addresses__ip__in=ips)
+        .annotate(event_ip=F("interface__ip_addresses__ip"))
+        .only(*node_fields)
+        .order_by("id")
+    ):
+        nodes_by_ip.setdefault(node.event_ip, node)
+
+    def get_node(event):
+        if event.get("system_id") is not None:
+            return nodes_by_system_id.get(event["system_id"])
+        elif event.get("mac_address") is not None:
+            return nodes_by_mac.get(event["mac_address"])
+        elif event.get("ip_address") is not None:
+            return nodes_by_ip.get(event["ip_address"])
+        else:
+            return None
+
+    return get_node
+
+
+@synchronous
+@transactional
+def send_events(events):
+    """Send events in bulk.
+
+    for :py:class:`~provisioningserver.rpc.region.SendEvents`.
+
+    The event types and the nodes of all the events are looked up with a
+    query or so each, then the events are inserted together. Events for
+    unknown nodes or event types are dropped; the cluster may send events
+    for nodes that have not yet enlisted.
+    """
+    event_types = {
+        event_type.name: event_type
+        for event_type in EventType.objects.filter(
+            name__in={event["type_name"] for event in events}
+        )
+    }
+    get_node = _get_event_nodes(events)
+    new_events = []
+    for event in events:
+        event_type = event_types.get(event["type_name"])
+        node = get_node(event)
+        if event_type is None or node is None:
+            log.debug(
+                "Event '{type}: {description}' sent for non-existent "
+                "node or event type.",
+                type=event["type_name"],
+                description=event["description"],
+            )
+            continue
+        created = datetime.fromtimestamp(event["timestamp"])
+        new_events.append(
+            Event(
+                type=event_type,
+                node=node,
+                node_system_id=node.system_id,
+                node_hostname=node.hostname,
+                description=event["description"],
+                created=created,
+                updated=created,
+            )
+        )
+    Event.objects.bulk_create(new_events)
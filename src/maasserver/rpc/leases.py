@@ -3,22 +3,24 @@
 
 """RPC helpers relating to DHCP leases."""
 
-__all__ = ["update_lease"]
+__all__ = ["update_lease", "update_leases"]
 
+from collections import defaultdict
 from datetime import datetime
 
-from netaddr import IPAddress
+from netaddr import AddrFormatError, EUI, IPAddress
 
-from maasserver.enum import IPADDRESS_FAMILY, IPADDRESS_TYPE
+from maasserver.enum import IPADDRESS_FAMILY, IPADDRESS_TYPE, IPRANGE_TYPE
 from maasserver.models import (
     DNSResource,
     Interface,
+    IPRange,
     Node,
     StaticIPAddress,
     Subnet,
     UnknownInterface,
 )
-from maasserver.utils.orm import transactional
+from maasserver.utils.orm import is_retryable_failure, savepoint, transactional
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.network import coerce_to_valid_hostname
 from provisioningserver.utils.twisted import synchronous
@@ -39,6 +41,144 @@ def _is_valid_hostname(hostname):
     )
 
 
+def _parse_ip(ip):
+    try:
+        ip = IPAddress(ip)
+    except (AddrFormatError, TypeError, ValueError):
+        return None
+    if ip.is_ipv4_mapped():
+        ip = ip.ipv4()
+    return ip
+
+
+def _parse_mac(mac):
+    try:
+        return EUI(str(mac))
+    except (AddrFormatError, TypeError, ValueError):
+        return None
+
+
+# Does what `Subnet.objects.find_best_subnet_for_ip_query` does, but for many
+# addresses at once.
+_find_best_subnets_for_ips_query = """
+    SELECT DISTINCT ON (ip) subnet.*, host(ip) AS lease_ip
+    FROM unnest(%s::inet[]) AS ip
+    INNER JOIN maasserver_subnet AS subnet
+        ON ip << subnet.cidr
+    INNER JOIN maasserver_vlan AS vlan
+        ON subnet.vlan_id = vlan.id
+    ORDER BY ip, vlan.dhcp_on DESC, masklen(subnet.cidr) DESC, subnet.id
+    """
+
+
+class _LeaseUpdateContext:
+    """The objects that a batch of lease updates refer to.
+
+    Subnets, dynamic ranges, interfaces and node hostnames are each looked
+    up with one query for the whole batch.
+    """
+
+    def __init__(self, updates):
+        ips = {_parse_ip(update["ip"]) for update in updates}
+        ips.discard(None)
+        macs = {str(update["mac"]) for update in updates}
+        hostnames = {
+            coerce_to_valid_hostname(update["hostname"])
+            for update in updates
+            if _is_valid_hostname(update.get("hostname"))
+        }
+
+        self.subnets = {}
+        if len(ips) > 0:
+            subnets = Subnet.objects.raw(
+                _find_best_subnets_for_ips_query,
+                params=[[str(ip) for ip in ips]],
+            )
+            for subnet in subnets:
+                self.subnets[IPAddress(subnet.lease_ip)] = subnet
+
+        self.dynamic_ranges = defaultdict(list)
+        iprange_query = IPRange.objects.filter(
+            subnet__in=list(self.subnets.values()), type=IPRANGE_TYPE.DYNAMIC
+        )
+        for iprange in iprange_query:
+            self.dynamic_ranges[iprange.subnet_id].append(iprange)
+
+        self.interfaces = defaultdict(list)
+        if len(macs) > 0:
+            interface_query = Interface.objects.filter(mac_address__in=macs)
+            for interface in interface_query:
+                mac = _parse_mac(interface.mac_address)
+                self.interfaces[mac].append(interface)
+
+        self.node_hostnames = set()
+        if len(hostnames) > 0:
+            self.node_hostnames.update(
+                Node.objects.filter(hostname__in=hostnames).values_list(
+                    "hostname", flat=True
+                )
+            )
+
+    def get_best_subnet_for_ip(self, ip):
+        parsed_ip = _parse_ip(ip)
+        if parsed_ip is None:
+            # Let the subnet manager raise the error it always did.
+            return Subnet.objects.get_best_subnet_for_ip(ip)
+        return self.subnets.get(parsed_ip)
+
+    def get_dynamic_range_for_ip(self, subnet, ip):
+        for iprange in self.dynamic_ranges[subnet.id]:
+            if ip in iprange.netaddr_iprange:
+                return iprange
+        return None
+
+    def get_interfaces(self, mac):
+        return list(self.interfaces[_parse_mac(mac)])
+
+    def add_interface(self, interface):
+        self.interfaces[_parse_mac(interface.mac_address)].append(interface)
+
+    def reload_interfaces(self, mac):
+        """Look up the interfaces for `mac` again.
+
+        Use this after an update was rolled back, in case it created one.
+        """
+        self.interfaces[_parse_mac(mac)] = list(
+            Interface.objects.filter(mac_address=mac)
+        )
+
+    def is_node_hostname(self, hostname):
+        return coerce_to_valid_hostname(hostname) in self.node_hostnames
+
+
+@synchronous
+@transactional
+def update_leases(updates):
+    """Update many DHCP leases from a cluster in one transaction.
+
+    for :py:class:`~provisioningserver.rpc.region.UpdateLeases`.
+
+    :param updates: A list of dicts, each holding the arguments to
+        `update_lease` for one lease, applied in order.
+
+    The objects the updates refer to are looked up once for the whole batch,
+    and DNS and websocket notifications are sent once, when the transaction
+    commits. An update that fails is logged and rolled back on its own; the
+    rest of the batch is still applied.
+    """
+    context = _LeaseUpdateContext(updates)
+    for update in updates:
+        try:
+            with savepoint():
+                _update_lease(context, **update)
+        except Exception as error:
+            if is_retryable_failure(error):
+                raise
+            log.err(None, "Unhandled failure in updating lease.")
+            context.reload_interfaces(update["mac"])
+    return {}
+
+
 @synchronous
 @transactional
 def update_lease(
@@ -74,13 +214,35 @@ def update_lease(
     :raises NoSuchCluster: If the cluster identified by `cluster_uuid` does not
         exist.
     """
+    context = _LeaseUpdateContext(
+        [{"mac": mac, "ip": ip, "hostname": hostname}]
+    )
+    return _update_lease(
+        context, action, mac, ip_family, ip, timestamp, lease_time, hostname
+    )
+
+
+def _update_lease(
+    context,
+    action,
+    mac,
+    ip_family,
+    ip,
+    timestamp,
+    lease_time=None,
+    hostname=None,
+):
+    """Update one DHCP lease, as `update_lease` does.
+
+    :param context: The `_LeaseUpdateContext` of the batch.
+    """
     # Check for a valid action.
     if action not in ["commit", "expiry", "release"]:
         raise LeaseUpdateError("Unknown lease action: %s" % action)
 
     # Get the subnet for this IP address. If no subnet exists then something
     # is wrong as we should not be recieving message about unknown subnets.
-    subnet = Subnet.objects.get_best_subnet_for_ip(ip)
+    subnet = context.get_best_subnet_for_ip(ip)
     if subnet is None:
         raise LeaseUpdateError("No subnet exists for: %s" % ip)
 
@@ -114,12 +276,12 @@ def update_lease(
 
     # We will recieve actions on all addresses in the subnet. We only want
     # to update the addresses in the dynamic range.
-    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
+    dynamic_range = context.get_dynamic_range_for_ip(subnet, IPAddress(ip))
     if dynamic_range is None:
         # Do nothing.
         return {}
 
-    interfaces = list(Interface.objects.filter(mac_address=mac))
+    interfaces = context.get_interfaces(mac)
     if len(interfaces) == 0 and action == "commit":
         # A MAC address that is unknown to MAAS was given an IP address. Create
         # an unknown interface for this lease.
@@ -127,6 +289,7 @@ def update_lease(
             name="eth0", mac_address=mac, vlan_id=subnet.vlan_id
         )
         unknown_interface.save()
+        context.add_interface(unknown_interface)
         interfaces = [unknown_interface]
     elif len(interfaces) == 0:
         # No interfaces and not commit action so nothing needs to be done.
@@ -180,10 +343,7 @@ def update_lease(
         if sip_hostname is not None:
             # MAAS automatically manages DNS for node hostnames, so we cannot
             # allow a DHCP client to override that.
-            hostname_belongs_to_a_node = Node.objects.filter(
-                hostname=coerce_to_valid_hostname(sip_hostname)
-            ).exists()
-            if hostname_belongs_to_a_node:
+            if context.is_node_hostname(sip_hostname):
                 # Ensure we don't allow a DHCP hostname to override a node
                 # hostname.
                 DNSResource.objects.release_dynamic_hostname(sip)
@@ -6,6 +6,7 @@
 __all__ = [
     "mark_node_failed",
     "update_node_power_state",
+    "update_node_power_states",
     "commission_node",
     "create_node",
 ]
@@ -166,6 +167,40 @@ def update_node_power_state(system_id, power_state):
     node.update_power_state(power_state)
 
 
+@synchronous
+@transactional
+def update_node_power_states(power_states):
+    """Update the power states of many nodes in one transaction.
+
+    for :py:class:`~provisioningserver.rpc.region.UpdateNodePowerStates`.
+
+    Nodes whose power state is unchanged, and whose status does not depend
+    on their power state, only need `power_state_updated` refreshing; that
+    is done for all of them with a single query.
+
+    :param power_states: An iterable of dicts with `system_id` and
+        `power_state` keys.
+    :return: A list of the system IDs for which no node exists.
+    """
+    states = {
+        power_state["system_id"]: power_state["power_state"]
+        for power_state in power_states
+    }
+    unchanged = []
+    for node in Node.objects.filter(system_id__in=states.keys()):
+        power_state = states.pop(node.system_id)
+        if node.power_state == power_state and node.status not in (
+            NODE_STATUS.RELEASING,
+            NODE_STATUS.EXITING_RESCUE_MODE,
+        ):
+            unchanged.append(node.id)
+        else:
+            node.update_power_state(power_state)
+    if len(unchanged) > 0:
+        Node.objects.filter(id__in=unchanged).update(power_state_updated=now())
+    return sorted(states)
+
+
 @synchronous
 @transactional
 def create_node(
@@ -46,6 +46,7 @@ from maasserver.rpc import (
     packagerepository,
     rackcontrollers,
 )
+from maasserver.rpc.events import send_events
 from maasserver.rpc.nodes import (
     commission_node,
     create_node,
@@ -61,7 +62,7 @@ from provisioningserver.prometheus.metrics import (
     PROMETHEUS_METRICS,
 )
 from provisioningserver.rpc import cluster, common, exceptions, region
-from provisioningserver.rpc.common import RPCProtocol
+from provisioningserver.rpc.common import batchable, RPCProtocol
 from provisioningserver.rpc.exceptions import NoSuchCluster
 from provisioningserver.rpc.interfaces import IConnection
 from provisioningserver.security import calculate_digest
@@ -161,6 +162,31 @@ class Region(RPCProtocol):
         # region recieves the message.
         return d
 
+    @region.UpdateLeases.responder
+    def update_leases(self, cluster_uuid, updates):
+        """update_leases(cluster_uuid, updates)
+
+        Implementation of
+        :py:class`~provisioningserver.rpc.region.UpdateLeases`.
+        """
+        dbtasks = eventloop.services.getServiceNamed("database-tasks")
+        d = dbtasks.deferTask(leases.update_leases, updates)
+
+        # Catch all errors except the NoSuchCluster failure. We want that to
+        # be sent back to the cluster.
+        def err_NoSuchCluster_passThrough(failure):
+            if failure.check(NoSuchCluster):
+                return failure
+            else:
+                log.err(failure, "Unhandled failure in updating leases.")
+                return {}
+
+        d.addErrback(err_NoSuchCluster_passThrough)
+
+        # Wait for the batch to be handled, so that batches from a cluster
+        # are processed in order.
+        return d
+
     @amp.StartTLS.responder
     def get_tls_parameters(self):
         """get_tls_parameters()
@@ -286,6 +312,7 @@ class Region(RPCProtocol):
         return d
 
     @region.UpdateNodePowerState.responder
+    @batchable
     def update_node_power_state(self, system_id, power_state):
         """update_node_power_state()
 
@@ -298,7 +325,19 @@ class Region(RPCProtocol):
         d.addCallback(lambda args: {})
         return d
 
+    @region.UpdateNodePowerStates.responder
+    def update_node_power_states(self, power_states):
+        """update_node_power_states()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.region.UpdateNodePowerStates`.
+        """
+        d = deferToDatabase(nodes.update_node_power_states, power_states)
+        d.addCallback(lambda missing: {"missing": missing})
+        return d
+
     @region.RegisterEventType.responder
+    @batchable
     def register_event_type(self, name, description, level):
         """register_event_type()
 
@@ -312,6 +351,7 @@ class Region(RPCProtocol):
         return d
 
     @region.SendEvent.responder
+    @batchable
     def send_event(self, system_id, type_name, description):
         """send_event()
 
@@ -327,6 +367,7 @@ class Region(RPCProtocol):
         return succeed({})
 
     @region.SendEventMACAddress.responder
+    @batchable
     def send_event_mac_address(self, mac_address, type_name, description):
         """send_event_mac_address()
 
@@ -346,6 +387,7 @@ class Region(RPCProtocol):
         return succeed({})
 
     @region.SendEventIPAddress.responder
+    @batchable
     def send_event_ip_address(self, ip_address, type_name, description):
         """send_event_ip_address()
 
@@ -364,6 +406,19 @@ class Region(RPCProtocol):
         # Don't wait for the record to be written.
         return succeed({})
 
+    @region.SendEvents.responder
+    def send_events(self, events):
+        """send_events()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.region.SendEvents`.
+        """
+        # Unlike single events, wait for these to be recorded: the cluster
+        # keeps hold of them until then.
+        d = deferToDatabase(send_events, events)
+        d.addCallback(lambda _: {})
+        return d
+
     @region.ReportForeignDHCPServer.responder
     def report_foreign_dhcp_server(
         self, system_id, interface_name, dhcp_ip=None
@@ -448,6 +503,7 @@ class Region(RPCProtocol):
         return d
 
     @region.ReportMDNSEntries.responder
+    @batchable
     def report_mdns_entries(self, system_id, mdns):
         """report_neighbours()
 
@@ -461,6 +517,7 @@ class Region(RPCProtocol):
         return d
 
     @region.ReportNeighbours.responder
+    @batchable
     def report_neighbours(self, system_id, neighbours):
         """report_neighbours()
 
@@ -15,6 +15,7 @@ from maasserver.models.eventtype import EventType
 from maasserver.rpc import events
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.djangotestcase import count_queries
 from provisioningserver.rpc.exceptions import NoSuchEventType
 
 
@@ -180,3 +181,95 @@ class TestSendEventIPAddress(MAASServerTestCase):
             description=description,
             created=timestamp,
         )
+
+
+class TestSendEvents(MAASServerTestCase):
+    def make_event(self, event_type, **kwargs):
+        event = {
+            "type_name": event_type.name,
+            "description": factory.make_name("description"),
+            "timestamp": datetime.datetime.utcnow().timestamp(),
+        }
+        event.update(kwargs)
+        return event
+
+    def assertEventCreated(self, node, event_type, event):
+        # Doesn't raise a DoesNotExist error.
+        Event.objects.get(
+            node=node,
+            type=event_type,
+            description=event["description"],
+            created=datetime.datetime.fromtimestamp(event["timestamp"]),
+        )
+
+    def test__creates_events_for_system_id(self):
+        event_type = factory.make_EventType()
+        node = factory.make_Node()
+        event = self.make_event(event_type, system_id=node.system_id)
+        events.send_events([event])
+        self.assertEventCreated(node, event_type, event)
+
+    def test__creates_events_for_mac_address(self):
+        event_type = factory.make_EventType()
+        node = factory.make_Node(interface=True)
+        mac = node.interface_set.first().mac_address
+        event = self.make_event(event_type, mac_address=str(mac).upper())
+        events.send_events([event])
+        self.assertEventCreated(node, event_type, event)
+
+    def test__creates_events_for_ip_address(self):
+        event_type = factory.make_EventType()
+        node = factory.make_Node(interface=True)
+        ip = factory.make_StaticIPAddress(interface=node.interface_set.first())
+        event = self.make_event(event_type, ip_address=ip.ip)
+        events.send_events([event])
+        self.assertEventCreated(node, event_type, event)
+
+    def test__drops_events_for_unknown_nodes_and_types(self):
+        event_type = factory.make_EventType()
+        node = factory.make_Node()
+        events.send_events(
+            [
+                self.make_event(
+                    event_type, system_id=factory.make_name("system_id")
+                ),
+                self.make_event(
+                    event_type, mac_address=factory.make_mac_address()
+                ),
+                self.make_event(
+                    event_type, ip_address=factory.make_ip_address()
+                ),
+                self.make_event(event_type, mac_address="not-a-mac"),
+                self.make_event(
+                    event_type,
+                    system_id=node.system_id,
+                    type_name=factory.make_name("type"),
+                ),
+            ]
+        )
+        self.assertItemsEqual([], Event.objects.all())
+
+    def test__query_count_does_not_depend_on_number_of_events(self):
+        event_type = factory.make_EventType()
+
+        def make_events(count):
+            result = []
+            for _ in range(count):
+                node = factory.make_Node(interface=True)
+                interface = node.interface_set.first()
+                ip = factory.make_StaticIPAddress(interface=interface)
+                result.append(
+                    self.make_event(event_type, system_id=node.system_id)
+                )
+                result.append(
+                    self.make_event(
+                        event_type, mac_address=str(interface.mac_address)
+                    )
+                )
+                result.append(self.make_event(event_type, ip_address=ip.ip))
+            return result
+
+        count_one, _ = count_queries(events.send_events, make_events(1))
+        count_many, _ = count_queries(events.send_events, make_events(5))
+        self.assertEqual(count_one, count_many)
+        self.assertEqual(18, Event.objects.count())
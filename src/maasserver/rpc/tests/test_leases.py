@@ -17,10 +17,12 @@ from maasserver.enum import INTERFACE_TYPE, IPADDRESS_FAMILY, IPADDRESS_TYPE
 from maasserver.models import DNSResource
 from maasserver.models.interface import UnknownInterface
 from maasserver.models.staticipaddress import StaticIPAddress
-from maasserver.rpc.leases import LeaseUpdateError, update_lease
+from maasserver.rpc.leases import LeaseUpdateError, update_lease, update_leases
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils.orm import get_one, reload_object
+from maastesting.djangotestcase import count_queries
+from maastesting.twisted import TwistedLoggerFixture
 
 
 class TestUpdateLease(MAASServerTestCase):
@@ -508,3 +510,84 @@ class TestUpdateLease(MAASServerTestCase):
         self.assertEqual(1, ip_address2.interface_set.count())
         self.assertEqual(1, boot_interface1.ip_addresses.count())
         self.assertEqual(1, boot_interface2.ip_addresses.count())
+
+
+class TestUpdateLeases(MAASServerTestCase):
+
+    make_kwargs = TestUpdateLease.make_kwargs
+
+    def make_commits(self, subnet, count):
+        dynamic_range = subnet.get_dynamic_ranges()[0]
+        ips = set()
+        while len(ips) < count:
+            ips.add(factory.pick_ip_in_IPRange(dynamic_range))
+        return [self.make_kwargs(action="commit", ip=ip) for ip in ips]
+
+    def get_discovered_ips(self):
+        return set(
+            StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED
+            ).values_list("ip", flat=True)
+        )
+
+    def test_creates_leases(self):
+        subnet = factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True
+        )
+        updates = self.make_commits(subnet, 3)
+        update_leases(updates)
+        self.assertEqual(
+            {update["ip"] for update in updates}, self.get_discovered_ips()
+        )
+
+    def test_applies_updates_in_order(self):
+        subnet = factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True
+        )
+        node = factory.make_Node_with_Interface_on_Subnet(subnet=subnet)
+        mac = node.get_boot_interface().mac_address
+        commit1, commit2 = self.make_commits(subnet, 2)
+        commit1["mac"] = commit2["mac"] = mac
+        update_leases([commit1, commit2])
+        self.assertEqual(
+            [commit2["ip"]],
+            [
+                address.ip
+                for address in node.get_boot_interface().ip_addresses.all()
+            ],
+        )
+
+    def test_applies_other_updates_when_one_fails(self):
+        subnet = factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True
+        )
+        good, bad = self.make_commits(subnet, 2)
+        bad["action"] = factory.make_name("action")
+        with TwistedLoggerFixture() as logger:
+            update_leases([bad, good])
+        self.assertEqual({good["ip"]}, self.get_discovered_ips())
+        self.assertIn("Unhandled failure in updating lease.", logger.dump())
+
+    def test_does_not_override_node_hostname(self):
+        subnet = factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True
+        )
+        node = factory.make_Node()
+        [update] = self.make_commits(subnet, 1)
+        update["hostname"] = node.hostname
+        update_leases([update])
+        self.assertIsNone(
+            DNSResource.objects.filter(name=node.hostname).first()
+        )
+
+    def test_uses_fewer_queries_than_updating_leases_one_by_one(self):
+        subnet = factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True
+        )
+        updates = self.make_commits(subnet, 10)
+        count_one_by_one = 0
+        for update in updates[:5]:
+            count, _ = count_queries(update_lease, **update)
+            count_one_by_one += count
+        count_batch, _ = count_queries(update_leases, updates[5:])
+        self.assertLess(count_batch, count_one_by_one)
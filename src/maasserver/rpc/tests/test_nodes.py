@@ -36,6 +36,7 @@ from maasserver.rpc.nodes import (
     mark_node_failed,
     request_node_info_by_mac_address,
     update_node_power_state,
+    update_node_power_states,
 )
 from maasserver.rpc.testing.fixtures import MockLiveRegionToClusterRPCFixture
 from maasserver.testing.architecture import make_usable_architecture
@@ -49,6 +50,8 @@ from maasserver.testing.testcase import (
     MAASTransactionServerTestCase,
 )
 from maasserver.utils.orm import post_commit_hooks, reload_object
+from maastesting.djangotestcase import count_queries
+from maastesting.matchers import MockCalledOnceWith, MockNotCalled
 from maastesting.twisted import always_succeed_with
 from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.rpc.cluster import DescribePowerTypes
@@ -550,6 +553,69 @@ class TestUpdateNodePowerState(MAASServerTestCase):
         self.assertEqual(reload_object(node).power_state, POWER_STATE.ON)
 
 
+class TestUpdateNodePowerStates(MAASServerTestCase):
+    def test__returns_missing_system_ids(self):
+        system_id = factory.make_name("system_id")
+        self.assertEqual(
+            [system_id],
+            update_node_power_states(
+                [{"system_id": system_id, "power_state": POWER_STATE.ON}]
+            ),
+        )
+
+    def test__updates_node_power_states(self):
+        nodes = [
+            factory.make_Node(power_state=POWER_STATE.OFF) for _ in range(3)
+        ]
+        missing = update_node_power_states(
+            [
+                {"system_id": node.system_id, "power_state": POWER_STATE.ON}
+                for node in nodes
+            ]
+        )
+        self.assertEqual([], missing)
+        self.assertEqual(
+            [POWER_STATE.ON] * 3,
+            [reload_object(node).power_state for node in nodes],
+        )
+
+    def test__only_touches_updated_time_of_unchanged_nodes(self):
+        node = factory.make_Node(power_state=POWER_STATE.ON)
+        updated = now() - timedelta(minutes=1)
+        Node.objects.filter(id=node.id).update(power_state_updated=updated)
+        update_node_power_state = self.patch(Node, "update_power_state")
+        update_node_power_states(
+            [{"system_id": node.system_id, "power_state": POWER_STATE.ON}]
+        )
+        self.assertThat(update_node_power_state, MockNotCalled())
+        node = reload_object(node)
+        self.assertEqual(POWER_STATE.ON, node.power_state)
+        self.assertGreater(node.power_state_updated, updated)
+
+    def test__updates_releasing_node_with_unchanged_power_state(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.RELEASING, power_state=POWER_STATE.OFF
+        )
+        update_node_power_state = self.patch(Node, "update_power_state")
+        update_node_power_states(
+            [{"system_id": node.system_id, "power_state": POWER_STATE.OFF}]
+        )
+        self.assertThat(
+            update_node_power_state, MockCalledOnceWith(POWER_STATE.OFF)
+        )
+
+    def test__uses_constant_number_of_updates(self):
+        nodes = [
+            factory.make_Node(power_state=POWER_STATE.ON) for _ in range(10)
+        ]
+        power_states = [
+            {"system_id": node.system_id, "power_state": POWER_STATE.ON}
+            for node in nodes
+        ]
+        count, _ = count_queries(update_node_power_states, power_states)
+        self.assertEqual(2, count)
+
+
 class TestGetControllerType(MAASServerTestCase):
     """Tests for `get_controller_type`."""
 
@@ -70,7 +70,7 @@ from maastesting.twisted import (
     TwistedLoggerFixture,
 )
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
-from provisioningserver.rpc import cluster, exceptions
+from provisioningserver.rpc import cluster, exceptions, region
 from provisioningserver.rpc.exceptions import (
     CannotRegisterRackController,
     NoConnectionsAvailable,
@@ -543,6 +543,26 @@ class TestRegionServer(MAASTransactionServerTestCase):
         )
 
 
+class TestRegionBatchable(MAASTestCase):
+
+    scenarios = [
+        (command.__name__, {"command": command})
+        for command in (
+            region.RegisterEventType,
+            region.ReportMDNSEntries,
+            region.ReportNeighbours,
+            region.SendEvent,
+            region.SendEventIPAddress,
+            region.SendEventMACAddress,
+            region.UpdateNodePowerState,
+        )
+    ]
+
+    def test_responder_is_batchable(self):
+        _, responder = Region._commandDispatch[self.command.commandName]
+        self.assertTrue(responder.batchable)
+
+
 class TestRackClient(MAASTestCase):
     def test_defined_cache_calls(self):
         self.assertEquals(
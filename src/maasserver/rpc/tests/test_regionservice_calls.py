@@ -79,9 +79,12 @@ from provisioningserver.rpc.region import (
     RequestRackRefresh,
     SendEvent,
     SendEventMACAddress,
+    SendEvents,
     UpdateInterfaces,
     UpdateLease,
+    UpdateLeases,
     UpdateNodePowerState,
+    UpdateNodePowerStates,
     UpdateServices,
 )
 from provisioningserver.rpc.testing import (
@@ -278,6 +281,73 @@ class TestRegionProtocol_UpdateLease(MAASTransactionServerTestCase):
         # works as expected.
 
 
+class TestRegionProtocol_UpdateLeases(MAASTransactionServerTestCase):
+    def setUp(self):
+        super(TestRegionProtocol_UpdateLeases, self).setUp()
+        self.useFixture(RegionEventLoopFixture("database-tasks"))
+
+    def test_update_leases_is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(UpdateLeases.commandName)
+        self.assertIsNotNone(responder)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__passes_updates_to_update_leases(self):
+        update_leases = self.patch(leases_module, "update_leases")
+        update_leases.return_value = {}
+        updates = [
+            {
+                "action": "expiry",
+                "mac": factory.make_mac_address(),
+                "ip_family": "ipv4",
+                "ip": factory.make_ipv4_address(),
+                "timestamp": int(time.time()),
+            }
+        ]
+
+        yield eventloop.start()
+        try:
+            yield call_responder(
+                Region(),
+                UpdateLeases,
+                {
+                    "cluster_uuid": factory.make_name("uuid"),
+                    "updates": updates,
+                },
+            )
+        finally:
+            yield eventloop.reset()
+
+        # Optional arguments that were not sent arrive as None.
+        self.assertThat(
+            update_leases,
+            MockCalledOnceWith(
+                [dict(updates[0], lease_time=None, hostname=None)]
+            ),
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__doesnt_raises_other_errors(self):
+        self.patch(
+            leases_module, "update_leases"
+        ).side_effect = factory.make_exception()
+
+        yield eventloop.start()
+        try:
+            yield call_responder(
+                Region(),
+                UpdateLeases,
+                {"cluster_uuid": factory.make_name("uuid"), "updates": []},
+            )
+        finally:
+            yield eventloop.reset()
+
+        # Test is that no exceptions are raised. If this test passes then all
+        # works as expected.
+
+
 class TestRegionProtocol_GetBootConfig(MAASTransactionServerTestCase):
     def test_get_boot_config_is_registered(self):
         protocol = Region()
@@ -656,6 +726,48 @@ class TestRegionProtocol_UpdateNodePowerState(MAASTransactionServerTestCase):
         return d.addErrback(check)
 
 
+class TestRegionProtocol_UpdateNodePowerStates(MAASTransactionServerTestCase):
+    @transactional
+    def create_node(self, power_state):
+        node = factory.make_Node(power_state=power_state)
+        return node
+
+    @transactional
+    def get_node_power_state(self, system_id):
+        node = Node.objects.get(system_id=system_id)
+        return node.power_state
+
+    def test__is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(UpdateNodePowerStates.commandName)
+        self.assertIsNotNone(responder)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__changes_power_states_and_reports_missing_nodes(self):
+        power_state = factory.pick_enum(POWER_STATE)
+        node = yield deferToDatabase(self.create_node, power_state)
+        new_state = factory.pick_enum(POWER_STATE, but_not=power_state)
+        system_id = factory.make_name("unknown-system-id")
+
+        response = yield call_responder(
+            Region(),
+            UpdateNodePowerStates,
+            {
+                "power_states": [
+                    {"system_id": node.system_id, "power_state": new_state},
+                    {"system_id": system_id, "power_state": new_state},
+                ]
+            },
+        )
+
+        self.assertEqual({"missing": [system_id]}, response)
+        db_state = yield deferToDatabase(
+            self.get_node_power_state, node.system_id
+        )
+        self.assertEqual(new_state, db_state)
+
+
 class TestRegionProtocol_RegisterEventType(MAASTransactionServerTestCase):
     def test_register_event_type_is_registered(self):
         protocol = Region()
@@ -1048,6 +1160,63 @@ class TestRegionProtocol_SendEventMACAddress(MAASTransactionServerTestCase):
         )
 
 
+class TestRegionProtocol_SendEvents(MAASTransactionServerTestCase):
+    def setUp(self):
+        super(TestRegionProtocol_SendEvents, self).setUp()
+        self.useFixture(RegionEventLoopFixture("database-tasks"))
+
+    def test_send_events_is_registered(self):
+        protocol = Region()
+        responder = protocol.locateResponder(SendEvents.commandName)
+        self.assertIsNotNone(responder)
+
+    @transactional
+    def create_event_type_and_node(self):
+        return factory.make_EventType().name, factory.make_Node().system_id
+
+    @transactional
+    def get_events(self):
+        return [
+            (event.node.system_id, event.type.name, event.description)
+            for event in Event.objects.all().select_related("node", "type")
+        ]
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_send_events_stores_events(self):
+        name, system_id = yield deferToDatabase(
+            self.create_event_type_and_node
+        )
+        descriptions = [factory.make_name("description") for _ in range(3)]
+
+        yield eventloop.start()
+        try:
+            response = yield call_responder(
+                Region(),
+                SendEvents,
+                {
+                    "events": [
+                        {
+                            "system_id": system_id,
+                            "type_name": name,
+                            "description": description,
+                            "timestamp": time.time(),
+                        }
+                        for description in descriptions
+                    ]
+                },
+            )
+        finally:
+            yield eventloop.reset()
+
+        self.assertEqual({}, response)
+        stored = yield deferToDatabase(self.get_events)
+        self.assertItemsEqual(
+            [(system_id, name, description) for description in descriptions],
+            stored,
+        )
+
+
 class TestRegionProtocol_UpdateServices(MAASTransactionServerTestCase):
     def setUp(self):
         super(TestRegionProtocol_UpdateServices, self).setUp()
@@ -7,14 +7,20 @@ __all__ = [
     "get_subnets_utilisation_stats",
     "StatsService",
     "STATS_SERVICE_PERIOD",
+    "subnets_utilisation_stats",
+    "SubnetsUtilisationStatsCache",
+    "SubnetsUtilisationStatsService",
+    "SUBNETS_UTILISATION_STATS_PERIOD",
 ]
 
 import base64
 from collections import Counter, defaultdict
 from datetime import timedelta
 import json
+import threading
+import time
 
-from django.db.models import Count, Sum, Value
+from django.db.models import Sum, Value
 from django.db.models.functions import Coalesce
 import requests
 from twisted.application.internet import TimerService
@@ -34,14 +40,16 @@ from maasserver.models import (
     Node,
     Pod,
     Space,
-    StaticIPAddress,
+    StaticRoute,
     Subnet,
     VLAN,
 )
+from maasserver.models.subnet import get_allocated_ips
 from maasserver.utils import get_maas_user_agent
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.prometheus import PROMETHEUS_SUPPORTED
 from provisioningserver.utils.network import IPRangeStatistics
 
 log = LegacyLogger()
@@ -146,13 +154,24 @@ def get_subnets_stats():
 
 
 def get_subnets_utilisation_stats():
-    """Return a dict mapping subnet CIDRs to their utilisation details."""
-    ips_count = _get_subnets_ipaddress_count()
+    """Return a dict mapping subnet CIDRs to their utilisation details.
+
+    The subnets, their IP ranges, static routes and allocated addresses are
+    each fetched with a single query, so the number of queries does not grow
+    with the number of subnets.
+    """
+    subnets = list(Subnet.objects.prefetch_related("iprange_set"))
+    staticroutes = defaultdict(list)
+    for staticroute in StaticRoute.objects.select_related("source"):
+        staticroutes[staticroute.source_id].append(staticroute)
 
     stats = {}
-    for subnet in Subnet.objects.all():
-        full_range = subnet.get_iprange_usage()
-        range_stats = IPRangeStatistics(subnet.get_iprange_usage())
+    for subnet, ips in get_allocated_ips(subnets):
+        subnet.cache_allocated_ips(ips)
+        full_range = subnet.get_iprange_usage(
+            cached_staticroutes=staticroutes[subnet.id]
+        )
+        range_stats = IPRangeStatistics(full_range)
         static = 0
         reserved_available = 0
         reserved_used = 0
@@ -166,7 +185,7 @@ def get_subnets_utilisation_stats():
             elif "assigned-ip" in rng.purpose:
                 static += rng.num_addresses
         # allocated IPs
-        subnet_ips = ips_count[subnet.id]
+        subnet_ips = Counter(alloc_type for _, alloc_type in ips)
         reserved_used += subnet_ips[IPADDRESS_TYPE.USER_RESERVED]
         reserved_available -= reserved_used
         dynamic_used += (
@@ -187,16 +206,62 @@ def get_subnets_utilisation_stats():
     return stats
 
 
-def _get_subnets_ipaddress_count():
-    counts = defaultdict(lambda: defaultdict(int))
-    rows = (
-        StaticIPAddress.objects.values("subnet_id", "alloc_type")
-        .filter(ip__isnull=False)
-        .annotate(count=Count("ip"))
-    )
-    for row in rows:
-        counts[row["subnet_id"]][row["alloc_type"]] = row["count"]
-    return counts
+class SubnetsUtilisationStatsCache:
+    """Snapshot of `get_subnets_utilisation_stats`.
+
+    Working out the utilisation of every subnet is too expensive to do for
+    each Prometheus scrape, so the snapshot is recomputed in the background
+    by `SubnetsUtilisationStatsService` and only read when scraping. It is
+    recomputed when read if it is older than `max_age` seconds, which
+    happens when the service is not running.
+    """
+
+    max_age = 300
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._stats = None
+        self._updated = None
+        # Held while the snapshot is being recomputed, so that concurrent
+        # readers wait for one computation rather than starting their own.
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the snapshot, recomputing it if it is missing or too old."""
+        stats = self._get_fresh()
+        if stats is None:
+            with self._lock:
+                stats = self._get_fresh()
+                if stats is None:
+                    stats = self._update()
+        return stats
+
+    def refresh(self):
+        """Recompute the snapshot, unless that is already in progress."""
+        if self._lock.acquire(blocking=False):
+            try:
+                self._update()
+            finally:
+                self._lock.release()
+
+    def clear(self):
+        """Forget the snapshot."""
+        self._stats = self._updated = None
+
+    def _get_fresh(self):
+        stats, updated = self._stats, self._updated
+        if stats is not None and updated + self.max_age > self.clock():
+            return stats
+        return None
+
+    def _update(self):
+        stats = get_subnets_utilisation_stats()
+        self._stats, self._updated = stats, self.clock()
+        return stats
+
+
+# The subnet utilisation snapshot of this process.
+subnets_utilisation_stats = SubnetsUtilisationStatsCache()
 
 
 def get_maas_stats():
@@ -278,3 +343,31 @@ class StatsService(TimerService, object):
         d = deferToDatabase(transactional(determine_stats_request))
         d.addErrback(log.err, "Failure performing user agent request.")
         return d
+
+
+# How often the subnet utilisation snapshot is recomputed.
+SUBNETS_UTILISATION_STATS_PERIOD = timedelta(minutes=1)
+
+
+class SubnetsUtilisationStatsService(TimerService, object):
+    """Service to periodically recompute the subnet utilisation snapshot.
+
+    This runs in every region process, since any of them may be asked for
+    metrics, but only does any work when Prometheus is enabled.
+    """
+
+    def __init__(self, interval=SUBNETS_UTILISATION_STATS_PERIOD):
+        super(SubnetsUtilisationStatsService, self).__init__(
+            interval.total_seconds(), self.maybe_refresh_stats
+        )
+
+    def maybe_refresh_stats(self):
+        def refresh_stats():
+            if PROMETHEUS_SUPPORTED and Config.objects.get_config(
+                "prometheus_enabled"
+            ):
+                subnets_utilisation_stats.refresh()
+
+        d = deferToDatabase(transactional(refresh_stats))
+        d.addErrback(log.err, "Failure updating subnet utilisation stats.")
+        return d
@@ -23,6 +23,7 @@ from netaddr import IPAddress, IPNetwork
 import yaml
 
 from maasserver.clusterrpc.driver_parameters import get_driver_types
+from maasserver.contentstore import get_filesystem_content_store
 from maasserver.enum import (
     ALLOCATED_NODE_STATUSES,
     BOOT_RESOURCE_FILE_TYPE,
@@ -2232,7 +2233,9 @@ class Factory(maastesting.factory.Factory):
         )
 
     @typed
-    def make_LargeFile(self, content: bytes = None, size=512):
+    def make_LargeFile(
+        self, content: bytes = None, size=512, filesystem=False
+    ):
         """Create `LargeFile`.
 
         :param content: Data to store in large file object.
@@ -2240,12 +2243,24 @@ class Factory(maastesting.factory.Factory):
             then it will be a random string of this size. If content is
             provided and `size` is not the same length, then it will
             be an inprogress file.
+        :param filesystem: Store `content` in the filesystem rather than in
+            the database. The region must be configured with a
+            `boot_resources_path`.
         """
         if content is None:
             content = factory.make_bytes(size=size)
         sha256 = hashlib.sha256()
         sha256.update(content)
         sha256 = sha256.hexdigest()
+        if filesystem:
+            store = get_filesystem_content_store()
+            with store.open_partial(sha256, "wb") as stream:
+                stream.write(content)
+            if len(content) == size:
+                store.commit(sha256)
+            return LargeFile.objects.create(
+                sha256=sha256, size=len(content), total_size=size, content=None
+            )
         largeobject = LargeObjectFile()
         with largeobject.open("wb") as stream:
             stream.write(content)
@@ -7,6 +7,7 @@ __all__ = []
 
 from datetime import datetime
 from email.utils import format_datetime
+import hashlib
 import http.client
 from io import BytesIO
 import json
@@ -24,6 +25,7 @@ from crochet import wait_for
 from django.conf import settings
 from django.db import connections, transaction
 from django.http import StreamingHttpResponse
+from django.test.client import RequestFactory
 from fixtures import FakeLogger, Fixture
 from testtools.matchers import Contains, ContainsAll, Equals, HasLength, Not
 from twisted.application.internet import TimerService
@@ -487,6 +489,125 @@ class TestSimpleStreamsHandler(MAASServerTestCase):
         )
         self.assertIsInstance(response, StreamingHttpResponse)
 
+    def make_filesystem_resource_file(self, content=None, size=None):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_path=self.make_dir())
+        )
+        resource = factory.make_BootResource(rtype=BOOT_RESOURCE_TYPE.SYNCED)
+        resource_set = factory.make_BootResourceSet(resource)
+        largefile = factory.make_LargeFile(
+            content, size=size or len(content), filesystem=True
+        )
+        rfile = factory.make_BootResourceFile(resource_set, largefile)
+        os_name, series = resource.name.split("/")
+        arch, subarch = resource.split_arch()
+        return (
+            os_name,
+            arch,
+            subarch,
+            series,
+            resource_set.version,
+            rfile.filename,
+        )
+
+    def test_download_streams_content_from_filesystem(self):
+        content = factory.make_bytes(size=1024)
+        path = self.make_filesystem_resource_file(content)
+        response = self.get_file_client(*path)
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertIsInstance(response, bootresources.ContentFileResponse)
+        self.assertEqual(str(len(content)), response["Content-Length"])
+        self.assertEqual(content, b"".join(response.streaming_content))
+
+    def test_download_incomplete_content_from_filesystem_returns_404(self):
+        content = factory.make_bytes(size=512)
+        path = self.make_filesystem_resource_file(content, size=1024)
+        response = self.get_file_client(*path)
+        self.assertEqual(http.client.NOT_FOUND, response.status_code)
+
+    def test_download_sets_etag_and_accept_ranges(self):
+        content = factory.make_bytes(size=1024)
+        path = self.make_filesystem_resource_file(content)
+        response = self.get_file_client(*path)
+        self.assertEqual(
+            '"%s"' % hashlib.sha256(content).hexdigest(), response["ETag"]
+        )
+        self.assertEqual("bytes", response["Accept-Ranges"])
+
+    def test_download_matching_if_none_match_returns_304(self):
+        content = factory.make_bytes(size=1024)
+        path = self.make_filesystem_resource_file(content)
+        response = self.client.get(
+            self.reverse_file_handler(*path),
+            HTTP_IF_NONE_MATCH='"%s"' % hashlib.sha256(content).hexdigest(),
+        )
+        self.assertEqual(http.client.NOT_MODIFIED, response.status_code)
+
+    def test_download_range_from_filesystem(self):
+        content = factory.make_bytes(size=1024)
+        path = self.make_filesystem_resource_file(content)
+        response = self.client.get(
+            self.reverse_file_handler(*path), HTTP_RANGE="bytes=100-"
+        )
+        self.assertEqual(http.client.PARTIAL_CONTENT, response.status_code)
+        self.assertEqual("bytes 100-1023/1024", response["Content-Range"])
+        self.assertEqual("924", response["Content-Length"])
+        self.assertEqual(content[100:], b"".join(response.streaming_content))
+
+    def test_download_unsatisfiable_range_returns_416(self):
+        content = factory.make_bytes(size=1024)
+        path = self.make_filesystem_resource_file(content)
+        response = self.client.get(
+            self.reverse_file_handler(*path), HTTP_RANGE="bytes=1024-"
+        )
+        self.assertEqual(
+            http.client.REQUESTED_RANGE_NOT_SATISFIABLE, response.status_code
+        )
+        self.assertEqual("bytes */1024", response["Content-Range"])
+
+
+class TestGetByteRange(MAASTestCase):
+    """Tests for `get_byte_range`."""
+
+    def get_byte_range(self, header, if_range=None, size=100):
+        request = RequestFactory().get("/", HTTP_RANGE=header)
+        if if_range is not None:
+            request.META["HTTP_IF_RANGE"] = if_range
+        return bootresources.get_byte_range(request, '"etag"', size)
+
+    def test_returns_None_without_range(self):
+        self.assertIsNone(self.get_byte_range(None))
+
+    def test_returns_range(self):
+        self.assertEqual((10, 19), self.get_byte_range("bytes=10-19"))
+
+    def test_returns_open_ended_range(self):
+        self.assertEqual((10, 99), self.get_byte_range("bytes=10-"))
+
+    def test_returns_suffix_range(self):
+        self.assertEqual((90, 99), self.get_byte_range("bytes=-10"))
+
+    def test_limits_range_to_size(self):
+        self.assertEqual((90, 99), self.get_byte_range("bytes=90-1000"))
+        self.assertEqual((0, 99), self.get_byte_range("bytes=-1000"))
+
+    def test_ignores_invalid_ranges(self):
+        for header in ("bytes=20-10", "bytes=-", "items=0-1", "bytes=a-b"):
+            self.assertIsNone(self.get_byte_range(header), header)
+
+    def test_ignores_multiple_ranges(self):
+        self.assertIsNone(self.get_byte_range("bytes=0-1,5-6"))
+
+    def test_ignores_range_if_etag_does_not_match_if_range(self):
+        self.assertIsNone(self.get_byte_range("bytes=0-1", '"other"'))
+
+    def test_honours_range_if_etag_matches_if_range(self):
+        self.assertEqual((0, 1), self.get_byte_range("bytes=0-1", '"etag"'))
+
+    def test_raises_ValueError_if_unsatisfiable(self):
+        self.assertRaises(ValueError, self.get_byte_range, "bytes=100-")
+        self.assertRaises(ValueError, self.get_byte_range, "bytes=-0")
+
 
 class TestConnectionWrapper(MAASTransactionServerTestCase):
     """Tests the use of StreamingHttpResponse(ConnectionWrapper(stream)).
@@ -560,6 +681,13 @@ class TestConnectionWrapper(MAASTransactionServerTestCase):
         self.read_response(response)
         self.assertThat(mock_get_new_connection, MockCalledOnceWith())
 
+    def test_download_range_from_database(self):
+        content, url = self.make_file_for_client()
+        client = MAASSensibleClient()
+        response = client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(http.client.PARTIAL_CONTENT, response.status_code)
+        self.assertEqual(content[10:20], self.read_response(response))
+
     def test_download_connection_is_not_same_as_django_connections(self):
         content, url = self.make_file_for_client()
 
@@ -985,6 +1113,27 @@ class TestBootResourceStore(MAASServerTestCase):
         self.assertEqual(rfile.largefile.size, len(written_data))
         self.assertEqual(rfile.largefile.size, rfile.largefile.total_size)
 
+    def test_write_content_thread_saves_data_in_filesystem(self):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_path=self.make_dir())
+        )
+        store = BootResourceStore()
+        size = int(2.5 * store.read_size)
+        content = factory.make_bytes(size=size)
+        resource = factory.make_BootResource(rtype=BOOT_RESOURCE_TYPE.SYNCED)
+        resource_set = factory.make_BootResourceSet(resource)
+        largefile = LargeFile.objects.create(
+            sha256=hashlib.sha256(content).hexdigest(),
+            total_size=size,
+            content=None,
+        )
+        rfile = factory.make_BootResourceFile(resource_set, largefile)
+        store.write_content_thread(rfile.id, BytesIO(content))
+        largefile = reload_object(largefile)
+        self.assertTrue(largefile.complete)
+        with largefile.open_content() as stream:
+            self.assertEqual(content, stream.read())
+
     def test_write_content_doesnt_write_if_cancel(self):
         store = BootResourceStore()
         size = int(2.5 * store.read_size)
@@ -1267,6 +1416,26 @@ class TestBootResourceTransactional(MAASTransactionServerTestCase):
             mock_save_later, MockCalledOnceWith(rfile, sentinel.reader)
         )
 
+    def test_insert_creates_new_largefile_in_filesystem(self):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_storage="filesystem")
+        )
+        name, architecture, product = make_product()
+        with transaction.atomic():
+            resource = factory.make_BootResource(
+                rtype=BOOT_RESOURCE_TYPE.SYNCED,
+                name=name,
+                architecture=architecture,
+            )
+            resource_set = factory.make_BootResourceSet(
+                resource, version=product["version_name"]
+            )
+        store = BootResourceStore()
+        self.patch(store, "save_content_later")
+        store.insert(product, sentinel.reader)
+        rfile = get_one(reload_object(resource_set).files.all())
+        self.assertTrue(rfile.largefile.stored_in_filesystem)
+
     def test_insert_prints_error_when_breaking_resources(self):
         # Test case for bug 1419041: if the call to insert() makes
         # an existing complete resource incomplete: print an error in the
@@ -0,0 +1,70 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the `db_move_lobjects` management command."""
+
+__all__ = []
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from maasserver.contentstore import get_filesystem_content_store
+from maasserver.testing.config import RegionConfigurationFixture
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.utils.orm import reload_object
+
+
+class TestDBMoveLObjects(MAASServerTestCase):
+    def configure_filesystem_storage(self):
+        self.useFixture(
+            RegionConfigurationFixture(
+                boot_resources_storage="filesystem",
+                boot_resources_path=self.make_dir(),
+            )
+        )
+
+    def call_command(self):
+        stdout = StringIO()
+        call_command("db_move_lobjects", stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_requires_filesystem_storage(self):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_storage="database")
+        )
+        self.assertRaises(CommandError, self.call_command)
+
+    def test_moves_content_to_filesystem(self):
+        largefile = factory.make_LargeFile()
+        with largefile.content.open("rb") as stream:
+            content = stream.read()
+        self.configure_filesystem_storage()
+        output = self.call_command()
+        largefile = reload_object(largefile)
+        self.assertTrue(largefile.stored_in_filesystem)
+        with largefile.open_content() as stream:
+            self.assertEqual(content, stream.read())
+        self.assertIn("Moved 1 large files.", output)
+
+    def test_skips_incomplete_content(self):
+        largefile = factory.make_LargeFile(
+            factory.make_bytes(size=10), size=1024
+        )
+        self.configure_filesystem_storage()
+        self.call_command()
+        largefile = reload_object(largefile)
+        self.assertFalse(largefile.stored_in_filesystem)
+        self.assertFalse(
+            get_filesystem_content_store().exists(largefile.sha256)
+        )
+
+    def test_leaves_mismatched_content_in_database(self):
+        largefile = factory.make_LargeFile()
+        largefile.sha256 = factory.make_string(size=64)
+        largefile.save()
+        self.configure_filesystem_storage()
+        self.assertRaises(CommandError, self.call_command)
+        self.assertFalse(reload_object(largefile).stored_in_filesystem)
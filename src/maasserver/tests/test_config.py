@@ -13,6 +13,7 @@ from testtools.testcase import ExpectedException
 from maasserver.config import RegionConfiguration
 from maastesting.factory import factory
 from maastesting.testcase import MAASTestCase
+from provisioningserver.path import get_tentative_data_path
 
 
 class TestRegionConfiguration(MAASTestCase):
@@ -153,3 +154,39 @@ class TestRegionConfigurationDebugOptions(MAASTestCase):
         self.assertTrue(getattr(config, self.option))
         # It's also stored in the configuration database.
         self.assertEqual({self.option: True}, config.store)
+
+
+class TestRegionConfigurationBootResourceOptions(MAASTestCase):
+    """Tests for the boot resource options in `RegionConfiguration`."""
+
+    def test__default_storage(self):
+        config = RegionConfiguration({})
+        self.assertEqual("database", config.boot_resources_storage)
+
+    def test__set_and_get_storage(self):
+        config = RegionConfiguration({})
+        config.boot_resources_storage = "filesystem"
+        self.assertEqual("filesystem", config.boot_resources_storage)
+        # It's also stored in the configuration database.
+        self.assertEqual(
+            {"boot_resources_storage": "filesystem"}, config.store
+        )
+
+    def test__rejects_unknown_storage(self):
+        config = RegionConfiguration({})
+        with ExpectedException(formencode.api.Invalid):
+            config.boot_resources_storage = factory.make_name("storage")
+
+    def test__default_path(self):
+        config = RegionConfiguration({})
+        self.assertEqual(
+            get_tentative_data_path("/var/lib/maas/image-storage"),
+            config.boot_resources_path,
+        )
+
+    def test__set_and_get_path(self):
+        config = RegionConfiguration({})
+        path = factory.make_name("/path")
+        config.boot_resources_path = path
+        self.assertEqual(path, config.boot_resources_path)
+        self.assertEqual({"boot_resources_path": path}, config.store)
@@ -0,0 +1,147 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.contentstore`."""
+
+__all__ = []
+
+import hashlib
+from io import BytesIO
+import os
+
+from maasserver.contentstore import (
+    ContentChecksumMismatch,
+    FilesystemContentStore,
+    get_filesystem_content_store,
+    use_filesystem_content_store,
+)
+from maasserver.testing.config import RegionConfigurationFixture
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+
+
+def make_content(size=1024):
+    content = factory.make_bytes(size=size)
+    return content, hashlib.sha256(content).hexdigest()
+
+
+class TestFilesystemContentStore(MAASTestCase):
+    def make_store(self):
+        return FilesystemContentStore(self.make_dir())
+
+    def test_get_path_is_named_by_sha256(self):
+        store = self.make_store()
+        _, sha256 = make_content()
+        self.assertEqual(
+            os.path.join(store.root, sha256[:2], sha256),
+            store.get_path(sha256),
+        )
+
+    def test_put_stores_content(self):
+        store = self.make_store()
+        content, sha256 = make_content(3 * store.block_size // 2)
+        store.put(sha256, BytesIO(content))
+        self.assertTrue(store.exists(sha256))
+        with store.open(sha256) as stream:
+            self.assertEqual(content, stream.read())
+        self.assertFalse(os.path.exists(store.get_partial_path(sha256)))
+
+    def test_put_rejects_mismatched_content(self):
+        store = self.make_store()
+        content, _ = make_content()
+        _, sha256 = make_content()
+        self.assertRaises(
+            ContentChecksumMismatch, store.put, sha256, BytesIO(content)
+        )
+        self.assertFalse(store.exists(sha256))
+        self.assertFalse(os.path.exists(store.get_partial_path(sha256)))
+
+    def test_partial_content_is_not_stored(self):
+        store = self.make_store()
+        content, sha256 = make_content()
+        with store.open_partial(sha256) as stream:
+            stream.write(content[:10])
+        self.assertFalse(store.exists(sha256))
+        self.assertEqual(10, store.get_partial_size(sha256))
+
+    def test_open_partial_appends(self):
+        store = self.make_store()
+        content, sha256 = make_content()
+        with store.open_partial(sha256) as stream:
+            stream.write(content[:10])
+        with store.open_partial(sha256) as stream:
+            self.assertEqual(10, stream.tell())
+            stream.write(content[10:])
+        store.commit(sha256)
+        with store.open(sha256) as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_open_partial_can_start_again(self):
+        store = self.make_store()
+        content, sha256 = make_content()
+        with store.open_partial(sha256) as stream:
+            stream.write(factory.make_bytes())
+        with store.open_partial(sha256, "wb") as stream:
+            stream.write(content)
+        store.commit(sha256)
+        with store.open(sha256) as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_get_partial_size_without_content(self):
+        store = self.make_store()
+        _, sha256 = make_content()
+        self.assertEqual(0, store.get_partial_size(sha256))
+
+    def test_commit_uses_given_digest(self):
+        store = self.make_store()
+        content, sha256 = make_content()
+        with store.open_partial(sha256) as stream:
+            stream.write(content)
+        self.assertRaises(
+            ContentChecksumMismatch,
+            store.commit,
+            sha256,
+            hashlib.sha256(b"").hexdigest(),
+        )
+        self.assertFalse(store.exists(sha256))
+
+    def test_commit_rejects_mismatched_content(self):
+        store = self.make_store()
+        _, sha256 = make_content()
+        with store.open_partial(sha256) as stream:
+            stream.write(factory.make_bytes())
+        self.assertRaises(ContentChecksumMismatch, store.commit, sha256)
+        self.assertEqual(0, store.get_partial_size(sha256))
+
+    def test_delete_removes_content(self):
+        store = self.make_store()
+        content, sha256 = make_content()
+        store.put(sha256, BytesIO(content))
+        with store.open_partial(sha256) as stream:
+            stream.write(content)
+        store.delete(sha256)
+        self.assertFalse(store.exists(sha256))
+        self.assertEqual(0, store.get_partial_size(sha256))
+
+    def test_delete_ignores_missing_content(self):
+        store = self.make_store()
+        _, sha256 = make_content()
+        store.delete(sha256)
+        self.assertFalse(store.exists(sha256))
+
+
+class TestConfiguration(MAASTestCase):
+    def test_use_filesystem_content_store_defaults_to_False(self):
+        self.useFixture(RegionConfigurationFixture())
+        self.assertFalse(use_filesystem_content_store())
+
+    def test_use_filesystem_content_store_when_configured(self):
+        self.useFixture(
+            RegionConfigurationFixture(boot_resources_storage="filesystem")
+        )
+        self.assertTrue(use_filesystem_content_store())
+
+    def test_get_filesystem_content_store_uses_configured_path(self):
+        path = self.make_dir()
+        self.useFixture(RegionConfigurationFixture(boot_resources_path=path))
+        self.assertEqual(path, get_filesystem_content_store().root)
@@ -8,7 +8,7 @@ __all__ = []
 from datetime import datetime
 from operator import itemgetter
 import random
-from unittest.mock import ANY
+from unittest.mock import ANY, call, Mock
 
 from crochet import wait_for
 from django.core.exceptions import ValidationError
@@ -53,20 +53,30 @@ from maasserver.testing.testcase import (
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from maastesting.djangotestcase import count_queries
-from maastesting.matchers import MockCalledOnceWith, MockNotCalled
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase, MAASTwistedRunTest
 from maastesting.twisted import always_fail_with, always_succeed_with
 from provisioningserver.rpc.cluster import (
     ConfigureDHCPv4,
     ConfigureDHCPv4_V2,
     ConfigureDHCPv6,
     ConfigureDHCPv6_V2,
+    UpdateDHCPv4Hosts,
+    UpdateDHCPv6Hosts,
     ValidateDHCPv4Config,
     ValidateDHCPv4Config_V2,
     ValidateDHCPv6Config,
     ValidateDHCPv6Config_V2,
 )
 from provisioningserver.rpc.dhcp import downgrade_shared_networks
-from provisioningserver.rpc.exceptions import CannotConfigureDHCP
+from provisioningserver.rpc.exceptions import (
+    CannotConfigureDHCP,
+    DHCPRevisionMismatch,
+)
 from provisioningserver.utils.twisted import synchronous
 
 wait_for_reactor = wait_for(30)  # 30 seconds.
@@ -1829,6 +1839,72 @@ class TestMakeHostsForSubnet(MAASServerTestCase):
 
         self.assertEqual(expected_hosts, dhcp.make_hosts_for_subnets([subnet]))
 
+    def test__query_count_does_not_depend_on_number_of_hosts(self):
+        subnet = factory.make_Subnet()
+
+        def make_hosts(count):
+            for _ in range(count):
+                node = factory.make_Node(interface=False)
+                factory.make_DHCPSnippet(node=node, enabled=True)
+                eth0 = factory.make_Interface(
+                    INTERFACE_TYPE.PHYSICAL, node=node, vlan=subnet.vlan
+                )
+                eth1 = factory.make_Interface(
+                    INTERFACE_TYPE.PHYSICAL, node=node, vlan=subnet.vlan
+                )
+                bond0 = factory.make_Interface(
+                    INTERFACE_TYPE.BOND,
+                    node=node,
+                    mac_address=eth1.mac_address,
+                    parents=[eth0, eth1],
+                    vlan=subnet.vlan,
+                )
+                factory.make_StaticIPAddress(
+                    alloc_type=IPADDRESS_TYPE.AUTO,
+                    subnet=subnet,
+                    interface=bond0,
+                )
+                device = factory.make_Device(interface=False)
+                factory.make_StaticIPAddress(
+                    alloc_type=IPADDRESS_TYPE.USER_RESERVED,
+                    subnet=subnet,
+                    interface=factory.make_Interface(
+                        INTERFACE_TYPE.PHYSICAL, node=device, vlan=subnet.vlan
+                    ),
+                )
+
+        def count_host_queries():
+            # Fetched like get_dhcp_configuration does.
+            dhcp_snippets = list(
+                DHCPSnippet.objects.filter(enabled=True).select_related(
+                    "value"
+                )
+            )
+            return count_queries(
+                dhcp.make_hosts_for_subnets, [subnet], dhcp_snippets
+            )
+
+        make_hosts(2)
+        query_2_count, hosts_2 = count_host_queries()
+        make_hosts(10)
+        query_12_count, hosts_12 = count_host_queries()
+
+        self.assertThat(hosts_2, HasLength(2 * 3))
+        self.assertThat(hosts_12, HasLength(12 * 3))
+        # This check is to notify the developer that a change was made that
+        # affects the number of queries performed when performing this
+        # operation. It is important to keep this number as low as possible.
+        self.assertEqual(
+            query_2_count,
+            3,
+            "Number of queries has changed; make sure this is expected.",
+        )
+        self.assertEqual(
+            query_2_count,
+            query_12_count,
+            "Number of queries is not independent to the number of objects.",
+        )
+
 
 class TestMakeFailoverPeerConfig(MAASServerTestCase):
     """Tests for `make_failover_peer_config`."""
@@ -2306,6 +2382,164 @@ class TestGetDHCPConfiguration(MAASServerTestCase):
         )
 
 
+class TestPushDHCPConfig(MAASTestCase):
+    """Tests for `_push_dhcp_config`."""
+
+    scenarios = (
+        (
+            "v4",
+            dict(
+                ip_version=4,
+                configure_command=ConfigureDHCPv4_V2,
+                update_command=UpdateDHCPv4Hosts,
+            ),
+        ),
+        (
+            "v6",
+            dict(
+                ip_version=6,
+                configure_command=ConfigureDHCPv6_V2,
+                update_command=UpdateDHCPv6Hosts,
+            ),
+        ),
+    )
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def setUp(self):
+        super(TestPushDHCPConfig, self).setUp()
+        self.addCleanup(dhcp._pushed_dhcp_state.clear)
+        self.client = Mock(ident=factory.make_name("system_id"))
+        self.client.return_value = defer.succeed({})
+
+    def make_host(self):
+        return {
+            "host": factory.make_name("host"),
+            "mac": factory.make_mac_address(),
+            "ip": factory.make_ip_address(),
+            "dhcp_snippets": [],
+        }
+
+    def make_settings(self):
+        return {
+            "omapi_key": factory.make_name("omapi_key"),
+            "failover_peers": [],
+            "shared_networks": [{"name": factory.make_name("vlan")}],
+            "interfaces": [{"name": factory.make_name("eth")}],
+            "global_dhcp_snippets": [],
+        }
+
+    def push(self, hosts, settings):
+        return dhcp._push_dhcp_config(
+            self.client, self.ip_version, hosts=hosts, **settings
+        )
+
+    def get_revision(self):
+        return dhcp._pushed_dhcp_state[self.client.ident, self.ip_version][0]
+
+    def configure_call(self, hosts, settings):
+        return call(
+            self.configure_command,
+            _timeout=ANY,
+            hosts=hosts,
+            revision=self.get_revision(),
+            **settings
+        )
+
+    @inlineCallbacks
+    def test__sends_full_configuration_first(self):
+        hosts = [self.make_host()]
+        settings = self.make_settings()
+        yield self.push(hosts, settings)
+        self.assertThat(
+            self.client, MockCallsMatch(self.configure_call(hosts, settings))
+        )
+
+    @inlineCallbacks
+    def test__sends_only_changed_hosts(self):
+        removed, modified, kept = [self.make_host() for _ in range(3)]
+        settings = self.make_settings()
+        yield self.push([removed, modified, kept], settings)
+        base_revision = self.get_revision()
+        modified = dict(modified, ip=factory.make_ip_address())
+        added = self.make_host()
+        self.client.reset_mock()
+
+        yield self.push([modified, kept, added], settings)
+
+        self.assertThat(
+            self.client,
+            MockCalledOnceWith(
+                self.update_command,
+                _timeout=ANY,
+                base_revision=base_revision,
+                revision=self.get_revision(),
+                remove=[removed["mac"]],
+                hosts=[modified, added],
+            ),
+        )
+        self.assertNotEqual(base_revision, self.get_revision())
+
+    @inlineCallbacks
+    def test__sends_full_configuration_when_settings_change(self):
+        hosts = [self.make_host()]
+        yield self.push(hosts, self.make_settings())
+        self.client.reset_mock()
+
+        settings = self.make_settings()
+        yield self.push(hosts, settings)
+
+        self.assertThat(
+            self.client, MockCallsMatch(self.configure_call(hosts, settings))
+        )
+
+    @inlineCallbacks
+    def test__sends_full_configuration_on_revision_mismatch(self):
+        settings = self.make_settings()
+        yield self.push([self.make_host()], settings)
+        self.client.reset_mock()
+        self.client.side_effect = [
+            defer.fail(DHCPRevisionMismatch()),
+            defer.succeed({}),
+        ]
+
+        hosts = [self.make_host()]
+        yield self.push(hosts, settings)
+
+        self.assertThat(
+            self.client,
+            MockCallsMatch(
+                call(
+                    self.update_command,
+                    _timeout=ANY,
+                    base_revision=ANY,
+                    revision=self.get_revision(),
+                    remove=ANY,
+                    hosts=hosts,
+                ),
+                self.configure_call(hosts, settings),
+            ),
+        )
+
+    @inlineCallbacks
+    def test__forgets_configuration_when_push_fails(self):
+        hosts = [self.make_host()]
+        settings = self.make_settings()
+        yield self.push(hosts, settings)
+        self.client.return_value = defer.fail(CannotConfigureDHCP())
+
+        with ExpectedException(CannotConfigureDHCP):
+            yield self.push([self.make_host()], settings)
+
+        self.assertEqual({}, dhcp._pushed_dhcp_state)
+
+    @inlineCallbacks
+    def test__does_not_keep_configuration_when_dhcp_is_stopped(self):
+        settings = dict(self.make_settings(), shared_networks=[])
+        yield self.push([], settings)
+        self.assertEqual({}, dhcp._pushed_dhcp_state)
+
+
 class TestConfigureDHCP(MAASTransactionServerTestCase):
     """Tests for `configure_dhcp`."""
 
@@ -2317,6 +2551,7 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
                 command_v4=ConfigureDHCPv4,
                 command_v6=ConfigureDHCPv6,
                 process_expected_shared_networks=downgrade_shared_networks,
+                expected_revision={},
             ),
         ),
         (
@@ -2326,6 +2561,7 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
                 command_v4=ConfigureDHCPv4_V2,
                 command_v6=ConfigureDHCPv6_V2,
                 process_expected_shared_networks=None,
+                expected_revision={"revision": ANY},
             ),
         ),
     )
@@ -2444,6 +2680,7 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
                 hosts=config.hosts_v4,
                 interfaces=interfaces_v4,
                 global_dhcp_snippets=config.global_dhcp_snippets,
+                **self.expected_revision
             ),
         )
         self.assertThat(
@@ -2456,6 +2693,7 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
                 hosts=config.hosts_v6,
                 interfaces=interfaces_v6,
                 global_dhcp_snippets=config.global_dhcp_snippets,
+                **self.expected_revision
             ),
         )
 
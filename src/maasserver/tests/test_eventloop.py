@@ -29,7 +29,12 @@ from maasserver import (
 )
 from maasserver.eventloop import DEFAULT_PORT, MAASServices
 from maasserver.prometheus.stats import PrometheusService
-from maasserver.regiondservices import ntp, service_monitor_service, syslog
+from maasserver.regiondservices import (
+    free_ranges,
+    ntp,
+    service_monitor_service,
+    syslog,
+)
 from maasserver.rpc import regionservice
 from maasserver.testing.eventloop import RegionEventLoopFixture
 from maasserver.testing.listener import FakePostgresListenerService
@@ -399,6 +404,20 @@ class TestFactories(MAASServerTestCase):
         )
         self.assertTrue(eventloop.loop.factories["stats"]["only_on_master"])
 
+    def test_make_SubnetsUtilisationStatsService(self):
+        service = eventloop.make_SubnetsUtilisationStatsService()
+        self.assertThat(
+            service, IsInstance(stats.SubnetsUtilisationStatsService)
+        )
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_SubnetsUtilisationStatsService,
+            eventloop.loop.factories["subnet-stats"]["factory"],
+        )
+        self.assertFalse(
+            eventloop.loop.factories["subnet-stats"]["only_on_master"]
+        )
+
     def test_make_PrometheusService(self):
         service = eventloop.make_PrometheusService()
         self.assertThat(service, IsInstance(PrometheusService))
@@ -520,6 +539,25 @@ class TestFactories(MAASServerTestCase):
             eventloop.loop.factories["status-worker"]["only_on_master"]
         )
 
+    def test_make_FreeRangeCacheService(self):
+        service = eventloop.make_FreeRangeCacheService(
+            FakePostgresListenerService()
+        )
+        self.assertThat(service, IsInstance(free_ranges.FreeRangeCacheService))
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_FreeRangeCacheService,
+            eventloop.loop.factories["free-range-cache"]["factory"],
+        )
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener-worker"],
+            eventloop.loop.factories["free-range-cache"]["requires"],
+        )
+        self.assertFalse(
+            eventloop.loop.factories["free-range-cache"]["only_on_master"]
+        )
+
     def test_make_NetworkTimeProtocolService(self):
         service = eventloop.make_NetworkTimeProtocolService()
         self.assertThat(
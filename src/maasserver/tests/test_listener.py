@@ -11,6 +11,7 @@ from unittest.mock import ANY, call, MagicMock, sentinel
 
 from crochet import wait_for
 from django.db import connection
+import prometheus_client
 from psycopg2 import OperationalError
 from testtools import ExpectedException
 from testtools.matchers import (
@@ -27,6 +28,7 @@ from twisted.internet.defer import (
     Deferred,
     DeferredQueue,
     inlineCallbacks,
+    succeed,
 )
 from twisted.logger import LogLevel
 from twisted.python.failure import Failure
@@ -50,6 +52,8 @@ from maastesting.matchers import (
     MockNotCalled,
 )
 from maastesting.twisted import TwistedLoggerFixture
+from provisioningserver.prometheus.metrics import METRICS_DEFINITIONS
+from provisioningserver.prometheus.utils import create_metrics
 from provisioningserver.utils.twisted import DeferredValue
 
 wait_for_reactor = wait_for(30)  # 30 seconds.
@@ -624,3 +628,140 @@ class TestPostgresListenerService(MAASServerTestCase):
                 call("UNLISTEN %s_update;" % channel),
             ),
         )
+
+
+class TestPostgresListenerServiceCoalescing(MAASServerTestCase):
+    """Tests for coalescing and batching in `PostgresListenerService`."""
+
+    def make_listener(self):
+        prometheus_metrics = create_metrics(
+            METRICS_DEFINITIONS, registry=prometheus_client.CollectorRegistry()
+        )
+        return PostgresListenerService(prometheus_metrics=prometheus_metrics)
+
+    def add_notifies(self, listener, notifies):
+        connection = self.patch(listener, "connection")
+        connection.connection.poll.return_value = None
+        connection.connection.notifies = list(notifies)
+        listener.doRead()
+
+    def test_register_batched_handler(self):
+        listener = PostgresListenerService()
+        listener.register("machine", sentinel.handler, batched=True)
+        self.assertEqual([sentinel.handler], listener.listeners["machine"])
+        self.assertEqual(
+            [sentinel.handler], listener.batchedListeners["machine"]
+        )
+
+    def test_unregister_removes_batched_handler(self):
+        listener = PostgresListenerService()
+        listener.register("machine", sentinel.handler, batched=True)
+        listener.unregister("machine", sentinel.handler)
+        self.assertEqual([], listener.batchedListeners["machine"])
+
+    def test__doRead_counts_notifications_received(self):
+        listener = self.make_listener()
+        notify = FakeNotify(channel="machine_update", payload="abc")
+        self.add_notifies(listener, [notify] * 3)
+        self.assertEqual({notify}, listener.notifications)
+        self.assertEqual(3, listener.notificationsReceived)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_calls_batched_handler_once_per_action(self):
+        listener = self.make_listener()
+        handler = MagicMock(return_value=succeed(None))
+        listener.register("machine", handler, batched=True)
+        self.add_notifies(
+            listener,
+            [
+                FakeNotify(channel="machine_update", payload="a"),
+                FakeNotify(channel="machine_update", payload="b"),
+                FakeNotify(channel="machine_update", payload="a"),
+                FakeNotify(channel="machine_delete", payload="c"),
+            ],
+        )
+        yield listener.handleNotifies()
+        self.assertThat(handler.call_count, Equals(2))
+        calls = {
+            action: sorted(payloads)
+            for (action, payloads), _ in handler.call_args_list
+        }
+        self.assertEqual({"update": ["a", "b"], "delete": ["c"]}, calls)
+        self.assertEqual(set(), listener.notifications)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_calls_handler_once_per_object(self):
+        listener = self.make_listener()
+        handler = MagicMock(return_value=succeed(None))
+        listener.register("machine", handler)
+        self.add_notifies(
+            listener,
+            [
+                FakeNotify(channel="machine_update", payload="a"),
+                FakeNotify(channel="machine_update", payload="b"),
+                FakeNotify(channel="machine_update", payload="a"),
+            ],
+        )
+        yield listener.handleNotifies()
+        self.assertItemsEqual(
+            [call("update", "a"), call("update", "b")], handler.call_args_list
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_limits_concurrency_per_channel(self):
+        listener = self.make_listener()
+        listener.HANDLE_NOTIFY_CONCURRENCY = 2
+        pending = []
+
+        def handler(action, obj_id):
+            d = Deferred()
+            pending.append(d)
+            return d
+
+        listener.register("machine", handler)
+        self.add_notifies(
+            listener,
+            [
+                FakeNotify(channel="machine_update", payload=str(i))
+                for i in range(5)
+            ],
+        )
+        done = listener.handleNotifies()
+        self.assertThat(pending, HasLength(2))
+        while len(pending) != 0:
+            pending.pop(0).callback(None)
+        yield done
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_logs_handler_failures(self):
+        listener = self.make_listener()
+        listener.register("machine", MagicMock(side_effect=ValueError()))
+        self.add_notifies(
+            listener, [FakeNotify(channel="machine_update", payload="a")]
+        )
+        with TwistedLoggerFixture() as logger:
+            yield listener.handleNotifies()
+        self.assertThat(
+            logger.output,
+            DocTestMatches(
+                "Failure while handling notification to 'machine': 'a'..."
+            ),
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__handleNotifies_records_metrics(self):
+        listener = self.make_listener()
+        listener.register("machine", MagicMock(return_value=None))
+        notify = FakeNotify(channel="machine_update", payload="a")
+        self.add_notifies(listener, [notify] * 4)
+        metrics = listener.prometheus_metrics.generate_latest().decode()
+        self.assertIn("maas_listener_notify_queue_depth 1.0", metrics)
+        yield listener.handleNotifies()
+        metrics = listener.prometheus_metrics.generate_latest().decode()
+        self.assertIn("maas_listener_notify_queue_depth 0.0", metrics)
+        self.assertIn("maas_listener_notify_coalesce_ratio 4.0", metrics)
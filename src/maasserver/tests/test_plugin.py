@@ -121,6 +121,8 @@ class TestRegionWorkerServiceMaker(TestServiceMaker):
         expected_services = [
             "database-tasks",
             "postgres-listener-worker",
+            "free-range-cache",
+            "subnet-stats",
             "rack-controller",
             "rpc",
             "status-worker",
@@ -158,6 +160,8 @@ class TestRegionWorkerServiceMaker(TestServiceMaker):
         expected_services = [
             "database-tasks",
             "postgres-listener-worker",
+            "free-range-cache",
+            "subnet-stats",
             "rack-controller",
             "rpc",
             "status-worker",
@@ -359,6 +363,8 @@ class TestRegionAllInOneServiceMaker(TestServiceMaker):
             # Worker services.
             "database-tasks",
             "postgres-listener-worker",
+            "free-range-cache",
+            "subnet-stats",
             "rack-controller",
             "rpc",
             "service-monitor",
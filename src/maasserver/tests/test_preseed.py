@@ -5,16 +5,19 @@
 
 __all__ = []
 
+from collections import namedtuple
 import http.client
 import json
 import os
 from pipes import quote
 import random
 from textwrap import dedent
-from unittest.mock import ANY, sentinel
+import time
+from unittest.mock import ANY, Mock, sentinel
 from urllib.parse import urlparse
 
 from django.conf import settings
+from testtools.content import text_content
 from testtools.matchers import (
     AllMatch,
     Contains,
@@ -67,6 +70,7 @@ from maasserver.preseed import (
     get_preseed_type_for,
     load_preseed_template,
     PreseedTemplate,
+    PreseedTemplateCache,
     render_enlistment_preseed,
     render_preseed,
     split_subarch,
@@ -442,6 +446,141 @@ class TestLoadPreseedTemplate(MAASServerTestCase):
         self.assertRaises(TemplateNotFoundError, template.substitute)
 
 
+class TestPreseedTemplateCache(MAASTestCase):
+    """Tests for `PreseedTemplateCache`."""
+
+    def make_location(self, **templates):
+        # Files and locations modified recently are not cached, so pretend
+        # they're older.
+        location = self.make_dir()
+        past = time.time() - 60
+        for name, content in templates.items():
+            path = os.path.join(location, name)
+            with open(path, "w", encoding="utf-8") as stream:
+                stream.write(content)
+            os.utime(path, (past, past))
+        os.utime(location, (past, past))
+        return location
+
+    def test_list_location(self):
+        location = self.make_location(foo="", bar="")
+        cache = PreseedTemplateCache()
+        self.assertEqual({"foo", "bar"}, cache.list_location(location))
+
+    def test_list_location_is_cached(self):
+        location = self.make_location(foo="")
+        cache = PreseedTemplateCache()
+        self.assertIs(
+            cache.list_location(location), cache.list_location(location)
+        )
+
+    def test_list_location_notices_new_files(self):
+        location = self.make_location(foo="")
+        cache = PreseedTemplateCache()
+        cache.list_location(location)
+        factory.make_file(location, "bar")
+        self.assertEqual({"foo", "bar"}, cache.list_location(location))
+
+    def test_list_location_ignores_missing_location(self):
+        cache = PreseedTemplateCache()
+        self.assertEqual(
+            frozenset(), cache.list_location(factory.make_name("missing"))
+        )
+
+    def test_read_is_cached(self):
+        location = self.make_location(foo=factory.make_string())
+        path = os.path.join(location, "foo")
+        cache = PreseedTemplateCache()
+        self.assertIs(cache.read(path), cache.read(path))
+
+    def test_read_notices_modified_files(self):
+        location = self.make_location(foo=factory.make_string())
+        path = os.path.join(location, "foo")
+        cache = PreseedTemplateCache()
+        cache.read(path)
+        content = factory.make_string(size=20)
+        factory.make_file(location, "foo", content)
+        self.assertEqual(content, cache.read(path))
+
+    def test_read_does_not_cache_recently_modified_files(self):
+        path = self.make_file(contents=factory.make_string())
+        cache = PreseedTemplateCache()
+        self.assertIsNot(cache.read(path), cache.read(path))
+
+    def test_compile_parses_once(self):
+        location = self.make_location(foo="{{bar}}")
+        path = os.path.join(location, "foo")
+        cache = PreseedTemplateCache()
+        content = cache.read(path)
+        get_template_1, get_template_2 = Mock(), Mock()
+        template_1 = cache.compile(path, content, get_template_1)
+        template_2 = cache.compile(path, content, get_template_2)
+        self.assertIsInstance(template_2, PreseedTemplate)
+        self.assertIs(template_1._parsed, template_2._parsed)
+        self.assertIs(get_template_1, template_1.get_template)
+        self.assertIs(get_template_2, template_2.get_template)
+        self.assertEqual("baz", template_2.substitute(bar="baz"))
+
+    def test_compile_parses_content_not_read(self):
+        location = self.make_location(foo="{{bar}}")
+        path = os.path.join(location, "foo")
+        cache = PreseedTemplateCache()
+        cache.read(path)
+        template = cache.compile(path, "{{baz}}", None)
+        self.assertEqual("bar", template.substitute(baz="bar"))
+
+    def test_benchmark_load_preseed_template_for_500_nodes(self):
+        # Load the templates for deploying 500 nodes, with and without the
+        # cache, as `get_curtin_userdata` does.
+        location = self.make_location(
+            curtin_userdata='{{inherit "curtin_base"}}',
+            curtin_base="{{def body}}{{hostname}}{{enddef}}{{body}}",
+        )
+        self.patch(settings, "PRESEED_TEMPLATE_LOCATIONS", [location])
+        Node = namedtuple("Node", ("architecture", "hostname"))
+        nodes = [Node("amd64/generic", "node-%d" % i) for i in range(500)]
+        compiled = self.patch(
+            preseed_module,
+            "PreseedTemplate",
+            Mock(side_effect=PreseedTemplate),
+        )
+
+        def render(cached):
+            cache = PreseedTemplateCache()
+            self.patch(preseed_module, "preseed_template_cache", cache)
+            compiled.reset_mock()
+            start = time.monotonic()
+            for node in nodes:
+                if not cached:
+                    cache.clear()
+                template = load_preseed_template(
+                    node, "curtin_userdata", "ubuntu", "bionic"
+                )
+                self.assertEqual(
+                    node.hostname, template.substitute(hostname=node.hostname)
+                )
+            return time.monotonic() - start, compiled.call_count
+
+        uncached_time, uncached_compiled = render(cached=False)
+        cached_time, cached_compiled = render(cached=True)
+        # Recorded for comparison when run with `--verbose`.
+        self.addDetail(
+            "benchmark",
+            text_content(
+                "uncached: %.3fs, %d templates compiled; "
+                "cached: %.3fs, %d templates compiled"
+                % (
+                    uncached_time,
+                    uncached_compiled,
+                    cached_time,
+                    cached_compiled,
+                )
+            ),
+        )
+        self.assertEqual(1000, uncached_compiled)
+        self.assertEqual(2, cached_compiled)
+
+
 class TestPreseedContext(MAASServerTestCase):
     """Tests for `get_preseed_context`."""
 
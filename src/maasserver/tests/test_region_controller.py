@@ -118,6 +118,14 @@ class TestRegionControllerService(MAASServerTestCase):
         self.assertTrue(service.needsDNSUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_markAllForUpdate_sets_needsFullDNSUpdate(self):
+        service = self.make_service(MagicMock())
+        self.patch(service, "startProcessing")
+        service.needsFullDNSUpdate = False
+        service.markAllForUpdate()
+        self.assertTrue(service.needsDNSUpdate)
+        self.assertTrue(service.needsFullDNSUpdate)
+
     def test_markProxyForUpdate_sets_needsProxyUpdate_and_starts_process(self):
         listener = MagicMock()
         service = self.make_service(listener)
@@ -216,6 +224,49 @@ class TestRegionControllerService(MAASServerTestCase):
             MockCalledOnceWith("Reloaded DNS configuration; regiond started."),
         )
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_changed_zones_after_first_update(self):
+        service = self.make_service(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.needsFullDNSUpdate = False
+        service.previousSerial = random.randint(1, 1000)
+        dns_result = (
+            service.previousSerial + 1,
+            True,
+            [factory.make_name("domain")],
+        )
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones"
+        )
+        mock_dns_update_changed_zones = self.patch(
+            region_controller, "dns_update_changed_zones"
+        )
+        mock_dns_update_changed_zones.return_value = dns_result
+        self.patch(service, "_checkSerial").return_value = succeed(None)
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_dns_update_all_zones, MockNotCalled())
+        self.assertThat(
+            mock_dns_update_changed_zones,
+            MockCalledOnceWith(service.previousSerial),
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_all_zones_when_previous_update_failed(self):
+        service = self.make_service(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.needsFullDNSUpdate = False
+        service.previousSerial = random.randint(1, 1000)
+        self.patch(
+            region_controller, "dns_update_changed_zones"
+        ).side_effect = factory.make_exception()
+        self.patch(region_controller.log, "err")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertTrue(service.needsFullDNSUpdate)
+
     @wait_for_reactor
     @inlineCallbacks
     def test_process_zones_kills_bind_on_failed_reload(self):
@@ -29,7 +29,12 @@ from maasserver.testing.testcase import (
     MAASServerTestCase,
     MAASTransactionServerTestCase,
 )
-from maastesting.matchers import MockCalledOnce, MockNotCalled
+from maastesting.djangotestcase import count_queries
+from maastesting.matchers import (
+    MockCalledOnce,
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import extract_result
 from provisioningserver.utils.twisted import asynchronous
@@ -398,6 +403,139 @@ class TestGetSubnetsUtilisationStats(MAASServerTestCase):
             },
         )
 
+    def test_stats_static_route(self):
+        subnet = factory.make_Subnet(cidr="1.2.0.0/16", gateway_ip="1.2.0.254")
+        factory.make_StaticRoute(source=subnet, gateway_ip="1.2.0.253")
+        self.assertEqual(
+            stats.get_subnets_utilisation_stats()[subnet.cidr],
+            {
+                "available": 2 ** 16 - 4,
+                "dynamic_available": 0,
+                "dynamic_used": 0,
+                "reserved_available": 0,
+                "reserved_used": 0,
+                "static": 0,
+                "unavailable": 2,
+            },
+        )
+
+    def test_stats_query_count_does_not_depend_on_subnets(self):
+        def make_subnet():
+            subnet = factory.make_Subnet(version=4)
+            factory.make_StaticIPAddress(subnet=subnet)
+            factory.make_StaticRoute(source=subnet)
+
+        make_subnet()
+        count1, _ = count_queries(stats.get_subnets_utilisation_stats)
+        make_subnet()
+        make_subnet()
+        count2, _ = count_queries(stats.get_subnets_utilisation_stats)
+        self.assertEqual(count1, count2)
+
+
+class TestSubnetsUtilisationStatsCache(MAASTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        self.get_stats = self.patch(stats, "get_subnets_utilisation_stats")
+        self.get_stats.side_effect = lambda: {"cidr": {"now": self.now}}
+
+    def make_cache(self):
+        return stats.SubnetsUtilisationStatsCache(clock=lambda: self.now)
+
+    def test_get_computes_stats(self):
+        cache = self.make_cache()
+        self.assertEqual({"cidr": {"now": 1000.0}}, cache.get())
+        self.assertThat(self.get_stats, MockCalledOnceWith())
+
+    def test_get_returns_snapshot(self):
+        cache = self.make_cache()
+        snapshot = cache.get()
+        self.now += cache.max_age - 1
+        self.assertIs(snapshot, cache.get())
+        self.assertThat(self.get_stats, MockCalledOnceWith())
+
+    def test_get_recomputes_old_snapshot(self):
+        cache = self.make_cache()
+        cache.get()
+        self.now += cache.max_age
+        self.assertEqual({"cidr": {"now": self.now}}, cache.get())
+
+    def test_refresh_recomputes_snapshot(self):
+        cache = self.make_cache()
+        cache.get()
+        self.now += 1
+        cache.refresh()
+        self.assertEqual({"cidr": {"now": self.now}}, cache.get())
+        self.assertEqual(2, self.get_stats.call_count)
+
+    def test_refresh_does_nothing_while_computing(self):
+        cache = self.make_cache()
+        self.get_stats.side_effect = lambda: cache.refresh() or {}
+        cache.get()
+        self.assertThat(self.get_stats, MockCalledOnceWith())
+
+    def test_clear_forgets_snapshot(self):
+        cache = self.make_cache()
+        cache.get()
+        cache.clear()
+        cache.get()
+        self.assertEqual(2, self.get_stats.call_count)
+
+
+class TestSubnetsUtilisationStatsService(MAASTestCase):
+    """Tests for `SubnetsUtilisationStatsService`."""
+
+    def test__is_a_TimerService(self):
+        service = stats.SubnetsUtilisationStatsService()
+        self.assertIsInstance(service, TimerService)
+
+    def test__runs_once_a_minute(self):
+        service = stats.SubnetsUtilisationStatsService()
+        self.assertEqual(60, service.step)
+
+    def test__calls__maybe_refresh_stats(self):
+        service = stats.SubnetsUtilisationStatsService()
+        self.assertEqual((service.maybe_refresh_stats, (), {}), service.call)
+
+    def test_maybe_refresh_stats_does_not_error(self):
+        service = stats.SubnetsUtilisationStatsService()
+        deferToDatabase = self.patch(stats, "deferToDatabase")
+        exception_type = factory.make_exception_type()
+        deferToDatabase.return_value = fail(exception_type())
+        d = service.maybe_refresh_stats()
+        self.assertIsNone(extract_result(d))
+
+
+class TestSubnetsUtilisationStatsServiceAsync(MAASTransactionServerTestCase):
+    """Tests for the async parts of `SubnetsUtilisationStatsService`."""
+
+    def test_maybe_refresh_stats_refreshes_stats(self):
+        self.patch(stats, "PROMETHEUS_SUPPORTED", True)
+        mock_refresh = self.patch(stats.subnets_utilisation_stats, "refresh")
+
+        with transaction.atomic():
+            Config.objects.set_config("prometheus_enabled", True)
+
+        service = stats.SubnetsUtilisationStatsService()
+        maybe_refresh_stats = asynchronous(service.maybe_refresh_stats)
+        maybe_refresh_stats().wait(5)
+
+        self.assertThat(mock_refresh, MockCalledOnceWith())
+
+    def test_maybe_refresh_stats_doesnt_refresh_stats(self):
+        self.patch(stats, "PROMETHEUS_SUPPORTED", True)
+        mock_refresh = self.patch(stats.subnets_utilisation_stats, "refresh")
+
+        with transaction.atomic():
+            Config.objects.set_config("prometheus_enabled", False)
+
+        service = stats.SubnetsUtilisationStatsService()
+        maybe_refresh_stats = asynchronous(service.maybe_refresh_stats)
+        maybe_refresh_stats().wait(5)
+
+        self.assertThat(mock_refresh, MockNotCalled())
+
 
 class TestStatsService(MAASTestCase):
     """Tests for `ImportStatsService`."""
@@ -4,15 +4,19 @@
 """The base class that all handlers must extend."""
 
 __all__ = [
+    "DehydrationCache",
     "HandlerError",
     "HandlerPKError",
     "HandlerValidationError",
     "Handler",
 ]
 
-from functools import wraps
+from collections import OrderedDict
+from functools import partial, wraps
 from operator import attrgetter
+import threading
 
+from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
 from django.db.models import Model
@@ -66,6 +70,82 @@ class HandlerPermissionError(HandlerError):
         super().__init__("Permission denied")
 
 
+class DehydrationCache:
+    """Process-wide cache of objects dehydrated for a list.
+
+    Entries are keyed on the primary key of the object and a version key,
+    which is made of the `updated` timestamp of the object and the permission
+    class of the user the object was dehydrated for. Only the latest version
+    of an object is kept, and at most `max_size` objects are cached.
+
+    Changes that don't touch the object's row (new events, script results,
+    ...) are handled by `invalidate`, which is called for every notification
+    the handler receives. An entry computed concurrently with an invalidation
+    is not stored, see `generation`.
+
+    Cached data is shared between connections so it must not be modified.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def generation(self, pk):
+        """Return the current generation for `pk`.
+
+        This must be read before loading the object from the database, and
+        passed to `set` once it's dehydrated.
+        """
+        with self._lock:
+            return self._generations.get(pk, 0)
+
+    def get(self, pk, version):
+        """Return the cached data for `pk` at `version`, or None."""
+        with self._lock:
+            versions = self._entries.get(pk)
+            if versions is None:
+                return None
+            self._entries.move_to_end(pk)
+            return versions.get(version)
+
+    def set(self, pk, version, data, generation):
+        """Cache `data` for `pk` at `version`.
+
+        Nothing is stored when `pk` was invalidated since `generation` was
+        read.
+        """
+        with self._lock:
+            if self._generations.get(pk, 0) != generation:
+                return
+            versions = self._entries.pop(pk, {})
+            updated = version[0]
+            versions = {
+                key: value
+                for key, value in versions.items()
+                if key[0] == updated
+            }
+            versions[version] = data
+            self._entries[pk] = versions
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, pk):
+        """Forget everything cached for `pk`."""
+        with self._lock:
+            self._entries.pop(pk, None)
+            self._generations[pk] = self._generations.get(pk, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
 class HandlerOptions(object):
     """Configuraton class for `Handler`.
 
@@ -97,6 +177,10 @@ class HandlerOptions(object):
     form_requires_request = True
     listen_channels = []
     batch_key = "id"
+    list_chunk_size = None
+    list_cache_size = None
+    bulk_listen = False
+    owner_field = None
     create_permission = None
     view_permission = None
     edit_permission = None
@@ -145,6 +229,14 @@ class HandlerMetaclass(type):
         if new_class._meta.list_exclude is None:
             new_class._meta.list_exclude = new_class._meta.exclude
 
+        # Each handler gets its own cache of dehydrated objects.
+        if new_class._meta.list_cache_size:
+            new_class._meta.list_cache = DehydrationCache(
+                new_class._meta.list_cache_size
+            )
+        else:
+            new_class._meta.list_cache = None
+
         return new_class
 
 
@@ -165,6 +257,11 @@ class Handler(metaclass=HandlerMetaclass):
 
     """
 
+    # Called with each chunk of a streamed `list`, from the thread running
+    # the handler method. Set by the protocol when the client asked for the
+    # response to be streamed.
+    partial_result_callback = None
+
     def __init__(self, user, cache, request):
         self.user = user
         self.cache = cache
@@ -452,6 +549,11 @@ class Handler(metaclass=HandlerMetaclass):
     def list(self, params):
         """List objects.
 
+        When `Meta.list_chunk_size` is set, objects are loaded and dehydrated
+        that many at a time. Each chunk but the last is passed to
+        `partial_result_callback` if it's set, otherwise all the chunks are
+        returned together.
+
         :param start: A value of the `batch_key` column and NOT `pk`. They are
             often the same but that is not a certainty. Make sure the client
             also understands this distinction.
@@ -464,11 +566,132 @@ class Handler(metaclass=HandlerMetaclass):
             queryset = queryset.filter(
                 **{"%s__gt" % self._meta.batch_key: params["start"]}
             )
-        if "limit" in params:
-            queryset = queryset[: params["limit"]]
-        objs = list(queryset)
-        self._cache_pks(objs)
-        return [self.full_dehydrate(obj, for_list=True) for obj in objs]
+        if self._meta.list_chunk_size is None:
+            if "limit" in params:
+                queryset = queryset[: params["limit"]]
+            objs = list(queryset)
+            self._cache_pks(objs)
+            return [self.full_dehydrate(obj, for_list=True) for obj in objs]
+
+        remaining = params.get("limit")
+        chunk_size = self._meta.list_chunk_size
+        data, last_key = [], None
+        while remaining is None or remaining > 0:
+            size = (
+                chunk_size if remaining is None else min(chunk_size, remaining)
+            )
+            chunk_queryset = queryset
+            if last_key is not None:
+                chunk_queryset = queryset.filter(
+                    **{"%s__gt" % self._meta.batch_key: last_key}
+                )
+            chunk, last_key, count = self._list_chunk(chunk_queryset, size)
+            if data and self.partial_result_callback is not None:
+                self.partial_result_callback(data)
+                data = []
+            data.extend(chunk)
+            if count < size:
+                break
+            if remaining is not None:
+                remaining -= count
+        return data
+
+    def get_dehydration_version(self, obj_updated, obj_owner_id=None):
+        """Return the version key for an object updated at `obj_updated`.
+
+        Cached data is only shared between handlers with the same
+        `get_permission_class`, and not with the owner of the object, given
+        by `obj_owner_id`, when `Meta.owner_field` is set.
+        """
+        version = (obj_updated, self.get_permission_class())
+        if self._owns(obj_owner_id):
+            version += (self.user.id,)
+        return version
+
+    def get_permission_class(self):
+        """Return a key shared by handlers that dehydrate objects the same.
+
+        The dehydrated data can depend on the user (for instance the actions
+        that are available). Superusers all have the same permissions unless
+        RBAC is used, so they share it; other users only share it between
+        their own connections.
+
+        Objects that dehydrate differently for their owner are not shared
+        with the owner either, see `Meta.owner_field`.
+        """
+        if self.user.is_superuser and not rbac.is_enabled():
+            return "superuser"
+        return self.user.id
+
+    def _owns(self, owner_id):
+        """Return whether objects owned by `owner_id` dehydrate differently
+        for this handler's user than for others of its permission class."""
+        return self._meta.owner_field is not None and owner_id == self.user.id
+
+    def _list_chunk(self, queryset, size):
+        """Dehydrate the first `size` objects from `queryset`.
+
+        Returns the dehydrated objects, the value of `batch_key` for the last
+        of them, and the number of objects that were read from `queryset`.
+        """
+        cache = self._meta.list_cache
+        if cache is None:
+            objs = list(queryset[:size])
+            self._cache_pks(objs)
+            data = [self.full_dehydrate(obj, for_list=True) for obj in objs]
+            if len(objs) == 0:
+                return data, None, 0
+            return data, getattr(objs[-1], self._meta.batch_key), len(objs)
+
+        # Only load the keys at first, so objects that are already cached
+        # don't need to be loaded (with all their prefetched relations) nor
+        # dehydrated.
+        pk_name, batch_key = self._meta.pk, self._meta.batch_key
+        owner_field = self._meta.owner_field
+        fields = [pk_name, "updated"]
+        if batch_key != pk_name:
+            fields.append(batch_key)
+        if owner_field is not None:
+            fields.append(owner_field)
+        rows = list(
+            queryset.prefetch_related(None).values_list(*fields)[:size]
+        )
+        if len(rows) == 0:
+            return [], None, 0
+        data, generations = {}, {}
+        for row in rows:
+            pk, updated = row[0], row[1]
+            owner_id = None if owner_field is None else row[-1]
+            cached = cache.get(
+                pk, self.get_dehydration_version(updated, owner_id)
+            )
+            if cached is None:
+                generations[pk] = cache.generation(pk)
+            else:
+                data[pk] = cached
+        self.cache["loaded_pks"].update(data)
+        if generations:
+            objs = list(
+                queryset.filter(**{"%s__in" % pk_name: list(generations)})
+            )
+            self._cache_pks(objs)
+            for obj in objs:
+                pk = getattr(obj, pk_name)
+                data[pk] = self.full_dehydrate(obj, for_list=True)
+                cache.set(
+                    pk,
+                    self.get_dehydration_version(
+                        obj.updated,
+                        None
+                        if owner_field is None
+                        else getattr(obj, owner_field),
+                    ),
+                    data[pk],
+                    generations[pk],
+                )
+        last_key = rows[-1][fields.index(batch_key)]
+        data = [data[row[0]] for row in rows if row[0] in data]
+        return data, last_key, len(rows)
 
     def get(self, params):
         """Get object.
@@ -585,6 +808,12 @@ class Handler(metaclass=HandlerMetaclass):
         self.cache["active_pk"] = obj_data[self._meta.pk]
         return obj_data
 
+    @classmethod
+    def invalidate_cached(cls, pk):
+        """Forget the cached dehydrated data for the object with `pk`."""
+        if cls._meta.list_cache is not None:
+            cls._meta.list_cache.invalidate(cls._meta.pk_type(pk))
+
     def on_listen(self, channel, action, pk):
         """Called by the protocol when a channel notification occurs.
 
@@ -592,25 +821,163 @@ class Handler(metaclass=HandlerMetaclass):
         """
         pk = self._meta.pk_type(pk)
         if action == "delete":
-            if pk in self.cache["loaded_pks"]:
-                self.cache["loaded_pks"].remove(pk)
-                return (self._meta.handler_name, action, pk)
-            else:
-                return None
+            return self._on_listen_delete(pk)
 
         self.user.refresh_from_db()
         try:
             obj = self.listen(channel, action, pk)
         except HandlerDoesNotExistError:
             obj = None
+        return self._on_listen_object(
+            action, pk, obj, self.on_listen_for_active_pk
+        )
+
+    @classmethod
+    def on_listen_many(cls, handlers, channel, action, pks):
+        """Called by the protocol when channel notifications occur.
+
+        `handlers` holds a handler for each connected client, and `pks` all
+        the objects notified for `action` on `channel`. Returns a list with,
+        for each of `handlers`, the messages to send to its client.
+
+        Unless `Meta.bulk_listen` is set, this calls `on_listen` for every
+        handler and object. Otherwise the objects visible to each permission
+        class are loaded in one query and each is dehydrated once per
+        permission class; `listen` and `on_listen_for_active_pk` are not used.
+        """
+        if not cls._meta.bulk_listen:
+            return [
+                [
+                    message
+                    for message in (
+                        handler.on_listen(channel, action, pk) for pk in pks
+                    )
+                    if message is not None
+                ]
+                for handler in handlers
+            ]
+
+        pks = [cls._meta.pk_type(pk) for pk in pks]
+        if action == "delete":
+            return [
+                [
+                    message
+                    for message in map(handler._on_listen_delete, pks)
+                    if message is not None
+                ]
+                for handler in handlers
+            ]
+
+        # Bring the users of all the handlers up to date with one query.
+        users = User.objects.in_bulk({handler.user.id for handler in handlers})
+        fields = [field.attname for field in User._meta.concrete_fields]
+        groups = OrderedDict()
+        for index, handler in enumerate(handlers):
+            user = users.get(handler.user.id)
+            if user is None:
+                # The user has been deleted.
+                continue
+            for field in fields:
+                setattr(handler.user, field, getattr(user, field))
+            groups.setdefault(handler.get_permission_class(), []).append(index)
+        pk_in = {cls._meta.pk + "__in": pks}
+        visible = {
+            permission_class: set(
+                handlers[indexes[0]]
+                .get_queryset(for_list=False)
+                .filter(**pk_in)
+                .prefetch_related(None)
+                .values_list(cls._meta.pk, flat=True)
+            )
+            for permission_class, indexes in groups.items()
+        }
+        getpk = attrgetter(cls._meta.pk)
+        objs = {
+            getpk(obj): obj
+            for obj in cls._meta.queryset.filter(
+                **{cls._meta.pk + "__in": set().union(*visible.values())}
+            )
+        }
+
+        messages = [[] for _ in handlers]
+        for permission_class, indexes in groups.items():
+            dehydrator = handlers[indexes[0]]
+            group_objs = {
+                pk: objs[pk]
+                for pk in visible[permission_class]
+                if pk in objs and dehydrator._can_view(objs[pk])
+            }
+            dehydrator.prepare_listen(list(group_objs.values()))
+            dehydrated = {}
+            for index in indexes:
+                handler = handlers[index]
+                dehydrate = partial(
+                    dehydrator._dehydrate_for_listen, handler, dehydrated
+                )
+                for pk in pks:
+                    message = handler._on_listen_object(
+                        action, pk, group_objs.get(pk), dehydrate
+                    )
+                    if message is not None:
+                        messages[index].append(message)
+        return messages
+
+    def prepare_listen(self, objs):
+        """Called before `objs` are dehydrated by `on_listen_many`.
+
+        Override to load, in one go, data otherwise loaded by
+        `on_listen_for_active_pk` for each object.
+        """
+
+    def _can_view(self, obj):
+        """Return whether the user has `Meta.view_permission` on `obj`."""
+        permission = self._meta.view_permission
+        return permission is None or self.user.has_perm(permission, obj)
+
+    def _dehydrate_for_listen(self, handler, dehydrated, action, pk, obj):
+        """Return the message about `obj` for the client of `handler`.
+
+        `obj` is dehydrated by this handler, at most once for the list and
+        once for the active object, keeping the result in `dehydrated`. When
+        `Meta.owner_field` is set, it is dehydrated apart for its owner.
+        """
+        for_list = handler.cache.get("active_pk") != pk
+        owner_field = self._meta.owner_field
+        owner_id = None if owner_field is None else getattr(obj, owner_field)
+        owned = handler._owns(owner_id)
+        key = (pk, for_list, handler.user.id if owned else None)
+        if key not in dehydrated:
+            dehydrator = self
+            if owned != self._owns(owner_id):
+                # Either this handler's user owns `obj` and `handler`'s
+                # doesn't, or the other way round.
+                dehydrator = handler
+                dehydrator.prepare_listen([obj])
+            dehydrated[key] = dehydrator.full_dehydrate(obj, for_list=for_list)
+        return (self._meta.handler_name, action, dehydrated[key])
+
+    def _on_listen_delete(self, pk):
+        """Return the message for the deletion of the object with `pk`."""
+        if pk in self.cache["loaded_pks"]:
+            self.cache["loaded_pks"].remove(pk)
+            return (self._meta.handler_name, "delete", pk)
+        else:
+            return None
+
+    def _on_listen_object(self, action, pk, obj, on_active_pk):
+        """Return the message for `action` on `obj`, which has `pk`.
+
+        `obj` is None when the user cannot view the object. `on_active_pk` is
+        called to build the message when the client should get the object.
+        """
         if action == "create" and obj is not None:
             if pk in self.cache["loaded_pks"]:
                 # The user already knows about this node, so its not a create
                 # to the user but an update.
-                return self.on_listen_for_active_pk("update", pk, obj)
+                return on_active_pk("update", pk, obj)
             else:
                 self.cache["loaded_pks"].add(pk)
-                return self.on_listen_for_active_pk(action, pk, obj)
+                return on_active_pk(action, pk, obj)
         elif action == "update":
             if pk in self.cache["loaded_pks"]:
                 if obj is None:
@@ -620,12 +987,12 @@ class Handler(metaclass=HandlerMetaclass):
                     return (self._meta.handler_name, "delete", pk)
                 else:
                     # Just a normal update to the client.
-                    return self.on_listen_for_active_pk(action, pk, obj)
+                    return on_active_pk(action, pk, obj)
             elif obj is not None:
                 # User just got access to this new object. Send the message to
                 # the client as a create action instead of an update.
                 self.cache["loaded_pks"].add(pk)
-                return self.on_listen_for_active_pk("create", pk, obj)
+                return on_active_pk("create", pk, obj)
             else:
                 # User doesn't have access to this object, so do nothing.
                 pass
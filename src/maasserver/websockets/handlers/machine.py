@@ -242,6 +242,8 @@ class MachineHandler(NodeHandler):
             "zone",
         ]
         listen_channels = ["machine"]
+        list_chunk_size = 500
+        list_cache_size = 20000
         create_permission = NodePermission.admin
         view_permission = NodePermission.view
         edit_permission = NodePermission.admin
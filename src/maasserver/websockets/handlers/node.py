@@ -94,6 +94,9 @@ class NodeHandler(TimestampedModelHandler):
         abstract = True
         pk = "system_id"
         pk_type = str
+        bulk_listen = True
+        # Some actions are only available to the owner of a node.
+        owner_field = "owner_id"
 
     def __init__(self, user, cache, request):
         super().__init__(user, cache, request)
@@ -475,6 +478,9 @@ class NodeHandler(TimestampedModelHandler):
         self._cache_script_results([obj])
         return super().on_listen_for_active_pk(action, pk, obj)
 
+    def prepare_listen(self, objs):
+        self._cache_script_results(objs)
+
     def dehydrate_blockdevice(self, blockdevice, obj):
         """Return `BlockDevice` formatted for JSON encoding."""
         # model and serial are currently only avalible on physical block
@@ -31,6 +31,9 @@ class SwitchHandler(NodeHandler):
         exclude = MachineHandler.Meta.exclude
         list_fields = MachineHandler.Meta.list_fields
         listen_channels = ["machine", "device", "controller", "switch"]
+        # Notifications must go through on_listen and get_object, which only
+        # let admins and owners see switches.
+        bulk_listen = False
 
     def get_queryset(self, for_list=False):
         """Return `QuerySet` for devices only viewable by `user`."""
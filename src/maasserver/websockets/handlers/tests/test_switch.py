@@ -265,6 +265,25 @@ class TestSwitchHandler(MAASTransactionServerTestCase):
         self.assertEqual("update", action)
         self.assertEqual(node.system_id, obj["system_id"])
 
+    @transactional
+    def test_on_listen_many_switch_update_only_for_admin_or_owner(self):
+        admin = factory.make_admin()
+        user = factory.make_User()
+        node = factory.make_Node()
+        factory.make_Switch(node=node)
+        handlers = [
+            SwitchHandler(admin, {}, None),
+            SwitchHandler(user, {}, None),
+        ]
+        [admin_messages, user_messages] = SwitchHandler.on_listen_many(
+            handlers, "switch", "update", [node.system_id]
+        )
+        [(obj_type, action, obj)] = admin_messages
+        self.assertEqual("switch", obj_type)
+        self.assertEqual("create", action)
+        self.assertEqual(node.system_id, obj["system_id"])
+        self.assertEqual([], user_messages)
+
     @transactional
     def test_on_listen_switch_create(self):
         admin = factory.make_admin()
@@ -17,7 +17,7 @@ from django.contrib.auth import BACKEND_SESSION_KEY, load_backend, SESSION_KEY
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 from twisted.internet.defer import fail, inlineCallbacks
 from twisted.internet.protocol import Factory, Protocol
 from twisted.python.modules import getModule
@@ -50,6 +50,10 @@ class MSG_TYPE:
     PING = 3
     PING_REPLY = 4
 
+    #: Part of a streamed response from server. Any number of them are sent
+    #: before the final RESPONSE for the same request.
+    PARTIAL_RESPONSE = 5
+
 
 class RESPONSE_TYPE:
     #:
@@ -321,6 +325,12 @@ class WebSocketProtocol(Protocol):
             return None
 
         handler = self.buildHandler(handler_class)
+        if message.get("stream", False):
+            # The client can handle partial responses. The handler method
+            # runs in a database thread, so send them from the reactor.
+            handler.partial_result_callback = partial(
+                reactor.callFromThread, self.sendPartialResult, request_id
+            )
         d = handler.execute(method, message.get("params", {}))
         d.addCallbacks(
             partial(self.sendResult, request_id),
@@ -350,6 +360,10 @@ class WebSocketProtocol(Protocol):
         )
         return result
 
+    def sendPartialResult(self, request_id, result):
+        """Send part of a streamed result to client."""
+        self.sendResult(request_id, result, msg_type=MSG_TYPE.PARTIAL_RESPONSE)
+
     def sendError(self, request_id, handler, method, failure):
         """Log and send error to client."""
         if isinstance(failure.value, ValidationError):
@@ -458,11 +472,14 @@ class WebSocketFactory(Factory):
         for handler in self.handlers.values():
             for channel in handler._meta.listen_channels:
                 self.listener.register(
-                    channel, partial(self.onNotify, handler, channel)
+                    channel,
+                    partial(self.onNotifyBatch, handler, channel),
+                    batched=True,
                 )
 
     @inlineCallbacks
     def onNotify(self, handler_class, channel, action, obj_id):
+        handler_class.invalidate_cached(obj_id)
         for client in self.clients:
             handler = client.buildHandler(handler_class)
             data = yield deferToDatabase(
@@ -476,6 +493,32 @@ class WebSocketFactory(Factory):
     def processNotify(self, handler, channel, action, obj_id):
         return handler.on_listen(channel, action, obj_id)
 
+    @inlineCallbacks
+    def onNotifyBatch(self, handler_class, channel, action, obj_ids):
+        for obj_id in obj_ids:
+            handler_class.invalidate_cached(obj_id)
+        clients = list(self.clients)
+        if len(clients) == 0:
+            return
+        handlers = [client.buildHandler(handler_class) for client in clients]
+        messages = yield deferToDatabase(
+            self.processNotifyBatch,
+            handler_class,
+            handlers,
+            channel,
+            action,
+            obj_ids,
+        )
+        for client, client_messages in zip(clients, messages):
+            for name, client_action, data in client_messages:
+                client.sendNotify(name, client_action, data)
+
+    @transactional
+    def processNotifyBatch(
+        self, handler_class, handlers, channel, action, obj_ids
+    ):
+        return handler_class.on_listen_many(handlers, channel, action, obj_ids)
+
     def registerRPCEvents(self):
         """Register for connected and disconnected events from the RPC
         service."""
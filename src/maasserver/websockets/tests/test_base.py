@@ -5,9 +5,11 @@
 
 __all__ = []
 
+from functools import partial
 import random
-from unittest.mock import ANY, MagicMock, sentinel
+from unittest.mock import ANY, call, MagicMock, sentinel
 
+from django.contrib.auth.models import User
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 from testtools.matchers import Equals, Is, IsInstance, MatchesStructure
@@ -33,6 +35,7 @@ from maasserver.websockets.base import (
     HandlerPermissionError,
     HandlerValidationError,
 )
+from maastesting.djangotestcase import count_queries
 from maastesting.matchers import MockCalledOnceWith, MockNotCalled
 from maastesting.testcase import MAASTestCase
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
@@ -44,6 +47,51 @@ def make_handler(name, **kwargs):
     return object.__new__(type(name, (Handler,), {"Meta": meta}))
 
 
+class TestDehydrationCache(MAASTestCase):
+    def test_get_returns_None_when_not_cached(self):
+        cache = base.DehydrationCache(10)
+        self.assertIsNone(cache.get(1, (sentinel.updated, 1)))
+
+    def test_get_returns_cached_data(self):
+        cache = base.DehydrationCache(10)
+        cache.set(1, (sentinel.updated, 1), sentinel.data, cache.generation(1))
+        self.assertIs(sentinel.data, cache.get(1, (sentinel.updated, 1)))
+        self.assertIsNone(cache.get(1, (sentinel.updated, 2)))
+        self.assertIsNone(cache.get(2, (sentinel.updated, 1)))
+
+    def test_set_forgets_older_versions(self):
+        cache = base.DehydrationCache(10)
+        cache.set(1, (sentinel.old, 1), sentinel.old_data, 0)
+        cache.set(1, (sentinel.old, 2), sentinel.other_data, 0)
+        cache.set(1, (sentinel.new, 1), sentinel.new_data, 0)
+        self.assertIsNone(cache.get(1, (sentinel.old, 1)))
+        self.assertIsNone(cache.get(1, (sentinel.old, 2)))
+        self.assertIs(sentinel.new_data, cache.get(1, (sentinel.new, 1)))
+
+    def test_set_evicts_least_recently_used(self):
+        cache = base.DehydrationCache(2)
+        cache.set(1, (sentinel.updated, 1), sentinel.data1, 0)
+        cache.set(2, (sentinel.updated, 1), sentinel.data2, 0)
+        cache.get(1, (sentinel.updated, 1))
+        cache.set(3, (sentinel.updated, 1), sentinel.data3, 0)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(2, (sentinel.updated, 1)))
+        self.assertIs(sentinel.data1, cache.get(1, (sentinel.updated, 1)))
+
+    def test_invalidate_forgets_object(self):
+        cache = base.DehydrationCache(10)
+        cache.set(1, (sentinel.updated, 1), sentinel.data, 0)
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1, (sentinel.updated, 1)))
+
+    def test_set_ignores_data_loaded_before_invalidation(self):
+        cache = base.DehydrationCache(10)
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        cache.set(1, (sentinel.updated, 1), sentinel.data, generation)
+        self.assertIsNone(cache.get(1, (sentinel.updated, 1)))
+
+
 class TestHandlerMeta(MAASTestCase):
     def test_creates_handler_with_default_meta(self):
         handler = Handler(None, {}, None)
@@ -496,6 +544,124 @@ class TestHandler(MAASServerTestCase, FakeNodesHandlerMixin):
         handler.list({"start": nodes[0].id})
         self.assertItemsEqual(pks, handler.cache["loaded_pks"])
 
+    def test_list_in_chunks(self):
+        nodes = [factory.make_Node() for _ in range(5)]
+        output = [{"hostname": node.hostname} for node in nodes]
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2
+        )
+        self.assertEqual(output, handler.list({}))
+
+    def test_list_in_chunks_start_and_limit(self):
+        nodes = [factory.make_Node() for _ in range(9)]
+        output = [{"hostname": node.hostname} for node in nodes[3:8]]
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2
+        )
+        self.assertEqual(
+            output, handler.list({"start": nodes[2].id, "limit": 5})
+        )
+
+    def test_list_in_chunks_sends_partial_results(self):
+        nodes = [factory.make_Node() for _ in range(5)]
+        output = [{"hostname": node.hostname} for node in nodes]
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2
+        )
+        partial_results = []
+        handler.partial_result_callback = partial_results.append
+        result = handler.list({})
+        self.assertEqual([output[:2], output[2:4]], partial_results)
+        self.assertEqual(output[4:], result)
+
+    def test_list_in_chunks_adds_to_loaded_pks(self):
+        pks = [factory.make_Node().system_id for _ in range(3)]
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.list({})
+        self.assertItemsEqual(pks, handler.cache["loaded_pks"])
+
+    def test_list_reuses_cached_dehydrated_objects(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        output = [{"hostname": node.hostname} for node in nodes]
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.list({})
+        # Another connection for the same user.
+        other_handler = type(handler)(handler.user, {}, handler.request)
+        full_dehydrate = self.patch(other_handler, "full_dehydrate")
+        self.assertEqual(output, other_handler.list({}))
+        self.assertThat(full_dehydrate, MockNotCalled())
+        self.assertItemsEqual(
+            [node.system_id for node in nodes],
+            other_handler.cache["loaded_pks"],
+        )
+
+    def test_list_doesnt_share_cached_objects_between_users(self):
+        factory.make_Node()
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.list({})
+        other_handler = type(handler)(factory.make_User(), {}, handler.request)
+        full_dehydrate = self.patch(other_handler, "full_dehydrate")
+        other_handler.list({})
+        self.assertThat(full_dehydrate, MockCalledOnceWith(ANY, for_list=True))
+
+    def test_list_shares_cached_objects_between_superusers(self):
+        factory.make_Node()
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.user = factory.make_admin()
+        handler.list({})
+        other_handler = type(handler)(
+            factory.make_admin(), {}, handler.request
+        )
+        full_dehydrate = self.patch(other_handler, "full_dehydrate")
+        other_handler.list({})
+        self.assertThat(full_dehydrate, MockNotCalled())
+
+    def test_list_doesnt_share_cached_objects_with_their_owner(self):
+        handler = self.make_nodes_handler(
+            fields=["hostname"],
+            list_chunk_size=2,
+            list_cache_size=10,
+            owner_field="owner_id",
+        )
+        handler.user = factory.make_admin()
+        owner = factory.make_admin()
+        factory.make_Node(owner=owner)
+        handler.list({})
+        other_handler = type(handler)(owner, {}, handler.request)
+        full_dehydrate = self.patch(other_handler, "full_dehydrate")
+        other_handler.list({})
+        self.assertThat(full_dehydrate, MockCalledOnceWith(ANY, for_list=True))
+
+    def test_list_dehydrates_updated_objects_again(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.list({})
+        node.hostname = factory.make_name("hostname")
+        node.save()
+        self.assertEqual([{"hostname": node.hostname}], handler.list({}))
+
+    def test_list_dehydrates_invalidated_objects_again(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(
+            fields=["hostname"], list_chunk_size=2, list_cache_size=10
+        )
+        handler.list({})
+        # Change the node without changing its `updated` timestamp.
+        hostname = factory.make_name("hostname")
+        Node.objects.filter(id=node.id).update(hostname=hostname)
+        type(handler).invalidate_cached(node.system_id)
+        self.assertEqual([{"hostname": hostname}], handler.list({}))
+
     def test_get(self):
         node = factory.make_Node()
         handler = self.make_nodes_handler(fields=["hostname"])
@@ -854,6 +1020,210 @@ class TestHandler(MAASServerTestCase, FakeNodesHandlerMixin):
             mock_dehydrate, MockCalledOnceWith(node, for_list=False)
         )
 
+    def make_handlers_for_users(self, users, **kwargs):
+        handler = self.make_nodes_handler(**kwargs)
+        handlers = []
+        for user in users:
+            request = HttpRequest()
+            request.user = user
+            handlers.append(type(handler)(user, {}, request))
+        return handlers
+
+    def test_on_listen_many_calls_on_listen_without_bulk_listen(self):
+        handler = self.make_nodes_handler()
+        mock_on_listen = self.patch(handler, "on_listen")
+        mock_on_listen.side_effect = [sentinel.message, None]
+        self.assertEqual(
+            [[sentinel.message]],
+            type(handler).on_listen_many(
+                [handler], sentinel.channel, "update", ["a", "b"]
+            ),
+        )
+        self.assertEqual(
+            [
+                call(sentinel.channel, "update", "a"),
+                call(sentinel.channel, "update", "b"),
+            ],
+            mock_on_listen.call_args_list,
+        )
+
+    def test_on_listen_many_delete_only_notifies_loaded_pks(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users([user, user], bulk_listen=True)
+        handlers[0].cache["loaded_pks"].add("a")
+        self.assertEqual(
+            [[(handlers[0]._meta.handler_name, "delete", "a")], []],
+            type(handlers[0]).on_listen_many(
+                handlers, sentinel.channel, "delete", ["a", "b"]
+            ),
+        )
+        self.assertEqual(set(), handlers[0].cache["loaded_pks"])
+
+    def test_on_listen_many_returns_create_and_update_messages(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users(
+            [user, user], bulk_listen=True, fields=["hostname"]
+        )
+        node = factory.make_Node(owner=user)
+        handlers[0].cache["loaded_pks"].add(node.system_id)
+        name = handlers[0]._meta.handler_name
+        self.assertEqual(
+            [
+                [(name, "update", {"hostname": node.hostname})],
+                [(name, "create", {"hostname": node.hostname})],
+            ],
+            type(handlers[0]).on_listen_many(
+                handlers, sentinel.channel, "update", [node.system_id]
+            ),
+        )
+        self.assertIn(node.system_id, handlers[1].cache["loaded_pks"])
+
+    def test_on_listen_many_dehydrates_once_per_permission_class(self):
+        user = factory.make_User()
+        other_user = factory.make_User()
+        handlers = self.make_handlers_for_users(
+            [user, user, other_user], bulk_listen=True
+        )
+        handler_class = type(handlers[0])
+        mock_dehydrate = self.patch(handler_class, "full_dehydrate")
+        mock_dehydrate.return_value = sentinel.data
+        node = factory.make_Node()
+        messages = handler_class.on_listen_many(
+            handlers, sentinel.channel, "update", [node.system_id]
+        )
+        self.assertEqual(
+            [[(handlers[0]._meta.handler_name, "create", sentinel.data)]] * 3,
+            messages,
+        )
+        self.assertEqual(2, mock_dehydrate.call_count)
+
+    def test_on_listen_many_dehydrates_once_for_superusers(self):
+        handlers = self.make_handlers_for_users(
+            [factory.make_admin() for _ in range(3)], bulk_listen=True
+        )
+        handler_class = type(handlers[0])
+        mock_dehydrate = self.patch(handler_class, "full_dehydrate")
+        mock_dehydrate.return_value = sentinel.data
+        node = factory.make_Node()
+        handler_class.on_listen_many(
+            handlers, sentinel.channel, "update", [node.system_id]
+        )
+        self.assertEqual(1, mock_dehydrate.call_count)
+
+    def test_on_listen_many_dehydrates_apart_for_owner(self):
+        admins = [factory.make_admin() for _ in range(3)]
+        handlers = self.make_handlers_for_users(
+            admins, bulk_listen=True, owner_field="owner_id"
+        )
+        dehydrated_for = []
+
+        def full_dehydrate(handler, obj, for_list=False):
+            dehydrated_for.append(handler.user)
+            return handler.user.username
+
+        for handler in handlers:
+            handler.full_dehydrate = partial(full_dehydrate, handler)
+        # The first handler, which dehydrates for the others, owns the node.
+        node = factory.make_Node(owner=admins[0])
+        messages = type(handlers[0]).on_listen_many(
+            handlers, sentinel.channel, "update", [node.system_id]
+        )
+        name = handlers[0]._meta.handler_name
+        self.assertEqual(
+            [
+                [(name, "create", admins[0].username)],
+                [(name, "create", admins[1].username)],
+                [(name, "create", admins[1].username)],
+            ],
+            messages,
+        )
+        self.assertEqual(admins[:2], dehydrated_for)
+
+    def test_on_listen_many_refreshes_users_in_one_query(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users([user], bulk_listen=True)
+        handler_class = type(handlers[0])
+        node = factory.make_Node(owner=user)
+
+        def count(handlers):
+            return count_queries(
+                handler_class.on_listen_many,
+                handlers,
+                sentinel.channel,
+                "update",
+                [node.system_id],
+            )[0]
+
+        self.assertEqual(
+            count(handlers),
+            count(self.make_handlers_for_users([user] * 5, bulk_listen=True)),
+        )
+
+    def test_on_listen_many_uses_current_user(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users([user], bulk_listen=True)
+        User.objects.filter(id=user.id).update(is_superuser=True)
+        type(handlers[0]).on_listen_many(
+            handlers,
+            sentinel.channel,
+            "update",
+            [factory.make_Node().system_id],
+        )
+        self.assertTrue(handlers[0].user.is_superuser)
+
+    def test_on_listen_many_dehydrates_active_pk_not_for_list(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users([user, user], bulk_listen=True)
+        handler_class = type(handlers[0])
+        mock_dehydrate = self.patch(handler_class, "full_dehydrate")
+        node = factory.make_Node()
+        handlers[1].cache["active_pk"] = node.system_id
+        handler_class.on_listen_many(
+            handlers, sentinel.channel, "update", [node.system_id]
+        )
+        self.assertItemsEqual(
+            [call(ANY, for_list=True), call(ANY, for_list=False)],
+            mock_dehydrate.call_args_list,
+        )
+
+    def test_on_listen_many_deletes_objects_no_longer_visible(self):
+        user = factory.make_User()
+        handlers = self.make_handlers_for_users(
+            [user], bulk_listen=True, view_permission=NodePermission.view
+        )
+        node = factory.make_Node(owner=factory.make_User())
+        handlers[0].cache["loaded_pks"].add(node.system_id)
+        self.assertEqual(
+            [[(handlers[0]._meta.handler_name, "delete", node.system_id)]],
+            type(handlers[0]).on_listen_many(
+                handlers, sentinel.channel, "update", [node.system_id]
+            ),
+        )
+
+    def test_on_listen_many_queries_do_not_scale_with_objects(self):
+        users = [factory.make_User() for _ in range(2)]
+        handlers = self.make_handlers_for_users(
+            users * 2, bulk_listen=True, fields=["hostname"]
+        )
+        handler_class = type(handlers[0])
+
+        def count(nodes):
+            for handler in handlers:
+                handler.cache["loaded_pks"].clear()
+            pks = [node.system_id for node in nodes]
+            return count_queries(
+                handler_class.on_listen_many,
+                handlers,
+                sentinel.channel,
+                "update",
+                pks,
+            )[0]
+
+        self.assertEqual(
+            count([factory.make_Node()]),
+            count([factory.make_Node() for _ in range(5)]),
+        )
+
     def test_listen_calls_get_object_with_pk_on_other_actions(self):
         handler = self.make_nodes_handler()
         mock_get_object = self.patch(handler, "get_object")
@@ -7,7 +7,7 @@ __all__ = []
 from collections import deque
 import json
 import random
-from unittest.mock import MagicMock, sentinel
+from unittest.mock import call, MagicMock, sentinel
 
 from crochet import wait_for
 from django.core.exceptions import ValidationError
@@ -39,6 +39,7 @@ from maastesting.matchers import (
     IsFiredDeferred,
     MockCalledOnceWith,
     MockCalledWith,
+    MockCallsMatch,
 )
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
@@ -625,6 +626,43 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
         self.expectThat(sent_obj["rtype"], Equals(RESPONSE_TYPE.SUCCESS))
         self.expectThat(sent_obj["result"]["hostname"], Equals(node.hostname))
 
+    def test_handleRequest_sets_partial_result_callback_when_streaming(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = sentinel.user
+        handler_class = MagicMock()
+        handler_name = maas_factory.make_name("handler")
+        handler_class._meta.handler_name = handler_name
+        handler = handler_class.return_value
+        handler.execute.return_value = succeed(None)
+        factory.handlers[handler_name] = handler_class
+        mock_callFromThread = self.patch(
+            protocol_module.reactor, "callFromThread"
+        )
+
+        protocol.handleRequest(
+            {
+                "type": MSG_TYPE.REQUEST,
+                "request_id": 1,
+                "method": "%s.list" % handler_name,
+                "stream": True,
+            }
+        )
+        handler.partial_result_callback(sentinel.chunk)
+        self.assertThat(
+            mock_callFromThread,
+            MockCalledOnceWith(protocol.sendPartialResult, 1, sentinel.chunk),
+        )
+
+    def test_sendPartialResult_sends_partial_response(self):
+        protocol, factory = self.make_protocol()
+        result = [{"id": random.randint(1, 100)}]
+        protocol.sendPartialResult(1, result)
+        sent_obj = self.get_written_transport_message(protocol)
+        self.expectThat(sent_obj["type"], Equals(MSG_TYPE.PARTIAL_RESPONSE))
+        self.expectThat(sent_obj["request_id"], Equals(1))
+        self.expectThat(sent_obj["rtype"], Equals(RESPONSE_TYPE.SUCCESS))
+        self.expectThat(sent_obj["result"], Equals(result))
+
     @wait_for_reactor
     @inlineCallbacks
     def test_handleRequest_sends_validation_error(self):
@@ -977,6 +1015,79 @@ class TestWebSocketFactoryTransactional(
         )
         self.assertThat(mock_sendNotify, MockCalledWith(name, action, data))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotify_invalidates_cached_object(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        mock_class = MagicMock()
+        mock_class.return_value.on_listen.return_value = None
+        yield factory.onNotify(
+            mock_class, sentinel.channel, sentinel.action, sentinel.obj_id
+        )
+        self.assertThat(
+            mock_class.invalidate_cached, MockCalledOnceWith(sentinel.obj_id)
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotifyBatch_calls_on_listen_many_with_client_handlers(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        handler_class = MagicMock()
+        handler_class._meta.handler_name = maas_factory.make_name("handler")
+        handler_class.on_listen_many.return_value = [[]]
+        yield factory.onNotifyBatch(
+            handler_class, sentinel.channel, sentinel.action, ["a", "b"]
+        )
+        self.assertThat(
+            handler_class.on_listen_many,
+            MockCalledOnceWith(
+                [handler_class.return_value],
+                sentinel.channel,
+                sentinel.action,
+                ["a", "b"],
+            ),
+        )
+        self.assertIs(
+            protocol.cache[handler_class._meta.handler_name],
+            handler_class.call_args[0][1],
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotifyBatch_sends_messages_to_each_client(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        mock_sendNotify = self.patch(protocol, "sendNotify")
+        mock_class = MagicMock()
+        mock_class.on_listen_many.return_value = [
+            [("name", "update", "a"), ("name", "delete", "b")]
+        ]
+        yield factory.onNotifyBatch(
+            mock_class, sentinel.channel, "update", ["a", "b"]
+        )
+        self.assertThat(
+            mock_sendNotify,
+            MockCallsMatch(
+                call("name", "update", "a"), call("name", "delete", "b")
+            ),
+        )
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotifyBatch_invalidates_cached_objects(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        mock_class = MagicMock()
+        mock_class.on_listen_many.return_value = [[]]
+        yield factory.onNotifyBatch(
+            mock_class, sentinel.channel, sentinel.action, ["a", "b"]
+        )
+        self.assertThat(
+            mock_class.invalidate_cached, MockCallsMatch(call("a"), call("b"))
+        )
+
     @wait_for_reactor
     @inlineCallbacks
     def test_updateRackController_calls_onNotify_for_controller_update(self):
@@ -18,6 +18,7 @@ __all__ = [
 import base64
 from datetime import datetime
 from functools import partial
+import hashlib
 import http.client
 from io import BytesIO
 from itertools import chain
@@ -31,6 +32,8 @@ from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from formencode.validators import Int, String
 from piston3.utils import rc
 import yaml
@@ -86,6 +89,7 @@ from metadataserver.enum import (
     SIGNAL_STATUS_CHOICES,
 )
 from metadataserver.models import (
+    NodeCurtinUserData,
     NodeKey,
     NodeUserData,
     Script,
@@ -103,10 +107,16 @@ from provisioningserver.events import (
     EVENT_TYPES,
 )
 from provisioningserver.logger import LegacyLogger
+from provisioningserver.path import get_data_path
+from provisioningserver.utils.fs import atomic_write
 
 log = LegacyLogger()
 
 
+# Where archives of the commissioning scripts are cached, named by a hash of
+# the scripts they contain. They are shared by all region processes.
+COMMISSIONING_SCRIPTS_CACHE = "/var/lib/maas/commissioning-scripts"
+
 # Where the netplan configuration file should be stored in the Scripts tar.
 # ../ is added to keep config outside of the scripts directory.
 NETPLAN_TAR_PATH = "../config/netplan.yaml"
@@ -191,34 +201,39 @@ def check_version(version):
         raise UnknownMetadataVersion("Unknown metadata version: %s" % version)
 
 
-def add_event_to_node_event_log(
-    node, origin, action, description, event_type, result=None, created=None
-):
-    """Add an entry to the node's event log."""
+def _get_node_event_log_type(node, result):
+    """Return the event type to log a status message from `node` with."""
     if node.status == NODE_STATUS.COMMISSIONING:
         if result in ["SUCCESS", None]:
-            type_name = EVENT_TYPES.NODE_COMMISSIONING_EVENT
+            return EVENT_TYPES.NODE_COMMISSIONING_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_COMMISSIONING_EVENT_FAILED
+            return EVENT_TYPES.NODE_COMMISSIONING_EVENT_FAILED
     elif node.status == NODE_STATUS.DEPLOYING:
         if result in ["SUCCESS", None]:
-            type_name = EVENT_TYPES.NODE_INSTALL_EVENT
+            return EVENT_TYPES.NODE_INSTALL_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_INSTALL_EVENT_FAILED
+            return EVENT_TYPES.NODE_INSTALL_EVENT_FAILED
     elif node.status == NODE_STATUS.DEPLOYED and result in ["FAIL"]:
-        type_name = EVENT_TYPES.NODE_POST_INSTALL_EVENT_FAILED
+        return EVENT_TYPES.NODE_POST_INSTALL_EVENT_FAILED
     elif node.status == NODE_STATUS.ENTERING_RESCUE_MODE:
         if result in ["SUCCESS", None]:
-            type_name = EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT
+            return EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT
         else:
-            type_name = EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT_FAILED
+            return EVENT_TYPES.NODE_ENTERING_RESCUE_MODE_EVENT_FAILED
     elif node.node_type in [
         NODE_TYPE.RACK_CONTROLLER,
         NODE_TYPE.REGION_AND_RACK_CONTROLLER,
     ]:
-        type_name = EVENT_TYPES.REQUEST_CONTROLLER_REFRESH
+        return EVENT_TYPES.REQUEST_CONTROLLER_REFRESH
     else:
-        type_name = EVENT_TYPES.NODE_STATUS_EVENT
+        return EVENT_TYPES.NODE_STATUS_EVENT
+
+
+def add_event_to_node_event_log(
+    node, origin, action, description, event_type, result=None, created=None
+):
+    """Add an entry to the node's event log."""
+    type_name = _get_node_event_log_type(node, result)
 
     # Create an extra event for the machine status messages.
     if action in EVENT_STATUS_MESSAGES and event_type == "start":
@@ -244,6 +259,31 @@ def add_event_to_node_event_log(
     )
 
 
+def make_node_event_log_entries(
+    node, origin, action, description, event_type, result=None, created=None
+):
+    """Return the entries `add_event_to_node_event_log` would add.
+
+    They are returned as arguments for `Event.objects.bulk_create_node_events`
+    so that the entries for many status messages can be added at once.
+    """
+    entries = []
+    if action in EVENT_STATUS_MESSAGES and event_type == "start":
+        entries.append(
+            (node, EVENT_STATUS_MESSAGES[action], action, "", created)
+        )
+    entries.append(
+        (
+            node,
+            _get_node_event_log_type(node, result),
+            action,
+            "'%s' %s" % (origin, description),
+            created,
+        )
+    )
+    return entries
+
+
 def process_file(
     results,
     script_set,
@@ -1007,12 +1047,27 @@ class UserDataHandler(MetadataViewHandler):
 
 
 class CurtinUserDataHandler(MetadataViewHandler):
-    """Curtin user-data blob for a given version."""
+    """Curtin user-data blob for a given version.
+
+    While a node is deploying, the user-data is rendered once and stored, so
+    that it's served as is if the installer asks for it again.
+    """
 
     def read(self, request, version, mac=None):
         check_version(version)
         node = get_queried_node(request, for_mac=mac)
-        user_data = get_curtin_userdata(request, node)
+        if node.status != NODE_STATUS.DEPLOYING:
+            user_data = get_curtin_userdata(request, node)
+        else:
+            base_url = request.build_absolute_uri("/")
+            user_data = NodeCurtinUserData.objects.get_user_data(
+                node, base_url
+            )
+            if user_data is None:
+                user_data = get_curtin_userdata(request, node)
+                NodeCurtinUserData.objects.set_user_data(
+                    node, base_url, user_data
+                )
         return HttpResponse(user_data, content_type="application/octet-stream")
 
 
@@ -1066,11 +1121,63 @@ class CommissioningScriptsHandler(MetadataViewHandler):
                 add_script(os.path.join("commissioning.d", name), content)
         return binary.getvalue()
 
+    def _get_archive_key(self):
+        """Return a hash of the content of the archive.
+
+        The content of user scripts isn't read: it is kept in
+        `VersionedTextFile`s, which are immutable, so a script changes only
+        when it points to another one.
+        """
+        hasher = hashlib.sha256()
+        for name, content in sorted(self._iter_builtin_scripts()):
+            hasher.update(name.encode("utf-8") + b"\0")
+            hasher.update(hashlib.sha256(content).digest())
+        scripts = (
+            Script.objects.filter(script_type=SCRIPT_TYPE.COMMISSIONING)
+            .order_by("name")
+            .values_list("name", "script_id", "script__updated")
+        )
+        for name, script_id, updated in scripts:
+            hasher.update(
+                ("%s\0%d\0%s\0" % (name, script_id, updated)).encode("utf-8")
+            )
+        return hasher.hexdigest()
+
+    def _get_cached_archive(self, key):
+        """Return the archive with `key`, producing it if it's not cached.
+
+        Once an archive is produced, the ones cached for older versions of
+        the scripts are removed.
+        """
+        path = get_data_path(COMMISSIONING_SCRIPTS_CACHE, "%s.tar" % key)
+        try:
+            with open(path, "rb") as fd:
+                return fd.read()
+        except FileNotFoundError:
+            pass
+        archive = self._get_archive()
+        atomic_write(archive, path, mode=0o644)
+        directory, filename = os.path.split(path)
+        for stale in os.listdir(directory):
+            # Files starting with a dot are still being written.
+            if stale != filename and not stale.startswith("."):
+                try:
+                    os.remove(os.path.join(directory, stale))
+                except FileNotFoundError:
+                    pass
+        return archive
+
     def read(self, request, version, mac=None):
         check_version(version)
-        return HttpResponse(
-            self._get_archive(), content_type="application/tar"
-        )
+        key = self._get_archive_key()
+        etag = quote_etag(key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                self._get_cached_archive(key), content_type="application/tar"
+            )
+        response["ETag"] = etag
+        return response
 
 
 class MAASScriptsHandler(OperationsHandler):
@@ -1198,12 +1305,14 @@ class MAASScriptsHandler(OperationsHandler):
         will be returned.
         """
         node = get_queried_node(request)
-        binary = BytesIO()
+        response = HttpResponse(content_type="application/x-tar")
         mtime = time.time()
         tar_meta_data = {}
         # Responses are currently gzip compressed using
-        # django.middleware.gzip.GZipMiddleware.
-        with tarfile.open(mode="w", fileobj=binary) as tar:
+        # django.middleware.gzip.GZipMiddleware. The tar is written as a
+        # stream straight into the response, rather than into a buffer which
+        # is then copied into it.
+        with tarfile.open(mode="w|", fileobj=response) as tar:
             # Commissioning scripts should only be run during commissioning or
             # in rescue mode.
             if (
@@ -1267,9 +1376,7 @@ class MAASScriptsHandler(OperationsHandler):
                 0o644,
             )
 
-        return HttpResponse(
-            binary.getvalue(), content_type="application/x-tar"
-        )
+        return response
 
 
 class EnlistMetaDataHandler(OperationsHandler):
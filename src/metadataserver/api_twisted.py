@@ -12,22 +12,29 @@ import json
 from django.db.utils import DatabaseError
 from twisted.application.internet import TimerService
 from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 
 from maasserver.api.utils import extract_oauth_key_from_auth_header
 from maasserver.enum import NODE_STATUS, NODE_TYPE
 from maasserver.forms.pods import PodForm
-from maasserver.models import Node, NodeMetadata
+from maasserver.models import Event, Node, NodeMetadata
 from maasserver.preseed import CURTIN_INSTALL_LOG
 from maasserver.utils.orm import (
     in_transaction,
+    is_retryable_failure,
+    savepoint,
     transactional,
     TransactionManagementError,
 )
 from maasserver.utils.threads import deferToDatabase
 from metadataserver import logger
-from metadataserver.api import add_event_to_node_event_log, process_file
+from metadataserver.api import (
+    add_event_to_node_event_log,
+    make_node_event_log_entries,
+    process_file,
+)
 from metadataserver.enum import SCRIPT_STATUS
 from metadataserver.models import NodeKey
 from provisioningserver.events import EVENT_STATUS_MESSAGES
@@ -111,6 +118,9 @@ class StatusHandlerResource(Resource):
         `script_result_id`, when present, MAAS will search for an existing
         ScriptResult with the given id to store files present.
 
+        When MAAS has too many status messages to process already, it
+        responds with 503 (Service Unavailable) and a Retry-After header.
+
         """
         # Extract the authorization from request. This only does a basic
         # check that its provided. The status worker will do the authorization,
@@ -168,10 +178,33 @@ class StatusHandlerResource(Resource):
             request.setResponseCode(204)
             request.finish()
 
-        d.addCallback(_finish, request)
+        # Ask the node to send the message again later when the status
+        # worker has too many messages to process already.
+        def _refuse(failure, request):
+            failure.trap(StatusQueueFull)
+            request.setResponseCode(503)
+            request.setHeader(
+                b"Retry-After", b"%d" % failure.value.retry_after
+            )
+            request.finish()
+
+        d.addCallbacks(
+            _finish, _refuse, callbackArgs=(request,), errbackArgs=(request,)
+        )
         return NOT_DONE_YET
 
 
+class StatusQueueFull(Exception):
+    """The status worker has too many messages queued to accept more."""
+
+    def __init__(self, retry_after):
+        super(StatusQueueFull, self).__init__(
+            "Too many status messages queued; retry after %d seconds."
+            % retry_after
+        )
+        self.retry_after = retry_after
+
+
 POD_CREATION_ERROR = (
     "Internal error while creating KVM pod. (See regiond.log for details.)"
 )
@@ -228,25 +261,85 @@ def _create_pod_for_deployment(node):
 
 
 class StatusWorkerService(TimerService, object):
-    """Service to update nodes from recieved status messages."""
-
-    check_interval = 60  # Every second.
-
-    def __init__(self, dbtasks, clock=reactor):
+    """Service to update nodes from recieved status messages.
+
+    Messages that do not need to be processed straight away are queued. The
+    queue is flushed once it holds `flush_size` messages or its oldest
+    message is `flush_age` seconds old, whichever comes first. Flushed
+    messages are written in batches of up to `batch_size` messages, each
+    batch in one transaction. When `max_queue_size` messages are queued or
+    waiting to be written, further messages are refused with
+    `StatusQueueFull` until the backlog has been written.
+    """
+
+    check_interval = 1  # Every second.
+
+    # Number of queued messages that triggers a flush.
+    flush_size = 100
+
+    # Age, in seconds, of the oldest queued message that triggers a flush.
+    flush_age = 5
+
+    # Most messages to write in one transaction.
+    batch_size = 500
+
+    # Most messages to hold in memory before refusing more.
+    max_queue_size = 10000
+
+    # Seconds a node is asked to wait before sending a refused message again.
+    retry_after = 10
+
+    def __init__(
+        self,
+        dbtasks,
+        clock=reactor,
+        flush_size=None,
+        flush_age=None,
+        max_queue_size=None,
+    ):
         # Call self._tryUpdateNodes() every self.check_interval.
         super(StatusWorkerService, self).__init__(
             self.check_interval, self._tryUpdateNodes
         )
         self.dbtasks = dbtasks
         self.clock = clock
+        if flush_size is not None:
+            self.flush_size = flush_size
+        if flush_age is not None:
+            self.flush_age = flush_age
+        if max_queue_size is not None:
+            self.max_queue_size = max_queue_size
         self.queue = defaultdict(list)
+        # Number of messages in the queue, and when the oldest was queued.
+        self.queueSize = 0
+        self.queueStarted = None
+        # Number of flushed messages not yet written to the database.
+        self.backlog = 0
+
+    def _isFlushDue(self):
+        if self.queueSize == 0:
+            return False
+        elif self.queueSize >= self.flush_size:
+            return True
+        else:
+            age = self.clock.seconds() - self.queueStarted
+            return age >= self.flush_age
 
     def _tryUpdateNodes(self):
-        if len(self.queue) != 0:
+        if self._isFlushDue():
             queue, self.queue = self.queue, defaultdict(list)
-            d = deferToDatabase(self._preProcessQueue, queue)
-            d.addCallback(self._processMessagesLater)
+            size, self.queueSize, self.queueStarted = self.queueSize, 0, None
+            self.backlog += size
+
+            def release(result):
+                self.backlog -= size
+                return result
+
+            d = maybeDeferred(
+                self.dbtasks.deferTask, self._processQueue, queue
+            )
             d.addErrback(log.err, "Failed to process node status messages.")
+            d.addBoth(release)
             return d
 
     @transactional
@@ -261,38 +354,71 @@ class StatusWorkerService(TimerService, object):
         ).select_related("node")
         return [(key.node, queue[key.key]) for key in keys]
 
-    def _processMessagesLater(self, tasks):
-        # Move all messages on the queue off onto the database tasks queue.
-        # We're not going to wait for them to be processed because we can't /
-        # don't apply back-pressure to those systems that are producing these
-        # messages anyway.
-        for node, messages in tasks:
-            self.dbtasks.addTask(self._processMessages, node, messages)
-
-    def _processMessages(self, node, messages):
-        # Push the messages into the database, recording them for this node.
-        # This should be called in a non-reactor thread with a pre-existing
-        # connection (e.g. via deferToDatabase).
+    def _processQueue(self, queue):
+        # Push the messages into the database, a batch at a time. This should
+        # be called in a non-reactor thread with a pre-existing connection
+        # (e.g. via deferToDatabase).
         if in_transaction():
             raise TransactionManagementError(
-                "_processMessages must be called from "
-                "outside of a transaction."
+                "_processQueue must be called from outside of a transaction."
             )
-        else:
-            # Here we're in a database thread, with a database connection.
-            for idx, message in enumerate(messages):
+        batch, room = [], self.batch_size
+        for node, messages in self._preProcessQueue(queue):
+            while len(messages) != 0:
+                batch.append((node, messages[:room]))
+                messages, room = messages[room:], room - len(batch[-1][1])
+                if room == 0:
+                    self._processBatch(batch)
+                    batch, room = [], self.batch_size
+        if len(batch) != 0:
+            self._processBatch(batch)
+
+    def _processBatch(self, batch):
+        try:
+            self._processMessageBatch(batch)
+        except Exception:
+            log.err(
+                None,
+                "Failed to process messages for nodes: %s"
+                % ", ".join(node.hostname for node, _ in batch),
+            )
+
+    @transactional
+    def _processMessageBatch(self, batch):
+        """Process the messages for many nodes in one transaction.
+
+        Each message is processed in its own savepoint, so that a message
+        that cannot be processed is logged and skipped without losing the
+        others. The event log entries for all the messages are created at
+        once at the end.
+
+        :param batch: A list of (node, messages) tuples.
+        """
+        # Validate that the nodes still exist since this is a new
+        # transaction. Deleted nodes need no more events saving.
+        nodes = Node.objects.in_bulk([node.id for node, _ in batch])
+        events = []
+        for node, messages in batch:
+            node = nodes.get(node.id)
+            if node is None:
+                continue
+            for message in messages:
+                message_events = []
                 try:
-                    exists = self._processMessage(node, message)
-                    if not exists:
-                        # Node has been deleted no reason to continue saving
-                        # the events for this node.
-                        break
-                except Exception:
+                    with savepoint():
+                        self._updateNode(node, message, message_events)
+                except Exception as error:
+                    if is_retryable_failure(error):
+                        # Retry the whole batch.
+                        raise
                     log.err(
                         None,
                         "Failed to process message "
                         "for node: %s" % node.hostname,
                     )
+                else:
+                    events.extend(message_events)
+        Event.objects.bulk_create_node_events(events)
 
     @transactional
     def _processMessage(self, node, message):
@@ -301,7 +427,16 @@ class StatusWorkerService(TimerService, object):
             node = Node.objects.get(id=node.id)
         except Node.DoesNotExist:
             return False
+        self._updateNode(node, message)
+        return True
+
+    def _updateNode(self, node, message, events=None):
+        """Update `node` from a status message.
 
+        :param events: When given, the entries for the node's event log are
+            appended to this list, to be created in bulk later, rather than
+            being created straight away.
+        """
         event_type = message["event_type"]
         origin = message["origin"]
         activity_name = message["name"]
@@ -315,15 +450,28 @@ class StatusWorkerService(TimerService, object):
 
         # Add this event to the node event log if 'start' or a 'failure'.
         if event_type == "start" or failed:
-            add_event_to_node_event_log(
-                node,
-                origin,
-                activity_name,
-                description,
-                event_type,
-                result,
-                message["timestamp"],
-            )
+            if events is None:
+                add_event_to_node_event_log(
+                    node,
+                    origin,
+                    activity_name,
+                    description,
+                    event_type,
+                    result,
+                    message["timestamp"],
+                )
+            else:
+                events.extend(
+                    make_node_event_log_entries(
+                        node,
+                        origin,
+                        activity_name,
+                        description,
+                        event_type,
+                        result,
+                        message["timestamp"],
+                    )
+                )
 
         # Group files together with the ScriptResult they belong.
         results = {}
@@ -472,7 +620,6 @@ class StatusWorkerService(TimerService, object):
 
         if save_node:
             node.save()
-        return True
 
     def _retrieve_content(self, compression, encoding, content):
         """Extract the content of the sent file."""
@@ -570,5 +717,12 @@ class StatusWorkerService(TimerService, object):
                 log.err, "Failed to process status message instantly."
             )
             return d
+        elif self.queueSize + self.backlog >= self.max_queue_size:
+            raise StatusQueueFull(self.retry_after)
         else:
             self.queue[authorization].append(message)
+            if self.queueStarted is None:
+                self.queueStarted = self.clock.seconds()
+            self.queueSize += 1
+            if self.queueSize >= self.flush_size:
+                self._tryUpdateNodes()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+import maasserver.models.cleansave
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("metadataserver", "0023_reorder_network_scripts")]
+
+    operations = [
+        migrations.CreateModel(
+            name="NodeCurtinUserData",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(editable=False)),
+                ("updated", models.DateTimeField(editable=False)),
+                ("base_url", models.CharField(editable=False, max_length=255)),
+                ("data", models.TextField(editable=False)),
+                (
+                    "node",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="maasserver.Node",
+                    ),
+                ),
+            ],
+            options={"abstract": False},
+            bases=(
+                maasserver.models.cleansave.CleanSave,
+                models.Model,
+                object,
+            ),
+        )
+    ]
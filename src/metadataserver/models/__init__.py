@@ -4,8 +4,16 @@
 """Model export and helpers for metadataserver.
 """
 
-__all__ = ["NodeKey", "NodeUserData", "Script", "ScriptResult", "ScriptSet"]
+__all__ = [
+    "NodeCurtinUserData",
+    "NodeKey",
+    "NodeUserData",
+    "Script",
+    "ScriptResult",
+    "ScriptSet",
+]
 
+from metadataserver.models.nodecurtinuserdata import NodeCurtinUserData
 from metadataserver.models.nodekey import NodeKey
 from metadataserver.models.nodeuserdata import NodeUserData
 from metadataserver.models.script import Script
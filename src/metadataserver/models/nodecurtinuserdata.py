@@ -0,0 +1,72 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Curtin user-data rendered for a node's deployment."""
+
+__all__ = ["NodeCurtinUserData"]
+
+
+from django.db.models import (
+    CASCADE,
+    CharField,
+    Manager,
+    OneToOneField,
+    TextField,
+)
+
+from maasserver.models.cleansave import CleanSave
+from maasserver.models.timestampedmodel import TimestampedModel
+from metadataserver import DefaultMeta
+
+
+class NodeCurtinUserDataManager(Manager):
+    """Utility for the collection of NodeCurtinUserData items."""
+
+    def get_user_data(self, node, base_url):
+        """Retrieve the curtin user data rendered for `node`.
+
+        :param base_url: The URL of the region as seen by the node. The
+            user data contains URLs based on it, so it's only returned if it
+            was rendered for the same one.
+        :return: The user data, or None if none has been rendered.
+        """
+        return (
+            self.filter(node=node, base_url=base_url)
+            .values_list("data", flat=True)
+            .first()
+        )
+
+    def set_user_data(self, node, base_url, data):
+        """Store the curtin user data rendered for `node`."""
+        self.update_or_create(
+            node=node, defaults={"base_url": base_url, "data": data}
+        )
+
+    def invalidate(self, node):
+        """Forget the curtin user data rendered for `node`, if any."""
+        self.filter(node=node).delete()
+
+
+class NodeCurtinUserData(CleanSave, TimestampedModel):
+    """Curtin user-data rendered for the deployment of a node.
+
+    Rendering it is costly, and the installer may ask for it more than once,
+    so it's rendered once per deployment and kept until the node is started
+    again.
+
+    :ivar node: Node that this is for.
+    :ivar base_url: URL of the region as seen by the node when it was
+        rendered.
+    :ivar data: The rendered user-data.
+    """
+
+    class Meta(DefaultMeta):
+        """Needed for South to recognize this model."""
+
+    objects = NodeCurtinUserDataManager()
+
+    node = OneToOneField(
+        "maasserver.Node", null=False, editable=False, on_delete=CASCADE
+    )
+    base_url = CharField(max_length=255, null=False, editable=False)
+    data = TextField(null=False, editable=False)
@@ -0,0 +1,78 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for :class:`NodeCurtinUserData` and manager."""
+
+__all__ = []
+
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from metadataserver.models import NodeCurtinUserData
+
+
+class TestNodeCurtinUserDataManager(MAASServerTestCase):
+    """Test NodeCurtinUserDataManager."""
+
+    def test_get_user_data_returns_None_if_none_rendered(self):
+        node = factory.make_Node()
+        self.assertIsNone(
+            NodeCurtinUserData.objects.get_user_data(
+                node, factory.make_simple_http_url()
+            )
+        )
+
+    def test_get_user_data_returns_stored_user_data(self):
+        node = factory.make_Node()
+        base_url = factory.make_simple_http_url()
+        data = factory.make_string()
+        NodeCurtinUserData.objects.set_user_data(node, base_url, data)
+        self.assertEqual(
+            data, NodeCurtinUserData.objects.get_user_data(node, base_url)
+        )
+
+    def test_get_user_data_ignores_other_base_url(self):
+        node = factory.make_Node()
+        NodeCurtinUserData.objects.set_user_data(
+            node, factory.make_simple_http_url(), factory.make_string()
+        )
+        self.assertIsNone(
+            NodeCurtinUserData.objects.get_user_data(
+                node, factory.make_simple_http_url()
+            )
+        )
+
+    def test_set_user_data_overwrites_existing_user_data(self):
+        node = factory.make_Node()
+        base_url = factory.make_simple_http_url()
+        NodeCurtinUserData.objects.set_user_data(
+            node, factory.make_simple_http_url(), factory.make_string()
+        )
+        data = factory.make_string()
+        NodeCurtinUserData.objects.set_user_data(node, base_url, data)
+        self.assertEqual(
+            data, NodeCurtinUserData.objects.get_user_data(node, base_url)
+        )
+        self.assertEqual(
+            1, NodeCurtinUserData.objects.filter(node=node).count()
+        )
+
+    def test_invalidate_removes_user_data(self):
+        node = factory.make_Node()
+        other_node = factory.make_Node()
+        base_url = factory.make_simple_http_url()
+        NodeCurtinUserData.objects.set_user_data(
+            node, base_url, factory.make_string()
+        )
+        NodeCurtinUserData.objects.set_user_data(
+            other_node, base_url, factory.make_string()
+        )
+        NodeCurtinUserData.objects.invalidate(node)
+        self.assertFalse(NodeCurtinUserData.objects.filter(node=node).exists())
+        self.assertTrue(
+            NodeCurtinUserData.objects.filter(node=other_node).exists()
+        )
+
+    def test_invalidate_ignores_node_without_user_data(self):
+        node = factory.make_Node()
+        NodeCurtinUserData.objects.invalidate(node)
+        self.assertFalse(NodeCurtinUserData.objects.filter(node=node).exists())
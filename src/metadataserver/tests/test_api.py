@@ -76,6 +76,7 @@ from metadataserver.api import (
     get_node_for_request,
     get_queried_node,
     make_list_response,
+    make_node_event_log_entries,
     make_text_response,
     MetaDataHandler,
     NETPLAN_TAR_PATH,
@@ -92,7 +93,12 @@ from metadataserver.enum import (
     SIGNAL_STATUS,
     SIGNAL_STATUS_CHOICES,
 )
-from metadataserver.models import NodeKey, NodeUserData, ScriptSet
+from metadataserver.models import (
+    NodeCurtinUserData,
+    NodeKey,
+    NodeUserData,
+    ScriptSet,
+)
 from metadataserver.nodeinituser import get_node_init_user
 from provisioningserver.events import (
     EVENT_DETAILS,
@@ -265,6 +271,38 @@ class TestHelpers(MAASServerTestCase):
             EVENT_TYPES.REQUEST_CONTROLLER_REFRESH, event.type.name
         )
 
+    def test_make_node_event_log_entries(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYING)
+        origin = factory.make_name("origin")
+        action = factory.make_name("action")
+        description = factory.make_name("description")
+        created = factory.make_date()
+        self.assertEqual(
+            [
+                (
+                    node,
+                    EVENT_TYPES.NODE_INSTALL_EVENT,
+                    action,
+                    "'%s' %s" % (origin, description),
+                    created,
+                )
+            ],
+            make_node_event_log_entries(
+                node, origin, action, description, "start", None, created
+            ),
+        )
+
+    def test_make_node_event_log_entries_for_status_messages(self):
+        node = factory.make_Node()
+        action = random.choice(list(EVENT_STATUS_MESSAGES))
+        entries = make_node_event_log_entries(
+            node, "origin", action, "description", event_type="start"
+        )
+        self.assertEqual(
+            (node, EVENT_STATUS_MESSAGES[action], action, "", None), entries[0]
+        )
+        self.assertEqual(2, len(entries))
+
     def test_process_file_creates_new_entry_for_output(self):
         results = {}
         script_result = factory.make_ScriptResult(status=SCRIPT_STATUS.RUNNING)
@@ -1118,6 +1156,52 @@ class TestCurtinMetadataUserData(
             Contains("PREFIX='curtin'"),
         )
 
+    def test_curtin_user_data_view_stores_user_data_while_deploying(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYING)
+        user_data = factory.make_string()
+        get_curtin_userdata = self.patch(api, "get_curtin_userdata")
+        get_curtin_userdata.return_value = user_data
+        client = make_node_client(node)
+        url = reverse("curtin-metadata-user-data", args=["latest"])
+        responses = [client.get(url), client.get(url)]
+
+        self.assertEqual(
+            [user_data.encode(settings.DEFAULT_CHARSET)] * 2,
+            [response.content for response in responses],
+        )
+        self.assertThat(get_curtin_userdata, MockCalledOnceWith(ANY, node))
+        self.assertEqual(
+            user_data, NodeCurtinUserData.objects.get(node=node).data
+        )
+
+    def test_curtin_user_data_view_renders_again_for_other_base_url(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYING)
+        NodeCurtinUserData.objects.set_user_data(
+            node, factory.make_simple_http_url(), factory.make_string()
+        )
+        user_data = factory.make_string()
+        self.patch(api, "get_curtin_userdata").return_value = user_data
+        client = make_node_client(node)
+        response = client.get(
+            reverse("curtin-metadata-user-data", args=["latest"])
+        )
+
+        self.assertEqual(
+            user_data.encode(settings.DEFAULT_CHARSET), response.content
+        )
+
+    def test_curtin_user_data_view_does_not_store_unless_deploying(self):
+        node = factory.make_Node(status=NODE_STATUS.DEPLOYED)
+        get_curtin_userdata = self.patch(api, "get_curtin_userdata")
+        get_curtin_userdata.return_value = factory.make_string()
+        client = make_node_client(node)
+        url = reverse("curtin-metadata-user-data", args=["latest"])
+        client.get(url)
+        client.get(url)
+
+        self.assertEqual(2, get_curtin_userdata.call_count)
+        self.assertFalse(NodeCurtinUserData.objects.filter(node=node).exists())
+
 
 class TestInstallingAPI(MAASServerTestCase):
     def setUp(self):
@@ -2098,6 +2182,52 @@ class TestCommissioningAPI(MAASServerTestCase):
             archive.extractfile(path).read().decode("utf-8"),
         )
 
+    def test_commissioning_scripts_sets_etag(self):
+        url = reverse("commissioning-scripts", args=["latest"])
+        client = make_node_client()
+        response = client.get(url)
+        self.assertThat(response, HasStatusCode(http.client.OK))
+        self.assertIn("ETag", response)
+        response = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertThat(response, HasStatusCode(http.client.NOT_MODIFIED))
+
+    def test_commissioning_scripts_are_cached(self):
+        get_archive = self.patch_autospec(
+            api.CommissioningScriptsHandler, "_get_archive"
+        )
+        get_archive.return_value = factory.make_bytes()
+        url = reverse("commissioning-scripts", args=["latest"])
+        client = make_node_client()
+        responses = [client.get(url), client.get(url)]
+        self.assertEqual(
+            [get_archive.return_value] * 2,
+            [response.content for response in responses],
+        )
+        self.assertThat(get_archive, MockCalledOnceWith(ANY))
+
+    def test_commissioning_scripts_cache_changes_with_scripts(self):
+        script = factory.make_Script(script_type=SCRIPT_TYPE.COMMISSIONING)
+        url = reverse("commissioning-scripts", args=["latest"])
+        client = make_node_client()
+        old_response = client.get(url)
+        old_path = api.get_data_path(
+            api.COMMISSIONING_SCRIPTS_CACHE,
+            "%s.tar" % old_response["ETag"].strip('W/"'),
+        )
+        self.assertTrue(os.path.exists(old_path))
+        script.script = script.script.update(factory.make_string())
+        script.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=old_response["ETag"])
+        self.assertThat(response, HasStatusCode(http.client.OK))
+        self.assertNotEqual(old_response["ETag"], response["ETag"])
+        archive = tarfile.open(fileobj=BytesIO(response.content))
+        path = os.path.join("commissioning.d", script.name)
+        self.assertEqual(
+            script.script.data,
+            archive.extractfile(path).read().decode("utf-8"),
+        )
+        self.assertFalse(os.path.exists(old_path))
+
     def test_other_user_than_node_cannot_signal_commissioning_result(self):
         node = factory.make_Node(status=NODE_STATUS.COMMISSIONING)
         client = MAASSensibleOAuthClient(factory.make_User())
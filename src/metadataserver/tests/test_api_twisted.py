@@ -11,13 +11,14 @@ from datetime import datetime, timedelta
 from io import BytesIO
 import json
 import random
-from unittest.mock import call, Mock, sentinel
+from unittest.mock import Mock, sentinel
 
 from crochet import wait_for
 from django.db.utils import DatabaseError
 from testtools import ExpectedException
-from testtools.matchers import Equals, Is, MatchesListwise, MatchesSetwise
-from twisted.internet.defer import inlineCallbacks, succeed
+from testtools.matchers import Equals, Is
+from twisted.internet.defer import Deferred, fail, inlineCallbacks, succeed
+from twisted.internet.task import Clock
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.test.requesthelper import DummyRequest
 
@@ -41,16 +42,17 @@ from maasserver.utils.threads import deferToDatabase
 from maastesting.matchers import (
     DocTestMatches,
     MockCalledOnceWith,
-    MockCallsMatch,
     MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
+from maastesting.twisted import extract_result, TwistedLoggerFixture
 from metadataserver import api
 from metadataserver import api_twisted as api_twisted_module
 from metadataserver.api_twisted import (
     _create_pod_for_deployment,
     POD_CREATION_ERROR,
     StatusHandlerResource,
+    StatusQueueFull,
     StatusWorkerService,
 )
 from metadataserver.enum import RESULT_TYPE, SCRIPT_STATUS
@@ -162,6 +164,27 @@ class TestStatusHandlerResource(MAASTestCase):
             status_worker.queueMessage, MockCalledOnceWith(token, message)
         )
 
+    def test__render_POST_refuses_messages_when_queue_full(self):
+        status_worker = Mock()
+        status_worker.queueMessage = Mock()
+        status_worker.queueMessage.return_value = fail(StatusQueueFull(12))
+        resource = StatusHandlerResource(status_worker)
+        message = {
+            "event_type": factory.make_name("type"),
+            "origin": factory.make_name("origin"),
+            "name": factory.make_name("name"),
+            "description": factory.make_name("description"),
+        }
+        request = self.make_request(
+            content=json.dumps(message).encode("ascii")
+        )
+        output = resource.render_POST(request)
+        self.assertEquals(NOT_DONE_YET, output)
+        self.assertEquals(503, request.responseCode)
+        self.assertEquals(
+            [b"12"], request.responseHeaders.getRawHeaders(b"retry-after")
+        )
+
 
 class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
     @transactional
@@ -184,51 +207,109 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
         worker = StatusWorkerService(sentinel.dbtasks, clock=sentinel.reactor)
         self.assertEqual(sentinel.dbtasks, worker.dbtasks)
         self.assertEqual(sentinel.reactor, worker.clock)
-        self.assertEqual(60, worker.step)
+        self.assertEqual(1, worker.step)
         self.assertEqual((worker._tryUpdateNodes, tuple(), {}), worker.call)
+        self.assertEqual(100, worker.flush_size)
+        self.assertEqual(5, worker.flush_age)
+        self.assertEqual(10000, worker.max_queue_size)
+
+    def test__init__configures_flushing(self):
+        worker = StatusWorkerService(
+            sentinel.dbtasks, flush_size=1, flush_age=2, max_queue_size=3
+        )
+        self.assertEqual(1, worker.flush_size)
+        self.assertEqual(2, worker.flush_age)
+        self.assertEqual(3, worker.max_queue_size)
 
     def test__tryUpdateNodes_returns_None_when_empty_queue(self):
         worker = StatusWorkerService(sentinel.dbtasks)
         self.assertIsNone(worker._tryUpdateNodes())
 
+    def test__tryUpdateNodes_returns_None_until_flush_is_due(self):
+        clock = Clock()
+        worker = StatusWorkerService(sentinel.dbtasks, clock=clock)
+        worker.queueMessage(factory.make_name("token"), self.make_message())
+        clock.advance(worker.flush_age - 1)
+        self.assertIsNone(worker._tryUpdateNodes())
+        self.assertEqual(1, worker.queueSize)
+
+    def test__tryUpdateNodes_flushes_when_oldest_message_is_old(self):
+        clock = Clock()
+        dbtasks = Mock()
+        dbtasks.deferTask.return_value = Deferred()
+        worker = StatusWorkerService(dbtasks, clock=clock)
+        token = factory.make_name("token")
+        message = self.make_message()
+        worker.queueMessage(token, message)
+        clock.advance(worker.flush_age)
+        worker._tryUpdateNodes()
+        self.assertThat(
+            dbtasks.deferTask,
+            MockCalledOnceWith(worker._processQueue, {token: [message]}),
+        )
+        self.assertEqual({}, worker.queue)
+        self.assertEqual(0, worker.queueSize)
+        self.assertEqual(1, worker.backlog)
+
+    def test__queueMessage_flushes_when_queue_is_large(self):
+        dbtasks = Mock()
+        dbtasks.deferTask.return_value = Deferred()
+        worker = StatusWorkerService(dbtasks, flush_size=3)
+        token = factory.make_name("token")
+        messages = [self.make_message() for _ in range(3)]
+        for message in messages[:2]:
+            worker.queueMessage(token, message)
+        self.assertThat(dbtasks.deferTask, MockNotCalled())
+        worker.queueMessage(token, messages[2])
+        self.assertThat(
+            dbtasks.deferTask,
+            MockCalledOnceWith(worker._processQueue, {token: messages}),
+        )
+
+    def test__queueMessage_refuses_messages_when_backlog_is_full(self):
+        dbtasks = Mock()
+        done = Deferred()
+        dbtasks.deferTask.side_effect = [done, Deferred()]
+        worker = StatusWorkerService(dbtasks, flush_size=2, max_queue_size=3)
+        token = factory.make_name("token")
+        for _ in range(3):
+            worker.queueMessage(token, self.make_message())
+        self.assertEqual(2, worker.backlog)
+        self.assertEqual(1, worker.queueSize)
+        d = worker.queueMessage(token, self.make_message())
+        self.assertRaises(StatusQueueFull, extract_result, d)
+        # Once the flushed messages are written, messages are accepted.
+        done.callback(None)
+        self.assertEqual(0, worker.backlog)
+        self.assertIsNone(
+            extract_result(worker.queueMessage(token, self.make_message()))
+        )
+        self.assertEqual(2, worker.backlog)
+
     @wait_for_reactor
     @inlineCallbacks
     def test__tryUpdateNodes_sends_work_to_dbtasks(self):
         nodes_with_tokens = yield deferToDatabase(self.make_nodes_with_tokens)
-        node_messages = {
-            node: [self.make_message() for _ in range(3)]
-            for node, _ in nodes_with_tokens
-        }
         dbtasks = Mock()
-        dbtasks.addTask = Mock()
-        worker = StatusWorkerService(dbtasks)
-        for node, token in nodes_with_tokens:
-            for message in node_messages[node]:
+        dbtasks.deferTask.return_value = succeed(None)
+        worker = StatusWorkerService(dbtasks, flush_age=0)
+        queue = {}
+        for _, token in nodes_with_tokens:
+            queue[token.key] = [self.make_message() for _ in range(3)]
+            for message in queue[token.key]:
                 worker.queueMessage(token.key, message)
         yield worker._tryUpdateNodes()
-        call_args = [
-            (call_arg[0][1], call_arg[0][2])
-            for call_arg in dbtasks.addTask.call_args_list
-        ]
         self.assertThat(
-            call_args,
-            MatchesSetwise(
-                *[
-                    MatchesListwise([Equals(node), Equals(messages)])
-                    for node, messages in node_messages.items()
-                ]
-            ),
+            dbtasks.deferTask, MockCalledOnceWith(worker._processQueue, queue)
         )
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_fails_when_in_transaction(self):
+    def test__processQueue_fails_when_in_transaction(self):
         worker = StatusWorkerService(sentinel.dbtasks)
         with ExpectedException(TransactionManagementError):
             yield deferToDatabase(
-                transactional(worker._processMessages),
-                sentinel.node,
-                [sentinel.message],
+                transactional(worker._processQueue), {"token": []}
             )
 
     @wait_for_reactor
@@ -244,36 +325,65 @@ class TestStatusWorkerServiceTransactional(MAASTransactionServerTestCase):
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_doesnt_call_when_node_deleted(self):
+    def test__processQueue_processes_messages_in_batches(self):
+        nodes_with_tokens = yield deferToDatabase(self.make_nodes_with_tokens)
         worker = StatusWorkerService(sentinel.dbtasks)
-        mock_processMessage = self.patch(worker, "_processMessage")
-        mock_processMessage.return_value = False
-        yield deferToDatabase(
-            worker._processMessages,
-            sentinel.node,
-            [sentinel.message1, sentinel.message2],
+        worker.batch_size = 4
+        mock_processMessageBatch = self.patch(worker, "_processMessageBatch")
+        queue = {
+            token.key: [self.make_message() for _ in range(3)]
+            for _, token in nodes_with_tokens
+        }
+        yield deferToDatabase(worker._processQueue, queue)
+        batches = [
+            call_args[0][0]
+            for call_args in mock_processMessageBatch.call_args_list
+        ]
+        self.assertEqual(
+            [4, 4, 1],
+            [sum(len(messages) for _, messages in batch) for batch in batches],
         )
-        self.assertThat(
-            mock_processMessage,
-            MockCalledOnceWith(sentinel.node, sentinel.message1),
+        processed = {}
+        for batch in batches:
+            for node, messages in batch:
+                processed.setdefault(node, []).extend(messages)
+        self.assertEqual(
+            {node: queue[token.key] for node, token in nodes_with_tokens},
+            processed,
         )
 
     @wait_for_reactor
     @inlineCallbacks
-    def test__processMessages_calls_processMessage(self):
+    def test__processQueue_logs_failed_batches(self):
+        nodes_with_tokens = yield deferToDatabase(self.make_nodes_with_tokens)
         worker = StatusWorkerService(sentinel.dbtasks)
-        mock_processMessage = self.patch(worker, "_processMessage")
+        worker.batch_size = 3
+        mock_processMessageBatch = self.patch(worker, "_processMessageBatch")
+        mock_processMessageBatch.side_effect = [ValueError(), None, None]
+        queue = {
+            token.key: [self.make_message() for _ in range(3)]
+            for _, token in nodes_with_tokens
+        }
+        with TwistedLoggerFixture() as logger:
+            yield deferToDatabase(worker._processQueue, queue)
+        self.assertEqual(3, mock_processMessageBatch.call_count)
+        self.assertIn("Failed to process messages for nodes", logger.dump())
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__processMessageBatch_skips_deleted_nodes(self):
+        nodes_with_tokens = yield deferToDatabase(self.make_nodes_with_tokens)
+        (node1, _), (node2, _), _ = nodes_with_tokens
+        yield deferToDatabase(transactional(node1.delete))
+        worker = StatusWorkerService(sentinel.dbtasks)
+        mock_updateNode = self.patch(worker, "_updateNode")
+        message1, message2 = self.make_message(), self.make_message()
         yield deferToDatabase(
-            worker._processMessages,
-            sentinel.node,
-            [sentinel.message1, sentinel.message2],
+            worker._processMessageBatch,
+            [(node1, [message1]), (node2, [message2])],
         )
         self.assertThat(
-            mock_processMessage,
-            MockCallsMatch(
-                call(sentinel.node, sentinel.message1),
-                call(sentinel.node, sentinel.message2),
-            ),
+            mock_updateNode, MockCalledOnceWith(node2, message2, [])
         )
 
     @wait_for_reactor
@@ -394,6 +504,79 @@ class TestStatusWorkerService(MAASServerTestCase):
         }
         self.assertFalse(self.processMessage(node1, payload))
 
+    def make_progress_payload(self, description):
+        return {
+            "event_type": "start",
+            "origin": "curtin",
+            "name": "cmd-install/stage-partitioning",
+            "description": description,
+            "timestamp": datetime.utcnow(),
+        }
+
+    def test_process_message_batch_creates_events_for_all_nodes(self):
+        nodes = [
+            factory.make_Node(
+                status=NODE_STATUS.DEPLOYING, with_empty_script_sets=True
+            )
+            for _ in range(3)
+        ]
+        worker = StatusWorkerService(sentinel.dbtasks)
+        worker._processMessageBatch(
+            [
+                (
+                    node,
+                    [
+                        self.make_progress_payload("%s %d" % (node, i))
+                        for i in range(2)
+                    ],
+                )
+                for node in nodes
+            ]
+        )
+        for node in nodes:
+            self.assertEqual(
+                ["'curtin' %s 0" % node, "'curtin' %s 1" % node],
+                [
+                    event.description
+                    for event in Event.objects.filter(node=node).order_by("id")
+                ],
+            )
+
+    def test_process_message_batch_skips_failed_messages(self):
+        node = factory.make_Node(
+            status=NODE_STATUS.DEPLOYING, with_empty_script_sets=True
+        )
+        bad_payload = self.make_progress_payload("bad")
+        bad_payload["files"] = [
+            {
+                "path": "sample.txt",
+                "encoding": "uuencode",
+                "content": encode_as_base64(b"content"),
+            }
+        ]
+        worker = StatusWorkerService(sentinel.dbtasks)
+        with TwistedLoggerFixture() as logger:
+            worker._processMessageBatch(
+                [
+                    (
+                        node,
+                        [
+                            self.make_progress_payload("first"),
+                            bad_payload,
+                            self.make_progress_payload("last"),
+                        ],
+                    )
+                ]
+            )
+        self.assertIn("Failed to process message for node", logger.dump())
+        self.assertEqual(
+            ["'curtin' first", "'curtin' last"],
+            [
+                event.description
+                for event in Event.objects.filter(node=node).order_by("id")
+            ],
+        )
+
     def test_status_installation_result_does_not_affect_other_node(self):
         node1 = factory.make_Node(
             status=NODE_STATUS.DEPLOYING, with_empty_script_sets=True
@@ -0,0 +1,514 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Native client for the ISC DHCP server's OMAPI protocol.
+
+Unlike `Omshell`, which starts a new ``omshell`` process for every host map
+change, `OmapiClient` keeps a single authenticated connection open to the
+DHCP server and pipelines many host object operations over it.
+"""
+
+__all__ = [
+    "OmapiClient",
+    "OmapiConnectionError",
+    "OmapiError",
+    "OmapiOperation",
+    "OmapiResult",
+]
+
+import base64
+from collections import namedtuple
+import hashlib
+import hmac
+from itertools import count
+import socket
+import struct
+from time import time
+
+from netaddr import EUI, IPAddress
+
+from provisioningserver.logger import LegacyLogger
+
+log = LegacyLogger()
+
+
+OMAPI_PROTOCOL_VERSION = 100
+OMAPI_HEADER_SIZE = 24
+
+OMAPI_OP_OPEN = 1
+OMAPI_OP_REFRESH = 2
+OMAPI_OP_UPDATE = 3
+OMAPI_OP_NOTIFY = 4
+OMAPI_OP_STATUS = 5
+OMAPI_OP_DELETE = 6
+
+# ISC result codes, as returned in the `result` field of STATUS messages.
+ISC_R_SUCCESS = 0
+ISC_R_EXISTS = 18
+ISC_R_NOTFOUND = 23
+ISC_R_IOERROR = 26
+
+HMAC_MD5_ALGORITHM = b"hmac-md5.SIG-ALG.REG.INT."
+HMAC_MD5_SIGNATURE_SIZE = 16
+
+# The name of the key in the dhcpd.conf templates.
+OMAPI_KEY_NAME = "omapi_key"
+
+
+class OmapiError(Exception):
+    """The DHCP server refused an OMAPI request."""
+
+    def __init__(self, message, result=None):
+        super(OmapiError, self).__init__(message)
+        self.result = result
+
+
+class OmapiConnectionError(OmapiError):
+    """The DHCP server could not be reached over OMAPI."""
+
+
+# A host map change to send to the DHCP server. `action` is one of
+# "create", "modify" or "remove"; `ip` is not used when removing.
+OmapiOperation = namedtuple("OmapiOperation", ["action", "mac", "ip"])
+
+# The outcome of an `OmapiOperation`. `error` is None on success, or an
+# `OmapiError` otherwise. `latency` is the number of seconds from sending the
+# first message for the operation until its final response arrived.
+OmapiResult = namedtuple("OmapiResult", ["operation", "error", "latency"])
+
+
+def _pack_int(value):
+    return struct.pack("!I", value)
+
+
+def _unpack_int(value):
+    return struct.unpack("!I", value)[0]
+
+
+def _serialize_pairs(pairs):
+    """Serialize a list of OMAPI (key, value) pairs."""
+    data = []
+    for key, value in pairs:
+        data.append(struct.pack("!H", len(key)))
+        data.append(key)
+        data.append(struct.pack("!I", len(value)))
+        data.append(value)
+    data.append(struct.pack("!H", 0))
+    return b"".join(data)
+
+
+def _read_pairs(read):
+    """Read a list of OMAPI (key, value) pairs using `read`."""
+    pairs = []
+    while True:
+        (key_length,) = struct.unpack("!H", read(2))
+        if key_length == 0:
+            return pairs
+        key = read(key_length)
+        (value_length,) = struct.unpack("!I", read(4))
+        pairs.append((key, read(value_length)))
+
+
+class OmapiMessage:
+    """A single message in the OMAPI wire protocol.
+
+    `message` and `obj` are lists of (key, value) pairs, both as bytes.
+    """
+
+    def __init__(
+        self,
+        opcode,
+        handle=0,
+        tid=0,
+        rid=0,
+        message=(),
+        obj=(),
+        authid=0,
+        signature=b"",
+    ):
+        self.opcode = opcode
+        self.handle = handle
+        self.tid = tid
+        self.rid = rid
+        self.message = list(message)
+        self.obj = list(obj)
+        self.authid = authid
+        self.signature = signature
+
+    def serialize(self, forsigning=False):
+        """Return the wire representation of this message.
+
+        When `forsigning` is set the authenticator ID and the signature are
+        left out, as they are when computing the HMAC.
+        """
+        header = struct.pack(
+            "!IIIII",
+            len(self.signature),
+            self.opcode,
+            self.handle,
+            self.tid,
+            self.rid,
+        )
+        body = (
+            header
+            + _serialize_pairs(self.message)
+            + _serialize_pairs(self.obj)
+        )
+        if forsigning:
+            return body
+        return _pack_int(self.authid) + body + self.signature
+
+    def compute_signature(self, key):
+        return hmac.new(
+            key, self.serialize(forsigning=True), hashlib.md5
+        ).digest()
+
+    def sign(self, authid, key):
+        """Sign this message with the authenticator `authid` using `key`."""
+        self.authid = authid
+        # The signature length is part of the signed data.
+        self.signature = b"\0" * HMAC_MD5_SIGNATURE_SIZE
+        self.signature = self.compute_signature(key)
+
+    def verify(self, key):
+        """Return True if this message was signed with `key`."""
+        return hmac.compare_digest(self.signature, self.compute_signature(key))
+
+    def get_result(self):
+        """Return the (result, message) of a STATUS message."""
+        message = dict(self.message)
+        result = message.get(b"result")
+        result = ISC_R_SUCCESS if result is None else _unpack_int(result)
+        text = message.get(b"message", b"").decode("utf-8", "replace")
+        return result, text
+
+    @classmethod
+    def read(cls, read):
+        """Read a message using `read`, which must return exactly the number
+        of bytes requested."""
+        authid, authlen, opcode, handle, tid, rid = struct.unpack(
+            "!IIIIII", read(OMAPI_HEADER_SIZE)
+        )
+        message = _read_pairs(read)
+        obj = _read_pairs(read)
+        signature = read(authlen)
+        return cls(
+            opcode,
+            handle=handle,
+            tid=tid,
+            rid=rid,
+            message=message,
+            obj=obj,
+            authid=authid,
+            signature=signature,
+        )
+
+
+def make_host_object(mac, ip=None):
+    """Return the OMAPI object pairs describing a host map.
+
+    The name of the host map is derived from its MAC address, the same way as
+    `Omshell` names them.
+    """
+    obj = [(b"name", mac.replace(":", "-").encode("ascii"))]
+    if ip is not None:
+        obj.extend(
+            [
+                (b"ip-address", IPAddress(ip).packed),
+                (b"hardware-address", EUI(mac).packed),
+                (b"hardware-type", _pack_int(1)),
+            ]
+        )
+    return obj
+
+
+class OmapiClient:
+    """Persistent, pipelining OMAPI client for the ISC DHCP server.
+
+    The connection is opened and authenticated lazily, then reused for every
+    subsequent call until `close` is called. If a reused connection turns out
+    to be broken, for example because the DHCP server was restarted, the
+    client reconnects once and retries; every host operation is idempotent so
+    this is safe.
+
+    :param server_address: The address for the DHCP server (ip or hostname)
+    :param shared_key: The base64-encoded HMAC-MD5 secret of `omapi_key`, as
+        written in the DHCP server's configuration.
+    :param ipv6: Whether to talk to the DHCPv6 server.
+    :param window: The maximum number of requests in flight at once.
+    """
+
+    def __init__(
+        self,
+        server_address,
+        shared_key,
+        ipv6=False,
+        port=None,
+        key_name=OMAPI_KEY_NAME,
+        timeout=30,
+        window=64,
+    ):
+        self.server_address = server_address
+        self.shared_key = shared_key
+        self.ipv6 = ipv6
+        if port is None:
+            port = 7912 if ipv6 else 7911
+        self.server_port = port
+        self.key_name = key_name
+        self.timeout = timeout
+        self.window = window
+        self._key = base64.b64decode(shared_key)
+        self._socket = None
+        self._buffer = b""
+        self._authid = 0
+        self._tids = count(1)
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+    def connect(self):
+        """Open and authenticate the connection, if not already open."""
+        if self._socket is not None:
+            return
+        try:
+            self._socket = socket.create_connection(
+                (self.server_address, self.server_port), self.timeout
+            )
+            self._socket.sendall(
+                struct.pack("!II", OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE)
+            )
+            version, header_size = struct.unpack("!II", self._read(8))
+            if version != OMAPI_PROTOCOL_VERSION:
+                raise OmapiConnectionError(
+                    "Unsupported OMAPI protocol version %d." % version
+                )
+            if header_size != OMAPI_HEADER_SIZE:
+                raise OmapiConnectionError(
+                    "Unsupported OMAPI header size %d." % header_size
+                )
+            self._authenticate()
+        except OSError as error:
+            self.close()
+            raise OmapiConnectionError(
+                "The DHCP server could not be reached: %s" % error
+            )
+        except OmapiError:
+            self.close()
+            raise
+
+    def close(self):
+        """Close the connection to the DHCP server."""
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._buffer = b""
+        self._authid = 0
+
+    def _authenticate(self):
+        request = OmapiMessage(
+            OMAPI_OP_OPEN,
+            tid=next(self._tids),
+            message=[(b"type", b"authenticator")],
+            obj=[
+                (b"name", self.key_name.encode("ascii")),
+                (b"algorithm", HMAC_MD5_ALGORITHM),
+            ],
+        )
+        self._socket.sendall(request.serialize())
+        response = self._receive()
+        if response.opcode != OMAPI_OP_UPDATE or response.handle == 0:
+            _, text = response.get_result()
+            raise OmapiConnectionError(
+                "The DHCP server refused the OMAPI key: %s" % text
+            )
+        self._authid = response.handle
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            data = self._socket.recv(max(size - len(self._buffer), 65536))
+            if not data:
+                raise ConnectionResetError("Connection closed by server.")
+            self._buffer += data
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _receive(self):
+        response = OmapiMessage.read(self._read)
+        if response.authid != 0 and not response.verify(self._key):
+            raise OmapiConnectionError("Invalid signature on OMAPI response.")
+        return response
+
+    def _exchange(self, requests):
+        """Send `requests`, keeping at most `window` of them in flight.
+
+        :param requests: An iterable of (key, `OmapiMessage`) tuples.
+        :return: A dict mapping each key to a (response, sent time) tuple.
+        """
+        requests = iter(requests)
+        responses, inflight = {}, {}
+        exhausted = False
+        while True:
+            batch = []
+            while not exhausted and len(inflight) < self.window:
+                try:
+                    key, request = next(requests)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    request.tid = next(self._tids)
+                    request.sign(self._authid, self._key)
+                    inflight[request.tid] = key, time()
+                    batch.append(request.serialize())
+            if batch:
+                self._socket.sendall(b"".join(batch))
+            if not inflight:
+                return responses
+            response = self._receive()
+            try:
+                key, sent = inflight.pop(response.rid)
+            except KeyError:
+                raise OmapiConnectionError(
+                    "Unexpected OMAPI response for transaction %d."
+                    % response.rid
+                )
+            responses[key] = response, sent
+
+    def pipeline(self, operations):
+        """Perform all of `operations` over the connection.
+
+        Host lookups for every operation are sent first, followed by the
+        deletes and updates that depend on them, so the number of round trips
+        does not grow with the number of operations.
+
+        :param operations: An iterable of `OmapiOperation`.
+        :return: A list of `OmapiResult`, in the same order as `operations`.
+        """
+        operations = list(operations)
+        if len(operations) == 0:
+            return []
+        reused = self.connected
+        self.connect()
+        try:
+            return self._pipeline(operations)
+        except OSError as error:
+            self.close()
+            if not reused:
+                raise OmapiConnectionError(
+                    "The DHCP server could not be reached: %s" % error
+                )
+        log.debug("OMAPI connection was lost; reconnecting.")
+        self.connect()
+        try:
+            return self._pipeline(operations)
+        except OSError as error:
+            self.close()
+            raise OmapiConnectionError(
+                "The DHCP server could not be reached: %s" % error
+            )
+
+    def _pipeline(self, operations):
+        results = [None] * len(operations)
+        started = {}
+
+        def finish(index, error=None):
+            latency = time() - started[index]
+            results[index] = OmapiResult(operations[index], error, latency)
+
+        # First stage: create new host maps, and look up the handles of the
+        # existing host maps that need to be removed or modified.
+        first = []
+        for index, operation in enumerate(operations):
+            if operation.action == "create":
+                request = OmapiMessage(
+                    OMAPI_OP_OPEN,
+                    message=[
+                        (b"create", _pack_int(1)),
+                        (b"exclusive", _pack_int(1)),
+                        (b"type", b"host"),
+                    ],
+                    obj=make_host_object(operation.mac, operation.ip),
+                )
+            elif operation.action in ("modify", "remove"):
+                request = OmapiMessage(
+                    OMAPI_OP_OPEN,
+                    message=[(b"type", b"host")],
+                    obj=make_host_object(operation.mac),
+                )
+            else:
+                raise ValueError(
+                    "Unknown OMAPI operation: %r" % (operation.action,)
+                )
+            first.append((index, request))
+
+        second = []
+        for index, (response, sent) in sorted(self._exchange(first).items()):
+            started[index] = sent
+            operation = operations[index]
+            result, text = response.get_result()
+            if operation.action == "create":
+                if response.opcode == OMAPI_OP_UPDATE:
+                    finish(index)
+                elif result in (ISC_R_EXISTS, ISC_R_IOERROR):
+                    # Host map already existed. Treat as success, like
+                    # `Omshell.create` does.
+                    finish(index)
+                else:
+                    finish(index, OmapiError(text, result))
+            elif response.opcode != OMAPI_OP_UPDATE:
+                if operation.action == "remove" and result == ISC_R_NOTFOUND:
+                    # It was already removed. Consider success.
+                    finish(index)
+                else:
+                    finish(index, OmapiError(text, result))
+            elif operation.action == "remove":
+                second.append(
+                    (
+                        index,
+                        OmapiMessage(OMAPI_OP_DELETE, handle=response.handle),
+                    )
+                )
+            else:
+                obj = make_host_object(operation.mac, operation.ip)
+                second.append(
+                    (
+                        index,
+                        OmapiMessage(
+                            OMAPI_OP_UPDATE,
+                            handle=response.handle,
+                            obj=obj[1:],
+                        ),
+                    )
+                )
+
+        # Second stage: delete or update the host maps found above.
+        for index, (response, _) in self._exchange(second).items():
+            result, text = response.get_result()
+            if response.opcode == OMAPI_OP_UPDATE or (
+                response.opcode == OMAPI_OP_STATUS and result == ISC_R_SUCCESS
+            ):
+                finish(index)
+            else:
+                finish(index, OmapiError(text, result))
+
+        return results
+
+    def _perform(self, action, mac, ip=None):
+        [result] = self.pipeline([OmapiOperation(action, mac, ip)])
+        if result.error is not None:
+            raise result.error
+
+    def create(self, ip_address, mac_address):
+        """Create a host map for `mac_address` -> `ip_address`."""
+        self._perform("create", mac_address, ip_address)
+
+    def modify(self, ip_address, mac_address):
+        """Point the existing host map for `mac_address` to `ip_address`."""
+        self._perform("modify", mac_address, ip_address)
+
+    def remove(self, mac_address):
+        """Remove the host map for `mac_address`."""
+        self._perform("remove", mac_address)
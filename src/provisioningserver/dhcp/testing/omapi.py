@@ -0,0 +1,175 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""A fake OMAPI server for testing `OmapiClient`."""
+
+__all__ = ["FakeOmapiServer", "make_shared_key"]
+
+import base64
+from itertools import count
+import os
+import socket
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+import struct
+import threading
+
+from fixtures import Fixture
+
+from provisioningserver.dhcp.omapi import (
+    ISC_R_EXISTS,
+    ISC_R_NOTFOUND,
+    OMAPI_HEADER_SIZE,
+    OMAPI_OP_DELETE,
+    OMAPI_OP_OPEN,
+    OMAPI_OP_STATUS,
+    OMAPI_OP_UPDATE,
+    OMAPI_PROTOCOL_VERSION,
+    OmapiMessage,
+)
+
+# Result code used by the fake for requests it cannot make sense of.
+ISC_R_FAILURE = 25
+ISC_R_NOPERM = 6
+
+
+def make_shared_key():
+    """Return a random base64-encoded OMAPI secret."""
+    return base64.b64encode(os.urandom(64)).decode("ascii")
+
+
+class _OmapiRequestHandler(BaseRequestHandler):
+    def setup(self):
+        self.buffer = b""
+        self.authid = 0
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            data = self.request.recv(65536)
+            if not data:
+                raise EOFError()
+            self.buffer += data
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def handle(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.connections += 1
+            fake.sockets.append(self.request)
+        self.read(8)
+        self.request.sendall(
+            struct.pack("!II", OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE)
+        )
+        try:
+            while True:
+                request = OmapiMessage.read(self.read)
+                authid = self.authid
+                with fake.lock:
+                    fake.requests.append(request)
+                    response = self.respond(request)
+                response.rid = request.tid
+                if authid != 0:
+                    response.sign(authid, fake.key)
+                self.request.sendall(response.serialize())
+        except (EOFError, OSError):
+            pass
+
+    def status(self, result, message):
+        return OmapiMessage(
+            OMAPI_OP_STATUS,
+            message=[
+                (b"result", struct.pack("!I", result)),
+                (b"message", message.encode("ascii")),
+            ],
+        )
+
+    def respond(self, request):
+        fake = self.server.fake
+        message = dict(request.message)
+        obj = dict(request.obj)
+        if request.authid == 0:
+            if message.get(b"type") != b"authenticator":
+                return self.status(ISC_R_NOPERM, "not authenticated")
+            if obj.get(b"name") != fake.key_name.encode("ascii"):
+                return self.status(ISC_R_NOTFOUND, "key not found")
+            self.authid = fake.authid
+            return OmapiMessage(OMAPI_OP_UPDATE, handle=self.authid)
+        if request.authid != self.authid or not request.verify(fake.key):
+            return self.status(ISC_R_NOPERM, "bad signature")
+        if request.opcode == OMAPI_OP_OPEN:
+            if message.get(b"type") != b"host":
+                return self.status(ISC_R_FAILURE, "unknown type")
+            name = obj[b"name"].decode("ascii")
+            if message.get(b"create") == struct.pack("!I", 1):
+                if name in fake.hosts:
+                    return self.status(ISC_R_EXISTS, "already exists")
+                fake.hosts[name] = obj
+            elif name not in fake.hosts:
+                return self.status(ISC_R_NOTFOUND, "not found")
+            handle = next(fake.handles)
+            fake.handle_names[handle] = name
+            return OmapiMessage(
+                OMAPI_OP_UPDATE, handle=handle, obj=fake.hosts[name].items()
+            )
+        name = fake.handle_names.get(request.handle)
+        if name not in fake.hosts:
+            return self.status(ISC_R_NOTFOUND, "not found")
+        if request.opcode == OMAPI_OP_DELETE:
+            del fake.hosts[name]
+            return self.status(0, "")
+        if request.opcode == OMAPI_OP_UPDATE:
+            fake.hosts[name].update(obj)
+            return OmapiMessage(
+                OMAPI_OP_UPDATE,
+                handle=request.handle,
+                obj=fake.hosts[name].items(),
+            )
+        return self.status(ISC_R_FAILURE, "unsupported")
+
+
+class FakeOmapiServer(Fixture):
+    """Run a minimal in-process OMAPI server on the loopback interface.
+
+    It understands HMAC-MD5 authentication and host objects, which it keeps
+    in `hosts`, keyed by name. Every request received is kept in `requests`.
+    """
+
+    def __init__(self, shared_key, key_name="omapi_key"):
+        super(FakeOmapiServer, self).__init__()
+        self.shared_key = shared_key
+        self.key = base64.b64decode(shared_key)
+        self.key_name = key_name
+        self.authid = 1
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.handles = count(100)
+        self.handle_names = {}
+        self.requests = []
+        self.connections = 0
+        self.sockets = []
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def _setUp(self):
+        self.server = ThreadingTCPServer(
+            ("127.0.0.1", 0), _OmapiRequestHandler
+        )
+        self.server.daemon_threads = True
+        self.server.fake = self
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}
+        ).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def disconnect_all(self):
+        """Drop every open connection, as when the DHCP server restarts."""
+        with self.lock:
+            sockets, self.sockets = self.sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -0,0 +1,242 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the native OMAPI client."""
+
+__all__ = []
+
+import socket
+
+from netaddr import EUI, IPAddress
+from testtools.matchers import AllMatch, GreaterThan, MatchesStructure
+
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from provisioningserver.dhcp.omapi import (
+    ISC_R_NOTFOUND,
+    OMAPI_OP_DELETE,
+    OMAPI_OP_OPEN,
+    OMAPI_OP_UPDATE,
+    OmapiClient,
+    OmapiConnectionError,
+    OmapiError,
+    OmapiMessage,
+    OmapiOperation,
+)
+from provisioningserver.dhcp.testing.omapi import (
+    FakeOmapiServer,
+    make_shared_key,
+)
+
+
+class TestOmapiMessage(MAASTestCase):
+    def test_serialize_and_read_round_trip(self):
+        message = OmapiMessage(
+            OMAPI_OP_OPEN,
+            handle=3,
+            tid=4,
+            rid=5,
+            message=[(b"type", b"host")],
+            obj=[(b"name", b"foo"), (b"ip-address", b"\x0a\x00\x00\x01")],
+        )
+        message.sign(7, b"secret")
+        data = message.serialize()
+        read = OmapiMessage.read(lambda size: self.consume(data, size))
+        self.assertThat(
+            read,
+            MatchesStructure.byEquality(
+                opcode=OMAPI_OP_OPEN,
+                handle=3,
+                tid=4,
+                rid=5,
+                message=[(b"type", b"host")],
+                obj=[(b"name", b"foo"), (b"ip-address", b"\x0a\x00\x00\x01")],
+                authid=7,
+            ),
+        )
+        self.assertTrue(read.verify(b"secret"))
+        self.assertFalse(read.verify(b"other"))
+
+    def consume(self, data, size):
+        offset = getattr(self, "offset", 0)
+        self.offset = offset + size
+        return data[offset : offset + size]
+
+
+class TestOmapiClient(MAASTestCase):
+    def setUp(self):
+        super(TestOmapiClient, self).setUp()
+        self.shared_key = make_shared_key()
+        self.server = self.useFixture(FakeOmapiServer(self.shared_key))
+
+    def make_client(self, shared_key=None, **kwargs):
+        if shared_key is None:
+            shared_key = self.shared_key
+        client = OmapiClient(
+            "127.0.0.1", shared_key, port=self.server.port, **kwargs
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def make_hosts(self, count):
+        return [
+            (factory.make_mac_address(), factory.make_ipv4_address())
+            for _ in range(count)
+        ]
+
+    def test_defaults_to_dhcp_ports(self):
+        self.assertEqual(7911, OmapiClient("::1", "").server_port)
+        self.assertEqual(7912, OmapiClient("::1", "", ipv6=True).server_port)
+
+    def test_create_adds_host_map(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        client.create(ip, mac)
+        host = self.server.hosts[mac.replace(":", "-")]
+        self.assertEqual(IPAddress(ip).packed, host[b"ip-address"])
+        self.assertEqual(EUI(mac).packed, host[b"hardware-address"])
+
+    def test_create_treats_existing_host_map_as_success(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        client.create(factory.make_ipv4_address(), mac)
+        client.create(factory.make_ipv4_address(), mac)
+        self.assertEqual([mac.replace(":", "-")], list(self.server.hosts))
+
+    def test_modify_updates_host_map(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        ip = factory.make_ipv4_address()
+        client.create(factory.make_ipv4_address(), mac)
+        client.modify(ip, mac)
+        host = self.server.hosts[mac.replace(":", "-")]
+        self.assertEqual(IPAddress(ip).packed, host[b"ip-address"])
+
+    def test_modify_raises_error_for_unknown_host_map(self):
+        client = self.make_client()
+        error = self.assertRaises(
+            OmapiError,
+            client.modify,
+            factory.make_ipv4_address(),
+            factory.make_mac_address(),
+        )
+        self.assertEqual(ISC_R_NOTFOUND, error.result)
+
+    def test_remove_deletes_host_map(self):
+        client = self.make_client()
+        mac = factory.make_mac_address()
+        client.create(factory.make_ipv4_address(), mac)
+        client.remove(mac)
+        self.assertEqual({}, self.server.hosts)
+
+    def test_remove_treats_missing_host_map_as_success(self):
+        client = self.make_client()
+        client.remove(factory.make_mac_address())
+        self.assertEqual({}, self.server.hosts)
+
+    def test_pipeline_uses_one_connection(self):
+        client = self.make_client()
+        hosts = self.make_hosts(200)
+        results = client.pipeline(
+            OmapiOperation("create", mac, ip) for mac, ip in hosts
+        )
+        results += client.pipeline(
+            OmapiOperation("modify", mac, factory.make_ipv4_address())
+            for mac, _ in hosts[:100]
+        )
+        results += client.pipeline(
+            OmapiOperation("remove", mac, None) for mac, _ in hosts[100:]
+        )
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual([None] * 400, [result.error for result in results])
+        self.assertEqual(
+            sorted(mac.replace(":", "-") for mac, _ in hosts[:100]),
+            sorted(self.server.hosts),
+        )
+
+    def test_pipeline_reports_latency_per_operation(self):
+        client = self.make_client()
+        hosts = self.make_hosts(5)
+        operations = [OmapiOperation("create", mac, ip) for mac, ip in hosts]
+        results = client.pipeline(operations)
+        self.assertEqual(operations, [result.operation for result in results])
+        self.assertThat(
+            [result.latency for result in results], AllMatch(GreaterThan(0))
+        )
+
+    def test_pipeline_sends_lookups_before_deletes_and_updates(self):
+        client = self.make_client()
+        hosts = self.make_hosts(3)
+        client.pipeline(OmapiOperation("create", mac, ip) for mac, ip in hosts)
+        del self.server.requests[:]
+        client.pipeline(
+            [
+                OmapiOperation("remove", hosts[0][0], None),
+                OmapiOperation("modify", hosts[1][0], hosts[2][1]),
+                OmapiOperation("remove", hosts[2][0], None),
+            ]
+        )
+        self.assertEqual(
+            [
+                OMAPI_OP_OPEN,
+                OMAPI_OP_OPEN,
+                OMAPI_OP_OPEN,
+                OMAPI_OP_DELETE,
+                OMAPI_OP_UPDATE,
+                OMAPI_OP_DELETE,
+            ],
+            [request.opcode for request in self.server.requests],
+        )
+
+    def test_pipeline_keeps_errors_per_operation(self):
+        client = self.make_client()
+        mac, ip = self.make_hosts(1)[0]
+        results = client.pipeline(
+            [
+                OmapiOperation("modify", mac, ip),
+                OmapiOperation("create", mac, ip),
+            ]
+        )
+        self.assertIsInstance(results[0].error, OmapiError)
+        self.assertIsNone(results[1].error)
+
+    def test_pipeline_limits_requests_in_flight(self):
+        client = self.make_client(window=2)
+        results = client.pipeline(
+            OmapiOperation("create", mac, ip)
+            for mac, ip in self.make_hosts(10)
+        )
+        self.assertEqual([None] * 10, [result.error for result in results])
+
+    def test_pipeline_reconnects_when_connection_is_lost(self):
+        client = self.make_client()
+        mac, ip = self.make_hosts(1)[0]
+        client.create(ip, mac)
+        self.server.disconnect_all()
+        client.remove(mac)
+        self.assertEqual(2, self.server.connections)
+        self.assertEqual({}, self.server.hosts)
+
+    def test_connect_raises_error_for_wrong_key(self):
+        client = self.make_client(key_name=factory.make_name("key"))
+        self.assertRaises(OmapiConnectionError, client.connect)
+        self.assertFalse(client.connected)
+
+    def test_rejects_requests_signed_with_wrong_secret(self):
+        client = self.make_client(shared_key=make_shared_key())
+        self.assertRaises(
+            OmapiConnectionError,
+            client.create,
+            factory.make_ipv4_address(),
+            factory.make_mac_address(),
+        )
+        self.assertEqual({}, self.server.hosts)
+
+    def test_connect_raises_error_when_server_unreachable(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        client = OmapiClient("127.0.0.1", self.shared_key, port=port)
+        self.assertRaises(OmapiConnectionError, client.connect)
@@ -16,10 +16,15 @@ import pexpect
 from testtools.matchers import Contains, Equals
 from testtools.testcase import ExpectedException
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
 from twisted.internet.threads import deferToThread
 
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith, MockCallsMatch
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
 from maastesting.testcase import MAASTestCase, MAASTwistedRunTest
 from provisioningserver.drivers.pod import (
     Capabilities,
@@ -263,6 +268,46 @@ SAMPLE_DUMPXML_4 = dedent(
     """
 )
 
+SAMPLE_DUMPXML_DEVICES = dedent(
+    """
+    <domain type='kvm'>
+      <name>%s</name>
+      <memory unit='MiB'>2048</memory>
+      <vcpu placement='static' current='2'>4</vcpu>
+      <os>
+        <type arch='x86_64'>hvm</type>
+      </os>
+      <devices>
+        <disk type='file' device='disk'>
+          <source file='/var/lib/libvirt/images/%s.qcow2'/>
+          <target dev='vda' bus='virtio'/>
+        </disk>
+        <disk type='file' device='cdrom'>
+          <target dev='hdc' bus='ide'/>
+        </disk>
+        <interface type='network'>
+          <mac address='52:54:00:5b:86:86'/>
+          <source network='default'/>
+          <model type='virtio'/>
+        </interface>
+        <interface type='bridge'>
+          <mac address='52:54:00:8f:39:13'/>
+          <source bridge='br0'/>
+        </interface>
+      </devices>
+    </domain>
+    """
+)
+
+SAMPLE_LIST_ALL = dedent(
+    """
+     Id    Name                           State
+    ----------------------------------------------------
+     2     %s                           running
+     -     %s                           shut off
+    """
+)
+
 SAMPLE_CAPABILITY_KVM = dedent(
     """\
     <domainCapabilities>
@@ -709,6 +754,123 @@ class TestVirshSSH(MAASTestCase):
         expected = conn.list_machines()
         self.assertItemsEqual(names, expected)
 
+    def test_run_records_timeout(self):
+        conn = self.configure_virshssh_pexpect()
+        self.assertFalse(conn.timed_out)
+        conn.run(["list"])
+        self.assertTrue(conn.timed_out)
+        self.assertFalse(conn.check_session())
+
+    def test_check_session_without_session(self):
+        conn = virsh.VirshSSH()
+        self.assertFalse(conn.check_session())
+
+    def test_get_machine_states(self):
+        names = [factory.make_name("machine") for _ in range(2)]
+        conn = self.configure_virshssh(SAMPLE_LIST_ALL % tuple(names))
+        self.assertEqual(
+            {names[0]: "running", names[1]: "shut off"},
+            conn.get_machine_states(),
+        )
+
+    def test_get_machine_states_with_dom_prefix(self):
+        prefix = "dom_prefix"
+        names = [prefix + factory.make_name("machine"), "other"]
+        conn = self.configure_virshssh(
+            SAMPLE_LIST_ALL % tuple(names), dom_prefix=prefix
+        )
+        self.assertEqual({names[0]: "running"}, conn.get_machine_states())
+
+    def test_load_machines_xml_fetches_in_batches(self):
+        names = [factory.make_name("machine") for _ in range(3)]
+        conn = virsh.VirshSSH()
+        run = self.patch(conn, "run")
+        run.side_effect = lambda args: "\n".join(
+            SAMPLE_DUMPXML_DEVICES % (name, name)
+            for name in names
+            if "dumpxml %s" % name in args[0]
+        )
+        conn.load_machines_xml(names, batch_size=2)
+        self.assertThat(
+            run,
+            MockCallsMatch(
+                call(["dumpxml %s; dumpxml %s" % tuple(names[:2])]),
+                call(["dumpxml %s" % names[2]]),
+            ),
+        )
+        self.assertEqual(
+            {
+                name: (SAMPLE_DUMPXML_DEVICES % (name, name)).strip()
+                for name in names
+            },
+            conn.xml,
+        )
+
+    def test_get_discovered_machines(self):
+        names = [factory.make_name("machine") for _ in range(2)]
+        conn = virsh.VirshSSH()
+        run = self.patch(conn, "run")
+        run.side_effect = [
+            SAMPLE_LIST_ALL % tuple(names),
+            "\n".join(SAMPLE_DUMPXML_DEVICES % (name, name) for name in names),
+        ]
+        get_machine_local_storage = self.patch(
+            conn, "get_machine_local_storage"
+        )
+        get_machine_local_storage.return_value = 10 * 1024 ** 3
+        storage_pool = DiscoveredPodStoragePool(
+            id=factory.make_name("id"),
+            name="default",
+            path="/var/lib/libvirt/images",
+            type="dir",
+            storage=100 * 1024 ** 3,
+        )
+
+        machines = conn.get_discovered_machines(storage_pools=[storage_pool])
+        self.assertEqual(names, [machine.hostname for machine in machines])
+        self.assertEqual(
+            ["on", "off"], [machine.power_state for machine in machines]
+        )
+        machine = machines[0]
+        self.assertEqual("amd64/generic", machine.architecture)
+        self.assertEqual(2, machine.cores)
+        self.assertEqual(2048, machine.memory)
+        self.assertEqual({"power_id": names[0]}, machine.power_parameters)
+        [block_device] = machine.block_devices
+        self.assertEqual("/dev/vda", block_device.id_path)
+        self.assertEqual(10 * 1024 ** 3, block_device.size)
+        self.assertEqual(storage_pool.id, block_device.storage_pool)
+        self.assertEqual(
+            [
+                ("52:54:00:5b:86:86", True, "network", "default"),
+                ("52:54:00:8f:39:13", False, "bridge", "br0"),
+            ],
+            [
+                (
+                    interface.mac_address,
+                    interface.boot,
+                    interface.attach_type,
+                    interface.attach_name,
+                )
+                for interface in machine.interfaces
+            ],
+        )
+        self.assertThat(
+            get_machine_local_storage,
+            MockCallsMatch(call(names[0], "vda"), call(names[1], "vda")),
+        )
+
+    def test_get_discovered_machines_skips_missing_storage(self):
+        name = factory.make_name("machine")
+        conn = virsh.VirshSSH()
+        self.patch(conn, "run").side_effect = [
+            SAMPLE_LIST_ALL % (name, "other"),
+            SAMPLE_DUMPXML_DEVICES % (name, name),
+            "error: failed to get domain 'other'",
+        ]
+        self.patch(conn, "get_machine_local_storage").return_value = None
+        self.assertEqual([], conn.get_discovered_machines(storage_pools=[]))
+
     def test_list_pools(self):
         names = ["default", "ubuntu"]
         conn = self.configure_virshssh(SAMPLE_POOLLIST)
@@ -2590,6 +2752,96 @@ class TestVirsh(MAASTestCase):
             )
 
 
+class TestVirshSessionPool(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def setUp(self):
+        super().setUp()
+        self.clock = Clock()
+        self.pool = virsh.VirshSessionPool(self.clock)
+        self.login = self.patch(virsh.VirshSSH, "login")
+        self.login.return_value = True
+        self.check_session = self.patch(virsh.VirshSSH, "check_session")
+        self.check_session.return_value = True
+        self.close_session = self.patch(virsh.VirshSSH, "close_session")
+        self.power_address = factory.make_name("power_address")
+
+    @inlineCallbacks
+    def test_acquire_logs_in(self):
+        conn = yield self.pool.acquire(self.power_address, "")
+        self.assertIsInstance(conn, virsh.VirshSSH)
+        self.assertThat(
+            self.login, MockCalledOnceWith(self.power_address, None)
+        )
+
+    @inlineCallbacks
+    def test_acquire_raises_login_failure(self):
+        self.login.return_value = False
+        with ExpectedException(virsh.VirshError):
+            yield self.pool.acquire(self.power_address)
+
+    @inlineCallbacks
+    def test_reuses_released_session(self):
+        conn = yield self.pool.acquire(self.power_address)
+        conn.xml["machine"] = sentinel.xml
+        yield self.pool.release(conn)
+        reused = yield self.pool.acquire(self.power_address)
+        self.assertIs(conn, reused)
+        self.assertEqual({}, reused.xml)
+        self.assertThat(
+            self.login, MockCalledOnceWith(self.power_address, None)
+        )
+
+    @inlineCallbacks
+    def test_does_not_share_sessions_between_pods(self):
+        conn = yield self.pool.acquire(self.power_address)
+        yield self.pool.release(conn)
+        other = yield self.pool.acquire(factory.make_name("power_address"))
+        self.assertIsNot(conn, other)
+
+    @inlineCallbacks
+    def test_replaces_unusable_session(self):
+        conn = yield self.pool.acquire(self.power_address)
+        yield self.pool.release(conn)
+        self.check_session.return_value = False
+        new_conn = yield self.pool.acquire(self.power_address)
+        self.assertIsNot(conn, new_conn)
+        self.assertThat(self.close_session, MockCalledOnceWith())
+        self.assertEqual(2, self.login.call_count)
+
+    @inlineCallbacks
+    def test_release_quits_timed_out_session(self):
+        conn = yield self.pool.acquire(self.power_address)
+        conn.timed_out = True
+        yield self.pool.release(conn)
+        self.assertThat(self.close_session, MockCalledOnceWith())
+        new_conn = yield self.pool.acquire(self.power_address)
+        self.assertIsNot(conn, new_conn)
+
+    @inlineCallbacks
+    def test_release_keeps_at_most_max_idle_sessions(self):
+        self.pool.max_idle = 1
+        conns = []
+        for _ in range(2):
+            conn = yield self.pool.acquire(self.power_address)
+            conns.append(conn)
+        for conn in conns:
+            yield self.pool.release(conn)
+        self.assertThat(self.close_session, MockCalledOnceWith())
+
+    @inlineCallbacks
+    def test_quits_idle_sessions_after_timeout(self):
+        conn = yield self.pool.acquire(self.power_address)
+        yield self.pool.release(conn)
+        self.clock.advance(self.pool.idle_timeout + 1)
+        new_conn = yield self.pool.acquire(self.power_address)
+        self.assertIsNot(conn, new_conn)
+        self.assertThat(self.check_session, MockNotCalled())
+        yield deferToThread(lambda: None)  # Let the session be quit.
+        self.assertThat(self.close_session, MockCalledOnceWith())
+
+
 class TestVirshPodDriver(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -2811,7 +3063,7 @@ class TestVirshPodDriver(MAASTestCase):
             "power_address": factory.make_name("power_address"),
             "power_pass": factory.make_name("power_pass"),
         }
-        machines = [factory.make_name("machine") for _ in range(3)]
+        machines = [MagicMock() for _ in range(3)]
         mock_pod = MagicMock()
         mock_pod.storage_pools = sentinel.storage_pools
         mock_login = self.patch(virsh.VirshSSH, "login")
@@ -2826,27 +3078,49 @@ class TestVirshPodDriver(MAASTestCase):
         )
         mock_get_pod_resources.return_value = mock_pod
         mock_get_pod_hints = self.patch(virsh.VirshSSH, "get_pod_hints")
-        mock_list_machines = self.patch(virsh.VirshSSH, "list_machines")
-        mock_get_discovered_machine = self.patch(
-            virsh.VirshSSH, "get_discovered_machine"
+        mock_get_discovered_machines = self.patch(
+            virsh.VirshSSH, "get_discovered_machines"
         )
-        mock_list_machines.return_value = machines
+        mock_get_discovered_machines.return_value = machines
 
         discovered_pod = yield driver.discover(system_id, context)
         self.expectThat(mock_create_storage_pool, MockCalledOnceWith())
         self.expectThat(mock_get_pod_resources, MockCalledOnceWith())
         self.expectThat(mock_get_pod_hints, MockCalledOnceWith())
-        self.expectThat(mock_list_machines, MockCalledOnceWith())
         self.expectThat(
-            mock_get_discovered_machine,
-            MockCallsMatch(
-                call(machines[0], storage_pools=sentinel.storage_pools),
-                call(machines[1], storage_pools=sentinel.storage_pools),
-                call(machines[2], storage_pools=sentinel.storage_pools),
-            ),
+            mock_get_discovered_machines,
+            MockCalledOnceWith(storage_pools=sentinel.storage_pools),
+        )
+        self.expectThat(machines, Equals(discovered_pod.machines))
+        self.expectThat(
+            [mock_pod.cpu_speed] * 3,
+            Equals([machine.cpu_speed for machine in machines]),
         )
         self.expectThat(["virtual"], Equals(discovered_pod.tags))
 
+    @inlineCallbacks
+    def test_reuses_session_between_operations(self):
+        driver = VirshPodDriver()
+        context = {
+            "power_address": factory.make_name("power_address"),
+            "power_id": factory.make_name("power_id"),
+            "power_pass": factory.make_name("power_pass"),
+        }
+        mock_login = self.patch(virsh.VirshSSH, "login")
+        mock_login.return_value = True
+        self.patch(virsh.VirshSSH, "check_session").return_value = True
+        mock_state = self.patch(virsh.VirshSSH, "get_machine_state")
+        mock_state.return_value = virsh.VirshVMState.ON
+
+        yield driver.power_query(factory.make_name("system_id"), context)
+        yield driver.power_query(factory.make_name("system_id"), context)
+        self.assertThat(
+            mock_login,
+            MockCalledOnceWith(
+                context["power_address"], context["power_pass"]
+            ),
+        )
+
     @inlineCallbacks
     def test_compose(self):
         driver = VirshPodDriver()
@@ -5,8 +5,9 @@
 
 __all__ = ["probe_virsh_and_enlist", "VirshPodDriver"]
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 import os
+import re
 import string
 from tempfile import NamedTemporaryFile
 from textwrap import dedent
@@ -15,7 +16,8 @@ from uuid import uuid4
 
 from lxml import etree
 import pexpect
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.internet.threads import deferToThread
 
 from provisioningserver.drivers import (
@@ -36,7 +38,7 @@ from provisioningserver.drivers.pod import (
     PodDriver,
 )
 from provisioningserver.enum import LIBVIRT_NETWORK
-from provisioningserver.logger import get_maas_logger
+from provisioningserver.logger import get_maas_logger, LegacyLogger
 from provisioningserver.path import get_path
 from provisioningserver.rpc.exceptions import PodInvalidResources
 from provisioningserver.rpc.utils import commission_node, create_node
@@ -46,6 +48,7 @@ from provisioningserver.utils.shell import get_env_with_locale
 from provisioningserver.utils.twisted import asynchronous, synchronous
 
 maaslog = get_maas_logger("drivers.pod.virsh")
+log = LegacyLogger()
 
 ADD_DEFAULT_NETWORK = dedent(
     """
@@ -58,6 +61,11 @@ ADD_DEFAULT_NETWORK = dedent(
 XPATH_ARCH = "/domain/os/type/@arch"
 XPATH_BOOT = "/domain/os/boot"
 XPATH_OS = "/domain/os"
+XPATH_NAME = "/domain/name"
+XPATH_VCPU = "/domain/vcpu"
+XPATH_MEMORY = "/domain/memory"
+XPATH_DISKS = "/domain/devices/disk[@device='disk']"
+XPATH_INTERFACES = "/domain/devices/interface"
 
 XPATH_POOL_TYPE = "/pool/@type"
 XPATH_POOL_AVAILABLE = "/pool/available"
@@ -250,6 +258,24 @@ ARCH_FIX_REVERSE = {value: key for key, value in ARCH_FIX.items()}
 
 InterfaceInfo = namedtuple("InterfaceInfo", ("type", "source", "model", "mac"))
 
+# Multiples of a byte for the units libvirt uses in domain XML.
+MEMORY_UNITS = {
+    "b": 1,
+    "bytes": 1,
+    "KB": 1000,
+    "k": 1024,
+    "KiB": 1024,
+    "MB": 1000 ** 2,
+    "M": 1024 ** 2,
+    "MiB": 1024 ** 2,
+    "GB": 1000 ** 3,
+    "G": 1024 ** 3,
+    "GiB": 1024 ** 3,
+    "TB": 1000 ** 4,
+    "T": 1024 ** 4,
+    "TiB": 1024 ** 4,
+}
+
 
 REQUIRED_PACKAGES = [
     ["virsh", "libvirt-clients"],
@@ -317,6 +343,9 @@ class VirshSSH(pexpect.spawn):
             self.dom_prefix = dom_prefix
         # Store a mapping of { machine_name: xml }.
         self.xml = {}
+        # Set when virsh didn't answer a command in time, after which its
+        # output can't be told apart from the next command's.
+        self.timed_out = False
 
     def _execute(self, poweraddr):
         """Spawns the pexpect command."""
@@ -391,6 +420,22 @@ class VirshSSH(pexpect.spawn):
         self.sendline("quit")
         self.close()
 
+    def check_session(self):
+        """Whether the session can still be used to run commands."""
+        if self.timed_out or self.pid is None or not self.isalive():
+            return False
+        self.sendline("")
+        return self.prompt(timeout=5)
+
+    def close_session(self):
+        """Quits the virsh session, unless it's already gone."""
+        if self.pid is None:
+            return
+        if self.isalive():
+            self.logout()
+        else:
+            self.close()
+
     def prompt(self, timeout=None):
         """Waits for virsh prompt."""
         if timeout is None:
@@ -403,7 +448,8 @@ class VirshSSH(pexpect.spawn):
     def run(self, args):
         cmd = " ".join(args)
         self.sendline(cmd)
-        self.prompt()
+        if not self.prompt():
+            self.timed_out = True
         result = self.before.decode("utf-8").splitlines()
         return "\n".join(result[1:])
 
@@ -470,6 +516,39 @@ class VirshSSH(pexpect.spawn):
         machines = machines.strip().splitlines()
         return [m for m in machines if m.startswith(self.dom_prefix)]
 
+    def get_machine_states(self):
+        """Gets the state of all VMs, by name, with one command."""
+        # The output of `virsh list --all` looks like:
+        #
+        #  Id    Name                           State
+        # ----------------------------------------------------
+        #  2     vm-1                           running
+        #  -     vm-2                           shut off
+        output = self.run(["list", "--all"]).strip().splitlines()
+        states = {}
+        for line in output[2:]:
+            columns = line.split(None, 2)
+            if len(columns) == 3 and columns[1].startswith(self.dom_prefix):
+                states[columns[1]] = columns[2].strip()
+        return states
+
+    def load_machines_xml(self, machines, batch_size=10):
+        """Fetch the XML of `machines`, `batch_size` at a time.
+
+        Each batch is a single line of `dumpxml` commands, so it's answered
+        in one go. The XML is cached for `get_machine_xml`.
+        """
+        machines = [machine for machine in machines if machine not in self.xml]
+        for start in range(0, len(machines), batch_size):
+            batch = machines[start : start + batch_size]
+            output = self.run(
+                ["; ".join("dumpxml %s" % machine for machine in batch)]
+            )
+            for xml in re.findall(r"<domain\b.*?</domain>", output, re.DOTALL):
+                name = etree.XML(xml).findtext("name")
+                if name in batch:
+                    self.xml[name] = xml
+
     def list_pools(self):
         """Lists all pools in the pod."""
         keys = ["Name"]
@@ -780,6 +859,98 @@ class VirshSSH(pexpect.spawn):
         discovered_machine.interfaces = interfaces
         return discovered_machine
 
+    def get_discovered_machines(self, storage_pools=None):
+        """Gets all the discovered machines at once.
+
+        This is what `get_discovered_machine` finds for each machine, but
+        their states come from one listing and everything else but the size
+        of their disks from their XML, which is fetched in batches.
+        """
+        if storage_pools is None:
+            storage_pools = self.get_pod_storage_pools()
+        states = self.get_machine_states()
+        self.load_machines_xml(list(states))
+        machines = []
+        for machine, state in states.items():
+            xml = self.get_machine_xml(machine)
+            if xml is None:
+                continue
+            discovered_machine = self._get_discovered_machine_from_xml(
+                machine, xml, state, storage_pools
+            )
+            if discovered_machine is not None:
+                machines.append(discovered_machine)
+        return machines
+
+    def _get_discovered_machine_from_xml(
+        self, machine, xml, state, storage_pools
+    ):
+        evaluator = etree.XPathEvaluator(etree.XML(xml))
+        arch = evaluator(XPATH_ARCH)[0]
+        [vcpu] = evaluator(XPATH_VCPU)
+        [memory] = evaluator(XPATH_MEMORY)
+        memory_bytes = (
+            int(memory.text) * MEMORY_UNITS[memory.get("unit", "KiB")]
+        )
+        discovered_machine = DiscoveredMachine(
+            hostname=machine,
+            architecture=ARCH_FIX.get(arch, arch),
+            cores=int(vcpu.get("current", vcpu.text)),
+            cpu_speed=0,
+            # Memory in MiB.
+            memory=int(memory_bytes / 1024 ** 2),
+            power_state=VM_STATE_TO_POWER_STATE[state],
+            power_parameters={"power_id": machine},
+            interfaces=[],
+            block_devices=[],
+            tags=[],
+        )
+
+        for disk in evaluator(XPATH_DISKS):
+            device = disk.find("target").get("dev")
+            source = disk.find("source")
+            if source is None:
+                source = "-"
+            else:
+                source = source.get("file", source.get("dev", "-"))
+            size = self.get_machine_local_storage(machine, device)
+            if size is None:
+                # See `get_discovered_machine`.
+                maaslog.error(
+                    "Unable to discover machine '%s' in virsh pod: storage "
+                    "device '%s' is missing its storage backing."
+                    % (machine, device)
+                )
+                return None
+            storage_pool = self.find_storage_pool(source, storage_pools)
+            discovered_machine.block_devices.append(
+                DiscoveredMachineBlockDevice(
+                    model=None,
+                    serial=None,
+                    size=size,
+                    id_path="/dev/%s" % device,
+                    storage_pool=storage_pool.id if storage_pool else None,
+                )
+            )
+
+        for idx, interface in enumerate(evaluator(XPATH_INTERFACES)):
+            source = interface.find("source")
+            if source is None:
+                attach_name = "-"
+            else:
+                attach_name = source.get(
+                    "network", source.get("bridge", source.get("dev", "-"))
+                )
+            discovered_machine.interfaces.append(
+                DiscoveredMachineInterface(
+                    mac_address=interface.find("mac").get("address"),
+                    boot=idx == 0,
+                    attach_type=interface.get("type"),
+                    attach_name=attach_name,
+                )
+            )
+        return discovered_machine
+
     def check_machine_can_startup(self, machine):
         """Check the machine for any startup errors
         after the domain is created in virsh.
@@ -1279,6 +1450,81 @@ class VirshSSH(pexpect.spawn):
         )
 
 
+class VirshSessionPool:
+    """Logged-in virsh sessions, kept to be used again.
+
+    Logging in over SSH takes far longer than running a virsh command, so
+    sessions are handed back once an operation is done with them, and up to
+    `max_idle` of them per pod are kept for the next operations. Sessions
+    idle for more than `idle_timeout` seconds are quit, and those kept are
+    checked before they are handed out again. A session is only ever used
+    by one operation at a time.
+    """
+
+    idle_timeout = 300
+    max_idle = 5
+
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        # (power_address, power_pass) -> [(session, time it was released)]
+        self._idle = defaultdict(list)
+
+    @inlineCallbacks
+    def acquire(self, power_address, power_pass=None):
+        """Return a logged-in session to the pod at `power_address`.
+
+        :raise VirshError: If logging in failed.
+        """
+        # The power control script sends a blank password if none is set.
+        if power_pass == "":
+            power_pass = None
+        key = power_address, power_pass
+        self._expire()
+        idle = self._idle[key]
+        while len(idle) > 0:
+            conn, _ = idle.pop()
+            usable = yield deferToThread(conn.check_session)
+            if usable:
+                return conn
+            yield deferToThread(conn.close_session)
+        conn = VirshSSH()
+        logged_in = yield deferToThread(conn.login, power_address, power_pass)
+        if not logged_in:
+            raise VirshError("Failed to login to virsh console.")
+        conn.session_key = key
+        return conn
+
+    def release(self, conn):
+        """Hand `conn` back, once done with it.
+
+        :return: A `Deferred` that fires once the session is either kept or
+            quit.
+        """
+        idle = self._idle[conn.session_key]
+        # Forget what was learnt about the machines; they may change before
+        # the session is used again.
+        conn.xml.clear()
+        if conn.timed_out or len(idle) >= self.max_idle:
+            return deferToThread(conn.close_session)
+        idle.append((conn, self.clock.seconds()))
+        return succeed(None)
+
+    def _expire(self):
+        expired = self.clock.seconds() - self.idle_timeout
+        for key, idle in list(self._idle.items()):
+            for conn, released in idle:
+                if released < expired:
+                    d = deferToThread(conn.close_session)
+                    d.addErrback(log.err, "Failed to quit virsh session.")
+            idle[:] = [
+                (conn, released)
+                for conn, released in idle
+                if released >= expired
+            ]
+            if len(idle) == 0:
+                del self._idle[key]
+
+
 class VirshPodDriver(PodDriver):
 
     name = "virsh"
@@ -1299,6 +1545,10 @@ class VirshPodDriver(PodDriver):
         "power_address", IP_EXTRACTOR_PATTERNS.URL
     )
 
+    def __init__(self, clock=reactor):
+        super().__init__(clock)
+        self.sessions = VirshSessionPool(clock)
+
     def detect_missing_packages(self):
         missing_packages = set()
         for binary, package in REQUIRED_PACKAGES:
@@ -1311,17 +1561,14 @@ class VirshPodDriver(PodDriver):
         self, power_address, power_id, power_change, power_pass=None, **kwargs
     ):
         """Powers controls a VM using virsh."""
+        conn = yield self.sessions.acquire(power_address, power_pass)
+        try:
+            yield self._power_control_virsh(conn, power_id, power_change)
+        finally:
+            yield self.sessions.release(conn)
 
-        # Force password to None if blank, as the power control
-        # script will send a blank password if one is not set.
-        if power_pass == "":
-            power_pass = None
-
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError("Failed to login to virsh console.")
-
+    @inlineCallbacks
+    def _power_control_virsh(self, conn, power_id, power_change):
         state = yield deferToThread(conn.get_machine_state, power_id)
         if state is None:
             raise VirshError("%s: Failed to get power state" % power_id)
@@ -1342,18 +1589,11 @@ class VirshPodDriver(PodDriver):
         self, power_address, power_id, power_pass=None, **kwargs
     ):
         """Return the power state for the VM using virsh."""
-
-        # Force password to None if blank, as the power control
-        # script will send a blank password if one is not set.
-        if power_pass == "":
-            power_pass = None
-
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError("Failed to login to virsh console.")
-
-        state = yield deferToThread(conn.get_machine_state, power_id)
+        conn = yield self.sessions.acquire(power_address, power_pass)
+        try:
+            state = yield deferToThread(conn.get_machine_state, power_id)
+        finally:
+            yield self.sessions.release(conn)
         if state is None:
             raise VirshError("Failed to get domain: %s" % power_id)
 
@@ -1377,17 +1617,14 @@ class VirshPodDriver(PodDriver):
         """Power query Virsh node."""
         return self.power_state_virsh(**context)
 
-    @inlineCallbacks
     def get_virsh_connection(self, context):
-        """Connect and return the virsh connection."""
-        power_address = context.get("power_address")
-        power_pass = context.get("power_pass")
-        # Login to Virsh console.
-        conn = VirshSSH()
-        logged_in = yield deferToThread(conn.login, power_address, power_pass)
-        if not logged_in:
-            raise VirshError("Failed to login to virsh console.")
-        return conn
+        """Connect and return the virsh connection.
+
+        It must be handed back with `self.sessions.release` once done.
+        """
+        return self.sessions.acquire(
+            context.get("power_address"), context.get("power_pass")
+        )
 
     @inlineCallbacks
     def discover(self, system_id, context):
@@ -1396,7 +1633,14 @@ class VirshPodDriver(PodDriver):
         Returns a defer to a DiscoveredPod object.
         """
         conn = yield self.get_virsh_connection(context)
+        try:
+            discovered_pod = yield self._discover(conn)
+        finally:
+            yield self.sessions.release(conn)
+        return discovered_pod
 
+    @inlineCallbacks
+    def _discover(self, conn):
         # Check that we have at least one storage pool.  If not, create it.
         pools = yield deferToThread(conn.list_pools)
         if not len(pools):
@@ -1409,17 +1653,12 @@ class VirshPodDriver(PodDriver):
         discovered_pod.hints = yield deferToThread(conn.get_pod_hints)
 
         # Discover VMs.
-        machines = []
-        virtual_machines = yield deferToThread(conn.list_machines)
-        for vm in virtual_machines:
-            discovered_machine = yield deferToThread(
-                conn.get_discovered_machine,
-                vm,
-                storage_pools=discovered_pod.storage_pools,
-            )
-            if discovered_machine is not None:
-                discovered_machine.cpu_speed = discovered_pod.cpu_speed
-                machines.append(discovered_machine)
+        machines = yield deferToThread(
+            conn.get_discovered_machines,
+            storage_pools=discovered_pod.storage_pools,
+        )
+        for discovered_machine in machines:
+            discovered_machine.cpu_speed = discovered_pod.cpu_speed
         discovered_pod.machines = machines
 
         # Set KVM Pod tags to 'virtual'.
@@ -1435,18 +1674,24 @@ class VirshPodDriver(PodDriver):
         default_pool = context.get(
             "default_storage_pool_id", context.get("default_storage_pool")
         )
-        created_machine = yield deferToThread(
-            conn.create_domain, request, default_pool
-        )
-        hints = yield deferToThread(conn.get_pod_hints)
+        try:
+            created_machine = yield deferToThread(
+                conn.create_domain, request, default_pool
+            )
+            hints = yield deferToThread(conn.get_pod_hints)
+        finally:
+            yield self.sessions.release(conn)
         return created_machine, hints
 
     @inlineCallbacks
     def decompose(self, system_id, context):
         """Decompose machine."""
         conn = yield self.get_virsh_connection(context)
-        yield deferToThread(conn.delete_domain, context["power_id"])
-        hints = yield deferToThread(conn.get_pod_hints)
+        try:
+            yield deferToThread(conn.delete_domain, context["power_id"])
+            hints = yield deferToThread(conn.get_pod_hints)
+        finally:
+            yield self.sessions.release(conn)
         return hints
 
 
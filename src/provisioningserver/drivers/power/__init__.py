@@ -280,6 +280,41 @@ class PowerDriver(PowerDriverBase):
         """Implement this method for the actual implementation
         of the power query command."""
 
+    # The most nodes that `power_query_group` is given at once.
+    power_query_group_size = 64
+
+    def get_power_query_group(self, context):
+        """Return what nodes that can be queried together with this one, by
+        `power_query_group`, have in common; None if it can't be.
+
+        Override this, usually along with `power_query_group`, when the
+        power management tools can query many nodes at once.
+        """
+        return None
+
+    def power_query_group(self, contexts):
+        """Query the power states of many nodes at once, when
+        `get_power_query_group` returned the same for all of them.
+
+        This is called in a thread, and is not retried. By default, each node
+        is queried in turn with `power_query`; override this when the power
+        management tools can do better.
+
+        :return: The power state of each of the nodes, in order, or None for
+            those whose power state it could not get. These are queried on
+            their own afterwards, to retry and report their errors.
+        """
+        power_states = []
+        for context in contexts:
+            try:
+                power_state = self.power_query(
+                    context.get("system_id"), context
+                )
+            except Exception:
+                power_state = None
+            power_states.append(power_state)
+        return power_states
+
     def on(self, system_id, context):
         """Performs the power on action for `system_id`.
 
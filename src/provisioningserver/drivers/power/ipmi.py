@@ -300,6 +300,19 @@ class IPMIPowerDriver(PowerDriver):
         match = re.search(r":\s*(on|off)", stdout)
         return stdout if match is None else match.group(1)
 
+    @staticmethod
+    def _make_common_args(power_address, power_user, power_pass, power_driver):
+        # See https://launchpad.net/bugs/1053391 for details of modifying the
+        # command for power_driver and power_user.
+        common_args = []
+        if is_power_parameter_set(power_driver):
+            common_args.extend(("--driver-type", power_driver))
+        common_args.extend(("-h", power_address))
+        if is_power_parameter_set(power_user):
+            common_args.extend(("-u", power_user))
+        common_args.extend(("-p", power_pass))
+        return common_args
+
     def _issue_ipmi_command(
         self,
         power_change,
@@ -332,16 +345,10 @@ class IPMIPowerDriver(PowerDriver):
         ]
         ipmipower_command = ["ipmipower", "-W", "opensesspriv"]
 
-        # Arguments in common between chassis config and power control. See
-        # https://launchpad.net/bugs/1053391 for details of modifying the
-        # command for power_driver and power_user.
-        common_args = []
-        if is_power_parameter_set(power_driver):
-            common_args.extend(("--driver-type", power_driver))
-        common_args.extend(("-h", power_address))
-        if is_power_parameter_set(power_user):
-            common_args.extend(("-u", power_user))
-        common_args.extend(("-p", power_pass))
+        # Arguments in common between chassis config and power control.
+        common_args = self._make_common_args(
+            power_address, power_user, power_pass, power_driver
+        )
 
         # Update the power commands with common args.
         ipmipower_command.extend(common_args)
@@ -382,3 +389,50 @@ class IPMIPowerDriver(PowerDriver):
 
     def power_query(self, system_id, context):
         return self._issue_ipmi_command("query", **context)
+
+    def get_power_query_group(self, context):
+        """Nodes with the same driver type and credentials are queried with
+        one `ipmipower` process, given all their BMCs' addresses.
+
+        Nodes only known by their MAC address are queried on their own, as
+        their BMC's address has to be looked up first.
+        """
+        power_address = context.get("power_address")
+        if not is_power_parameter_set(power_address) or (
+            # These would be taken for a list or a range of hosts.
+            any(char in power_address for char in ",[]")
+        ):
+            return None
+        return (
+            context.get("power_driver"),
+            context.get("power_user"),
+            context.get("power_pass"),
+        )
+
+    def power_query_group(self, contexts):
+        power_addresses = sorted(
+            {context["power_address"] for context in contexts}
+        )
+        context = contexts[0]
+        command = ["ipmipower", "-W", "opensesspriv"]
+        command.extend(
+            self._make_common_args(
+                ",".join(power_addresses),
+                context.get("power_user"),
+                context.get("power_pass"),
+                context.get("power_driver"),
+            )
+        )
+        command.append("--stat")
+        env = shell.get_env_with_locale()
+        process = Popen(tuple(command), stdout=PIPE, stderr=PIPE, env=env)
+        stdout, _ = process.communicate()
+        # ipmipower prints a "<host>: <state or error>" line for each host.
+        # Its exit status is non-zero as soon as one of them failed, so the
+        # output is all there is to go by.
+        states = {}
+        for line in stdout.decode("utf-8").splitlines():
+            host, _, state = line.strip().rpartition(": ")
+            if state in ("on", "off"):
+                states[host] = state
+        return [states.get(context["power_address"]) for context in contexts]
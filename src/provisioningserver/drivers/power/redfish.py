@@ -3,7 +3,7 @@
 
 """Redfish Power Driver."""
 
-__all__ = ["RedfishPowerDriver"]
+__all__ = ["RedfishConnectionPool", "RedfishPowerDriver"]
 
 from base64 import b64encode
 from http import HTTPStatus
@@ -16,6 +16,7 @@ from twisted.internet.defer import inlineCallbacks
 from twisted.web.client import (
     Agent,
     FileBodyProducer,
+    HTTPConnectionPool,
     PartialDownloadError,
     readBody,
     RedirectAgent,
@@ -29,6 +30,7 @@ from provisioningserver.drivers import (
 )
 from provisioningserver.drivers.power import PowerActionError, PowerDriver
 from provisioningserver.drivers.power.utils import WebClientContextFactory
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.utils.twisted import asynchronous
 
 # no trailing slashes
@@ -39,6 +41,29 @@ REDFISH_POWER_CONTROL_ENDPOINT = (
 REDFISH_SYSTEMS_ENDPOINT = b"redfish/v1/Systems"
 
 
+class RedfishConnectionPool(HTTPConnectionPool):
+    """Persistent connections to Redfish BMCs.
+
+    Connections are kept per BMC, so the requests that make up a power
+    action, and those of later power queries for as long as the BMC keeps
+    the connection open, don't each need a new TCP connection and TLS
+    handshake. New connections are counted, so that the rate at which they
+    are reused can be told from the number of requests.
+    """
+
+    def __init__(self, reactor, prometheus_metrics=PROMETHEUS_METRICS):
+        super().__init__(reactor, persistent=True)
+        self.prometheus_metrics = prometheus_metrics
+
+    def _newConnection(self, key, endpoint):
+        self.prometheus_metrics.update("maas_rack_redfish_connections", "inc")
+        return super()._newConnection(key, endpoint)
+
+
+# The connections to BMCs, shared by all Redfish requests.
+redfish_connection_pool = RedfishConnectionPool(reactor)
+
+
 class RedfishPowerDriverBase(PowerDriver):
     def get_url(self, context):
         """Return url for the pod."""
@@ -65,14 +90,25 @@ class RedfishPowerDriverBase(PowerDriver):
     def redfish_request(self, method, uri, headers=None, bodyProducer=None):
         """Send the redfish request and return the response."""
         agent = RedirectAgent(
-            Agent(reactor, contextFactory=WebClientContextFactory())
+            Agent(
+                reactor,
+                contextFactory=WebClientContextFactory(),
+                pool=redfish_connection_pool,
+            )
         )
+        started = reactor.seconds()
         d = agent.request(
             method, uri, headers=headers, bodyProducer=bodyProducer
         )
 
         def render_response(response):
             """Render the HTTPS response received."""
+            PROMETHEUS_METRICS.update(
+                "maas_rack_redfish_request_latency",
+                "observe",
+                value=reactor.seconds() - started,
+                labels={"method": method.decode("ascii")},
+            )
 
             def eb_catch_partial(failure):
                 # Twisted is raising PartialDownloadError because the responses
@@ -150,6 +186,11 @@ class RedfishPowerDriver(RedfishPowerDriverBase):
     ]
     ip_extractor = make_ip_extractor("power_address")
 
+    def __init__(self, clock=reactor):
+        super().__init__(clock)
+        # BMC URL -> ID of its system, for nodes configured without one.
+        self._node_ids = {}
+
     def detect_missing_packages(self):
         # no required packages
         return []
@@ -172,9 +213,20 @@ class RedfishPowerDriver(RedfishPowerDriverBase):
         if node_id:
             node_id = node_id.encode("utf-8")
         else:
-            node_id = yield self.get_node_id(url, headers)
+            node_id = self._node_ids.get(url)
+            if node_id is None:
+                node_id = yield self.get_node_id(url, headers)
+                self._node_ids[url] = node_id
         return url, node_id, headers
 
+    def forget_node_id(self, context):
+        """Look the node's system up again next time, if it wasn't given.
+
+        It's called when talking to the BMC failed, in case its systems
+        changed.
+        """
+        self._node_ids.pop(self.get_url(context), None)
+
     @inlineCallbacks
     def get_node_id(self, url, headers):
         uri = join(url, REDFISH_SYSTEMS_ENDPOINT)
@@ -223,26 +275,34 @@ class RedfishPowerDriver(RedfishPowerDriverBase):
     def power_on(self, node_id, context):
         """Power on machine."""
         url, node_id, headers = yield self.process_redfish_context(context)
-        power_state = yield self.power_query(node_id, context)
-        # Power off the machine if currently on.
-        if power_state == "on":
-            yield self.power("ForceOff", url, node_id, headers)
-        # Set to PXE boot.
-        yield self.set_pxe_boot(url, node_id, headers)
-        # Power on the machine.
-        yield self.power("On", url, node_id, headers)
+        try:
+            power_state = yield self.power_query(node_id, context)
+            # Power off the machine if currently on.
+            if power_state == "on":
+                yield self.power("ForceOff", url, node_id, headers)
+            # Set to PXE boot.
+            yield self.set_pxe_boot(url, node_id, headers)
+            # Power on the machine.
+            yield self.power("On", url, node_id, headers)
+        except Exception:
+            self.forget_node_id(context)
+            raise
 
     @asynchronous
     @inlineCallbacks
     def power_off(self, node_id, context):
         """Power off machine."""
         url, node_id, headers = yield self.process_redfish_context(context)
-        # Set to PXE boot.
-        yield self.set_pxe_boot(url, node_id, headers)
-        # Power off the machine if it is not already off
-        power_state = yield self.power_query(node_id, context)
-        if power_state != "off":
-            yield self.power("ForceOff", url, node_id, headers)
+        try:
+            # Set to PXE boot.
+            yield self.set_pxe_boot(url, node_id, headers)
+            # Power off the machine if it is not already off
+            power_state = yield self.power_query(node_id, context)
+            if power_state != "off":
+                yield self.power("ForceOff", url, node_id, headers)
+        except Exception:
+            self.forget_node_id(context)
+            raise
 
     @asynchronous
     @inlineCallbacks
@@ -250,5 +310,9 @@ class RedfishPowerDriver(RedfishPowerDriverBase):
         """Power query machine."""
         url, node_id, headers = yield self.process_redfish_context(context)
         uri = join(url, REDFISH_SYSTEMS_ENDPOINT, b"%s" % node_id)
-        node_data, _ = yield self.redfish_request(b"GET", uri, headers)
+        try:
+            node_data, _ = yield self.redfish_request(b"GET", uri, headers)
+        except Exception:
+            self.forget_node_id(context)
+            raise
         return node_data.get("PowerState").lower()
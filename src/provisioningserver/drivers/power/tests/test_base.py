@@ -546,3 +546,40 @@ class TestPowerDriverQuery(MAASTestCase):
             power.pause,
             MockCallsMatch(*(call(wait, reactor) for wait in wait_time)),
         )
+
+
+class TestPowerDriverQueryGroup(MAASTestCase):
+    def test_get_power_query_group_is_None(self):
+        driver = make_power_driver()
+        self.assertIsNone(driver.get_power_query_group({}))
+
+    def test_queries_each_node_in_turn(self):
+        driver = make_power_driver()
+        contexts = [
+            {"system_id": factory.make_name("system_id")} for _ in range(3)
+        ]
+        power_query = self.patch(driver, "power_query")
+        power_query.side_effect = ["on", "off", "on"]
+        self.assertEqual(
+            ["on", "off", "on"], driver.power_query_group(contexts)
+        )
+        self.assertThat(
+            power_query,
+            MockCallsMatch(
+                *(call(context["system_id"], context) for context in contexts)
+            ),
+        )
+
+    def test_returns_None_for_nodes_that_fail(self):
+        driver = make_power_driver()
+        contexts = [
+            {"system_id": factory.make_name("system_id")} for _ in range(3)
+        ]
+        self.patch(driver, "power_query").side_effect = [
+            "on",
+            PowerError("broken"),
+            "off",
+        ]
+        self.assertEqual(
+            ["on", None, "off"], driver.power_query_group(contexts)
+        )
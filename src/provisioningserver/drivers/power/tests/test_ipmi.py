@@ -430,3 +430,77 @@ class TestIPMIPowerDriver(MAASTestCase):
         )
         self.assertThat(tmpfile.flush, MockCalledOnceWith())
         self.assertThat(tmpfile.__exit__, MockCalledOnceWith(None, None, None))
+
+    def test_get_power_query_group_is_shared_by_same_credentials(self):
+        context = make_context()
+        other_context = dict(
+            context, power_address=factory.make_name("power_address")
+        )
+        ipmi_power_driver = IPMIPowerDriver()
+        self.assertEqual(
+            ipmi_power_driver.get_power_query_group(context),
+            ipmi_power_driver.get_power_query_group(other_context),
+        )
+
+    def test_get_power_query_group_differs_by_credentials(self):
+        context = make_context()
+        other_context = dict(
+            context, power_pass=factory.make_name("power_pass")
+        )
+        ipmi_power_driver = IPMIPowerDriver()
+        self.assertNotEqual(
+            ipmi_power_driver.get_power_query_group(context),
+            ipmi_power_driver.get_power_query_group(other_context),
+        )
+
+    def test_get_power_query_group_None_without_power_address(self):
+        context = make_context()
+        context["power_address"] = ""
+        context["mac_address"] = factory.make_mac_address()
+        self.assertIsNone(IPMIPowerDriver().get_power_query_group(context))
+
+    def test_get_power_query_group_None_for_host_list(self):
+        context = make_context()
+        context["power_address"] = "node[1-2]"
+        self.assertIsNone(IPMIPowerDriver().get_power_query_group(context))
+
+    def test_power_query_group_queries_all_hosts_at_once(self):
+        context = make_context()
+        contexts = [
+            dict(context, power_address=power_address)
+            for power_address in ("10.0.0.2", "fd00::2", "10.0.0.1")
+        ]
+        ipmipower_command = make_ipmipower_command(
+            **dict(context, power_address="10.0.0.1,10.0.0.2,fd00::2")
+        )
+        ipmipower_command += ("--stat",)
+        env = get_env_with_locale()
+        popen_mock = self.patch(ipmi_module, "Popen")
+        process = popen_mock.return_value
+        process.communicate.return_value = (
+            b"10.0.0.1: off\n10.0.0.2: on\nfd00::2: connection timeout\n",
+            b"",
+        )
+        process.returncode = 1
+
+        states = IPMIPowerDriver().power_query_group(contexts)
+
+        self.assertThat(
+            popen_mock,
+            MockCalledOnceWith(
+                ipmipower_command, stdout=PIPE, stderr=PIPE, env=env
+            ),
+        )
+        self.assertEqual(["on", None, "off"], states)
+
+    def test_power_query_group_shares_state_of_same_host(self):
+        context = make_context()
+        popen_mock = self.patch(ipmi_module, "Popen")
+        process = popen_mock.return_value
+        process.communicate.return_value = (
+            ("%s: on\n" % context["power_address"]).encode("utf-8"),
+            b"",
+        )
+        process.returncode = 0
+        states = IPMIPowerDriver().power_query_group([context, dict(context)])
+        self.assertEqual(["on", "on"], states)
@@ -13,12 +13,17 @@ from io import BytesIO
 import json
 from os.path import join
 import random
-from unittest.mock import call, Mock
+from unittest.mock import ANY, call, Mock, sentinel
 
 from testtools import ExpectedException
 from twisted.internet._sslverify import ClientTLSOptions
 from twisted.internet.defer import fail, inlineCallbacks, succeed
-from twisted.web.client import FileBodyProducer, PartialDownloadError
+from twisted.internet import reactor
+from twisted.web.client import (
+    FileBodyProducer,
+    HTTPConnectionPool,
+    PartialDownloadError,
+)
 from twisted.web.http_headers import Headers
 
 from maastesting.factory import factory
@@ -32,6 +37,7 @@ from provisioningserver.drivers.power import PowerActionError
 import provisioningserver.drivers.power.redfish as redfish_module
 from provisioningserver.drivers.power.redfish import (
     REDFISH_POWER_CONTROL_ENDPOINT,
+    RedfishConnectionPool,
     RedfishPowerDriver,
     WebClientContextFactory,
 )
@@ -145,6 +151,31 @@ class TestWebClientContextFactory(MAASTestCase):
         self.assertIsInstance(opts, ClientTLSOptions)
 
 
+class TestRedfishConnectionPool(MAASTestCase):
+    def test_is_persistent(self):
+        pool = RedfishConnectionPool(reactor)
+        self.assertTrue(pool.persistent)
+
+    def test_counts_new_connections(self):
+        _newConnection = self.patch(HTTPConnectionPool, "_newConnection")
+        _newConnection.return_value = sentinel.connection
+        prometheus_metrics = Mock()
+        pool = RedfishConnectionPool(
+            reactor, prometheus_metrics=prometheus_metrics
+        )
+        self.assertIs(
+            sentinel.connection,
+            pool._newConnection(sentinel.key, sentinel.endpoint),
+        )
+        self.assertThat(
+            _newConnection, MockCalledOnceWith(sentinel.key, sentinel.endpoint)
+        )
+        self.assertThat(
+            prometheus_metrics.update,
+            MockCalledOnceWith("maas_rack_redfish_connections", "inc"),
+        )
+
+
 class TestRedfishPowerDriver(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -219,6 +250,50 @@ class TestRedfishPowerDriver(MAASTestCase):
         self.assertEquals(expected_response, response)
         self.assertEquals(expected_headers.headers, headers)
 
+    @inlineCallbacks
+    def test_redfish_request_uses_connection_pool(self):
+        driver = RedfishPowerDriver()
+        context = make_context()
+        uri = join(driver.get_url(context), b"redfish/v1/Systems")
+        mock_agent = self.patch(redfish_module, "Agent")
+        response = Mock()
+        response.code = HTTPStatus.OK
+        mock_agent.return_value.request.return_value = succeed(response)
+        self.patch(redfish_module, "readBody").return_value = succeed(b"")
+
+        yield driver.redfish_request(b"GET", uri)
+        self.assertThat(
+            mock_agent,
+            MockCalledOnceWith(
+                reactor,
+                contextFactory=ANY,
+                pool=redfish_module.redfish_connection_pool,
+            ),
+        )
+
+    @inlineCallbacks
+    def test_redfish_request_records_latency(self):
+        driver = RedfishPowerDriver()
+        context = make_context()
+        uri = join(driver.get_url(context), b"redfish/v1/Systems")
+        mock_agent = self.patch(redfish_module, "Agent")
+        response = Mock()
+        response.code = HTTPStatus.OK
+        mock_agent.return_value.request.return_value = succeed(response)
+        self.patch(redfish_module, "readBody").return_value = succeed(b"")
+        prometheus_metrics = self.patch(redfish_module, "PROMETHEUS_METRICS")
+
+        yield driver.redfish_request(b"GET", uri)
+        self.assertThat(
+            prometheus_metrics.update,
+            MockCalledOnceWith(
+                "maas_rack_redfish_request_latency",
+                "observe",
+                value=ANY,
+                labels={"method": "GET"},
+            ),
+        )
+
     @inlineCallbacks
     def test_wrap_redfish_request_retries_404s_trailing_slash(self):
         driver = RedfishPowerDriver()
@@ -512,3 +587,48 @@ class TestRedfishPowerDriver(MAASTestCase):
         ]
         power_state = yield driver.power_query(system_id, context)
         self.assertEquals(power_state, power_change.lower())
+
+    @inlineCallbacks
+    def test_process_redfish_context_caches_node_id(self):
+        driver = RedfishPowerDriver()
+        context = make_context()
+        mock_redfish_request = self.patch(driver, "redfish_request")
+        mock_redfish_request.return_value = (SAMPLE_JSON_SYSTEMS, None)
+
+        _, node_id, _ = yield driver.process_redfish_context(context)
+        _, cached_node_id, _ = yield driver.process_redfish_context(context)
+        self.assertEqual(b"1", node_id)
+        self.assertEqual(b"1", cached_node_id)
+        self.assertThat(
+            mock_redfish_request, MockCalledOnceWith(ANY, ANY, ANY)
+        )
+
+    @inlineCallbacks
+    def test_process_redfish_context_prefers_given_node_id(self):
+        driver = RedfishPowerDriver()
+        context = make_context()
+        context["node_id"] = "2"
+        mock_redfish_request = self.patch(driver, "redfish_request")
+
+        _, node_id, _ = yield driver.process_redfish_context(context)
+        self.assertEqual(b"2", node_id)
+        self.assertThat(mock_redfish_request, MockNotCalled())
+
+    @inlineCallbacks
+    def test_power_query_forgets_node_id_on_failure(self):
+        driver = RedfishPowerDriver()
+        system_id = factory.make_name("system_id")
+        context = make_context()
+        mock_redfish_request = self.patch(driver, "redfish_request")
+        mock_redfish_request.side_effect = [
+            (SAMPLE_JSON_SYSTEMS, None),
+            PowerActionError("Failed"),
+            (SAMPLE_JSON_SYSTEMS, None),
+            (SAMPLE_JSON_SYSTEM, None),
+        ]
+
+        with ExpectedException(PowerActionError):
+            yield driver.power_query(system_id, context)
+        power_state = yield driver.power_query(system_id, context)
+        self.assertEqual("off", power_state)
+        self.assertEqual(4, mock_redfish_request.call_count)
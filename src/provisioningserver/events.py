@@ -7,26 +7,43 @@ __all__ = [
     "EVENT_DETAILS",
     "EVENT_STATUS_MESSAGES",
     "EVENT_TYPES",
+    "NodeEventBuffer",
     "send_node_event",
     "send_node_event_mac_address",
     "send_rack_event",
 ]
 
 from collections import namedtuple
+import json
 from logging import DEBUG, ERROR, INFO, WARN
-
-from twisted.internet.defer import maybeDeferred, succeed
+import os
+
+from twisted.internet import reactor
+from twisted.internet.defer import (
+    DeferredList,
+    DeferredLock,
+    inlineCallbacks,
+    maybeDeferred,
+    succeed,
+)
+from twisted.protocols.amp import UnhandledCommand
 
 from provisioningserver.logger import get_maas_logger, LegacyLogger
 from provisioningserver.rpc import getRegionClient
-from provisioningserver.rpc.exceptions import NoSuchEventType, NoSuchNode
+from provisioningserver.rpc.exceptions import (
+    NoConnectionsAvailable,
+    NoSuchEventType,
+    NoSuchNode,
+)
 from provisioningserver.rpc.region import (
     RegisterEventType,
     SendEvent,
     SendEventIPAddress,
     SendEventMACAddress,
+    SendEvents,
 )
 from provisioningserver.utils.env import get_maas_id
+from provisioningserver.utils.fs import atomic_write
 from provisioningserver.utils.twisted import (
     asynchronous,
     callOut,
@@ -434,12 +451,16 @@ class NodeEventHub:
 
     This automatically ensures that the event type is registered before
     sending logs to the region.
+
+    :ivar buffer: A `NodeEventBuffer` to queue events in, rather than
+        sending each of them to the region as it is logged, or None.
     """
 
     def __init__(self):
         super(NodeEventHub, self).__init__()
         self._types_registering = dict()
         self._types_registered = set()
+        self.buffer = None
 
     @asynchronous
     def registerEventType(self, event_type):
@@ -529,7 +550,13 @@ class NodeEventHub:
         :param description: An optional description of the event.
         :type description: unicode
         """
+        if self.buffer is not None:
+            return self.buffer.add(
+                event_type, description, system_id=system_id
+            )
+        return self._logByID(event_type, system_id, description)
 
+    def _logByID(self, event_type, system_id, description):
         def send(_):
             client = getRegionClient()
             return client(
@@ -556,7 +583,13 @@ class NodeEventHub:
         :param description: An optional description of the event.
         :type description: unicode
         """
+        if self.buffer is not None:
+            return self.buffer.add(
+                event_type, description, mac_address=mac_address
+            )
+        return self._logByMAC(event_type, mac_address, description)
 
+    def _logByMAC(self, event_type, mac_address, description):
         def send(_):
             client = getRegionClient()
             return client(
@@ -591,7 +624,13 @@ class NodeEventHub:
         :param description: An optional description of the event.
         :type description: unicode
         """
+        if self.buffer is not None:
+            return self.buffer.add(
+                event_type, description, ip_address=ip_address
+            )
+        return self._logByIP(event_type, ip_address, description)
 
+    def _logByIP(self, event_type, ip_address, description):
         def send(_):
             client = getRegionClient()
             return client(
@@ -614,6 +653,179 @@ class NodeEventHub:
         return d
 
 
+class NodeEventBuffer:
+    """Send node events to the region in batches.
+
+    Events are sent with `SendEvents` once `batch_size` of them are waiting,
+    or `delay` seconds after the first of them arrived. Batches that cannot
+    be sent, because no region is connected or the call fails, are written
+    to files in `spool_dir`; those are sent, oldest first, ahead of the next
+    batch, or when `flush` is next called. Regions that do not know
+    `SendEvents` are sent each event on its own instead.
+    """
+
+    batch_size = 500
+    delay = 1.0
+    # At most this many batches are kept in the spool; the oldest are
+    # dropped to make room for more.
+    spool_limit = 1000
+
+    def __init__(self, spool_dir, hub, clock=reactor):
+        self.spool_dir = spool_dir
+        self.hub = hub
+        self.clock = clock
+        self.pending = []
+        self.batched = True
+        self._delayed_flush = None
+        self._lock = DeferredLock()
+        self._spool_count = 0
+
+    def add(self, event_type, description, **node):
+        """Queue an event to be sent.
+
+        :param node: One of `system_id`, `mac_address`, or `ip_address`,
+            identifying the node of the event.
+        :return: A `Deferred` that has already fired; the event is sent, or
+            spooled, later.
+        """
+        event = dict(
+            node,
+            type_name=event_type,
+            description=description,
+            timestamp=self.clock.seconds(),
+        )
+        self.pending.append(event)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self._delayed_flush is None:
+            self._delayed_flush = self.clock.callLater(self.delay, self.flush)
+        return succeed(None)
+
+    def flush(self):
+        """Send the queued events, and any spooled, now.
+
+        :return: A `Deferred` that fires once they have been sent, or
+            spooled.
+        """
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+        pending, self.pending = self.pending, []
+        return self._lock.run(self._flush, pending)
+
+    @inlineCallbacks
+    def _flush(self, pending):
+        for path in self._listSpool():
+            try:
+                with open(path, "rb") as fd:
+                    spooled = json.loads(fd.read().decode("utf-8"))
+            except (OSError, ValueError):
+                log.err(None, "Discarding unreadable spooled node events.")
+            else:
+                sent = yield self._send(spooled)
+                if not sent:
+                    break
+            os.remove(path)
+        else:
+            if len(pending) == 0:
+                return
+            sent = yield self._send(pending)
+            if sent:
+                return
+        if len(pending) != 0:
+            self._spool(pending)
+
+    @inlineCallbacks
+    def _send(self, events):
+        """Send `events` to the region.
+
+        :return: A `Deferred` that fires with True if they were sent, or
+            False if they should be spooled.
+        """
+        try:
+            client = getRegionClient()
+            for event_type in {event["type_name"] for event in events}:
+                yield self.hub.ensureEventTypeRegistered(event_type)
+            if self.batched:
+                try:
+                    yield client(SendEvents, events=events)
+                except UnhandledCommand:
+                    # The region is older than this rack controller.
+                    self.batched = False
+            if not self.batched:
+                yield self._sendOneAtATime(events)
+        except NoConnectionsAvailable:
+            log.msg(
+                "Region not available; spooling %d node events." % len(events)
+            )
+            return False
+        except Exception:
+            log.err(None, "Failed to send node events; will try again later.")
+            return False
+        else:
+            return True
+
+    def _sendOneAtATime(self, events):
+        sends = []
+        for event in events:
+            if event.get("system_id") is not None:
+                d = self.hub._logByID(
+                    event["type_name"],
+                    event["system_id"],
+                    event["description"],
+                )
+            elif event.get("mac_address") is not None:
+                d = self.hub._logByMAC(
+                    event["type_name"],
+                    event["mac_address"],
+                    event["description"],
+                )
+            else:
+                d = self.hub._logByIP(
+                    event["type_name"],
+                    event["ip_address"],
+                    event["description"],
+                )
+            d.addErrback(log.err, "Failed to send node event to region.")
+            sends.append(d)
+        return DeferredList(sends)
+
+    def _listSpool(self):
+        """Return the paths of the spooled batches, oldest first."""
+        try:
+            filenames = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return []
+        else:
+            return [
+                os.path.join(self.spool_dir, filename)
+                for filename in sorted(filenames)
+                if filename.endswith(".json") and not filename.startswith(".")
+            ]
+
+    def _spool(self, events):
+        """Write `events` to a new file in the spool."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool_count += 1
+        filename = "%020d-%06d.json" % (
+            self.clock.seconds() * 1000000,
+            self._spool_count % 1000000,
+        )
+        atomic_write(
+            json.dumps(events).encode("utf-8"),
+            os.path.join(self.spool_dir, filename),
+        )
+        spooled = self._listSpool()
+        for path in spooled[: -self.spool_limit]:
+            maaslog.warning(
+                "Too many node events are waiting to be sent to the "
+                "region; discarding %s.",
+                os.path.basename(path),
+            )
+            os.remove(path)
+
+
 # Singleton.
 nodeEventHub = NodeEventHub()
 
@@ -127,11 +127,13 @@ def parse_sources(sources_yaml):
     return BootSources.parse(StringIO(sources_yaml))
 
 
-def import_images(sources):
+def import_images(sources, peers=None):
     """Import images.  Callable from the command line.
 
     :param config: An iterable of dicts representing the sources from
         which boot images will be downloaded.
+    :param peers: URLs of other rack controllers to try downloading files
+        from first; see `download_all_boot_resources`.
     """
     if len(sources) == 0:
         msg = "Can't import: region did not provide a source."
@@ -190,7 +192,7 @@ def import_images(sources):
 
         try:
             snapshot_path = download_all_boot_resources(
-                sources, storage, product_mapping
+                sources, storage, product_mapping, peers=peers
             )
         except Exception as e:
             try_send_rack_event(
@@ -201,8 +203,9 @@ def import_images(sources):
                 "Unable to import boot images; cleaning up failed snapshot "
                 "and cache."
             )
-            # Cleanup snapshots and cache since download failed.
-            cleanup_snapshots_and_cache(storage)
+            # Cleanup snapshots and cache since download failed, but keep
+            # interrupted downloads so the next import can resume them.
+            cleanup_snapshots_and_cache(storage, keep_partial_downloads=True)
             raise
 
     maaslog.info("Writing boot image metadata.")
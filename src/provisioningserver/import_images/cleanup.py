@@ -30,8 +30,12 @@ def cleanup_snapshots(storage):
         shutil.rmtree(snapshot)
 
 
-def list_unused_cache_files(storage):
-    """List of cache files that are no longer being referenced by snapshots."""
+def list_unused_cache_files(storage, keep_partial_downloads=False):
+    """List of cache files that are no longer being referenced by snapshots.
+
+    :param keep_partial_downloads: Leave out downloads that were interrupted,
+        so that they can be resumed.
+    """
     cache_dir = os.path.join(storage, "cache")
     if os.path.exists(cache_dir):
         cache_files = [
@@ -41,6 +45,12 @@ def list_unused_cache_files(storage):
         ]
     else:
         cache_files = []
+    if keep_partial_downloads:
+        cache_files = [
+            cache_file
+            for cache_file in cache_files
+            if not cache_file.endswith(".part")
+        ]
     return [
         cache_file
         for cache_file in cache_files
@@ -48,14 +58,14 @@ def list_unused_cache_files(storage):
     ]
 
 
-def cleanup_cache(storage):
+def cleanup_cache(storage, keep_partial_downloads=False):
     """Remove files that are no longer being referenced by snapshots."""
-    cache_files = list_unused_cache_files(storage)
+    cache_files = list_unused_cache_files(storage, keep_partial_downloads)
     for cache_file in cache_files:
         os.remove(cache_file)
 
 
-def cleanup_snapshots_and_cache(storage):
+def cleanup_snapshots_and_cache(storage, keep_partial_downloads=False):
     """Remove old snapshot directories and old cache files."""
     cleanup_snapshots(storage)
-    cleanup_cache(storage)
+    cleanup_cache(storage, keep_partial_downloads)
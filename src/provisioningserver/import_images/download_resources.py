@@ -5,9 +5,15 @@
 
 __all__ = ["download_all_boot_resources"]
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+import hashlib
+import http.client
 import os.path
+import random
 import tarfile
+import urllib.error
+import urllib.request
 
 from simplestreams.mirrors import BasicMirrorWriter, UrlMirrorReader
 from simplestreams.objectstores import FileStore
@@ -29,8 +35,138 @@ log = LegacyLogger()
 
 DEFAULT_KEYRING_PATH = "/usr/share/keyrings"
 
+# How many files the importer downloads at the same time.
+MAX_CONCURRENT_DOWNLOADS = 4
 
-def insert_file(store, name, tag, checksums, size, content_source):
+# How long to wait for data from the server before giving up on a download.
+DOWNLOAD_TIMEOUT = 120
+
+DOWNLOAD_BLOCK_SIZE = 1 << 20
+
+
+class InvalidDownload(Exception):
+    """Downloaded content does not have the expected size or checksum."""
+
+
+def _hash_file(hasher, path):
+    """Update `hasher` with the content of the file at `path`."""
+    with open(path, "rb") as stream:
+        for data in iter(lambda: stream.read(DOWNLOAD_BLOCK_SIZE), b""):
+            hasher.update(data)
+
+
+def download_file(url, path, sha256, size):
+    """Download `url` to `path`, resuming an earlier interrupted download.
+
+    Content is written to a partial file next to `path` (named the same as
+    the partial files simplestreams leaves behind), which is only renamed to
+    `path` once its size and checksum have been verified. If a partial file
+    is found, only the rest of the content is asked for, with a Range
+    request; if the server sends the whole content instead, it starts over.
+
+    :param sha256: The expected SHA256 of the content.
+    :param size: The expected size of the content, or None.
+    :raise InvalidDownload: If the content does not match `sha256` or
+        `size`. If it was only cut short, the partial file is kept so that
+        the next attempt resumes it; otherwise it is removed, so the next
+        attempt starts over.
+    """
+    partial_path = path + ".part"
+    hasher = hashlib.sha256()
+    try:
+        offset = os.path.getsize(partial_path)
+    except FileNotFoundError:
+        offset = 0
+    if size is not None and offset > size:
+        offset = 0
+    if size is None or offset < size:
+        request = urllib.request.Request(url)
+        if offset != 0:
+            request.add_header("Range", "bytes=%d-" % offset)
+        try:
+            response = urllib.request.urlopen(
+                request, timeout=DOWNLOAD_TIMEOUT
+            )
+        except urllib.error.HTTPError as error:
+            if offset == 0 or (
+                error.code != http.client.REQUESTED_RANGE_NOT_SATISFIABLE
+            ):
+                raise
+            # What was downloaded so far doesn't fit the file on the server.
+            os.remove(partial_path)
+            return download_file(url, path, sha256, size)
+        with response:
+            if (
+                offset != 0
+                and response.getcode() != http.client.PARTIAL_CONTENT
+            ):
+                offset = 0
+            if offset != 0:
+                log.debug(
+                    "Resuming download of {url} from byte {offset}.",
+                    url=url,
+                    offset=offset,
+                )
+                _hash_file(hasher, partial_path)
+            with open(partial_path, "ab" if offset != 0 else "wb") as stream:
+                for data in iter(
+                    lambda: response.read(DOWNLOAD_BLOCK_SIZE), b""
+                ):
+                    stream.write(data)
+                    hasher.update(data)
+    else:
+        _hash_file(hasher, partial_path)
+    actual_size = os.path.getsize(partial_path)
+    if size is not None and actual_size < size:
+        # The connection was closed early; there's more to ask for.
+        raise InvalidDownload(
+            "%s ended after %d of %d bytes." % (url, actual_size, size)
+        )
+    if hasher.hexdigest() != sha256 or (
+        size is not None and actual_size != size
+    ):
+        os.remove(partial_path)
+        raise InvalidDownload(
+            "%s has SHA256 %s and size %d; expected SHA256 %s and size %s."
+            % (url, hasher.hexdigest(), actual_size, sha256, size)
+        )
+    os.rename(partial_path, path)
+
+
+def fetch_file(store, tag, checksums, size, content_source, peers=()):
+    """Put the file `tag` into `store`, unless it's already there.
+
+    The file is downloaded with `download_file`, so that an interrupted
+    download can be resumed, whenever `content_source` has a URL.
+
+    :param peers: URLs of other rack controllers, under which the file may be
+        found by its SHA256. They are tried, in random order so as to spread
+        the load, before `content_source`. A download from one that fails,
+        for whatever reason, is resumed from the next.
+    """
+    path = store._fullpath(tag)
+    url = getattr(content_source, "url", None)
+    if url is None:
+        store.insert(tag, content_source, checksums, mutable=False, size=size)
+    elif not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sha256 = checksums["sha256"]
+        for peer in random.sample(peers, len(peers)):
+            try:
+                download_file(peer + sha256, path, sha256, size)
+            except (OSError, InvalidDownload) as error:
+                log.debug(
+                    "Could not download {tag} from {peer}: {error}",
+                    tag=tag,
+                    peer=peer,
+                    error=error,
+                )
+            else:
+                return
+        download_file(url, path, sha256, size)
+
+
+def insert_file(store, name, tag, checksums, size, content_source, peers=()):
     """Insert a file into `store`.
 
     :param store: A simplestreams `ObjectStore`.
@@ -45,6 +181,8 @@ def insert_file(store, name, tag, checksums, size, content_source):
         to expect.
     :param content_source: A Simplestreams `ContentSource` for reading the
         file.
+    :param peers: URLs of other rack controllers to try downloading the file
+        from first; see `fetch_file`.
     :return: A list of inserted files (actually, only the one file in this
         case) described as tuples of (path, logical name).  The path lies in
         the directory managed by `store` and has a filename based on `tag`,
@@ -56,12 +194,14 @@ def insert_file(store, name, tag, checksums, size, content_source):
         tag=tag,
         size=size,
     )
-    store.insert(tag, content_source, checksums, mutable=False, size=size)
+    fetch_file(store, tag, checksums, size, content_source, peers)
     # XXX jtv 2014-04-24 bug=1313580: Isn't _fullpath meant to be private?
     return [(store._fullpath(tag), name)]
 
 
-def extract_archive_tar(store, name, tag, checksums, size, content_source):
+def extract_archive_tar(
+    store, name, tag, checksums, size, content_source, peers=()
+):
     """Extract an archive.tar.xz into `store`.
 
     :param store: A simplestreams `ObjectStore`.
@@ -77,6 +217,8 @@ def extract_archive_tar(store, name, tag, checksums, size, content_source):
         to expect.
     :param content_source: A Simplestreams `ContentSource` for reading the
         file.
+    :param peers: URLs of other rack controllers to try downloading the
+        archive from first; see `fetch_file`.
     :return: A list of inserted files (file and archive.tar.xz) described
         as tuples of (path, logical name).  The path lies in the directory
         managed by `store` and has a filename based on `tag`, not logical name.
@@ -113,7 +255,7 @@ def extract_archive_tar(store, name, tag, checksums, size, content_source):
             size=size,
         )
         archive_path = store._fullpath(tag)
-        store.insert(tag, content_source, checksums, mutable=False, size=size)
+        fetch_file(store, tag, checksums, size, content_source, peers)
         with tarfile.open(archive_path, "r|*") as tar:
             for member in tar:
                 if member.isfile():
@@ -197,12 +339,27 @@ class RepoWriter(BasicMirrorWriter):
         should be stored.
     :ivar product_mapping: A `ProductMapping` describing the desired boot
         resources.
+    :ivar max_concurrency: How many files to download at the same time.
+    :ivar peers: URLs of other rack controllers to try downloading files
+        from first; see `fetch_file`.
     """
 
-    def __init__(self, root_path, store, product_mapping):
+    def __init__(
+        self,
+        root_path,
+        store,
+        product_mapping,
+        max_concurrency=MAX_CONCURRENT_DOWNLOADS,
+        peers=None,
+    ):
         self.root_path = root_path
         self.store = store
         self.product_mapping = product_mapping
+        self.max_concurrency = max_concurrency
+        self.peers = () if peers is None else tuple(peers)
+        self._executor = None
+        self._downloads = {}
+        self._links = []
         super(RepoWriter, self).__init__(
             config={
                 # Only download the latest version. Without this all versions
@@ -211,6 +368,62 @@ class RepoWriter(BasicMirrorWriter):
             }
         )
 
+    def sync(self, reader, path):
+        """Overridable from `BasicMirrorWriter`.
+
+        While syncing, files are downloaded in the background as they are
+        found, at most `max_concurrency` at a time. They are linked into the
+        snapshot, in the order they were found, once all have been found and
+        downloaded.
+        """
+        self._executor = ThreadPoolExecutor(self.max_concurrency)
+        try:
+            super(RepoWriter, self).sync(reader, path)
+            for download, filename, link_args in self._links:
+                links = download.result()
+                if filename is not None:
+                    links = [
+                        (cached_file, filename) for cached_file, _ in links
+                    ]
+                link_resources(links=links, **link_args)
+        finally:
+            for download in self._downloads.values():
+                download.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._downloads.clear()
+            self._links.clear()
+
+    def _download(self, ftype, filename, tag, checksums, size, contentsource):
+        """Download a file, in the background when syncing.
+
+        A file found more than once is only downloaded once.
+
+        :return: A `Future` for the list of links to the file's content.
+        """
+        if ftype == "archive.tar.xz":
+            insert = extract_archive_tar
+        else:
+            insert = insert_file
+        args = (self.store, filename, tag, checksums, size, contentsource)
+        if self._executor is None:
+            download = Future()
+            download.set_result(insert(*args, peers=self.peers))
+            return download
+        download = self._downloads.get(tag)
+        if download is None:
+            if getattr(contentsource, "url", None) is None:
+                # Only content sources with a URL can be used from another
+                # thread once this item has been inserted.
+                download = Future()
+                download.set_result(insert(*args, peers=self.peers))
+            else:
+                download = self._executor.submit(
+                    insert, *args, peers=self.peers
+                )
+            self._downloads[tag] = download
+        return download
+
     def load_products(self, path=None, content_id=None):
         """Overridable from `BasicMirrorWriter`."""
         # It looks as if this method only makes sense for MirrorReaders, not
@@ -230,14 +443,9 @@ class RepoWriter(BasicMirrorWriter):
         size = data["size"]
         ftype = item["ftype"]
         filename = os.path.basename(item["path"])
-        if ftype == "archive.tar.xz":
-            links = extract_archive_tar(
-                self.store, filename, tag, checksums, size, contentsource
-            )
-        else:
-            links = insert_file(
-                self.store, filename, tag, checksums, size, contentsource
-            )
+        download = self._download(
+            ftype, filename, tag, checksums, size, contentsource
+        )
 
         osystem = get_os_from_product(item)
 
@@ -272,9 +480,8 @@ class RepoWriter(BasicMirrorWriter):
             subarch_parts = item["subarch"].split("-")
             subarch_parts[1] = "rolling"
             subarches.add("-".join(subarch_parts))
-        link_resources(
+        link_args = dict(
             snapshot_path=self.root_path,
-            links=links,
             osystem=osystem,
             arch=item["arch"],
             release=item["release"],
@@ -282,10 +489,22 @@ class RepoWriter(BasicMirrorWriter):
             subarches=subarches,
             bootloader_type=item.get("bootloader-type"),
         )
+        if self._executor is None:
+            link_resources(links=download.result(), **link_args)
+        else:
+            # The same file can be found under a different name, which is
+            # what it must be linked as.
+            self._links.append(
+                (
+                    download,
+                    None if ftype == "archive.tar.xz" else filename,
+                    link_args,
+                )
+            )
 
 
 def download_boot_resources(
-    path, store, snapshot_path, product_mapping, keyring_file=None
+    path, store, snapshot_path, product_mapping, keyring_file=None, peers=None
 ):
     """Download boot resources for one simplestreams source.
 
@@ -298,9 +517,11 @@ def download_boot_resources(
         downloaded.
     :param keyring_file: Optional path to a keyring file for verifying
         signatures.
+    :param peers: URLs of other rack controllers to try downloading files
+        from first; see `fetch_file`.
     """
     maaslog.info("Downloading boot resources from %s", path)
-    writer = RepoWriter(snapshot_path, store, product_mapping)
+    writer = RepoWriter(snapshot_path, store, product_mapping, peers=peers)
     (mirror, rpath) = path_from_mirror_url(path, None)
     policy = get_signing_policy(rpath, keyring_file)
     reader = UrlMirrorReader(mirror, policy=policy)
@@ -323,7 +544,7 @@ def compose_snapshot_path(storage_path):
 
 
 def download_all_boot_resources(
-    sources, storage_path, product_mapping, store=None
+    sources, storage_path, product_mapping, store=None, peers=None
 ):
     """Download the actual boot resources.
 
@@ -344,6 +565,8 @@ def download_all_boot_resources(
     :param product_mapping: A `ProductMapping` describing the resources to be
         downloaded.
     :param store: A `FileStore` instance. Used only for testing.
+    :param peers: URLs of other rack controllers to try downloading files
+        from first, before the sources; see `fetch_file`.
     :return: Path to the snapshot directory.
     """
     storage_path = os.path.abspath(storage_path)
@@ -363,6 +586,7 @@ def download_all_boot_resources(
             snapshot_path,
             product_mapping,
             keyring_file=source.get("keyring"),
+            peers=peers,
         ),
 
     return snapshot_path
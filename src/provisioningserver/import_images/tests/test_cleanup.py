@@ -75,6 +75,22 @@ class TestCleanup(MAASTestCase):
             cache_nlink_1, cleanup.list_unused_cache_files(storage)
         )
 
+    def test_list_unused_cache_files_can_keep_partial_downloads(self):
+        storage = self.make_dir()
+        cache_file = self.make_cache_file(storage)
+        partial_file = cache_file + ".part"
+        open(partial_file, "wb").close()
+        self.assertItemsEqual(
+            [cache_file, partial_file],
+            cleanup.list_unused_cache_files(storage),
+        )
+        self.assertItemsEqual(
+            [cache_file],
+            cleanup.list_unused_cache_files(
+                storage, keep_partial_downloads=True
+            ),
+        )
+
     def test_cleanup_cache_removes_all_files_nlink_equal_one(self):
         storage = self.make_dir()
         for _ in range(3):
@@ -98,4 +114,13 @@ class TestCleanup(MAASTestCase):
         mock_cache = self.patch_autospec(cleanup, "cleanup_cache")
         cleanup.cleanup_snapshots_and_cache(storage)
         self.assertThat(mock_snapshots, MockCalledOnceWith(storage))
-        self.assertThat(mock_cache, MockCalledOnceWith(storage))
+        self.assertThat(mock_cache, MockCalledOnceWith(storage, False))
+
+    def test_cleanup_snapshots_and_cache_can_keep_partial_downloads(self):
+        storage = self.make_dir()
+        self.patch_autospec(cleanup, "cleanup_snapshots")
+        mock_cache = self.patch_autospec(cleanup, "cleanup_cache")
+        cleanup.cleanup_snapshots_and_cache(
+            storage, keep_partial_downloads=True
+        )
+        self.assertThat(mock_cache, MockCalledOnceWith(storage, True))
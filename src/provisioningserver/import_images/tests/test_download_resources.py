@@ -7,9 +7,12 @@ __all__ = []
 
 from datetime import datetime
 import hashlib
+import http.client
+from io import BytesIO
 import os
 import random
 import tarfile
+import threading
 from unittest import mock
 
 from simplestreams.contentsource import ChecksummingContentSource
@@ -81,6 +84,7 @@ class TestDownloadAllBootResources(MAASTestCase):
                 snapshot_path,
                 product_mapping,
                 keyring_file=source["keyring"],
+                peers=None,
             ),
         )
 
@@ -259,6 +263,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -304,6 +309,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -348,6 +354,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -410,6 +417,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -454,6 +462,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -499,6 +508,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -546,6 +556,7 @@ class TestRepoWriter(MAASTestCase):
                 {"sha256": product["sha256"]},
                 product["size"],
                 None,
+                peers=(),
             ),
         )
         # links are mocked out by the mock_insert_file above.
@@ -563,6 +574,311 @@ class TestRepoWriter(MAASTestCase):
             ),
         )
 
+    def test_sync_downloads_in_parallel(self):
+        product_mapping = ProductMapping()
+        products = [self.make_product(subarch="generic") for _ in range(2)]
+        for product in products:
+            product_mapping.add(product, "generic")
+        repo_writer = download_resources.RepoWriter(
+            None, None, product_mapping, max_concurrency=2
+        )
+        self.patch(download_resources, "products_exdata").side_effect = list(
+            products
+        )
+        barrier = threading.Barrier(2, timeout=5)
+
+        def insert_file(
+            store, name, tag, checksums, size, content_source, peers=()
+        ):
+            # Only passes once both downloads are running.
+            barrier.wait()
+            return [(tag, name)]
+
+        self.patch(download_resources, "insert_file", insert_file)
+        mock_link_resources = self.patch(download_resources, "link_resources")
+
+        def sync(writer, reader, path):
+            for product in products:
+                content_source = mock.Mock(url=factory.make_simple_http_url())
+                repo_writer.insert_item(
+                    product, None, None, None, content_source
+                )
+            # Nothing is linked until everything has been found.
+            self.assertThat(mock_link_resources, MockNotCalled())
+
+        self.patch(download_resources.BasicMirrorWriter, "sync", sync)
+        repo_writer.sync(None, None)
+        self.assertEqual(
+            [
+                [(product["sha256"], os.path.basename(product["path"]))]
+                for product in products
+            ],
+            [call[2]["links"] for call in mock_link_resources.mock_calls],
+        )
+
+    def test_sync_downloads_same_file_once(self):
+        product_mapping = ProductMapping()
+        product = self.make_product(subarch="generic")
+        other = self.make_product(
+            subarch="generic",
+            sha256=product["sha256"],
+            path="/path/to/%s" % factory.make_name("filename"),
+        )
+        product_mapping.add(product, "generic")
+        product_mapping.add(other, "generic")
+        repo_writer = download_resources.RepoWriter(
+            None, None, product_mapping
+        )
+        self.patch(download_resources, "products_exdata").side_effect = [
+            product,
+            other,
+        ]
+        mock_insert_file = self.patch(download_resources, "insert_file")
+        mock_insert_file.return_value = [
+            (product["sha256"], os.path.basename(product["path"]))
+        ]
+        mock_link_resources = self.patch(download_resources, "link_resources")
+
+        def sync(writer, reader, path):
+            for item in (product, other):
+                content_source = mock.Mock(url=factory.make_simple_http_url())
+                repo_writer.insert_item(item, None, None, None, content_source)
+
+        self.patch(download_resources.BasicMirrorWriter, "sync", sync)
+        repo_writer.sync(None, None)
+        self.assertEqual(1, len(mock_insert_file.mock_calls))
+        self.assertEqual(
+            [
+                [(product["sha256"], os.path.basename(item["path"]))]
+                for item in (product, other)
+            ],
+            [call[2]["links"] for call in mock_link_resources.mock_calls],
+        )
+
+    def test_sync_raises_download_errors(self):
+        product_mapping = ProductMapping()
+        product = self.make_product(subarch="generic")
+        product_mapping.add(product, "generic")
+        repo_writer = download_resources.RepoWriter(
+            None, None, product_mapping
+        )
+        self.patch(
+            download_resources, "products_exdata"
+        ).return_value = product
+        self.patch(
+            download_resources, "insert_file"
+        ).side_effect = download_resources.InvalidDownload()
+        mock_link_resources = self.patch(download_resources, "link_resources")
+
+        def sync(writer, reader, path):
+            content_source = mock.Mock(url=factory.make_simple_http_url())
+            repo_writer.insert_item(product, None, None, None, content_source)
+
+        self.patch(download_resources.BasicMirrorWriter, "sync", sync)
+        self.assertRaises(
+            download_resources.InvalidDownload, repo_writer.sync, None, None
+        )
+        self.assertThat(mock_link_resources, MockNotCalled())
+
+
+class FakeResponse(BytesIO):
+    """A response from `urlopen`."""
+
+    def __init__(self, content, code=http.client.OK):
+        super(FakeResponse, self).__init__(content)
+        self.code = code
+
+    def getcode(self):
+        return self.code
+
+
+class TestDownloadFile(MAASTestCase):
+    """Tests for `download_file`()."""
+
+    def make_content(self, size=1024):
+        content = factory.make_bytes(size=size)
+        return content, hashlib.sha256(content).hexdigest()
+
+    def make_path(self):
+        return os.path.join(self.make_dir(), factory.make_name("tag"))
+
+    def read_file(self, path):
+        with open(path, "rb") as stream:
+            return stream.read()
+
+    def test_downloads_file(self):
+        content, sha256 = self.make_content()
+        url = "file://" + self.make_file(contents=content)
+        path = self.make_path()
+        download_resources.download_file(url, path, sha256, len(content))
+        self.assertEqual(content, self.read_file(path))
+        self.assertFalse(os.path.exists(path + ".part"))
+
+    def test_resumes_partial_download(self):
+        content, sha256 = self.make_content()
+        path = self.make_path()
+        factory.make_file(
+            os.path.dirname(path),
+            os.path.basename(path) + ".part",
+            content[:100],
+        )
+        urlopen = self.patch(download_resources.urllib.request, "urlopen")
+        urlopen.return_value = FakeResponse(
+            content[100:], http.client.PARTIAL_CONTENT
+        )
+        download_resources.download_file(
+            factory.make_simple_http_url(), path, sha256, len(content)
+        )
+        [request] = [call[1][0] for call in urlopen.mock_calls]
+        self.assertEqual("bytes=100-", request.get_header("Range"))
+        self.assertEqual(content, self.read_file(path))
+
+    def test_keeps_truncated_download_for_resuming(self):
+        content, sha256 = self.make_content()
+        path = self.make_path()
+        url = factory.make_simple_http_url()
+        urlopen = self.patch(download_resources.urllib.request, "urlopen")
+        urlopen.side_effect = [
+            FakeResponse(content[:100]),
+            FakeResponse(content[100:], http.client.PARTIAL_CONTENT),
+        ]
+        self.assertRaises(
+            download_resources.InvalidDownload,
+            download_resources.download_file,
+            url,
+            path,
+            sha256,
+            len(content),
+        )
+        self.assertEqual(content[:100], self.read_file(path + ".part"))
+        download_resources.download_file(url, path, sha256, len(content))
+        [_, request] = [call[1][0] for call in urlopen.mock_calls]
+        self.assertEqual("bytes=100-", request.get_header("Range"))
+        self.assertEqual(content, self.read_file(path))
+        self.assertFalse(os.path.exists(path + ".part"))
+
+    def test_starts_over_if_range_is_not_honoured(self):
+        content, sha256 = self.make_content()
+        url = "file://" + self.make_file(contents=content)
+        path = self.make_path()
+        factory.make_file(
+            os.path.dirname(path),
+            os.path.basename(path) + ".part",
+            factory.make_bytes(size=100),
+        )
+        download_resources.download_file(url, path, sha256, len(content))
+        self.assertEqual(content, self.read_file(path))
+
+    def test_verifies_complete_partial_download(self):
+        content, sha256 = self.make_content()
+        path = self.make_path()
+        factory.make_file(
+            os.path.dirname(path), os.path.basename(path) + ".part", content
+        )
+        urlopen = self.patch(download_resources.urllib.request, "urlopen")
+        download_resources.download_file(
+            factory.make_simple_http_url(), path, sha256, len(content)
+        )
+        self.assertThat(urlopen, MockNotCalled())
+        self.assertEqual(content, self.read_file(path))
+
+    def test_rejects_mismatched_content(self):
+        content, _ = self.make_content()
+        _, sha256 = self.make_content()
+        url = "file://" + self.make_file(contents=content)
+        path = self.make_path()
+        self.assertRaises(
+            download_resources.InvalidDownload,
+            download_resources.download_file,
+            url,
+            path,
+            sha256,
+            len(content),
+        )
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + ".part"))
+
+
+class TestFetchFile(MAASTestCase):
+    """Tests for `fetch_file`()."""
+
+    def test_downloads_from_url(self):
+        store = FileStore(self.make_dir())
+        content = factory.make_bytes()
+        tag = hashlib.sha256(content).hexdigest()
+        content_source = mock.Mock(
+            url="file://" + self.make_file(contents=content)
+        )
+        download_resources.fetch_file(
+            store, tag, {"sha256": tag}, len(content), content_source
+        )
+        with open(store._fullpath(tag), "rb") as stream:
+            self.assertEqual(content, stream.read())
+        self.assertThat(content_source.read, MockNotCalled())
+
+    def test_downloads_from_peer(self):
+        store = FileStore(self.make_dir())
+        content = factory.make_bytes()
+        tag = hashlib.sha256(content).hexdigest()
+        peer = "file://%s/" % self.make_dir()
+        factory.make_file(peer[len("file://") :], tag, content)
+        content_source = mock.Mock(url=factory.make_simple_http_url())
+        original_download_file = download_resources.download_file
+        download_file = self.patch_autospec(
+            download_resources, "download_file"
+        )
+        download_file.side_effect = original_download_file
+        download_resources.fetch_file(
+            store, tag, {"sha256": tag}, len(content), content_source, [peer]
+        )
+        self.assertThat(
+            download_file,
+            MockCalledOnceWith(
+                peer + tag, store._fullpath(tag), tag, len(content)
+            ),
+        )
+        with open(store._fullpath(tag), "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_falls_back_to_url_if_peers_fail(self):
+        store = FileStore(self.make_dir())
+        content = factory.make_bytes()
+        tag = hashlib.sha256(content).hexdigest()
+        # One peer does not have the file, the other has different content.
+        missing_peer = "file://%s/" % self.make_dir()
+        broken_peer = "file://%s/" % self.make_dir()
+        factory.make_file(broken_peer[len("file://") :], tag)
+        content_source = mock.Mock(
+            url="file://" + self.make_file(contents=content)
+        )
+        download_resources.fetch_file(
+            store,
+            tag,
+            {"sha256": tag},
+            len(content),
+            content_source,
+            [missing_peer, broken_peer],
+        )
+        with open(store._fullpath(tag), "rb") as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_inserts_from_content_source_without_url(self):
+        store = mock.Mock()
+        store._fullpath.return_value = self.make_file()
+        tag = factory.make_name("tag")
+        checksums = {"sha256": tag}
+        size = random.randint(1, 100)
+        content_source = object()
+        download_resources.fetch_file(
+            store, tag, checksums, size, content_source
+        )
+        self.assertThat(
+            store.insert,
+            MockCalledOnceWith(
+                tag, content_source, checksums, mutable=False, size=size
+            ),
+        )
+
 
 class TestLinkResources(MAASTestCase):
     """Tests for `LinkResources`()."""
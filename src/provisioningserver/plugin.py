@@ -134,6 +134,15 @@ class ProvisioningServiceMaker:
         node_monitor.setName("node_monitor")
         return node_monitor
 
+    def _makeNodeEventBufferService(self):
+        from provisioningserver.rackdservices.node_event_buffer_service import (
+            NodeEventBufferService,
+        )
+
+        node_event_buffer = NodeEventBufferService(reactor)
+        node_event_buffer.setName("node_event_buffer")
+        return node_event_buffer
+
     def _makeRPCService(self):
         from provisioningserver.rpc.clusterservice import ClusterClientService
 
@@ -203,6 +212,7 @@ class ProvisioningServiceMaker:
         yield self._makeDHCPProbeService(rpc_service)
         yield self._makeLeaseSocketService(rpc_service)
         yield self._makeNodePowerMonitorService()
+        yield self._makeNodeEventBufferService()
         yield self._makeServiceMonitorService(rpc_service)
         yield self._makeImageDownloadService(rpc_service, tftp_root)
         yield self._makeRackHTTPService(tftp_root, rpc_service)
@@ -31,6 +31,41 @@ METRICS_DEFINITIONS = [
         "Latency of TFTP file downloads",
         ["filename"],
     ),
+    MetricDefinition(
+        "Counter",
+        "maas_tftp_boot_config_requests",
+        "Boot configuration lookups, by cache result",
+        ["cache"],
+    ),
+    MetricDefinition(
+        "Histogram",
+        "maas_dhcp_omapi_operation_latency",
+        "Latency of DHCP host map operations over OMAPI",
+        ["operation"],
+    ),
+    MetricDefinition(
+        "Histogram",
+        "maas_rack_power_query_latency",
+        "Latency of node power state queries",
+        ["power_type"],
+    ),
+    MetricDefinition(
+        "Histogram",
+        "maas_rack_power_sweep_duration",
+        "Time taken to query the power state of all nodes",
+        buckets=[1, 5, 10, 15, 30, 60, 120, 300, 600],
+    ),
+    MetricDefinition(
+        "Histogram",
+        "maas_rack_redfish_request_latency",
+        "Latency of requests to Redfish BMCs",
+        ["method"],
+    ),
+    MetricDefinition(
+        "Counter",
+        "maas_rack_redfish_connections",
+        "Connections opened to Redfish BMCs",
+    ),
     # regiond metrics
     MetricDefinition(
         "Histogram",
@@ -83,6 +118,16 @@ METRICS_DEFINITIONS = [
         "HTTP request query latency",
         _WEBSOCKET_CALL_LABELS,
     ),
+    MetricDefinition(
+        "Gauge",
+        "maas_listener_notify_queue_depth",
+        "Number of coalesced database notifications waiting to be handled",
+    ),
+    MetricDefinition(
+        "Gauge",
+        "maas_listener_notify_coalesce_ratio",
+        "Database notifications received per notification handled",
+    ),
     # Common metrics
     *node_metrics_definitions(),
 ]
@@ -176,6 +176,13 @@ class RackHTTPService(TimerService):
                 {
                     "upstream_http": list(sorted(upstream_http)),
                     "resource_root": self._resource_root,
+                    # Other rack controllers download the files they need
+                    # from here, by SHA256, when importing boot images.
+                    "cache_root": os.path.join(
+                        os.path.dirname(self._resource_root.rstrip("/")),
+                        "cache",
+                        "",
+                    ),
                     "machine_resources": os.path.join(
                         snappy.get_snap_path(), "usr/share/maas"
                     )
@@ -13,11 +13,12 @@ from twisted.application.service import Service
 from twisted.internet import reactor, task
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.protocol import DatagramProtocol
+from twisted.protocols.amp import MAX_VALUE_LENGTH, UnhandledCommand
 
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.path import get_data_path
 from provisioningserver.rpc.exceptions import NoConnectionsAvailable
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import UpdateLease, UpdateLeases
 from provisioningserver.utils.twisted import pause, retries
 
 maaslog = get_maas_logger("lease_socket_service")
@@ -28,12 +29,62 @@ def get_socket_path():
     return os.path.join(get_data_path("/var/lib/maas"), "dhcpd.sock")
 
 
+def coalesce_notifications(notifications):
+    """Drop notifications that a later one in `notifications` supersedes.
+
+    dhcpd sends a notification every time a client renews its lease. When
+    the same action for the same MAC and IP address is repeated, with no
+    other notification for that MAC or IP address in between, only the last
+    one needs to be sent; applying the earlier ones makes no difference.
+    """
+    coalesced = []
+    last_for_mac, last_for_ip = {}, {}
+    for notification in notifications:
+        mac, ip = notification.get("mac"), notification.get("ip")
+        key = (notification.get("action"), notification.get("ip_family"))
+        index = last_for_mac.get(mac)
+        if index is not None and index == last_for_ip.get(ip):
+            previous = coalesced[index]
+            if (previous.get("action"), previous.get("ip_family")) == key:
+                coalesced[index] = None
+        last_for_mac[mac] = last_for_ip[ip] = len(coalesced)
+        coalesced.append(notification)
+    return [
+        notification for notification in coalesced if notification is not None
+    ]
+
+
+def get_encoded_length(notification):
+    """Return how many bytes `notification` takes at most in `UpdateLeases`.
+
+    Each key and value is sent as its length in 2 bytes followed by its
+    UTF-8 encoding, and each notification ends with 2 zero bytes. Keys that
+    are not sent are counted too, so this never comes out short.
+    """
+    return 2 + sum(
+        4 + len(str(key).encode("utf-8")) + len(str(value).encode("utf-8"))
+        for key, value in notification.items()
+    )
+
+
 class LeaseSocketService(Service, DatagramProtocol):
     """Service for recieving lease information over MAAS dhcpd.sock."""
 
     # None, or a Deferred that will fire when the processor exits.
     done = None
 
+    # Notifications received within this many seconds of each other are sent
+    # to the region together.
+    interval = 0.1
+
+    # The most notifications to send in one UpdateLeases call.
+    batch_size = 200
+
+    # The most bytes the notifications in one UpdateLeases call can take once
+    # encoded. AMP refuses to send any argument longer than this, and dhcpd
+    # does not limit the length of the hostnames it reports.
+    batch_length = MAX_VALUE_LENGTH
+
     def __init__(self, client_service, reactor):
         self.client_service = client_service
         self.reactor = reactor
@@ -42,6 +93,8 @@ class LeaseSocketService(Service, DatagramProtocol):
         self.processor = task.LoopingCall(
             self.processNotifications, clock=self.reactor
         )
+        # Whether the region knows UpdateLeases.
+        self.batched = True
 
     def startService(self):
         """Start the service."""
@@ -50,7 +103,7 @@ class LeaseSocketService(Service, DatagramProtocol):
         self.port = self.reactor.listenUNIXDatagram(self.address, self)
 
         # Start the looping call to handle received notifications.
-        self.done = self.processor.start(0.1, now=False)
+        self.done = self.processor.start(self.interval, now=False)
 
     def stopService(self):
         """Stop the service."""
@@ -85,32 +138,76 @@ class LeaseSocketService(Service, DatagramProtocol):
         self.notifications.append(notification)
 
     def processNotifications(self, clock=reactor):
-        """Process all notifications."""
+        """Process all notifications, in batches.
 
-        def gen_notifications(notifications):
+        Each batch has at most `batch_size` notifications, taking at most
+        `batch_length` bytes in an `UpdateLeases` call.
+        """
+
+        def gen_batches(notifications):
             while len(notifications) != 0:
-                yield notifications.popleft()
+                batch, length = [], 0
+                while len(notifications) != 0 and len(batch) < self.batch_size:
+                    next_length = get_encoded_length(notifications[0])
+                    if len(batch) != 0 and (
+                        length + next_length > self.batch_length
+                    ):
+                        break
+                    batch.append(notifications.popleft())
+                    length += next_length
+                yield batch
 
         return task.coiterate(
-            self.processNotification(notification, clock=clock)
-            for notification in gen_notifications(self.notifications)
+            self.processNotificationBatch(batch, clock=clock)
+            for batch in gen_batches(self.notifications)
         )
 
     @inlineCallbacks
-    def processNotification(self, notification, clock=reactor):
-        """Send a notification to the region."""
-        client = None
+    def getClient(self, clock=reactor):
+        """Return a client for the region, or `None` if there is none."""
         for elapsed, remaining, wait in retries(30, 10, clock):
             try:
                 client = yield self.client_service.getClientNow()
-                break
             except NoConnectionsAvailable:
-                yield pause(wait, self.clock)
-        else:
-            maaslog.error(
-                "Can't send DHCP lease information, no RPC "
-                "connection to region."
-            )
+                yield pause(wait, clock)
+            else:
+                return client
+        maaslog.error(
+            "Can't send DHCP lease information, no RPC connection to region."
+        )
+        return None
+
+    @inlineCallbacks
+    def processNotificationBatch(self, notifications, clock=reactor):
+        """Send a batch of notifications to the region.
+
+        They are sent with one `UpdateLeases` call, or one `UpdateLease` call
+        each if the region does not know `UpdateLeases`.
+        """
+        notifications = coalesce_notifications(notifications)
+        if self.batched:
+            client = yield self.getClient(clock)
+            if client is None:
+                return
+            try:
+                yield client(
+                    UpdateLeases,
+                    cluster_uuid=client.localIdent,
+                    updates=notifications,
+                )
+            except UnhandledCommand:
+                # The region is older than this rack controller.
+                self.batched = False
+            else:
+                return
+        for notification in notifications:
+            yield self.processNotification(notification, clock=clock)
+
+    @inlineCallbacks
+    def processNotification(self, notification, clock=reactor):
+        """Send a notification to the region."""
+        client = yield self.getClient(clock)
+        if client is None:
             return
 
         # Notification contains all the required data except for the cluster
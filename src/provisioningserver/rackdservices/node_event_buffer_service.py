@@ -0,0 +1,50 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Service to send node events to the region in batches."""
+
+__all__ = ["NodeEventBufferService"]
+
+from datetime import timedelta
+
+from twisted.application.internet import TimerService
+from twisted.internet import reactor
+
+from provisioningserver.events import NodeEventBuffer, nodeEventHub
+from provisioningserver.path import get_tentative_data_path
+
+
+class NodeEventBufferService(TimerService, object):
+    """Queue node events logged on this rack and send them in batches.
+
+    While running, node events are queued in a `NodeEventBuffer` rather
+    than sent one at a time. Events spooled while no region was available
+    are sent again every `retry_interval` seconds.
+    """
+
+    retry_interval = timedelta(seconds=30).total_seconds()
+
+    def __init__(self, clock=reactor, hub=nodeEventHub):
+        super(NodeEventBufferService, self).__init__(
+            self.retry_interval, self.flush
+        )
+        self.clock = clock
+        self.hub = hub
+        self.buffer = None
+
+    def flush(self):
+        if self.buffer is not None:
+            return self.buffer.flush()
+
+    def startService(self):
+        spool_dir = get_tentative_data_path("/var/lib/maas/event-spool")
+        self.buffer = NodeEventBuffer(spool_dir, self.hub, self.clock)
+        self.hub.buffer = self.buffer
+        super(NodeEventBufferService, self).startService()
+
+    def stopService(self):
+        self.hub.buffer = None
+        d = super(NodeEventBufferService, self).stopService()
+        # Send, or spool, whatever is still queued.
+        d.addCallback(lambda _: self.buffer.flush())
+        return d
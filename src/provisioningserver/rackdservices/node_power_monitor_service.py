@@ -9,16 +9,22 @@ __all__ = ["NodePowerMonitorService"]
 from datetime import timedelta
 
 from twisted.application.internet import TimerService
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
 from twisted.internet.error import ConnectionDone
 
 from provisioningserver.logger import get_maas_logger, LegacyLogger
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc import getRegionClient
 from provisioningserver.rpc.exceptions import (
     NoConnectionsAvailable,
     NoSuchCluster,
 )
-from provisioningserver.rpc.power import query_all_nodes
+from provisioningserver.rpc.power import (
+    PowerQueryLimiter,
+    PowerStateReporter,
+    query_all_nodes,
+)
 from provisioningserver.rpc.region import ListNodePowerParameters
 
 maaslog = get_maas_logger("power_monitor_service")
@@ -30,6 +36,12 @@ class NodePowerMonitorService(TimerService, object):
 
     check_interval = timedelta(seconds=15).total_seconds()
     max_nodes_at_once = 5
+    # The number of nodes of one power type that can be queried at once
+    # grows from max_nodes_at_once up to this while the BMCs keep up.
+    max_nodes_per_power_type = 50
+    # Stop fetching power parameters from the region while this many nodes
+    # are waiting to be queried.
+    max_nodes_waiting = 50
 
     def __init__(self, clock=None):
         # Call self.query_nodes() every self.check_interval.
@@ -37,6 +49,9 @@ class NodePowerMonitorService(TimerService, object):
             self.check_interval, self.try_query_nodes
         )
         self.clock = clock
+        # Kept between sweeps, so what it learns about each power type is
+        # not forgotten.
+        self.limiter = None
 
     def try_query_nodes(self):
         """Attempt to query nodes' power states.
@@ -56,22 +71,49 @@ class NodePowerMonitorService(TimerService, object):
             return d
 
     @inlineCallbacks
-    def query_nodes(self, client):
+    def query_nodes(self, client, prometheus_metrics=PROMETHEUS_METRICS):
+        clock = reactor if self.clock is None else self.clock
+        if self.limiter is None:
+            self.limiter = PowerQueryLimiter(
+                initial=self.max_nodes_at_once,
+                maximum=self.max_nodes_per_power_type,
+                clock=clock,
+            )
+        reporter = PowerStateReporter(clock)
+        started = clock.seconds()
+        queries = []
         # Get the nodes' power parameters from the region. Keep getting more
-        # power parameters until the region returns an empty list.
+        # power parameters until the region returns an empty list, querying
+        # the nodes of each page while the next one is fetched.
         while True:
             response = yield client(
                 ListNodePowerParameters, uuid=client.localIdent
             )
             power_parameters = response["nodes"]
-            if len(power_parameters) > 0:
-                yield query_all_nodes(
+            if len(power_parameters) == 0:
+                break
+            queries.append(
+                query_all_nodes(
                     power_parameters,
-                    max_concurrency=self.max_nodes_at_once,
-                    clock=self.clock,
+                    clock=clock,
+                    limiter=self.limiter,
+                    update=reporter.update,
                 )
-            else:
-                break
+            )
+            queries = [query for query in queries if not query.called]
+            while (
+                len(queries) > 0
+                and self.limiter.waiting >= self.max_nodes_waiting
+            ):
+                yield DeferredList(queries, fireOnOneCallback=True)
+                queries = [query for query in queries if not query.called]
+        yield DeferredList(queries)
+        yield reporter.flush()
+        prometheus_metrics.update(
+            "maas_rack_power_sweep_duration",
+            "observe",
+            value=clock.seconds() - started,
+        )
 
     def query_nodes_failed(self, failure, localIdent):
         if failure.check(NoSuchCluster):
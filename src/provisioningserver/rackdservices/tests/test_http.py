@@ -5,6 +5,7 @@
 
 __all__ = []
 
+import os.path
 import random
 from unittest.mock import ANY, Mock
 
@@ -137,6 +138,17 @@ class TestRackHTTPService(MAASTestCase):
             target_path,
             FileContains(matcher=Contains("alias %s;" % resource_root)),
         )
+        self.assertThat(
+            target_path,
+            FileContains(
+                matcher=Contains(
+                    "alias %s$1;"
+                    % os.path.join(
+                        os.path.dirname(resource_root[:-1]), "cache/"
+                    )
+                )
+            ),
+        )
         for region_ip in region_ips:
             self.assertThat(
                 target_path,
@@ -16,16 +16,19 @@ from twisted.application.service import Service
 from twisted.internet import defer, reactor
 from twisted.internet.protocol import DatagramProtocol
 from twisted.internet.threads import deferToThread
+from twisted.protocols.amp import UnhandledCommand
 
 from maastesting.factory import factory
 from maastesting.matchers import MockCalledOnceWith
 from maastesting.testcase import MAASTestCase, MAASTwistedRunTest
 from provisioningserver.rackdservices import lease_socket_service
 from provisioningserver.rackdservices.lease_socket_service import (
+    coalesce_notifications,
+    get_encoded_length,
     LeaseSocketService,
 )
 from provisioningserver.rpc import getRegionClient
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import UpdateLease, UpdateLeases
 from provisioningserver.rpc.testing import MockLiveClusterToRegionRPCFixture
 from provisioningserver.utils.twisted import DeferredValue, pause, retries
 
@@ -108,16 +111,18 @@ class TestLeaseSocketService(MAASTestCase):
         self.assertEquals([packet], list(service.notifications))
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_with_notification(self):
+    def test_processNotificationBatch_gets_called_with_notification(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(sentinel.service, reactor)
         dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
+        # Mock processNotificationBatch to catch the call.
+        def mock_processNotificationBatch(*args, **kwargs):
             dv.set(args)
 
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch", mock_processNotificationBatch
+        )
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -130,23 +135,25 @@ class TestLeaseSocketService(MAASTestCase):
         yield deferToThread(self.send_notification, socket_path, packet)
         yield dv.get(timeout=10)
 
-        # Packet should be the argument passed to processNotifcation
-        self.assertEquals((packet,), dv.value)
+        # Packet should be in the batch passed to processNotificationBatch.
+        self.assertEquals(([packet],), dv.value)
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_multiple_times(self):
+    def test_processNotificationBatch_gets_notifications_in_order(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(sentinel.service, reactor)
-        dvs = [DeferredValue(), DeferredValue()]
+        received = []
+        dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
-            for dv in dvs:
-                if not dv.isSet:
-                    dv.set(args)
-                    break
+        # Mock processNotificationBatch to catch the calls.
+        def mock_processNotificationBatch(notifications, **kwargs):
+            received.extend(notifications)
+            if len(received) == 2:
+                dv.set(received)
 
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch", mock_processNotificationBatch
+        )
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -159,13 +166,126 @@ class TestLeaseSocketService(MAASTestCase):
         # Send notifications to the socket and wait for notifications.
         yield deferToThread(self.send_notification, socket_path, packet1)
         yield deferToThread(self.send_notification, socket_path, packet2)
-        yield dvs[0].get(timeout=10)
-        yield dvs[1].get(timeout=10)
+        yield dv.get(timeout=10)
+
+        # Packets should be passed to processNotificationBatch in order.
+        self.assertEquals([packet1, packet2], dv.value)
+
+    @defer.inlineCallbacks
+    def test_processNotifications_splits_notifications_into_batches(self):
+        service = LeaseSocketService(sentinel.service, reactor)
+        service.batch_size = 2
+        packets = [{"test": factory.make_name("test")} for _ in range(5)]
+        service.notifications.extend(packets)
+        processNotificationBatch = self.patch(
+            service, "processNotificationBatch"
+        )
+        processNotificationBatch.return_value = None
+        yield service.processNotifications(clock=reactor)
+        self.assertEqual(
+            [packets[0:2], packets[2:4], packets[4:]],
+            [args[0] for args, _ in processNotificationBatch.call_args_list],
+        )
+
+    def make_notification(self, action="commit", mac=None, ip=None):
+        return {
+            "action": action,
+            "mac": factory.make_mac_address() if mac is None else mac,
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address() if ip is None else ip,
+            "timestamp": int(time.time()),
+            "lease_time": 30,
+            "hostname": factory.make_name("host"),
+        }
 
-        # Packet should be the argument passed to processNotification in
-        # order.
-        self.assertEquals((packet1,), dvs[0].value)
-        self.assertEquals((packet2,), dvs[1].value)
+    @defer.inlineCallbacks
+    def test_processNotifications_splits_batches_by_length(self):
+        service = LeaseSocketService(sentinel.service, reactor)
+        packets = [self.make_notification() for _ in range(5)]
+        updates = dict(UpdateLeases.arguments)[b"updates"]
+        service.batch_length = len(updates.toStringProto(packets[:2], None))
+        service.notifications.extend(packets)
+        processNotificationBatch = self.patch(
+            service, "processNotificationBatch"
+        )
+        processNotificationBatch.return_value = None
+        yield service.processNotifications(clock=reactor)
+        self.assertEqual(
+            [packets[0:2], packets[2:4], packets[4:]],
+            [args[0] for args, _ in processNotificationBatch.call_args_list],
+        )
+
+    @defer.inlineCallbacks
+    def test_processNotifications_batches_of_longest_notifications_fit(self):
+        service = LeaseSocketService(sentinel.service, reactor)
+        packets = [
+            {
+                "action": "release",
+                "mac": "ff:ff:ff:ff:ff:ff",
+                "ip_family": "ipv6",
+                "ip": "ffff:ffff:ffff:ffff:ffff:ffff:255.255.255.255",
+                "timestamp": 2 ** 63 - 1,
+                "lease_time": 2 ** 63 - 1,
+                # dhcpd passes on client hostnames of up to 255 bytes.
+                "hostname": factory.make_string(255),
+            }
+            for _ in range(service.batch_size * 2)
+        ]
+        service.notifications.extend(packets)
+        processNotificationBatch = self.patch(
+            service, "processNotificationBatch"
+        )
+        processNotificationBatch.return_value = None
+        yield service.processNotifications(clock=reactor)
+        batches = [
+            args[0] for args, _ in processNotificationBatch.call_args_list
+        ]
+        self.assertEqual(packets, sum(batches, []))
+        for batch in batches:
+            # This raises TooLong if the batch can't be sent.
+            UpdateLeases.makeArguments(
+                {"cluster_uuid": factory.make_UUID(), "updates": batch}, None
+            ).serialize()
+
+    @defer.inlineCallbacks
+    def test_processNotificationBatch_send_to_region(self):
+        fixture = self.useFixture(MockLiveClusterToRegionRPCFixture())
+        protocol, connecting = fixture.makeEventLoop(UpdateLeases)
+        self.addCleanup((yield connecting))
+
+        client = getRegionClient()
+        rpc_service = MagicMock()
+        rpc_service.getClientNow.return_value = defer.succeed(client)
+        service = LeaseSocketService(rpc_service, reactor)
+
+        packets = [self.make_notification() for _ in range(3)]
+        yield service.processNotificationBatch(packets, clock=reactor)
+        self.assertThat(
+            protocol.UpdateLeases,
+            MockCalledOnceWith(
+                protocol, cluster_uuid=client.localIdent, updates=packets
+            ),
+        )
+
+    @defer.inlineCallbacks
+    def test_processNotificationBatch_falls_back_to_UpdateLease(self):
+        client = MagicMock(localIdent=factory.make_UUID())
+        client.side_effect = [
+            defer.fail(UnhandledCommand()),
+            defer.succeed({}),
+            defer.succeed({}),
+        ]
+        rpc_service = MagicMock()
+        rpc_service.getClientNow.side_effect = lambda: defer.succeed(client)
+        service = LeaseSocketService(rpc_service, reactor)
+
+        packets = [self.make_notification() for _ in range(2)]
+        yield service.processNotificationBatch(packets, clock=reactor)
+        self.assertFalse(service.batched)
+        self.assertEqual(
+            [UpdateLeases, UpdateLease, UpdateLease],
+            [args[0] for args, _ in client.call_args_list],
+        )
 
     @defer.inlineCallbacks
     def test_processNotification_send_to_region(self):
@@ -202,3 +322,64 @@ class TestLeaseSocketService(MAASTestCase):
                 hostname=packet["hostname"],
             ),
         )
+
+
+class TestGetEncodedLength(MAASTestCase):
+    def test_matches_UpdateLeases_encoding(self):
+        notification = {
+            "action": "commit",
+            "mac": factory.make_mac_address(),
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address(),
+            "timestamp": int(time.time()),
+            "lease_time": 30,
+            "hostname": factory.make_name("h\u00f6st"),
+        }
+        updates = dict(UpdateLeases.arguments)[b"updates"]
+        self.assertEqual(
+            len(updates.toStringProto([notification], None)),
+            get_encoded_length(notification),
+        )
+
+    def test_counts_keys_that_are_not_sent(self):
+        notification = {"cluster_uuid": factory.make_UUID()}
+        self.assertEqual(
+            2 + 4 + len("cluster_uuid") + 36, get_encoded_length(notification)
+        )
+
+
+class TestCoalesceNotifications(MAASTestCase):
+    def make_notification(self, action="commit", mac=None, ip=None):
+        return {
+            "action": action,
+            "mac": factory.make_mac_address() if mac is None else mac,
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address() if ip is None else ip,
+            "timestamp": int(time.time()),
+        }
+
+    def test_keeps_different_notifications(self):
+        notifications = [self.make_notification() for _ in range(3)]
+        self.assertEqual(notifications, coalesce_notifications(notifications))
+
+    def test_keeps_last_of_repeated_notifications(self):
+        first = self.make_notification()
+        other = self.make_notification()
+        last = self.make_notification(mac=first["mac"], ip=first["ip"])
+        self.assertEqual(
+            [other, last], coalesce_notifications([first, other, last])
+        )
+
+    def test_keeps_repeated_notifications_with_other_action_between(self):
+        notifications = [self.make_notification()]
+        mac, ip = notifications[0]["mac"], notifications[0]["ip"]
+        notifications.append(self.make_notification("expiry", mac, ip))
+        notifications.append(self.make_notification("commit", mac, ip))
+        self.assertEqual(notifications, coalesce_notifications(notifications))
+
+    def test_keeps_repeated_notifications_when_ip_moved_between(self):
+        notifications = [self.make_notification()]
+        mac, ip = notifications[0]["mac"], notifications[0]["ip"]
+        notifications.append(self.make_notification(ip=ip))
+        notifications.append(self.make_notification(mac=mac, ip=ip))
+        self.assertEqual(notifications, coalesce_notifications(notifications))
@@ -0,0 +1,75 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for
+:py:module:`~provisioningserver.rackdservices.node_event_buffer_service`."""
+
+__all__ = []
+
+import os
+
+from fixtures import EnvironmentVariable
+from testtools.matchers import MatchesStructure
+from twisted.internet.task import Clock
+
+from maastesting.matchers import MockCalledOnceWith
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import extract_result
+from provisioningserver import events
+from provisioningserver.events import NodeEventBuffer, NodeEventHub
+from provisioningserver.rackdservices.node_event_buffer_service import (
+    NodeEventBufferService,
+)
+from provisioningserver.rpc.exceptions import NoConnectionsAvailable
+
+
+class TestNodeEventBufferService(MAASTestCase):
+    def setUp(self):
+        super(TestNodeEventBufferService, self).setUp()
+        self.maas_root = self.make_dir()
+        self.useFixture(EnvironmentVariable("MAAS_ROOT", self.maas_root))
+        self.getRegionClient = self.patch(events, "getRegionClient")
+        self.getRegionClient.side_effect = NoConnectionsAvailable()
+        self.hub = NodeEventHub()
+        self.service = NodeEventBufferService(Clock(), self.hub)
+
+    def start_service(self):
+        self.service.startService()
+        self.addCleanup(lambda: extract_result(self.service.stopService()))
+
+    def test_init_sets_up_timer_correctly(self):
+        self.assertThat(
+            self.service,
+            MatchesStructure.byEquality(
+                call=(self.service.flush, (), {}), step=30
+            ),
+        )
+
+    def test_startService_buffers_hub_events(self):
+        self.start_service()
+        self.assertThat(
+            self.hub.buffer,
+            MatchesStructure.byEquality(
+                spool_dir=os.path.join(
+                    self.maas_root, "var/lib/maas/event-spool"
+                ),
+                hub=self.hub,
+                clock=self.service.clock,
+            ),
+        )
+        self.assertIsInstance(self.hub.buffer, NodeEventBuffer)
+
+    def test_flushes_buffer_periodically(self):
+        self.start_service()
+        flush = self.patch(self.hub.buffer, "flush")
+        self.service.clock.advance(self.service.retry_interval)
+        self.assertThat(flush, MockCalledOnceWith())
+
+    def test_stopService_flushes_buffer(self):
+        self.service.startService()
+        buffer = self.hub.buffer
+        flush = self.patch(buffer, "flush")
+        flush.return_value = None
+        extract_result(self.service.stopService())
+        self.assertIsNone(self.hub.buffer)
+        self.assertThat(flush, MockCalledOnceWith())
@@ -10,7 +10,7 @@ from unittest.mock import ANY, Mock, sentinel
 
 from fixtures import FakeLogger
 from testtools.matchers import MatchesStructure
-from twisted.internet.defer import fail, succeed
+from twisted.internet.defer import Deferred, fail, succeed
 from twisted.internet.error import ConnectionDone
 from twisted.internet.task import Clock
 
@@ -23,6 +23,16 @@ from provisioningserver.rpc import exceptions, getRegionClient, region
 from provisioningserver.rpc.testing import MockClusterToRegionRPCFixture
 
 
+def make_power_parameters():
+    return {
+        "system_id": factory.make_UUID(),
+        "hostname": factory.make_hostname(),
+        "power_state": factory.make_name("power_state"),
+        "power_type": factory.make_name("power_type"),
+        "context": {},
+    }
+
+
 class TestNodePowerMonitorService(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -65,15 +75,8 @@ class TestNodePowerMonitorService(MAASTestCase):
 
     def test_query_nodes_calls_query_all_nodes(self):
         service = self.make_monitor_service()
-        service.max_nodes_at_once = sentinel.max_nodes_at_once
 
-        example_power_parameters = {
-            "system_id": factory.make_UUID(),
-            "hostname": factory.make_hostname(),
-            "power_state": factory.make_name("power_state"),
-            "power_type": factory.make_name("power_type"),
-            "context": {},
-        }
+        example_power_parameters = make_power_parameters()
 
         rpc_fixture = self.useFixture(MockClusterToRegionRPCFixture())
         proto_region, io = rpc_fixture.makeEventLoop(
@@ -85,6 +88,7 @@ class TestNodePowerMonitorService(MAASTestCase):
         ]
 
         query_all_nodes = self.patch(npms, "query_all_nodes")
+        query_all_nodes.return_value = succeed(None)
 
         d = service.query_nodes(getRegionClient())
         io.flush()
@@ -94,8 +98,84 @@ class TestNodePowerMonitorService(MAASTestCase):
             query_all_nodes,
             MockCalledOnceWith(
                 [example_power_parameters],
-                max_concurrency=sentinel.max_nodes_at_once,
                 clock=service.clock,
+                limiter=service.limiter,
+                update=ANY,
+            ),
+        )
+        self.assertThat(
+            service.limiter,
+            MatchesStructure.byEquality(
+                initial=service.max_nodes_at_once,
+                maximum=service.max_nodes_per_power_type,
+                clock=service.clock,
+            ),
+        )
+
+    def test_query_nodes_fetches_next_page_while_querying(self):
+        service = self.make_monitor_service()
+        pages = [[make_power_parameters()] for _ in range(3)]
+        client = Mock(
+            side_effect=[succeed({"nodes": page}) for page in pages]
+            + [succeed({"nodes": []})]
+        )
+        queries = [Deferred() for _ in pages]
+        query_all_nodes = self.patch(npms, "query_all_nodes")
+        query_all_nodes.side_effect = queries
+
+        d = service.query_nodes(client)
+
+        # All the pages were fetched before any of them was done.
+        self.assertEqual(
+            pages, [args[0] for args, _ in query_all_nodes.call_args_list]
+        )
+        self.assertFalse(d.called)
+        for query in queries:
+            query.callback(None)
+        self.assertEqual(None, extract_result(d))
+
+    def test_query_nodes_stops_fetching_while_nodes_are_waiting(self):
+        service = self.make_monitor_service()
+        service.max_nodes_waiting = 1
+        client = Mock(
+            side_effect=[
+                succeed({"nodes": [make_power_parameters()]}),
+                succeed({"nodes": []}),
+            ]
+        )
+        query = Deferred()
+        self.patch(npms, "query_all_nodes").return_value = query
+        service.limiter = Mock(waiting=1)
+
+        d = service.query_nodes(client)
+
+        self.assertThat(client, MockCalledOnceWith(ANY, uuid=ANY))
+        service.limiter.waiting = 0
+        query.callback(None)
+        self.assertEqual(None, extract_result(d))
+        self.assertEqual(2, client.call_count)
+
+    def test_query_nodes_records_sweep_duration(self):
+        service = self.make_monitor_service()
+        client = Mock(
+            side_effect=[
+                succeed({"nodes": [make_power_parameters()]}),
+                succeed({"nodes": []}),
+            ]
+        )
+        query = Deferred()
+        self.patch(npms, "query_all_nodes").return_value = query
+        prometheus_metrics = Mock()
+
+        d = service.query_nodes(client, prometheus_metrics=prometheus_metrics)
+        service.clock.advance(7)
+        query.callback(None)
+
+        self.assertEqual(None, extract_result(d))
+        self.assertThat(
+            prometheus_metrics.update,
+            MockCalledOnceWith(
+                "maas_rack_power_sweep_duration", "observe", value=7
             ),
         )
 
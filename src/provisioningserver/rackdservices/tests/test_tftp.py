@@ -36,7 +36,7 @@ from twisted.application import internet
 from twisted.application.service import MultiService
 from twisted.internet import reactor
 from twisted.internet.address import IPv4Address, IPv6Address
-from twisted.internet.defer import fail, inlineCallbacks, succeed
+from twisted.internet.defer import Deferred, fail, inlineCallbacks, succeed
 from twisted.internet.protocol import Protocol
 from twisted.internet.task import Clock
 from twisted.python import context
@@ -64,6 +64,7 @@ from provisioningserver.rackdservices.tftp import (
     TransferTimeTrackingTFTP,
     UDPServer,
 )
+from provisioningserver.rpc.boot_config import BootConfigCache
 from provisioningserver.rpc.exceptions import BootConfigNoResponse
 from provisioningserver.rpc.region import GetBootConfig
 from provisioningserver.testing.boot_images import (
@@ -204,6 +205,7 @@ class TestTFTPBackend(MAASTestCase):
         self.useFixture(ClusterConfigurationFixture())
         self.patch(boot, "find_mac_via_arp")
         self.patch(tftp_module, "log_request")
+        self.patch(tftp_module, "boot_config_cache", BootConfigCache())
 
     def test_init(self):
         temp_dir = self.make_dir()
@@ -854,7 +856,7 @@ class TestTFTPBackend(MAASTestCase):
         client_service.getClientNow.return_value = succeed(client)
 
         backend = TFTPBackend(self.make_dir(), client_service)
-        backend.fetcher = Mock()
+        backend.fetcher = Mock(return_value=Deferred())
 
         backend.get_kernel_params(params_all)
 
@@ -863,6 +865,27 @@ class TestTFTPBackend(MAASTestCase):
             MockCalledOnceWith(client, GetBootConfig, **params_okay),
         )
 
+    def test_get_kernel_params_shares_boot_config(self):
+        params = {
+            name.decode("ascii"): factory.make_name("value")
+            for name, _ in GetBootConfig.arguments
+        }
+        client = Mock()
+        client.localIdent = params["system_id"]
+        client_service = Mock()
+        client_service.getClientNow.return_value = succeed(client)
+
+        backend = TFTPBackend(self.make_dir(), client_service)
+        backend.fetcher = Mock(return_value=Deferred())
+
+        backend.get_kernel_params(params.copy())
+        backend.get_kernel_params(params.copy())
+
+        self.assertThat(
+            backend.fetcher,
+            MockCalledOnceWith(client, GetBootConfig, **params),
+        )
+
 
 class TestTFTPService(MAASTestCase):
     def test_tftp_service(self):
@@ -34,6 +34,7 @@ from provisioningserver.events import EVENT_TYPES, send_node_event_ip_address
 from provisioningserver.kernel_opts import KernelParameters
 from provisioningserver.logger import get_maas_logger, LegacyLogger
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+from provisioningserver.rpc.boot_config import boot_config_cache
 from provisioningserver.rpc.boot_images import list_boot_images
 from provisioningserver.rpc.exceptions import BootConfigNoResponse
 from provisioningserver.rpc.region import GetBootConfig, MarkNodeFailed
@@ -147,6 +148,7 @@ class TFTPBackend(FilesystemSynchronousBackend):
         self.client_to_remote = {}
         self.client_service = client_service
         self.fetcher = RPCFetcher()
+        self.boot_config_cache = boot_config_cache
 
     def _get_new_client_for_remote(self, remote_ip):
         """Return a new client for the `remote_ip`.
@@ -250,6 +252,7 @@ class TFTPBackend(FilesystemSynchronousBackend):
                 )
                 # Call MarkNodeFailed if this was a known machine.
                 if system_id is not None:
+                    self.boot_config_cache.invalidate(system_id)
                     d = client(
                         MarkNodeFailed,
                         system_id=system_id,
@@ -293,8 +296,13 @@ class TFTPBackend(FilesystemSynchronousBackend):
         params = {name: params[name] for name in arguments if name in params}
 
         def fetch(client, params):
+            # Every file a machine requests while booting needs the same
+            # configuration, so look it up once and share the answer.
+            key = self.boot_config_cache.make_key(params)
             params["system_id"] = client.localIdent
-            d = self.fetcher(client, GetBootConfig, **params)
+            d = self.boot_config_cache.get(
+                key, partial(self.fetcher, client, GetBootConfig, **params)
+            )
             d.addCallback(self.get_boot_image, client, params["remote_ip"])
             d.addCallback(lambda data: KernelParameters(**data))
             return d
@@ -6,6 +6,7 @@
 __all__ = [
     "Bytes",
     "Choice",
+    "Chunked",
     "IPAddress",
     "IPNetwork",
     "ParsedURL",
@@ -13,6 +14,7 @@ __all__ = [
 ]
 
 import collections
+from itertools import count
 import json
 import urllib.parse
 import zlib
@@ -120,6 +122,54 @@ class StructureAsJSON(amp.Argument):
         return json.loads(zlib.decompress(inString).decode("ascii"))
 
 
+class Chunked(amp.Argument):
+    """Encode another argument on the wire in as many chunks as needed.
+
+    AMP limits each value in a box to
+    :py:data:`~twisted.protocols.amp.MAX_VALUE_LENGTH` bytes. The serialised
+    form of the wrapped argument is split across as many keys as needed: the
+    first chunk under the argument's name, then ``name.1``, ``name.2``, and
+    so on, and joined again at the receiving end.
+    """
+
+    def __init__(self, argument, optional=False):
+        """Default constructor.
+
+        :param argument: The `amp.Argument` to chunk.
+        :param optional: Whether this argument can be omitted in the protocol.
+        """
+        super(Chunked, self).__init__(optional=optional)
+        self.argument = argument
+
+    def toBox(self, name, strings, objects, proto):
+        obj = self.retrieve(
+            objects, amp._wireNameToPythonIdentifier(name), proto
+        )
+        if self.optional and obj is None:
+            return
+        data = self.argument.toStringProto(obj, proto)
+        strings[name] = data[: amp.MAX_VALUE_LENGTH]
+        starts = range(amp.MAX_VALUE_LENGTH, len(data), amp.MAX_VALUE_LENGTH)
+        for index, start in enumerate(starts, 1):
+            strings[b"%s.%d" % (name, index)] = data[
+                start : start + amp.MAX_VALUE_LENGTH
+            ]
+
+    def fromBox(self, name, strings, objects, proto):
+        data = self.retrieve(strings, name, proto)
+        key = amp._wireNameToPythonIdentifier(name)
+        if self.optional and data is None:
+            objects[key] = None
+            return
+        chunks = [data]
+        for index in count(1):
+            chunk = strings.pop(b"%s.%d" % (name, index), None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        objects[key] = self.argument.fromStringProto(b"".join(chunks), proto)
+
+
 def _toByteString(string):
     """Encode `string` as (ASCII) bytes if it's a Unicode string.
 
@@ -0,0 +1,122 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Cache of boot configurations obtained from the region."""
+
+__all__ = ["boot_config_cache", "BootConfigCache"]
+
+from collections import defaultdict
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+from twisted.python.failure import Failure
+
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+
+
+class BootConfigCache:
+    """Cache of `GetBootConfig` responses.
+
+    A booting machine asks for many files in quick succession, and every
+    one of them needs the same boot configuration. Responses are kept for
+    `ttl` seconds, keyed on the arguments they were obtained with, and can
+    be dropped earlier for a node with `invalidate`. Lookups of a key that
+    is already being fetched wait for that fetch rather than starting
+    another.
+    """
+
+    ttl = 10
+
+    def __init__(self, clock=reactor, prometheus_metrics=PROMETHEUS_METRICS):
+        self.clock = clock
+        self.prometheus_metrics = prometheus_metrics
+        # Key -> (expiry time, response).
+        self._entries = {}
+        # Key -> list of Deferreds waiting for the fetch in progress.
+        self._pending = {}
+        # Node system_id -> keys of its cached responses.
+        self._keys = defaultdict(set)
+        # Incremented by every invalidation; responses fetched while it
+        # changed may be stale, so they are not cached.
+        self._generation = 0
+
+    @staticmethod
+    def make_key(arguments):
+        """Return a cache key for the `GetBootConfig` `arguments`."""
+        return tuple(sorted(arguments.items()))
+
+    def get(self, key, fetch):
+        """Return the response for `key`, calling `fetch` if needed.
+
+        :param fetch: A callable returning the response, or a `Deferred`
+            that fires with it.
+        :return: A `Deferred` that fires with a copy of the response, which
+            the caller is free to modify.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, response = entry
+            if expires > self.clock.seconds():
+                self._record("hit")
+                return succeed(dict(response))
+            self._remove(key)
+        d = Deferred()
+        d.addCallback(dict)
+        waiting = self._pending.get(key)
+        if waiting is None:
+            self._record("miss")
+            self._pending[key] = [d]
+            fetched = maybeDeferred(fetch)
+            fetched.addBoth(self._fetched, key, self._generation)
+        else:
+            self._record("coalesced")
+            waiting.append(d)
+        return d
+
+    def invalidate(self, system_id):
+        """Forget the responses for the node with `system_id`."""
+        self._generation += 1
+        for key in self._keys.pop(system_id, ()):
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Forget all responses."""
+        self._generation += 1
+        self._entries.clear()
+        self._keys.clear()
+
+    def _fetched(self, result, key, generation):
+        waiting = self._pending.pop(key)
+        if isinstance(result, Failure):
+            for d in waiting:
+                d.errback(result)
+        else:
+            if generation == self._generation:
+                self._add(key, result)
+            for d in waiting:
+                d.callback(result)
+
+    def _add(self, key, response):
+        self._entries[key] = (self.clock.seconds() + self.ttl, response)
+        system_id = response.get("system_id")
+        if system_id is not None:
+            self._keys[system_id].add(key)
+
+    def _remove(self, key):
+        _, response = self._entries.pop(key)
+        system_id = response.get("system_id")
+        if system_id is not None:
+            keys = self._keys.get(system_id)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._keys[system_id]
+
+    def _record(self, result):
+        self.prometheus_metrics.update(
+            "maas_tftp_boot_config_requests", "inc", labels={"cache": result}
+        )
+
+
+# The cache used by the TFTP and HTTP boot services on this rack controller.
+boot_config_cache = BootConfigCache()
@@ -95,10 +95,14 @@ def fix_sources_for_cluster(sources, maas_url):
 
 
 @synchronous
-def _run_import(sources, maas_url, http_proxy=None, https_proxy=None):
+def _run_import(
+    sources, maas_url, http_proxy=None, https_proxy=None, peers=None
+):
     """Run the import.
 
     This is function is synchronous so it must be called with deferToThread.
+
+    :param peers: URLs of other rack controllers to download files from.
     """
     # Fix the sources to download from the IP address defined in the cluster
     # configuration, instead of the URL that the region asked it to use.
@@ -108,7 +112,8 @@ def _run_import(sources, maas_url, http_proxy=None, https_proxy=None):
         variables["http_proxy"] = http_proxy
     if https_proxy is not None:
         variables["https_proxy"] = https_proxy
-    # Communication to the sources and loopback should not go through proxy.
+    # Communication to the sources, peers, and loopback should not go through
+    # proxy.
     no_proxy_hosts = [
         "localhost",
         "::ffff:127.0.0.1",
@@ -118,9 +123,13 @@ def _run_import(sources, maas_url, http_proxy=None, https_proxy=None):
         "[::1]",
     ]
     no_proxy_hosts += list(get_hosts_from_sources(sources))
+    if peers:
+        no_proxy_hosts += sorted(
+            get_hosts_from_sources({"url": peer} for peer in peers)
+        )
     variables["no_proxy"] = ",".join(no_proxy_hosts)
     with environment_variables(variables):
-        imported = boot_resources.import_images(sources)
+        imported = boot_resources.import_images(sources, peers=peers)
 
     # Update the boot images cache so `list_boot_images` returns the
     # correct information.
@@ -130,7 +139,9 @@ def _run_import(sources, maas_url, http_proxy=None, https_proxy=None):
     return imported
 
 
-def import_boot_images(sources, maas_url, http_proxy=None, https_proxy=None):
+def import_boot_images(
+    sources, maas_url, http_proxy=None, https_proxy=None, peers=None
+):
     """Imports the boot images from the given sources."""
     lock = concurrency.boot_images
     # This checks if any other defer is already waiting. If nothing is waiting
@@ -146,17 +157,20 @@ def import_boot_images(sources, maas_url, http_proxy=None, https_proxy=None):
             maas_url,
             http_proxy=http_proxy,
             https_proxy=https_proxy,
+            peers=peers,
         )
 
 
 @inlineCallbacks
-def _import_boot_images(sources, maas_url, http_proxy=None, https_proxy=None):
+def _import_boot_images(
+    sources, maas_url, http_proxy=None, https_proxy=None, peers=None
+):
     """Import boot images then inform the region.
 
     Helper for `import_boot_images`.
     """
     proxies = dict(http_proxy=http_proxy, https_proxy=https_proxy)
-    yield deferToThread(_run_import, sources, maas_url, **proxies)
+    yield deferToThread(_run_import, sources, maas_url, peers=peers, **proxies)
     yield touch_last_image_sync_timestamp().addErrback(
         log.err, "Failure touching last image sync timestamp."
     )
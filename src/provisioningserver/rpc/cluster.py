@@ -27,6 +27,8 @@ __all__ = [
     "PowerOn",
     "PowerQuery",
     "ScanNetworks",
+    "UpdateDHCPv4Hosts",
+    "UpdateDHCPv6Hosts",
     "ValidateDHCPv4Config",
     "ValidateDHCPv4Config_V2",
     "ValidateDHCPv6Config",
@@ -591,12 +593,67 @@ class ConfigureDHCPv4(_ConfigureDHCP):
     """
 
 
+class _UpdateDHCPHosts(amp.Command):
+    """Update the hosts of a DHCP server.
+
+    The changes are relative to the configuration at `base_revision`; once
+    they have been applied the configuration is at `revision`.
+
+    :since: 2.7
+    """
+
+    arguments = [
+        (b"base_revision", amp.Unicode()),
+        (b"revision", amp.Unicode()),
+        (b"remove", amp.ListOf(amp.Unicode())),
+        (
+            b"hosts",
+            CompressedAmpList(
+                [
+                    (b"host", amp.Unicode()),
+                    (b"mac", amp.Unicode()),
+                    (b"ip", amp.Unicode()),
+                    (
+                        b"dhcp_snippets",
+                        AmpList(
+                            [
+                                (b"name", amp.Unicode()),
+                                (b"description", amp.Unicode(optional=True)),
+                                (b"value", amp.Unicode()),
+                            ],
+                            optional=True,
+                        ),
+                    ),
+                ]
+            ),
+        ),
+    ]
+    response = []
+    errors = {
+        exceptions.CannotConfigureDHCP: b"CannotConfigureDHCP",
+        exceptions.DHCPRevisionMismatch: b"DHCPRevisionMismatch",
+    }
+
+
 class ConfigureDHCPv4_V2(_ConfigureDHCP_V2):
     """Configure the DHCPv4 server.
 
+    `revision` labels the configuration, for `UpdateDHCPv4Hosts`; since 2.7.
+
     :since: 2.1
     """
 
+    arguments = _ConfigureDHCP_V2.arguments + [
+        (b"revision", amp.Unicode(optional=True))
+    ]
+
+
+class UpdateDHCPv4Hosts(_UpdateDHCPHosts):
+    """Update the hosts of the DHCPv4 server.
+
+    :since: 2.7
+    """
+
 
 class ValidateDHCPv4Config(_ValidateDHCPConfig):
     """Validate the configure the DHCPv4 server.
@@ -622,9 +679,22 @@ class ConfigureDHCPv6(_ConfigureDHCP):
 class ConfigureDHCPv6_V2(_ConfigureDHCP_V2):
     """Configure the DHCPv6 server.
 
+    `revision` labels the configuration, for `UpdateDHCPv6Hosts`; since 2.7.
+
     :since: 2.1
     """
 
+    arguments = _ConfigureDHCP_V2.arguments + [
+        (b"revision", amp.Unicode(optional=True))
+    ]
+
+
+class UpdateDHCPv6Hosts(_UpdateDHCPHosts):
+    """Update the hosts of the DHCPv6 server.
+
+    :since: 2.7
+    """
+
 
 class ValidateDHCPv6Config(_ValidateDHCPConfig):
     """Configure the DHCPv6 server.
@@ -644,6 +714,9 @@ class ImportBootImages(amp.Command):
     """Import boot images and report the final
     boot images that exist on the cluster.
 
+    `peers` are URLs of other rack controllers to try downloading files
+    from, by their SHA256, before the sources; since 2.7.
+
     :since: 1.7
     """
 
@@ -671,6 +744,7 @@ class ImportBootImages(amp.Command):
         ),
         (b"http_proxy", ParsedURL(optional=True)),
         (b"https_proxy", ParsedURL(optional=True)),
+        (b"peers", amp.ListOf(amp.Unicode(), optional=True)),
     ]
     response = []
     errors = []
@@ -69,7 +69,7 @@ from provisioningserver.rpc.boot_images import (
     is_import_boot_images_running,
     list_boot_images,
 )
-from provisioningserver.rpc.common import Ping, RPCProtocol
+from provisioningserver.rpc.common import batchable, Ping, RPCProtocol
 from provisioningserver.rpc.exceptions import CannotConfigureDHCP
 from provisioningserver.rpc.interfaces import IConnectionToRegion
 from provisioningserver.rpc.osystems import (
@@ -306,7 +306,9 @@ class Cluster(RPCProtocol):
         return {"images": list_boot_images()}
 
     @cluster.ImportBootImages.responder
-    def import_boot_images(self, sources, http_proxy=None, https_proxy=None):
+    def import_boot_images(
+        self, sources, http_proxy=None, https_proxy=None, peers=None
+    ):
         """import_boot_images()
 
         Implementation of
@@ -321,6 +323,7 @@ class Cluster(RPCProtocol):
             self.service.maas_url,
             http_proxy=get_proxy_url(http_proxy),
             https_proxy=get_proxy_url(https_proxy),
+            peers=peers,
         )
         return {}
 
@@ -425,6 +428,7 @@ class Cluster(RPCProtocol):
         }
 
     @cluster.PowerOn.responder
+    @batchable
     def power_on(self, system_id, hostname, power_type, context):
         """Turn a node on."""
         d = maybe_change_power_state(
@@ -434,6 +438,7 @@ class Cluster(RPCProtocol):
         return d
 
     @cluster.PowerOff.responder
+    @batchable
     def power_off(self, system_id, hostname, power_type, context):
         """Turn a node off."""
         d = maybe_change_power_state(
@@ -447,6 +452,7 @@ class Cluster(RPCProtocol):
         return d
 
     @cluster.PowerCycle.responder
+    @batchable
     def power_cycle(self, system_id, hostname, power_type, context):
         """Power cycle a node."""
         d = maybe_change_power_state(
@@ -460,6 +466,7 @@ class Cluster(RPCProtocol):
         return d
 
     @cluster.PowerQuery.responder
+    @batchable
     def power_query(self, system_id, hostname, power_type, context):
         d = get_power_state(system_id, hostname, power_type, context=context)
         d.addCallback(lambda x: {"state": x})
@@ -507,6 +514,7 @@ class Cluster(RPCProtocol):
         hosts,
         interfaces,
         global_dhcp_snippets=[],
+        revision=None,
     ):
         server = dhcp.DHCPv4Server(omapi_key)
         if concurrency.dhcpv4.locked:
@@ -530,6 +538,7 @@ class Cluster(RPCProtocol):
             hosts,
             interfaces,
             global_dhcp_snippets,
+            revision,
         )
         d.addCallback(lambda _: {})
 
@@ -543,6 +552,31 @@ class Cluster(RPCProtocol):
 
         return d
 
+    @cluster.UpdateDHCPv4Hosts.responder
+    def update_dhcpv4_hosts(self, base_revision, revision, remove, hosts):
+        # Serialised with, and limited like, the full configuration.
+        d = concurrency.dhcpv4.run(
+            deferWithTimeout,
+            DHCP_TIMEOUT,
+            dhcp.configure_hosts,
+            dhcp.DHCPv4Server,
+            base_revision,
+            revision,
+            remove,
+            hosts,
+        )
+        d.addCallback(lambda _: {})
+
+        # Catch the cancelled error, which means the work timed out.
+        def _timeoutEb(failure):
+            failure.trap(CancelledError)
+            log.err(failure, "DHCPv4 hosts update timed out")
+            raise CannotConfigureDHCP("timed out") from failure.value
+
+        d.addErrback(_timeoutEb)
+
+        return d
+
     @cluster.ValidateDHCPv4Config.responder
     def validate_dhcpv4_config(
         self,
@@ -615,6 +649,7 @@ class Cluster(RPCProtocol):
         hosts,
         interfaces,
         global_dhcp_snippets=[],
+        revision=None,
     ):
         server = dhcp.DHCPv6Server(omapi_key)
         if concurrency.dhcpv6.locked:
@@ -638,6 +673,7 @@ class Cluster(RPCProtocol):
             hosts,
             interfaces,
             global_dhcp_snippets,
+            revision,
         )
         d.addCallback(lambda _: {})
 
@@ -651,6 +687,31 @@ class Cluster(RPCProtocol):
 
         return d
 
+    @cluster.UpdateDHCPv6Hosts.responder
+    def update_dhcpv6_hosts(self, base_revision, revision, remove, hosts):
+        # Serialised with, and limited like, the full configuration.
+        d = concurrency.dhcpv6.run(
+            deferWithTimeout,
+            DHCP_TIMEOUT,
+            dhcp.configure_hosts,
+            dhcp.DHCPv6Server,
+            base_revision,
+            revision,
+            remove,
+            hosts,
+        )
+        d.addCallback(lambda _: {})
+
+        # Catch the cancelled error, which means the work timed out.
+        def _timeoutEb(failure):
+            failure.trap(CancelledError)
+            log.err(failure, "DHCPv6 hosts update timed out")
+            raise CannotConfigureDHCP("timed out") from failure.value
+
+        d.addErrback(_timeoutEb)
+
+        return d
+
     @cluster.ValidateDHCPv6Config.responder
     def validate_dhcpv6_config(
         self,
@@ -3,17 +3,25 @@
 
 """Common RPC classes and utilties."""
 
-__all__ = ["Authenticate", "Client", "Identify", "RPCProtocol"]
+__all__ = [
+    "Authenticate",
+    "batchable",
+    "Client",
+    "Identify",
+    "MultiCommand",
+    "RPCProtocol",
+]
 
 from os import getpid
 from socket import gethostname
 
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, DeferredList, fail
 from twisted.protocols import amp
 from twisted.python.failure import Failure
 
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
+from provisioningserver.rpc.arguments import Bytes, Chunked
 from provisioningserver.rpc.interfaces import IConnection, IConnectionToRegion
 from provisioningserver.utils.twisted import asynchronous, deferWithTimeout
 
@@ -78,6 +86,45 @@ class Ping(amp.Command):
     errors = []
 
 
+class MultiCommand(amp.Command):
+    """Call several commands in a single round trip.
+
+    Each command is passed as a complete AMP box, serialised as it would be
+    on the wire, and the answer or error box for each is returned in the
+    same order. Only commands whose responders are marked as `batchable`
+    can be called this way; any others fail with `amp.UnhandledCommand`.
+
+    Both the commands and the responses are chunked, so a batch is not
+    limited by AMP's maximum value length, though the boxes within it are.
+
+    :since: 2.7
+    """
+
+    arguments = [(b"commands", Chunked(Bytes()))]
+    response = [(b"responses", Chunked(Bytes()))]
+    errors = []
+
+
+def batchable(responder):
+    """Mark `responder` as callable from within a `MultiCommand`.
+
+    Use it alongside the command's own responder decorator::
+
+      @region.SendEvent.responder
+      @batchable
+      def send_event(self, system_id, type_name, description):
+          ...
+
+    """
+    responder.batchable = True
+    return responder
+
+
+def _serialise_boxes(boxes):
+    """Serialise `boxes` as they would be sent on the wire."""
+    return b"".join(box.serialize() for box in boxes)
+
+
 class Client:
     """Wrapper around an :class:`amp.AMP` instance.
 
@@ -178,6 +225,68 @@ class Client:
                 timeout, self._conn.callRemote, cmd, **kwargs
             )
 
+    @asynchronous
+    def callMany(self, calls, _timeout=undefined):
+        """Call several remote RPC methods in a single round trip.
+
+        The calls are sent together in a `MultiCommand`. If the remote side
+        does not support that, they are made one at a time instead.
+
+        :param calls: A sequence of ``(cmd, kwargs)`` tuples, where `cmd` is
+            the `amp.Command` child class to invoke and `kwargs` a dict of
+            its parameters.
+        :param _timeout: As for `__call__`, but for the batch as a whole.
+        :return: A deferred result that fires with a list of ``(success,
+            result)`` tuples, one for each call in order, like that of a
+            `DeferredList`.
+        """
+        calls = list(calls)
+        boxes = []
+        for cmd, kwargs in calls:
+            box = cmd.makeArguments(kwargs, self._conn)
+            box[amp.COMMAND] = cmd.commandName
+            boxes.append(box)
+
+        def parse_responses(response):
+            boxes = amp.parseString(response["responses"])
+            return [
+                self._parseBatchedResponse(cmd, box)
+                for (cmd, _), box in zip(calls, boxes)
+            ]
+
+        def call_one_at_a_time(failure):
+            failure.trap(amp.UnhandledCommand)
+            return DeferredList(
+                [
+                    self(cmd, _timeout=_timeout, **kwargs)
+                    for cmd, kwargs in calls
+                ],
+                consumeErrors=True,
+            )
+
+        d = self(
+            MultiCommand, commands=_serialise_boxes(boxes), _timeout=_timeout
+        )
+        d.addCallbacks(parse_responses, call_one_at_a_time)
+        return d
+
+    def _parseBatchedResponse(self, cmd, box):
+        """Parse the answer or error `box` for `cmd` from a `MultiCommand`.
+
+        Errors are mapped back to exceptions the same way as they are for a
+        call made on its own.
+        """
+        if amp.ERROR_CODE not in box:
+            return True, cmd.parseResponse(box, self._conn)
+        code = box[amp.ERROR_CODE]
+        description = box[amp.ERROR_DESCRIPTION].decode("utf-8", "replace")
+        if code in amp.PROTOCOL_ERRORS:
+            error = amp.PROTOCOL_ERRORS[code](code, description)
+        else:
+            error_type = cmd.reverseErrors.get(code, amp.UnknownRemoteError)
+            error = error_type(description)
+        return False, Failure(error)
+
     @asynchronous
     def getHostCertificate(self):
         return self._conn.hostCertificate
@@ -306,6 +415,41 @@ class RPCProtocol(amp.AMP, object):
 
         return d.addErrback(coerce_error)
 
+    def _dispatchBatchedCommand(self, box):
+        """Dispatch a command `box` received within a `MultiCommand`.
+
+        :return: A `Deferred` that always fires with an answer or an error
+            box; errors are never fatal to the connection here.
+        """
+        command = box[amp.COMMAND]
+        _, responder = self._commandDispatch.get(command, (None, None))
+        if getattr(responder, "batchable", False):
+            d = self.dispatchCommand(box)
+        else:
+            d = fail(
+                amp.RemoteAmpError(
+                    amp.UNHANDLED_ERROR_CODE,
+                    "Unbatchable Command: %r" % (command,),
+                    fatal=False,
+                    local=Failure(amp.UnhandledCommand()),
+                )
+            )
+
+        def format_error(failure):
+            # dispatchCommand coerces everything to a RemoteAmpError.
+            failure.trap(amp.RemoteAmpError)
+            description = failure.value.description
+            if isinstance(description, str):
+                description = description.encode("utf-8", "replace")
+            return amp.AmpBox(
+                {
+                    amp.ERROR_CODE: failure.value.errorCode,
+                    amp.ERROR_DESCRIPTION: description,
+                }
+            )
+
+        return d.addErrback(format_error)
+
     def _safeEmit(self, box):
         """
         Override `_safeEmit` to log the RPC response.
@@ -354,3 +498,23 @@ class RPCProtocol(amp.AMP, object):
         :py:class:`~provisioningserver.rpc.common.Ping`.
         """
         return {}
+
+    @MultiCommand.responder
+    def multi_command(self, commands):
+        """multi_command(commands)
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.common.MultiCommand`.
+        """
+        d = DeferredList(
+            [
+                self._dispatchBatchedCommand(box)
+                for box in amp.parseString(commands)
+            ]
+        )
+        d.addCallback(
+            lambda results: {
+                "responses": _serialise_boxes(box for _, box in results)
+            }
+        )
+        return d
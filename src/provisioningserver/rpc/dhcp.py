@@ -5,6 +5,7 @@
 
 __all__ = [
     "configure",
+    "configure_hosts",
     "DHCPv4Server",
     "DHCPv6Server",
     "downgrade_shared_networks",
@@ -23,13 +24,19 @@ from twisted.internet.threads import deferToThread
 
 from provisioningserver.dhcp import DHCPv4Server, DHCPv6Server
 from provisioningserver.dhcp.config import get_config
-from provisioningserver.dhcp.omshell import Omshell
+from provisioningserver.dhcp.omapi import (
+    OmapiClient,
+    OmapiConnectionError,
+    OmapiOperation,
+)
 from provisioningserver.logger import get_maas_logger, LegacyLogger
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc.exceptions import (
     CannotConfigureDHCP,
     CannotCreateHostMap,
     CannotModifyHostMap,
     CannotRemoveHostMap,
+    DHCPRevisionMismatch,
 )
 from provisioningserver.service_monitor import service_monitor
 from provisioningserver.utils.fs import sudo_delete_file, sudo_write_file
@@ -48,6 +55,10 @@ log = LegacyLogger()
 # Holds the current state of DHCPv4 and DHCPv6.
 _current_server_state = {}
 
+# Holds the revision of the current state of DHCPv4 and DHCPv6, as given by
+# the region; it's only set once that state has been applied.
+_current_server_revision = {}
+
 
 DHCPStateBase = namedtuple(
     "DHCPStateBase",
@@ -187,70 +198,99 @@ def _delete_config(server):
         sudo_delete_file(server.config_filename)
 
 
-def _remove_host_map(omshell, mac):
-    """Remove host by `mac`."""
-    try:
-        omshell.remove(mac)
-    except ExternalProcessError as e:
-        if "not connected." in e.output_as_unicode:
-            msg = "The DHCP server could not be reached."
-        else:
-            msg = str(e)
-        err = "Could not remove host map for %s: %s" % (mac, msg)
-        maaslog.error(err)
-        raise CannotRemoveHostMap(err)
+# Persistent OMAPI connections, keyed by the name of the DHCP service.
+_omapi_clients = {}
 
 
-def _create_host_map(omshell, mac, ip_address):
-    """Create host with `mac` -> `ip_address`."""
-    try:
-        omshell.create(ip_address, mac)
-    except ExternalProcessError as e:
-        if "not connected." in e.output_as_unicode:
-            msg = "The DHCP server could not be reached."
-        else:
-            msg = str(e)
-        err = "Could not create host map for %s -> %s: %s" % (
-            mac,
-            ip_address,
-            msg,
+def _get_omapi_client(server):
+    """Return the persistent `OmapiClient` for `server`.
+
+    A new client is created when there is none yet or when the OMAPI key of
+    the server has changed.
+    """
+    client = _omapi_clients.get(server.dhcp_service)
+    if client is None or client.shared_key != server.omapi_key:
+        if client is not None:
+            client.close()
+        client = OmapiClient(
+            server_address="127.0.0.1",
+            shared_key=server.omapi_key,
+            ipv6=server.ipv6,
         )
-        maaslog.error(err)
-        raise CannotCreateHostMap(err)
+        _omapi_clients[server.dhcp_service] = client
+    return client
 
 
-def _modify_host_map(omshell, mac, ip_address):
-    """Modify host with `mac` -> `ip_address`."""
-    try:
-        omshell.modify(ip_address, mac)
-    except ExternalProcessError as e:
-        if "not connected." in e.output_as_unicode:
-            msg = "The DHCP server could not be reached."
-        else:
-            msg = str(e)
-        err = "Could not modify host map for %s -> %s: %s" % (
-            mac,
-            ip_address,
-            msg,
+def _close_omapi_client(server):
+    """Close the persistent `OmapiClient` for `server`, if there is one."""
+    client = _omapi_clients.pop(server.dhcp_service, None)
+    if client is not None:
+        client.close()
+
+
+def _host_map_error(operation, msg):
+    """Return the exception to raise for a failed host map `operation`."""
+    if operation.action == "remove":
+        return CannotRemoveHostMap(
+            "Could not remove host map for %s: %s" % (operation.mac, msg)
+        )
+    elif operation.action == "create":
+        return CannotCreateHostMap(
+            "Could not create host map for %s -> %s: %s"
+            % (operation.mac, operation.ip, msg)
+        )
+    else:
+        return CannotModifyHostMap(
+            "Could not modify host map for %s -> %s: %s"
+            % (operation.mac, operation.ip, msg)
         )
-        maaslog.error(err)
-        raise CannotModifyHostMap(err)
 
 
 @synchronous
-def _update_hosts(server, remove, add, modify):
-    """Update the hosts using the OMAPI."""
-    omshell = Omshell(
-        server_address="127.0.0.1",
-        shared_key=server.omapi_key,
-        ipv6=server.ipv6,
+def _update_hosts(
+    server, remove, add, modify, prometheus_metrics=PROMETHEUS_METRICS
+):
+    """Update the hosts using the OMAPI.
+
+    All the changes are pipelined over the persistent OMAPI connection to
+    `server`. Every change is attempted; if any of them fails, the error for
+    the first failure is raised once they have all completed.
+    """
+    operations = [
+        OmapiOperation("remove", host["mac"], None) for host in remove
+    ]
+    operations.extend(
+        OmapiOperation("create", host["mac"], host["ip"]) for host in add
+    )
+    operations.extend(
+        OmapiOperation("modify", host["mac"], host["ip"]) for host in modify
     )
-    for host in remove:
-        _remove_host_map(omshell, host["mac"])
-    for host in add:
-        _create_host_map(omshell, host["mac"], host["ip"])
-    for host in modify:
-        _modify_host_map(omshell, host["mac"], host["ip"])
+    client = _get_omapi_client(server)
+    try:
+        results = client.pipeline(operations)
+    except OmapiConnectionError:
+        _close_omapi_client(server)
+        error = _host_map_error(
+            operations[0], "The DHCP server could not be reached."
+        )
+        maaslog.error(str(error))
+        raise error
+
+    first_error = None
+    for result in results:
+        prometheus_metrics.update(
+            "maas_dhcp_omapi_operation_latency",
+            "observe",
+            value=result.latency,
+            labels={"operation": result.operation.action},
+        )
+        if result.error is not None:
+            error = _host_map_error(result.operation, result.error)
+            maaslog.error(str(error))
+            if first_error is None:
+                first_error = error
+    if first_error is not None:
+        raise first_error
 
 
 @asynchronous
@@ -315,6 +355,7 @@ def configure(
     hosts,
     interfaces,
     global_dhcp_snippets=None,
+    revision=None,
 ):
     """Configure the DHCPv6/DHCPv4 server, and restart it as appropriate.
 
@@ -331,9 +372,15 @@ def configure(
         contain a list of hosts the DHCP should statically.
     :param interfaces: List of interfaces that DHCP should use.
     :param global_dhcp_snippets: List of all global DHCP snippets
+    :param revision: The revision of this configuration, to which changes to
+        the hosts can later be applied with `configure_hosts`.
     """
     stopping = len(shared_networks) == 0
 
+    # Until this configuration has been applied, changes relative to the
+    # current revision can't be applied either.
+    _current_server_revision.pop(server.dhcp_service, None)
+
     if global_dhcp_snippets is None:
         global_dhcp_snippets = []
 
@@ -346,6 +393,7 @@ def configure(
         # Remove the config so that the even an administrator cannot turn it on
         # accidently when it should be off.
         yield deferToThread(_delete_config, server)
+        _close_omapi_client(server)
 
         # Ensure that the service is off and is staying off.
         service = service_monitor.getServiceByName(server.dhcp_service)
@@ -477,6 +525,51 @@ def configure(
 
         # Update the current state to the new state.
         _current_server_state[server.dhcp_service] = new_state
+        _current_server_revision[server.dhcp_service] = revision
+
+
+@asynchronous
+def configure_hosts(server_class, base_revision, revision, remove, hosts):
+    """Apply changes to the hosts of the DHCPv6/DHCPv4 server.
+
+    The rest of the configuration is left as it is, and the server is
+    reconfigured with `configure`, so it's only restarted if necessary.
+
+    This method is not safe to call concurrently, nor concurrently with
+    `configure`.
+
+    :param server_class: The `DHCPServer` class; its instance is created with
+        the current OMAPI key.
+    :param base_revision: The revision of the configuration the changes are
+        relative to.
+    :param revision: The revision of the configuration once the changes have
+        been applied.
+    :param remove: List of MAC addresses of the hosts to remove.
+    :param hosts: List of dicts with the parameters of the hosts to add or
+        replace.
+    :raise DHCPRevisionMismatch: When the current configuration is not
+        `base_revision`; the full configuration needs to be sent instead.
+    """
+    current_state = _current_server_state.get(server_class.dhcp_service)
+    current_revision = _current_server_revision.get(server_class.dhcp_service)
+    if current_state is None or current_revision != base_revision:
+        raise DHCPRevisionMismatch(
+            "%s server is at revision %s, not %s."
+            % (server_class.descriptive_name, current_revision, base_revision)
+        )
+    new_hosts = current_state.hosts.copy()
+    for mac in remove:
+        new_hosts.pop(mac, None)
+    new_hosts.update((host["mac"], host) for host in hosts)
+    return configure(
+        server_class(current_state.omapi_key),
+        current_state.failover_peers,
+        current_state.shared_networks,
+        list(new_hosts.values()),
+        [{"name": name} for name in current_state.interfaces],
+        current_state.global_dhcp_snippets,
+        revision,
+    )
 
 
 def _parse_dhcpd_errors(error_str):
@@ -12,6 +12,7 @@ __all__ = [
     "CannotRegisterCluster",
     "CannotRemoveHostMap",
     "CommissionNodeFailed",
+    "DHCPRevisionMismatch",
     "NoConnectionsAvailable",
     "NodeAlreadyExists",
     "NodeStateViolation",
@@ -84,6 +85,10 @@ class CannotConfigureDHCP(Exception):
     """Failure while configuring a DHCP server."""
 
 
+class DHCPRevisionMismatch(Exception):
+    """The DHCP server is not configured with the expected revision."""
+
+
 class CannotCreateHostMap(Exception):
     """The host map could not be created."""
 
@@ -7,8 +7,11 @@ __all__ = [
     "power_action_registry",
     "power_state_update",
     "maybe_change_power_state",
+    "PowerQueryLimiter",
+    "PowerStateReporter",
 ]
 
+from collections import defaultdict, deque
 from datetime import timedelta
 from functools import partial
 import sys
@@ -16,25 +19,35 @@ import sys
 from twisted.internet import reactor
 from twisted.internet.defer import (
     CancelledError,
+    Deferred,
     DeferredList,
-    DeferredSemaphore,
     inlineCallbacks,
+    maybeDeferred,
     returnValue,
     succeed,
 )
 from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThread
+from twisted.protocols.amp import UnhandledCommand
+from twisted.python.failure import Failure
 
 from provisioningserver.drivers.power import get_error_message, PowerError
 from provisioningserver.drivers.power.registry import PowerDriverRegistry
 from provisioningserver.events import EVENT_TYPES, send_node_event
 from provisioningserver.logger import get_maas_logger, LegacyLogger
+from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc import getRegionClient
+from provisioningserver.rpc.boot_config import boot_config_cache
 from provisioningserver.rpc.exceptions import (
     NoSuchNode,
     PowerActionAlreadyInProgress,
     PowerActionFail,
 )
-from provisioningserver.rpc.region import MarkNodeFailed, UpdateNodePowerState
+from provisioningserver.rpc.region import (
+    MarkNodeFailed,
+    UpdateNodePowerState,
+    UpdateNodePowerStates,
+)
 from provisioningserver.utils.twisted import (
     asynchronous,
     callOut,
@@ -212,6 +225,11 @@ def maybe_change_power_state(
             "'%s' package(s) are not installed" % " ".join(missing_packages)
         )
 
+    # The region changes the power state of a node when it starts to deploy,
+    # commission, release, etc. it, so what it boots next is likely to need
+    # a different boot configuration.
+    boot_config_cache.invalidate(system_id)
+
     # There should be one and only one power change for each system ID.
     if system_id in power_action_registry:
         current_power_change, d = power_action_registry[system_id]
@@ -374,23 +392,35 @@ def get_power_state(system_id, hostname, power_type, context, clock=reactor):
 
 
 @inlineCallbacks
-def power_query_success(system_id, hostname, state):
-    """Report a node that for which power querying has succeeded."""
+def power_query_success(system_id, hostname, state, update=None):
+    """Report a node that for which power querying has succeeded.
+
+    :param update: Used instead of `power_state_update` to tell the region
+        about the node's power state, when given.
+    """
+    if update is None:
+        update = power_state_update
     message = "Power state queried: %s" % state
-    yield power_state_update(system_id, state)
+    yield update(system_id, state)
     yield send_node_event(
         EVENT_TYPES.NODE_POWER_QUERIED_DEBUG, system_id, hostname, message
     )
 
 
 @inlineCallbacks
-def power_query_failure(system_id, hostname, failure):
-    """Report a node that for which power querying has failed."""
+def power_query_failure(system_id, hostname, failure, update=None):
+    """Report a node that for which power querying has failed.
+
+    :param update: Used instead of `power_state_update` to tell the region
+        about the node's power state, when given.
+    """
+    if update is None:
+        update = power_state_update
     maaslog.error(
         "%s: Power state could not be queried: %s"
         % (hostname, failure.getErrorMessage())
     )
-    yield power_state_update(system_id, "error")
+    yield update(system_id, "error")
     yield send_node_event(
         EVENT_TYPES.NODE_POWER_QUERY_FAILED,
         system_id,
@@ -400,21 +430,23 @@ def power_query_failure(system_id, hostname, failure):
 
 
 @asynchronous
-def report_power_state(d, system_id, hostname):
+def report_power_state(d, system_id, hostname, update=None):
     """Report the result of a power query.
 
     :param d: A `Deferred` that will fire with the node's updated power state,
         or an error condition. The callback/errback values are passed through
         unaltered. See `get_power_state` for details.
+    :param update: Used instead of `power_state_update` to tell the region
+        about the node's power state, when given.
     """
 
     def cb(state):
-        d = power_query_success(system_id, hostname, state)
+        d = power_query_success(system_id, hostname, state, update)
         d.addCallback(lambda _: state)
         return d
 
     def eb(failure):
-        d = power_query_failure(system_id, hostname, failure)
+        d = power_query_failure(system_id, hostname, failure, update)
         d.addCallback(lambda _: failure)
         return d
 
@@ -459,12 +491,28 @@ def maaslog_report_failure(node, failure):
         # log.err(failure, "Failed to refresh power state.")
 
 
-def query_node(node, clock):
+def query_node(node, clock, limiter=None, update=None):
     """Calls `get_power_state` on the given node.
 
     Logs to maaslog as errors and power states change.
+
+    :param limiter: A `PowerQueryLimiter`. When given, the query waits for
+        a slot for the node's power type, and gives it back as soon as the
+        node has answered, without waiting for the region to be told.
+    :param update: Used instead of `power_state_update` to tell the region
+        about the node's power state, when given.
     """
+    if limiter is None:
+        return _query_node(node, clock, update)
+    d = limiter.acquire(node["power_type"])
+    d.addCallback(partial(_query_node, node, clock, update))
+    return d
+
+
+def _query_node(node, clock, update, release=None):
     if node["system_id"] in power_action_registry:
+        if release is not None:
+            release(succeeded=False)
         log.debug(
             "{hostname}: Skipping query power status, "
             "power action already in progress.",
@@ -479,7 +527,9 @@ def query_node(node, clock):
             node["context"],
             clock=clock,
         )
-        d = report_power_state(d, node["system_id"], node["hostname"])
+        if release is not None:
+            d.addBoth(_release_query_slot, release)
+        d = report_power_state(d, node["system_id"], node["hostname"], update)
         d.addCallbacks(
             partial(maaslog_report_success, node),
             partial(maaslog_report_failure, node),
@@ -487,18 +537,316 @@ def query_node(node, clock):
         return d
 
 
-def query_all_nodes(nodes, max_concurrency=5, clock=reactor):
+def query_node_group(nodes, clock, limiter=None, update=None):
+    """Query the power states of `nodes` together.
+
+    They must all be of the same power type, and its driver's
+    `get_power_query_group` must have returned the same for all of them.
+    Those whose power state can't be got that way are queried on their own,
+    with `query_node`.
+
+    :param limiter: A `PowerQueryLimiter`. When given, the group waits for
+        one slot for its power type.
+    :param update: Used instead of `power_state_update` to tell the region
+        about the nodes' power states, when given.
+    """
+    if limiter is None:
+        return _query_node_group(nodes, clock, limiter, update)
+    d = limiter.acquire(nodes[0]["power_type"])
+    d.addCallback(partial(_query_node_group, nodes, clock, limiter, update))
+    return d
+
+
+def _query_node_group(nodes, clock, limiter, update, release=None):
+    nodes_to_query = []
+    for node in nodes:
+        if node["system_id"] in power_action_registry:
+            log.debug(
+                "{hostname}: Skipping query power status, "
+                "power action already in progress.",
+                hostname=node["hostname"],
+            )
+        else:
+            nodes_to_query.append(node)
+    nodes = nodes_to_query
+    if len(nodes) == 0:
+        if release is not None:
+            release(succeeded=False)
+        return succeed(None)
+    power_driver = PowerDriverRegistry[nodes[0]["power_type"]]
+    d = deferToThread(
+        power_driver.power_query_group, [node["context"] for node in nodes]
+    )
+    if release is not None:
+        d.addBoth(_release_query_slot, release)
+
+    def report(power_states):
+        queries = []
+        for node, power_state in zip(nodes, power_states):
+            if power_state is None:
+                d = query_node(node, clock, limiter=limiter, update=update)
+            else:
+                d = report_power_state(
+                    succeed(power_state),
+                    node["system_id"],
+                    node["hostname"],
+                    update,
+                )
+                d.addCallbacks(
+                    partial(maaslog_report_success, node),
+                    partial(maaslog_report_failure, node),
+                )
+            queries.append(d)
+        return DeferredList(queries, consumeErrors=True)
+
+    def query_separately(failure):
+        log.err(failure, "Failed to query power states together.")
+        return report([None] * len(nodes))
+
+    return d.addCallbacks(report, query_separately)
+
+
+def _release_query_slot(result, release):
+    release(succeeded=not isinstance(result, Failure))
+    return result
+
+
+def query_all_nodes(
+    nodes, max_concurrency=5, clock=reactor, limiter=None, update=None
+):
     """Queries the given nodes for their power state.
 
-    Nodes' states are reported back to the region.
+    Nodes' states are reported back to the region. Nodes whose power driver
+    can query many of them at once, see `PowerDriver.get_power_query_group`,
+    are queried in groups.
 
+    :param limiter: A `PowerQueryLimiter` shared between calls. Without
+        one, at most `max_concurrency` nodes of each power type are queried
+        at once.
+    :param update: Used instead of `power_state_update` to tell the region
+        about the nodes' power states, when given.
     :return: A deferred, which fires once all nodes have been queried,
         successfully or not.
     """
-    semaphore = DeferredSemaphore(tokens=max_concurrency)
-    queries = (
-        semaphore.run(query_node, node, clock)
-        for node in nodes
-        if node["power_type"] in PowerDriverRegistry
-    )
+    if limiter is None:
+        limiter = PowerQueryLimiter(
+            initial=max_concurrency, maximum=max_concurrency, clock=clock
+        )
+    queries = []
+    groups = defaultdict(list)
+    for node in nodes:
+        power_driver = PowerDriverRegistry.get_item(node["power_type"])
+        if power_driver is None:
+            continue
+        group = power_driver.get_power_query_group(node["context"])
+        if group is None:
+            queries.append(
+                query_node(node, clock, limiter=limiter, update=update)
+            )
+        else:
+            groups[node["power_type"], group].append(node)
+    for (power_type, _), group in groups.items():
+        size = PowerDriverRegistry[power_type].power_query_group_size
+        for start in range(0, len(group), size):
+            chunk = group[start : start + size]
+            if len(chunk) == 1:
+                query = query_node(
+                    chunk[0], clock, limiter=limiter, update=update
+                )
+            else:
+                query = query_node_group(
+                    chunk, clock, limiter=limiter, update=update
+                )
+            queries.append(query)
     return DeferredList(queries, consumeErrors=True)
+
+
+class _PowerTypeSlots:
+    """Book-keeping for one power type in a `PowerQueryLimiter`."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = deque()
+        # Queries finished since the limit last changed.
+        self.finished = 0
+        # Smoothed latency of successful queries, and the lowest it got.
+        self.latency = None
+        self.best_latency = None
+
+
+class PowerQueryLimiter:
+    """Limit how many power queries run at once, per power type.
+
+    Each power type starts out allowed `initial` queries at once. Every
+    time as many queries as that have succeeded, the limit is raised by one,
+    up to `maximum`, unless the power type's (smoothed) query latency has
+    grown beyond `overload_factor` times the best seen, in which case the
+    limit is halved instead, but not below `initial`. Failed queries, from
+    broken or unreachable BMCs, say nothing about load and are not counted.
+    """
+
+    overload_factor = 2
+    smoothing = 0.2
+
+    def __init__(
+        self,
+        initial=5,
+        maximum=50,
+        clock=reactor,
+        prometheus_metrics=PROMETHEUS_METRICS,
+    ):
+        self.initial = initial
+        self.maximum = max(initial, maximum)
+        self.clock = clock
+        self.prometheus_metrics = prometheus_metrics
+        self._slots = {}
+
+    def _get_slots(self, power_type):
+        slots = self._slots.get(power_type)
+        if slots is None:
+            slots = self._slots[power_type] = _PowerTypeSlots(self.initial)
+        return slots
+
+    def get_limit(self, power_type):
+        """Return the number of queries allowed at once for `power_type`."""
+        return self._get_slots(power_type).limit
+
+    @property
+    def waiting(self):
+        """The number of queries waiting for a slot."""
+        return sum(len(slots.waiting) for slots in self._slots.values())
+
+    def acquire(self, power_type):
+        """Wait for a slot to query a node of `power_type`.
+
+        :return: A `Deferred` that fires with a function to call when the
+            query is done, passing `succeeded=False` if it failed.
+        """
+        slots = self._get_slots(power_type)
+        d = Deferred()
+        slots.waiting.append(d)
+        self._dispatch(power_type, slots)
+        return d
+
+    def _dispatch(self, power_type, slots):
+        while len(slots.waiting) > 0 and slots.active < slots.limit:
+            slots.active += 1
+            release = partial(
+                self._release, power_type, slots, self.clock.seconds()
+            )
+            slots.waiting.popleft().callback(release)
+
+    def _release(self, power_type, slots, started, succeeded=True):
+        slots.active -= 1
+        if succeeded:
+            latency = self.clock.seconds() - started
+            self.prometheus_metrics.update(
+                "maas_rack_power_query_latency",
+                "observe",
+                value=latency,
+                labels={"power_type": power_type},
+            )
+            self._adapt(slots, latency)
+        self._dispatch(power_type, slots)
+
+    def _adapt(self, slots, latency):
+        if slots.latency is None:
+            slots.latency = latency
+        else:
+            slots.latency += self.smoothing * (latency - slots.latency)
+        if slots.best_latency is None or slots.latency < slots.best_latency:
+            slots.best_latency = slots.latency
+        slots.finished += 1
+        if slots.finished < slots.limit:
+            return
+        slots.finished = 0
+        if slots.latency > slots.best_latency * self.overload_factor:
+            slots.limit = max(self.initial, slots.limit // 2)
+        else:
+            slots.limit = min(self.maximum, slots.limit + 1)
+
+
+class PowerStateReporter:
+    """Report nodes' power states to the region in batches.
+
+    Power states are sent with `UpdateNodePowerStates` once `batch_size` of
+    them are waiting, or `delay` seconds after the first of them arrived,
+    so the region can record them all in one transaction. Regions that do
+    not know that command are sent `UpdateNodePowerState` for each node.
+    """
+
+    batch_size = 100
+    delay = 0.5
+
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self.pending = []
+        self.batched = True
+        self._delayed_flush = None
+
+    def update(self, system_id, state):
+        """Queue the power state of a node to be reported.
+
+        This can be used in place of `power_state_update`.
+
+        :return: A `Deferred` that fires once the region has recorded the
+            power state, or fails with `NoSuchNode`.
+        """
+        d = Deferred()
+        self.pending.append((system_id, state, d))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self._delayed_flush is None:
+            self._delayed_flush = self.clock.callLater(self.delay, self.flush)
+        return d
+
+    def flush(self):
+        """Report all the queued power states now.
+
+        :return: A `Deferred` that fires once they have been reported.
+        """
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+        pending, self.pending = self.pending, []
+        if len(pending) == 0:
+            return succeed(None)
+        else:
+            return self._report(pending)
+
+    @inlineCallbacks
+    def _report(self, pending):
+        if self.batched:
+            try:
+                client = getRegionClient()
+                response = yield client(
+                    UpdateNodePowerStates,
+                    power_states=[
+                        {"system_id": system_id, "power_state": state}
+                        for system_id, state, _ in pending
+                    ],
+                )
+            except UnhandledCommand:
+                # The region is older than this rack controller.
+                self.batched = False
+            except Exception:
+                failure = Failure()
+                for _, _, d in pending:
+                    d.errback(failure)
+                return
+            else:
+                missing = set(response["missing"])
+                for system_id, _, d in pending:
+                    if system_id in missing:
+                        d.errback(NoSuchNode.from_system_id(system_id))
+                    else:
+                        d.callback(None)
+                return
+        updates = []
+        for system_id, state, d in pending:
+            update = maybeDeferred(power_state_update, system_id, state)
+            update.addCallback(lambda _: None)
+            updates.append(update.chainDeferred(d))
+        yield DeferredList(updates)
@@ -31,9 +31,12 @@ __all__ = [
     "RequestNodeInfoByMACAddress",
     "SendEvent",
     "SendEventMACAddress",
+    "SendEvents",
     "UpdateInterfaces",
     "UpdateLastImageSync",
+    "UpdateLeases",
     "UpdateNodePowerState",
+    "UpdateNodePowerStates",
 ]
 
 from twisted.protocols import amp
@@ -41,6 +44,8 @@ from twisted.protocols import amp
 from provisioningserver.rpc.arguments import (
     AmpList,
     Bytes,
+    Chunked,
+    CompressedAmpList,
     ParsedURL,
     StructureAsJSON,
 )
@@ -344,6 +349,32 @@ class UpdateNodePowerState(amp.Command):
     errors = {NoSuchNode: b"NoSuchNode"}
 
 
+class UpdateNodePowerStates(amp.Command):
+    """Update the power states of many nodes at once.
+
+    :since: 2.7
+    """
+
+    arguments = [
+        (
+            b"power_states",
+            AmpList(
+                [
+                    # The node's system_id.
+                    (b"system_id", amp.Unicode()),
+                    # The node's power_state.
+                    (b"power_state", amp.Unicode()),
+                ]
+            ),
+        )
+    ]
+    response = [
+        # The system_ids of the nodes that were not found.
+        (b"missing", amp.ListOf(amp.Unicode()))
+    ]
+    errors = []
+
+
 class RegisterEventType(amp.Command):
     """Register an event type.
 
@@ -416,6 +447,38 @@ class SendEventIPAddress(amp.Command):
     errors = {NoSuchNode: b"NoSuchNode", NoSuchEventType: b"NoSuchEventType"}
 
 
+class SendEvents(amp.Command):
+    """Send many events at once.
+
+    Each event's node is given by one of its system ID, MAC address, or IP
+    address. Events for unknown nodes or event types are dropped.
+
+    :since: 2.7
+    """
+
+    arguments = [
+        (
+            b"events",
+            Chunked(
+                CompressedAmpList(
+                    [
+                        (b"system_id", amp.Unicode(optional=True)),
+                        (b"mac_address", amp.Unicode(optional=True)),
+                        (b"ip_address", amp.Unicode(optional=True)),
+                        (b"type_name", amp.Unicode()),
+                        (b"description", amp.Unicode()),
+                        # When the event happened, in seconds since the
+                        # epoch.
+                        (b"timestamp", amp.Float()),
+                    ]
+                )
+            ),
+        )
+    ]
+    response = []
+    errors = []
+
+
 class ReportForeignDHCPServer(amp.Command):
     """Report a foreign DHCP server on a rack controller's interface.
 
@@ -552,6 +615,35 @@ class UpdateLease(amp.Command):
     errors = {NoSuchCluster: b"NoSuchCluster"}
 
 
+class UpdateLeases(amp.Command):
+    """Report many DHCP lease updates from a rack controller at once.
+
+    The updates are applied in order, in one transaction.
+
+    :since: 2.7
+    """
+
+    arguments = [
+        (b"cluster_uuid", amp.Unicode()),
+        (
+            b"updates",
+            AmpList(
+                [
+                    (b"action", amp.Unicode()),
+                    (b"mac", amp.Unicode()),
+                    (b"ip_family", amp.Unicode()),
+                    (b"ip", amp.Unicode()),
+                    (b"timestamp", amp.Integer()),
+                    (b"lease_time", amp.Integer(optional=True)),
+                    (b"hostname", amp.Unicode(optional=True)),
+                ]
+            ),
+        ),
+    ]
+    response = []
+    errors = {NoSuchCluster: b"NoSuchCluster"}
+
+
 class UpdateServices(amp.Command):
     """Report service statuses that are monitored on the rackd.
 
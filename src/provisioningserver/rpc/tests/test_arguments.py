@@ -42,6 +42,40 @@ class TestBytes(MAASTestCase):
             arguments.Bytes().toString(object())
 
 
+class TestChunked(MAASTestCase):
+    def round_trip(self, argument, example):
+        strings = amp.AmpBox()
+        argument.toBox(b"thing", strings, {"thing": example}, proto=None)
+        objects = {}
+        argument.fromBox(b"thing", strings.copy(), objects, proto=None)
+        return strings, objects
+
+    def test_round_trip(self):
+        argument = arguments.Chunked(arguments.Bytes())
+        example = factory.make_bytes()
+        strings, objects = self.round_trip(argument, example)
+        self.assertEqual({b"thing": example}, strings)
+        self.assertEqual({"thing": example}, objects)
+
+    def test_round_trip_in_chunks(self):
+        argument = arguments.Chunked(arguments.Bytes())
+        example = factory.make_bytes(size=(2 * amp.MAX_VALUE_LENGTH) + 1)
+        strings, objects = self.round_trip(argument, example)
+        self.assertItemsEqual(
+            [b"thing", b"thing.1", b"thing.2"], list(strings)
+        )
+        self.assertThat(strings[b"thing.2"], HasLength(1))
+        self.assertEqual({"thing": example}, objects)
+        # The chunked box can be serialised.
+        self.assertEqual([strings], amp.parseString(strings.serialize()))
+
+    def test_round_trip_optional(self):
+        argument = arguments.Chunked(arguments.Bytes(), optional=True)
+        strings, objects = self.round_trip(argument, None)
+        self.assertEqual({}, strings)
+        self.assertEqual({"thing": None}, objects)
+
+
 class TestChoice(MAASTestCase):
     def test_round_trip(self):
         choices = {
@@ -0,0 +1,181 @@
+# Copyright 2019 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for :py:module:`~provisioningserver.rpc.boot_config`."""
+
+__all__ = []
+
+from unittest.mock import Mock
+
+import prometheus_client
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+
+from maastesting.factory import factory
+from maastesting.matchers import MockCalledOnceWith, MockNotCalled
+from maastesting.testcase import MAASTestCase
+from provisioningserver.prometheus.metrics import METRICS_DEFINITIONS
+from provisioningserver.prometheus.utils import create_metrics
+from provisioningserver.rpc.boot_config import BootConfigCache
+
+
+class TestBootConfigCache(MAASTestCase):
+    def make_cache(self):
+        self.clock = Clock()
+        self.prometheus_metrics = create_metrics(
+            METRICS_DEFINITIONS, registry=prometheus_client.CollectorRegistry()
+        )
+        return BootConfigCache(
+            clock=self.clock, prometheus_metrics=self.prometheus_metrics
+        )
+
+    def make_response(self, system_id=None):
+        return {
+            "system_id": system_id or factory.make_name("system_id"),
+            "purpose": "xinstall",
+        }
+
+    def make_fetch(self, d):
+        return Mock(side_effect=lambda: d)
+
+    def mock_fetch(self, response):
+        return self.make_fetch(succeed(response))
+
+    def get_value(self, d):
+        results = []
+        d.addCallback(results.append)
+        self.assertEqual(1, len(results))
+        return results[0]
+
+    def test_make_key_ignores_order(self):
+        self.assertEqual(
+            BootConfigCache.make_key({"mac": "mac", "arch": "amd64"}),
+            BootConfigCache.make_key({"arch": "amd64", "mac": "mac"}),
+        )
+
+    def test_get_fetches_on_miss(self):
+        cache = self.make_cache()
+        response = self.make_response()
+        fetch = self.mock_fetch(response)
+        self.assertEqual(response, self.get_value(cache.get("key", fetch)))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_returns_cached_response(self):
+        cache = self.make_cache()
+        response = self.make_response()
+        self.get_value(cache.get("key", self.mock_fetch(response)))
+        fetch = self.mock_fetch(self.make_response())
+        self.assertEqual(response, self.get_value(cache.get("key", fetch)))
+        self.assertThat(fetch, MockNotCalled())
+
+    def test_get_returns_copies(self):
+        cache = self.make_cache()
+        response = self.make_response()
+        fetch = self.mock_fetch(response)
+        self.get_value(cache.get("key", fetch)).pop("system_id")
+        self.get_value(cache.get("key", fetch)).pop("system_id")
+        self.assertEqual(response, self.get_value(cache.get("key", fetch)))
+
+    def test_get_fetches_again_after_ttl(self):
+        cache = self.make_cache()
+        self.get_value(cache.get("key", self.mock_fetch(self.make_response())))
+        self.clock.advance(cache.ttl)
+        response = self.make_response()
+        fetch = self.mock_fetch(response)
+        self.assertEqual(response, self.get_value(cache.get("key", fetch)))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_coalesces_concurrent_fetches(self):
+        cache = self.make_cache()
+        fetched = Deferred()
+        fetch = self.make_fetch(fetched)
+        d1 = cache.get("key", fetch)
+        d2 = cache.get("key", fetch)
+        response = self.make_response()
+        fetched.callback(response)
+        self.assertEqual(response, self.get_value(d1))
+        self.assertEqual(response, self.get_value(d2))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_does_not_coalesce_different_keys(self):
+        cache = self.make_cache()
+        response1 = self.make_response()
+        response2 = self.make_response()
+        d1 = cache.get("key1", self.mock_fetch(response1))
+        d2 = cache.get("key2", self.mock_fetch(response2))
+        self.assertEqual(response1, self.get_value(d1))
+        self.assertEqual(response2, self.get_value(d2))
+
+    def test_get_passes_failures_to_all_waiters(self):
+        cache = self.make_cache()
+        fetched = Deferred()
+        fetch = self.make_fetch(fetched)
+        d1 = cache.get("key", fetch)
+        d2 = cache.get("key", fetch)
+        fetched.errback(ZeroDivisionError())
+        self.assertRaises(ZeroDivisionError, self.extract_failure, d1)
+        self.assertRaises(ZeroDivisionError, self.extract_failure, d2)
+
+    def test_get_does_not_cache_failures(self):
+        cache = self.make_cache()
+        d = cache.get("key", lambda: fail(ZeroDivisionError()))
+        self.assertRaises(ZeroDivisionError, self.extract_failure, d)
+        response = self.make_response()
+        fetch = self.mock_fetch(response)
+        self.assertEqual(response, self.get_value(cache.get("key", fetch)))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_invalidate_forgets_node_responses(self):
+        cache = self.make_cache()
+        response = self.make_response()
+        other = self.make_response()
+        self.get_value(cache.get("key1", self.mock_fetch(response)))
+        self.get_value(cache.get("key2", self.mock_fetch(other)))
+        cache.invalidate(response["system_id"])
+        fetch = self.mock_fetch(response)
+        self.get_value(cache.get("key1", fetch))
+        self.assertThat(fetch, MockCalledOnceWith())
+        fetch = self.mock_fetch(other)
+        self.get_value(cache.get("key2", fetch))
+        self.assertThat(fetch, MockNotCalled())
+
+    def test_invalidate_during_fetch_prevents_caching(self):
+        cache = self.make_cache()
+        fetched = Deferred()
+        response = self.make_response()
+        d = cache.get("key", self.make_fetch(fetched))
+        cache.invalidate(response["system_id"])
+        fetched.callback(response)
+        self.assertEqual(response, self.get_value(d))
+        fetch = self.mock_fetch(response)
+        self.get_value(cache.get("key", fetch))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_clear_forgets_all_responses(self):
+        cache = self.make_cache()
+        self.get_value(cache.get("key", self.mock_fetch(self.make_response())))
+        cache.clear()
+        fetch = self.mock_fetch(self.make_response())
+        self.get_value(cache.get("key", fetch))
+        self.assertThat(fetch, MockCalledOnceWith())
+
+    def test_get_records_cache_results(self):
+        cache = self.make_cache()
+        fetched = Deferred()
+        cache.get("key", self.make_fetch(fetched))
+        cache.get("key", self.make_fetch(fetched))
+        fetched.callback(self.make_response())
+        cache.get("key", self.make_fetch(fetched))
+        metrics = self.prometheus_metrics.generate_latest().decode("ascii")
+        for result in ("hit", "miss", "coalesced"):
+            self.assertIn(
+                'maas_tftp_boot_config_requests_total{cache="%s"} 1.0'
+                % result,
+                metrics,
+            )
+
+    def extract_failure(self, d):
+        failures = []
+        d.addErrback(failures.append)
+        self.assertEqual(1, len(failures))
+        failures[0].raiseException()
@@ -10,7 +10,7 @@ from random import randint
 from unittest.mock import ANY, sentinel
 from urllib.parse import urlparse
 
-from testtools.matchers import Equals, Is
+from testtools.matchers import ContainsAll, Equals, Is
 from twisted.internet import defer
 from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.internet.task import Clock
@@ -245,7 +245,37 @@ class TestRunImport(MAASTestCase):
         fake = self.patch(boot_resources, "import_images")
         sources, _ = make_sources()
         _run_import(sources=sources, maas_url=factory.make_simple_http_url())
-        self.assertThat(fake, MockCalledOnceWith(sources))
+        self.assertThat(fake, MockCalledOnceWith(sources, peers=None))
+
+    def test__run_import_passes_peers(self):
+        fake = self.patch(boot_resources, "import_images")
+        sources, _ = make_sources()
+        peers = ["http://%s:5248/images-cache/" % factory.make_ipv4_address()]
+        _run_import(
+            sources=sources,
+            maas_url=factory.make_simple_http_url(),
+            peers=peers,
+        )
+        self.assertThat(fake, MockCalledOnceWith(sources, peers=peers))
+
+    def test__run_import_sets_proxy_for_peers(self):
+        ipv4 = factory.make_ipv4_address()
+        ipv6 = factory.make_ipv6_address()
+        peers = [
+            "http://%s:5248/images-cache/" % ipv4,
+            "http://[%s]:5248/images-cache/" % ipv6,
+        ]
+        sources, _ = make_sources()
+        fake = self.patch_boot_resources_function()
+        _run_import(
+            sources=sources,
+            maas_url=factory.make_simple_http_url(),
+            peers=peers,
+        )
+        self.assertThat(
+            fake.env["no_proxy"].split(","),
+            ContainsAll([ipv4, ipv6, "[%s]" % ipv6]),
+        )
 
     def test__run_import_calls_reload_boot_images(self):
         fake_reload = self.patch(boot_images, "reload_boot_images")
@@ -275,6 +305,7 @@ class TestImportBootImages(MAASTestCase):
                 _run_import,
                 sentinel.sources,
                 maas_url,
+                peers=None,
                 http_proxy=None,
                 https_proxy=None,
             ),
@@ -297,6 +328,7 @@ class TestImportBootImages(MAASTestCase):
                 _run_import,
                 sentinel.sources,
                 maas_url,
+                peers=None,
                 http_proxy=None,
                 https_proxy=None,
             ),
@@ -326,7 +358,9 @@ class TestImportBootImages(MAASTestCase):
         yield boot_images._import_boot_images(sentinel.sources, maas_url)
         self.assertThat(
             _run_import,
-            MockCalledOnceWith(sentinel.sources, maas_url, None, None),
+            MockCalledOnceWith(
+                sentinel.sources, maas_url, None, None, peers=None
+            ),
         )
         self.assertThat(getRegionClient, MockCalledOnceWith())
         self.assertThat(get_maas_id, MockCalledOnceWith())
@@ -347,7 +381,9 @@ class TestImportBootImages(MAASTestCase):
         yield boot_images._import_boot_images(sentinel.sources, maas_url)
         self.assertThat(
             _run_import,
-            MockCalledOnceWith(sentinel.sources, maas_url, None, None),
+            MockCalledOnceWith(
+                sentinel.sources, maas_url, None, None, peers=None
+            ),
         )
         self.assertThat(getRegionClient, MockCalledOnceWith())
         self.assertThat(get_maas_id, MockCalledOnceWith())
@@ -374,7 +410,9 @@ class TestImportBootImages(MAASTestCase):
         yield boot_images.import_boot_images(sources, maas_url)
         self.assertThat(
             boot_resources.import_images,
-            MockCalledOnceWith(fix_sources_for_cluster(sources, maas_url)),
+            MockCalledOnceWith(
+                fix_sources_for_cluster(sources, maas_url), peers=None
+            ),
         )
         self.assertThat(
             protocol.UpdateLastImageSync,
@@ -396,7 +434,9 @@ class TestImportBootImages(MAASTestCase):
         yield boot_images.import_boot_images(sources, maas_url)
         self.assertThat(
             boot_resources.import_images,
-            MockCalledOnceWith(fix_sources_for_cluster(sources, maas_url)),
+            MockCalledOnceWith(
+                fix_sources_for_cluster(sources, maas_url), peers=None
+            ),
         )
         self.assertThat(protocol.UpdateLastImageSync, MockNotCalled())
 
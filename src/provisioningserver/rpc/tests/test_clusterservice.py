@@ -355,6 +355,7 @@ class TestClusterProtocol_ImportBootImages(MAASTestCase):
                 conn_cluster.service.maas_url,
                 http_proxy=None,
                 https_proxy=None,
+                peers=None,
             ),
         )
 
@@ -386,6 +387,7 @@ class TestClusterProtocol_ImportBootImages(MAASTestCase):
                 conn_cluster.service.maas_url,
                 http_proxy=proxy,
                 https_proxy=proxy,
+                peers=None,
             ),
         )
 
@@ -2653,6 +2655,7 @@ class TestClusterProtocol_ConfigureDHCP(MAASTestCase):
                 hosts,
                 interfaces,
                 None,
+                None,
             ),
         )
 
@@ -2667,6 +2670,7 @@ class TestClusterProtocol_ConfigureDHCP(MAASTestCase):
             hosts,
             interfaces,
             global_dhcp_snippets,
+            revision,
         ):
             self.assertTrue(self.concurrency_lock.locked)
             # While we're here, check this is the IO thread.
@@ -2728,6 +2732,7 @@ class TestClusterProtocol_ConfigureDHCP(MAASTestCase):
             hosts,
             interfaces,
             global_dhcp_snippets,
+            revision,
         ):
             # Pause longer than the timeout.
             return pause(5)
@@ -2748,6 +2753,92 @@ class TestClusterProtocol_ConfigureDHCP(MAASTestCase):
             )
 
 
+class TestClusterProtocol_UpdateDHCPHosts(MAASTestCase):
+
+    scenarios = (
+        (
+            "DHCPv4",
+            {
+                "dhcp_server": dhcp.DHCPv4Server,
+                "command": cluster.UpdateDHCPv4Hosts,
+                "concurrency_lock": concurrency.dhcpv4,
+            },
+        ),
+        (
+            "DHCPv6",
+            {
+                "dhcp_server": dhcp.DHCPv6Server,
+                "command": cluster.UpdateDHCPv6Hosts,
+                "concurrency_lock": concurrency.dhcpv6,
+            },
+        ),
+    )
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def make_arguments(self):
+        return {
+            "base_revision": factory.make_name("base_revision"),
+            "revision": factory.make_name("revision"),
+            "remove": [factory.make_mac_address()],
+            "hosts": [make_host()],
+        }
+
+    def test__is_registered(self):
+        self.assertIsNotNone(
+            Cluster().locateResponder(self.command.commandName)
+        )
+
+    @inlineCallbacks
+    def test__executes_configure_hosts(self):
+        configure_hosts = self.patch_autospec(dhcp, "configure_hosts")
+        arguments = self.make_arguments()
+
+        yield call_responder(Cluster(), self.command, arguments)
+
+        self.assertThat(
+            configure_hosts,
+            MockCalledOnceWith(
+                self.dhcp_server,
+                arguments["base_revision"],
+                arguments["revision"],
+                arguments["remove"],
+                arguments["hosts"],
+            ),
+        )
+
+    @inlineCallbacks
+    def test__limits_concurrency(self):
+        def check_dhcp_locked(server_class, *args):
+            self.assertTrue(self.concurrency_lock.locked)
+
+        self.patch(dhcp, "configure_hosts", check_dhcp_locked)
+
+        self.assertFalse(self.concurrency_lock.locked)
+        yield call_responder(Cluster(), self.command, self.make_arguments())
+        self.assertFalse(self.concurrency_lock.locked)
+
+    @inlineCallbacks
+    def test__propagates_DHCPRevisionMismatch(self):
+        configure_hosts = self.patch_autospec(dhcp, "configure_hosts")
+        configure_hosts.side_effect = exceptions.DHCPRevisionMismatch()
+
+        with ExpectedException(exceptions.DHCPRevisionMismatch):
+            yield call_responder(
+                Cluster(), self.command, self.make_arguments()
+            )
+
+    @inlineCallbacks
+    def test__times_out(self):
+        self.patch(clusterservice, "DHCP_TIMEOUT", 1)
+        self.patch(dhcp, "configure_hosts", lambda *args: pause(5))
+
+        with ExpectedException(exceptions.CannotConfigureDHCP):
+            yield call_responder(
+                Cluster(), self.command, self.make_arguments()
+            )
+
+
 class TestClusterProtocol_ValidateDHCP(MAASTestCase):
 
     scenarios = (
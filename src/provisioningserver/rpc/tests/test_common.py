@@ -14,7 +14,9 @@ from testtools.matchers import Equals, Is, IsInstance, Not
 from twisted.internet.defer import Deferred
 from twisted.internet.protocol import connectionDone
 from twisted.protocols import amp
+from twisted.test import iosim
 from twisted.test.proto_helpers import StringTransport
+from zope.interface import directlyProvides
 
 from maastesting.factory import factory
 from maastesting.matchers import (
@@ -30,6 +32,7 @@ from maastesting.twisted import (
 )
 from provisioningserver.prometheus.metrics import PROMETHEUS_METRICS
 from provisioningserver.rpc import common
+from provisioningserver.rpc.interfaces import IConnection
 from provisioningserver.rpc.testing.doubles import (
     DummyConnection,
     FakeConnection,
@@ -218,6 +221,117 @@ class TestClient(MAASTestCase):
         self.assertThat(hash(conn), Equals(hash(client)))
 
 
+class Echo(amp.Command):
+    arguments = [(b"message", amp.Unicode())]
+    response = [(b"message", amp.Unicode())]
+    errors = {ZeroDivisionError: b"ZeroDivisionError"}
+
+
+class Unbatchable(amp.Command):
+    arguments = []
+    response = []
+    errors = []
+
+
+def echo(message):
+    if message == "":
+        raise ZeroDivisionError()
+    return {"message": message}
+
+
+class EchoProtocol(amp.AMP):
+    @Echo.responder
+    def echo(self, message):
+        return echo(message)
+
+
+class BatchingEchoProtocol(common.RPCProtocol):
+    @Echo.responder
+    @common.batchable
+    def echo(self, message):
+        return echo(message)
+
+    @Unbatchable.responder
+    def unbatchable(self):
+        return {}
+
+
+class TestClientCallMany(MAASTestCase):
+    def make_client(self, server):
+        protocol = common.RPCProtocol()
+        directlyProvides(protocol, IConnection)
+        self.pump = iosim.connect(
+            server,
+            iosim.makeFakeServer(server),
+            protocol,
+            iosim.makeFakeClient(protocol),
+        )
+        return common.Client(protocol)
+
+    def call_many(self, client, calls):
+        d = client.callMany(calls, _timeout=None)
+        self.pump.flush()
+        return extract_result(d)
+
+    def test_returns_results_in_order(self):
+        client = self.make_client(BatchingEchoProtocol())
+        messages = [factory.make_name("message") for _ in range(3)]
+        results = self.call_many(
+            client, [(Echo, {"message": message}) for message in messages]
+        )
+        self.assertEqual(
+            [(True, {"message": message}) for message in messages], results
+        )
+
+    def test_makes_a_single_call(self):
+        client = self.make_client(BatchingEchoProtocol())
+        callRemote = self.patch(client._conn, "callRemote")
+        callRemote.side_effect = amp.AMP.callRemote.__get__(client._conn)
+        self.call_many(
+            client, [(Echo, {"message": factory.make_name("message")})] * 3
+        )
+        self.assertThat(
+            callRemote, MockCalledOnceWith(common.MultiCommand, commands=ANY)
+        )
+
+    def test_maps_errors_for_each_call(self):
+        client = self.make_client(BatchingEchoProtocol())
+        message = factory.make_name("message")
+        results = self.call_many(
+            client,
+            [
+                (Echo, {"message": ""}),
+                (Echo, {"message": message}),
+                (Unbatchable, {}),
+            ],
+        )
+        self.assertEqual(
+            [False, True, False], [success for success, _ in results]
+        )
+        self.assertIsNotNone(results[0][1].check(ZeroDivisionError))
+        self.assertEqual({"message": message}, results[1][1])
+        self.assertIsNotNone(results[2][1].check(amp.UnhandledCommand))
+
+    def test_calls_one_at_a_time_if_batching_is_not_supported(self):
+        client = self.make_client(EchoProtocol())
+        message = factory.make_name("message")
+        results = self.call_many(
+            client, [(Echo, {"message": ""}), (Echo, {"message": message})]
+        )
+        self.assertEqual([False, True], [success for success, _ in results])
+        self.assertIsNotNone(results[0][1].check(ZeroDivisionError))
+        self.assertEqual({"message": message}, results[1][1])
+
+    def test_batch_can_exceed_maximum_value_length(self):
+        client = self.make_client(BatchingEchoProtocol())
+        message = factory.make_string(size=1000)
+        count = 2 * amp.MAX_VALUE_LENGTH // len(message)
+        results = self.call_many(
+            client, [(Echo, {"message": message})] * count
+        )
+        self.assertEqual([(True, {"message": message})] * count, results)
+
+
 class TestRPCProtocol(MAASTestCase):
     def test_init(self):
         protocol = common.RPCProtocol()
@@ -10,6 +10,7 @@ from operator import itemgetter
 from unittest.mock import ANY, call, Mock, sentinel
 
 from fixtures import FakeLogger
+from netaddr import IPAddress
 from testtools import ExpectedException
 from testtools.matchers import MatchesStructure
 from twisted.internet.defer import inlineCallbacks
@@ -32,6 +33,10 @@ from provisioningserver.dhcp.testing.config import (
     make_shared_network,
     make_subnet_dhcp_snippets,
 )
+from provisioningserver.dhcp.testing.omapi import (
+    FakeOmapiServer,
+    make_shared_key,
+)
 from provisioningserver.rpc import dhcp, exceptions
 from provisioningserver.utils.service_monitor import (
     SERVICE_STATE,
@@ -434,172 +439,164 @@ class TestDHCPState(MAASTestCase):
         )
 
 
-class TestRemoveHostMap(MAASTestCase):
-    def test_calls_omshell_remove(self):
-        omshell = Mock()
-        mac = factory.make_mac_address()
-        dhcp._remove_host_map(omshell, mac)
-        self.assertThat(omshell.remove, MockCalledOnceWith(mac))
+class TestGetOmapiClient(MAASTestCase):
+    def setUp(self):
+        super(TestGetOmapiClient, self).setUp()
+        self.addCleanup(dhcp._omapi_clients.clear)
 
-    def test_raises_error_when_omshell_crashes(self):
-        error_message = factory.make_name("error").encode("ascii")
-        omshell = Mock()
-        omshell.remove.side_effect = ExternalProcessError(
-            returncode=2, cmd=("omshell",), output=error_message
-        )
-        mac = factory.make_mac_address()
-        with FakeLogger("maas.dhcp") as logger:
-            error = self.assertRaises(
-                exceptions.CannotRemoveHostMap,
-                dhcp._remove_host_map,
-                omshell,
-                mac,
-            )
-        # The CannotRemoveHostMap exception includes a message describing the
-        # problematic mapping.
-        self.assertDocTestMatches(
-            "Could not remove host map for %s: ..." % mac, str(error)
-        )
-        # A message is also written to the maas.dhcp logger that describes the
-        # problematic mapping.
-        self.assertDocTestMatches(
-            "Could not remove host map for %s: ..." % mac, logger.output
-        )
+    def make_server(self):
+        server = Mock()
+        server.omapi_key = make_shared_key()
+        server.dhcp_service = factory.make_name("dhcpd")
+        server.ipv6 = factory.pick_bool()
+        return server
 
-    def test_raises_error_when_omshell_not_connected(self):
-        error = ExternalProcessError(returncode=2, cmd=("omshell",), output="")
-        self.patch(ExternalProcessError, "output_as_unicode", "not connected.")
-        omshell = Mock()
-        omshell.remove.side_effect = error
-        mac = factory.make_mac_address()
-        with FakeLogger("maas.dhcp") as logger:
-            error = self.assertRaises(
-                exceptions.CannotRemoveHostMap,
-                dhcp._remove_host_map,
-                omshell,
-                mac,
-            )
-        # The CannotCreateHostMap exception includes a message describing the
-        # problematic mapping.
-        self.assertDocTestMatches(
-            "Could not remove host map for %s: "
-            "The DHCP server could not be reached." % mac,
-            str(error),
+    def test__creates_client_with_correct_arguments(self):
+        server = self.make_server()
+        client = dhcp._get_omapi_client(server)
+        self.assertThat(
+            client,
+            MatchesStructure.byEquality(
+                server_address="127.0.0.1",
+                shared_key=server.omapi_key,
+                ipv6=server.ipv6,
+            ),
         )
-        # A message is also written to the maas.dhcp logger that describes the
-        # problematic mapping.
-        self.assertDocTestMatches(
-            "Could not remove host map for %s: "
-            "The DHCP server could not be reached." % mac,
-            logger.output,
+
+    def test__reuses_client(self):
+        server = self.make_server()
+        self.assertIs(
+            dhcp._get_omapi_client(server), dhcp._get_omapi_client(server)
         )
 
+    def test__replaces_client_when_key_changes(self):
+        server = self.make_server()
+        client = dhcp._get_omapi_client(server)
+        close = self.patch(client, "close")
+        server.omapi_key = make_shared_key()
+        self.assertIsNot(client, dhcp._get_omapi_client(server))
+        self.assertThat(close, MockCalledOnceWith())
+
 
-class TestCreateHostMap(MAASTestCase):
-    def test_calls_omshell_create(self):
-        omshell = Mock()
-        mac = factory.make_mac_address()
-        ip = factory.make_ip_address()
-        dhcp._create_host_map(omshell, mac, ip)
-        self.assertThat(omshell.create, MockCalledOnceWith(ip, mac))
+class TestUpdateHosts(MAASTestCase):
+    def setUp(self):
+        super(TestUpdateHosts, self).setUp()
+        self.addCleanup(dhcp._omapi_clients.clear)
+        self.server = Mock()
+        self.server.omapi_key = make_shared_key()
+        self.server.dhcp_service = factory.make_name("dhcpd")
+        self.server.ipv6 = False
+        self.omapi = self.useFixture(FakeOmapiServer(self.server.omapi_key))
+        client = dhcp.OmapiClient(
+            "127.0.0.1", self.server.omapi_key, port=self.omapi.port
+        )
+        self.addCleanup(client.close)
+        dhcp._omapi_clients[self.server.dhcp_service] = client
+
+    def make_host_map(self, host):
+        self.omapi.hosts[host["mac"].replace(":", "-")] = {
+            b"ip-address": IPAddress(host["ip"]).packed
+        }
 
-    def test_raises_error_when_omshell_crashes(self):
-        error_message = factory.make_name("error").encode("ascii")
-        omshell = Mock()
-        omshell.create.side_effect = ExternalProcessError(
-            returncode=2, cmd=("omshell",), output=error_message
+    def test__performs_operations(self):
+        remove_host = make_host()
+        modify_host = make_host()
+        add_host = make_host()
+        self.make_host_map(remove_host)
+        self.make_host_map(modify_host)
+        dhcp._update_hosts(
+            self.server, [remove_host], [add_host], [modify_host]
         )
-        mac = factory.make_mac_address()
-        ip = factory.make_ip_address()
+        self.assertEqual(
+            {
+                add_host["mac"]
+                .replace(":", "-"): IPAddress(add_host["ip"])
+                .packed,
+                modify_host["mac"]
+                .replace(":", "-"): IPAddress(modify_host["ip"])
+                .packed,
+            },
+            {
+                name: host[b"ip-address"]
+                for name, host in self.omapi.hosts.items()
+            },
+        )
+
+    def test__uses_one_connection(self):
+        for _ in range(3):
+            dhcp._update_hosts(self.server, [], [make_host()], [])
+        self.assertEqual(1, self.omapi.connections)
+
+    def test__records_latency_metrics(self):
+        prometheus_metrics = Mock()
+        add_host = make_host()
+        dhcp._update_hosts(
+            self.server,
+            [],
+            [add_host],
+            [],
+            prometheus_metrics=prometheus_metrics,
+        )
+        self.assertThat(
+            prometheus_metrics.update,
+            MockCalledOnceWith(
+                "maas_dhcp_omapi_operation_latency",
+                "observe",
+                value=ANY,
+                labels={"operation": "create"},
+            ),
+        )
+
+    def test__raises_error_after_performing_all_operations(self):
+        modify_host = make_host()
+        add_host = make_host()
         with FakeLogger("maas.dhcp") as logger:
             error = self.assertRaises(
-                exceptions.CannotCreateHostMap,
-                dhcp._create_host_map,
-                omshell,
-                mac,
-                ip,
+                exceptions.CannotModifyHostMap,
+                dhcp._update_hosts,
+                self.server,
+                [],
+                [add_host],
+                [modify_host],
             )
-        # The CannotCreateHostMap exception includes a message describing the
-        # problematic mapping.
         self.assertDocTestMatches(
-            "Could not create host map for %s -> %s: ..." % (mac, ip),
+            "Could not modify host map for %s -> %s: ..."
+            % (modify_host["mac"], modify_host["ip"]),
             str(error),
         )
-        # A message is also written to the maas.dhcp logger that describes the
-        # problematic mapping.
         self.assertDocTestMatches(
-            "Could not create host map for %s -> %s: ..." % (mac, ip),
+            "Could not modify host map for %s -> %s: ..."
+            % (modify_host["mac"], modify_host["ip"]),
             logger.output,
         )
+        self.assertItemsEqual(
+            [add_host["mac"].replace(":", "-")], list(self.omapi.hosts)
+        )
 
-    def test_raises_error_when_omshell_not_connected(self):
-        error = ExternalProcessError(returncode=2, cmd=("omshell",), output="")
-        self.patch(ExternalProcessError, "output_as_unicode", "not connected.")
-        omshell = Mock()
-        omshell.create.side_effect = error
-        mac = factory.make_mac_address()
-        ip = factory.make_ip_address()
+    def test__raises_error_when_not_connected(self):
+        remove_host = make_host()
+        pipeline = self.patch(dhcp.OmapiClient, "pipeline")
+        pipeline.side_effect = dhcp.OmapiConnectionError("refused")
         with FakeLogger("maas.dhcp") as logger:
             error = self.assertRaises(
-                exceptions.CannotCreateHostMap,
-                dhcp._create_host_map,
-                omshell,
-                mac,
-                ip,
+                exceptions.CannotRemoveHostMap,
+                dhcp._update_hosts,
+                self.server,
+                [remove_host],
+                [],
+                [],
             )
-        # The CannotCreateHostMap exception includes a message describing the
-        # problematic mapping.
         self.assertDocTestMatches(
-            "Could not create host map for %s -> %s: "
-            "The DHCP server could not be reached." % (mac, ip),
+            "Could not remove host map for %s: "
+            "The DHCP server could not be reached." % remove_host["mac"],
             str(error),
         )
-        # A message is also written to the maas.dhcp logger that describes the
-        # problematic mapping.
         self.assertDocTestMatches(
-            "Could not create host map for %s -> %s: "
-            "The DHCP server could not be reached." % (mac, ip),
+            "Could not remove host map for %s: "
+            "The DHCP server could not be reached." % remove_host["mac"],
             logger.output,
         )
-
-
-class TestUpdateHost(MAASTestCase):
-    def test__creates_omshell_with_correct_arguments(self):
-        omshell = self.patch(dhcp, "Omshell")
-        server = Mock()
-        server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [], [], [])
-        self.assertThat(
-            omshell,
-            MockCallsMatch(
-                call(
-                    ipv6=server.ipv6,
-                    server_address="127.0.0.1",
-                    shared_key=server.omapi_key,
-                )
-            ),
-        )
-
-    def test__performs_operations(self):
-        omshell = Mock()
-        self.patch(dhcp, "Omshell").return_value = omshell
-        remove_host = make_host()
-        add_host = make_host()
-        modify_host = make_host()
-        server = Mock()
-        server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [remove_host], [add_host], [modify_host])
-        self.assertThat(
-            omshell.remove, MockCallsMatch(call(remove_host["mac"]))
-        )
-        self.assertThat(
-            omshell.create,
-            MockCallsMatch(call(add_host["ip"], add_host["mac"])),
-        )
-        self.assertThat(
-            omshell.modify,
-            MockCallsMatch(call(modify_host["ip"], modify_host["mac"])),
-        )
+        self.assertEqual({}, dhcp._omapi_clients)
 
 
 class TestConfigureDHCP(MAASTestCase):
@@ -619,6 +616,7 @@ class TestConfigureDHCP(MAASTestCase):
         self.addCleanup(dhcp.service_monitor.getServiceByName("dhcpd6").off)
         # The dhcp server states are global so we clean them after each test.
         self.addCleanup(dhcp._current_server_state.clear)
+        self.addCleanup(dhcp._current_server_revision.clear)
         # Temporarily prevent hostname resolution when generating DHCP
         # configuration. This is tested elsewhere.
         self.useFixture(DHCPConfigNameResolutionDisabled())
@@ -631,6 +629,7 @@ class TestConfigureDHCP(MAASTestCase):
         hosts,
         interfaces,
         dhcp_snippets,
+        revision=None,
     ):
         server = self.server(omapi_key)
         return dhcp.configure(
@@ -640,6 +639,7 @@ class TestConfigureDHCP(MAASTestCase):
             hosts,
             interfaces,
             dhcp_snippets,
+            revision,
         )
 
     def patch_os_exists(self):
@@ -1207,6 +1207,71 @@ class TestConfigureDHCP(MAASTestCase):
             logger.output,
         )
 
+    @inlineCallbacks
+    def test__records_revision_once_configured(self):
+        self.patch_sudo_write_file()
+        self.patch_restartService()
+        self.patch_get_config().return_value = factory.make_name("config")
+        failover_peers = [make_failover_peer_config()]
+        shared_networks = fix_shared_networks_failover(
+            [make_shared_network()], failover_peers
+        )
+        revision = factory.make_name("revision")
+        yield self.configure(
+            factory.make_name("key"),
+            failover_peers,
+            shared_networks,
+            [make_host()],
+            [make_interface()],
+            make_global_dhcp_snippets(),
+            revision,
+        )
+        self.assertEqual(
+            revision, dhcp._current_server_revision[self.server.dhcp_service]
+        )
+
+    @inlineCallbacks
+    def test__forgets_revision_when_configuration_fails(self):
+        dhcp._current_server_revision[
+            self.server.dhcp_service
+        ] = factory.make_name("revision")
+        self.patch_sudo_write_file().side_effect = ExternalProcessError(
+            1, "sudo something"
+        )
+        failover_peers = [make_failover_peer_config()]
+        shared_networks = fix_shared_networks_failover(
+            [make_shared_network()], failover_peers
+        )
+        with ExpectedException(exceptions.CannotConfigureDHCP):
+            yield self.configure(
+                factory.make_name("key"),
+                failover_peers,
+                shared_networks,
+                [make_host()],
+                [make_interface()],
+                make_global_dhcp_snippets(),
+                factory.make_name("revision"),
+            )
+        self.assertNotIn(
+            self.server.dhcp_service, dhcp._current_server_revision
+        )
+
+    @inlineCallbacks
+    def test__forgets_revision_when_stopping(self):
+        dhcp._current_server_revision[
+            self.server.dhcp_service
+        ] = factory.make_name("revision")
+        self.patch_os_exists().return_value = False
+        dhcp_service = dhcp.service_monitor.getServiceByName(
+            self.server.dhcp_service
+        )
+        self.patch_autospec(dhcp_service, "off")
+        self.patch_ensureService()
+        yield self.configure(factory.make_name("key"), [], [], [], [], [])
+        self.assertNotIn(
+            self.server.dhcp_service, dhcp._current_server_revision
+        )
+
     @inlineCallbacks
     def test__converts_failure_writing_file_to_CannotConfigureDHCP(self):
         self.patch_sudo_delete_file()
@@ -1330,6 +1395,97 @@ class TestConfigureDHCP(MAASTestCase):
         )
 
 
+class TestConfigureHosts(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    scenarios = (
+        ("DHCPv4", {"server": dhcp.DHCPv4Server}),
+        ("DHCPv6", {"server": dhcp.DHCPv6Server}),
+    )
+
+    def setUp(self):
+        super(TestConfigureHosts, self).setUp()
+        self.addCleanup(dhcp._current_server_state.clear)
+        self.addCleanup(dhcp._current_server_revision.clear)
+        self.configure = self.patch_autospec(dhcp, "configure")
+
+    def make_current_state(self, hosts):
+        failover_peers = [make_failover_peer_config()]
+        state = dhcp.DHCPState(
+            factory.make_name("omapi_key"),
+            failover_peers,
+            fix_shared_networks_failover(
+                [make_shared_network()], failover_peers
+            ),
+            hosts,
+            [make_interface()],
+            make_global_dhcp_snippets(),
+        )
+        revision = factory.make_name("revision")
+        dhcp._current_server_state[self.server.dhcp_service] = state
+        dhcp._current_server_revision[self.server.dhcp_service] = revision
+        return state, revision
+
+    def test__raises_DHCPRevisionMismatch_without_current_state(self):
+        self.assertRaises(
+            exceptions.DHCPRevisionMismatch,
+            dhcp.configure_hosts,
+            self.server,
+            factory.make_name("base_revision"),
+            factory.make_name("revision"),
+            [],
+            [make_host()],
+        )
+        self.assertThat(self.configure, MockNotCalled())
+
+    def test__raises_DHCPRevisionMismatch_for_other_revision(self):
+        self.make_current_state([make_host()])
+        self.assertRaises(
+            exceptions.DHCPRevisionMismatch,
+            dhcp.configure_hosts,
+            self.server,
+            factory.make_name("base_revision"),
+            factory.make_name("revision"),
+            [],
+            [make_host()],
+        )
+        self.assertThat(self.configure, MockNotCalled())
+
+    def test__configures_with_changed_hosts(self):
+        removed_host, modified_host, kept_host = [make_host() for _ in "123"]
+        state, base_revision = self.make_current_state(
+            [removed_host, modified_host, kept_host]
+        )
+        modified_host = dict(modified_host, ip=factory.make_ip_address())
+        added_host = make_host()
+        revision = factory.make_name("revision")
+
+        dhcp.configure_hosts(
+            self.server,
+            base_revision,
+            revision,
+            [removed_host["mac"]],
+            [modified_host, added_host],
+        )
+
+        self.assertThat(
+            self.configure,
+            MockCalledOnceWith(
+                ANY,
+                state.failover_peers,
+                state.shared_networks,
+                [modified_host, kept_host, added_host],
+                [{"name": name} for name in state.interfaces],
+                state.global_dhcp_snippets,
+                revision,
+            ),
+        )
+        [server, *_], _ = self.configure.call_args
+        self.assertIsInstance(server, self.server)
+        self.assertEqual(state.omapi_key, server.omapi_key)
+
+
 class TestValidateDHCP(MAASTestCase):
 
     scenarios = (
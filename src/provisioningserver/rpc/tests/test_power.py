@@ -7,7 +7,7 @@ __all__ = []
 
 import logging
 import random
-from unittest.mock import ANY, call, MagicMock, sentinel
+from unittest.mock import ANY, call, MagicMock, Mock, sentinel
 
 from fixtures import FakeLogger
 from testtools import ExpectedException
@@ -23,6 +23,7 @@ from twisted.internet.defer import (
     succeed,
 )
 from twisted.internet.task import Clock
+from twisted.protocols.amp import UnhandledCommand
 from twisted.python.failure import Failure
 
 from maastesting.factory import factory
@@ -57,7 +58,9 @@ from provisioningserver.testing.events import EventTypesAllRegistered
 def suppress_reporting(test):
     # Skip telling the region; just pass-through the query result.
     report_power_state = test.patch(power, "report_power_state")
-    report_power_state.side_effect = lambda d, system_id, hostname: d
+    report_power_state.side_effect = (
+        lambda d, system_id, hostname, update=None: d
+    )
 
 
 class TestPowerHelpers(MAASTestCase):
@@ -1091,7 +1094,7 @@ class TestPowerQueryAsync(MAASTestCase):
         get_power_state = self.patch(power, "get_power_state")
         get_power_state.side_effect = queries
         report_power_state = self.patch(power, "report_power_state")
-        report_power_state.side_effect = lambda d, sid, hn: d
+        report_power_state.side_effect = lambda d, sid, hn, update: d
 
         yield power.query_all_nodes(nodes)
         self.assertThat(
@@ -1113,7 +1116,7 @@ class TestPowerQueryAsync(MAASTestCase):
             report_power_state,
             MockCallsMatch(
                 *(
-                    call(query, node["system_id"], node["hostname"])
+                    call(query, node["system_id"], node["hostname"], None)
                     for query, node in zip(queries, nodes)
                 )
             ),
@@ -1309,3 +1312,290 @@ class TestPowerQueryAsync(MAASTestCase):
             [(True, node1["power_state"]), (True, node2["power_state"])],
             results,
         )
+
+    def make_grouped_nodes(self, count=3):
+        credentials = {
+            "power_driver": "LAN_2_0",
+            "power_user": factory.make_name("power_user"),
+            "power_pass": factory.make_name("power_pass"),
+        }
+        nodes = []
+        for _ in range(count):
+            node = self.make_node(power_type="ipmi")
+            node["context"] = dict(
+                credentials, power_address=factory.make_ipv4_address()
+            )
+            nodes.append(node)
+        return nodes
+
+    def patch_power_query_group(self):
+        self.patch(power, "deferToThread", maybeDeferred)
+        return self.patch(PowerDriverRegistry["ipmi"], "power_query_group")
+
+    @inlineCallbacks
+    def test_query_all_nodes_queries_grouped_nodes_together(self):
+        nodes = self.make_grouped_nodes()
+        power_states = [random.choice(["on", "off"]) for _ in nodes]
+        power_query_group = self.patch_power_query_group()
+        power_query_group.return_value = power_states
+        get_power_state = self.patch(power, "get_power_state")
+        report_power_state = self.patch(power, "report_power_state")
+        report_power_state.side_effect = lambda d, sid, hn, update: d
+
+        yield power.query_all_nodes(nodes)
+        self.assertThat(
+            power_query_group,
+            MockCalledOnceWith([node["context"] for node in nodes]),
+        )
+        self.assertThat(get_power_state, MockNotCalled())
+        self.assertThat(
+            report_power_state,
+            MockCallsMatch(
+                *(
+                    call(ANY, node["system_id"], node["hostname"], None)
+                    for node in nodes
+                )
+            ),
+        )
+        self.assertEqual(
+            power_states,
+            [
+                extract_result(c[0][0])
+                for c in report_power_state.call_args_list
+            ],
+        )
+
+    @inlineCallbacks
+    def test_query_all_nodes_splits_groups_by_size(self):
+        nodes = self.make_grouped_nodes(5)
+        self.patch(PowerDriverRegistry["ipmi"], "power_query_group_size", 2)
+        power_query_group = self.patch_power_query_group()
+        power_query_group.side_effect = lambda contexts: ["on"] * len(contexts)
+        get_power_state = self.patch(power, "get_power_state")
+        get_power_state.return_value = succeed("on")
+        suppress_reporting(self)
+
+        yield power.query_all_nodes(nodes)
+        self.assertThat(
+            power_query_group,
+            MockCallsMatch(
+                call([node["context"] for node in nodes[:2]]),
+                call([node["context"] for node in nodes[2:4]]),
+            ),
+        )
+        # The one left over is queried on its own.
+        self.assertThat(
+            get_power_state,
+            MockCalledOnceWith(
+                nodes[4]["system_id"],
+                nodes[4]["hostname"],
+                "ipmi",
+                nodes[4]["context"],
+                clock=reactor,
+            ),
+        )
+
+    @inlineCallbacks
+    def test_query_all_nodes_queries_nodes_without_group_state_alone(self):
+        nodes = self.make_grouped_nodes(2)
+        power_query_group = self.patch_power_query_group()
+        power_query_group.return_value = [None, "on"]
+        get_power_state = self.patch(power, "get_power_state")
+        get_power_state.return_value = succeed("off")
+        suppress_reporting(self)
+
+        results = yield power.query_all_nodes(nodes)
+        self.assertThat(
+            get_power_state,
+            MockCalledOnceWith(
+                nodes[0]["system_id"],
+                nodes[0]["hostname"],
+                "ipmi",
+                nodes[0]["context"],
+                clock=reactor,
+            ),
+        )
+        [(success, group_results)] = results
+        self.assertTrue(success)
+        self.assertEqual([(True, "off"), (True, "on")], group_results)
+
+    @inlineCallbacks
+    def test_query_all_nodes_queries_nodes_alone_when_group_fails(self):
+        nodes = self.make_grouped_nodes(2)
+        power_query_group = self.patch_power_query_group()
+        power_query_group.side_effect = factory.make_exception()
+        get_power_state = self.patch(power, "get_power_state")
+        get_power_state.return_value = succeed("off")
+        suppress_reporting(self)
+
+        with TwistedLoggerFixture():
+            yield power.query_all_nodes(nodes)
+        self.assertThat(
+            get_power_state,
+            MockCallsMatch(
+                *(
+                    call(
+                        node["system_id"],
+                        node["hostname"],
+                        "ipmi",
+                        node["context"],
+                        clock=reactor,
+                    )
+                    for node in nodes
+                )
+            ),
+        )
+
+    @inlineCallbacks
+    def test_query_all_nodes_skips_grouped_nodes_in_action_registry(self):
+        nodes = self.make_grouped_nodes()
+        power.power_action_registry[nodes[0]["system_id"]] = sentinel.action
+        self.addCleanup(power.power_action_registry.clear)
+        power_query_group = self.patch_power_query_group()
+        power_query_group.return_value = ["on", "on"]
+        suppress_reporting(self)
+
+        yield power.query_all_nodes(nodes)
+        self.assertThat(
+            power_query_group,
+            MockCalledOnceWith([node["context"] for node in nodes[1:]]),
+        )
+
+
+class TestPowerQueryLimiter(MAASTestCase):
+    def make_limiter(self, initial=2, maximum=4):
+        self.clock = Clock()
+        self.prometheus_metrics = Mock()
+        return power.PowerQueryLimiter(
+            initial=initial,
+            maximum=maximum,
+            clock=self.clock,
+            prometheus_metrics=self.prometheus_metrics,
+        )
+
+    def test_limits_queries_per_power_type(self):
+        limiter = self.make_limiter()
+        ipmi = [limiter.acquire("ipmi") for _ in range(3)]
+        virsh = limiter.acquire("virsh")
+        self.assertEqual([True, True, False], [d.called for d in ipmi])
+        self.assertTrue(virsh.called)
+        self.assertEqual(1, limiter.waiting)
+        extract_result(ipmi[0])(succeeded=False)
+        self.assertTrue(ipmi[2].called)
+        self.assertEqual(0, limiter.waiting)
+
+    def test_raises_limit_while_latency_is_steady(self):
+        limiter = self.make_limiter()
+        for _ in range(4):
+            release = extract_result(limiter.acquire("ipmi"))
+            self.clock.advance(1)
+            release()
+        self.assertEqual(3, limiter.get_limit("ipmi"))
+        self.assertEqual(2, limiter.get_limit("virsh"))
+
+    def test_does_not_raise_limit_beyond_maximum(self):
+        limiter = self.make_limiter()
+        for _ in range(20):
+            extract_result(limiter.acquire("ipmi"))()
+        self.assertEqual(4, limiter.get_limit("ipmi"))
+
+    def test_lowers_limit_when_latency_grows(self):
+        limiter = self.make_limiter(maximum=8)
+        for _ in range(10):
+            release = extract_result(limiter.acquire("ipmi"))
+            self.clock.advance(1)
+            release()
+        self.assertEqual(5, limiter.get_limit("ipmi"))
+        for _ in range(10):
+            release = extract_result(limiter.acquire("ipmi"))
+            self.clock.advance(10)
+            release()
+        self.assertEqual(2, limiter.get_limit("ipmi"))
+
+    def test_ignores_failed_queries(self):
+        limiter = self.make_limiter()
+        for _ in range(10):
+            release = extract_result(limiter.acquire("ipmi"))
+            self.clock.advance(60)
+            release(succeeded=False)
+        self.assertEqual(2, limiter.get_limit("ipmi"))
+        self.assertThat(self.prometheus_metrics.update, MockNotCalled())
+
+    def test_records_latency_metrics(self):
+        limiter = self.make_limiter()
+        release = extract_result(limiter.acquire("ipmi"))
+        self.clock.advance(3)
+        release()
+        self.assertThat(
+            self.prometheus_metrics.update,
+            MockCalledOnceWith(
+                "maas_rack_power_query_latency",
+                "observe",
+                value=3,
+                labels={"power_type": "ipmi"},
+            ),
+        )
+
+
+class TestPowerStateReporter(MAASTestCase):
+    def setUp(self):
+        super(TestPowerStateReporter, self).setUp()
+        self.client = Mock(return_value=succeed({"missing": []}))
+        self.patch(power, "getRegionClient").return_value = self.client
+        self.clock = Clock()
+        self.reporter = power.PowerStateReporter(self.clock)
+
+    def test_sends_power_states_together_after_delay(self):
+        system_ids = [factory.make_name("system_id") for _ in range(3)]
+        updates = [
+            self.reporter.update(system_id, "on") for system_id in system_ids
+        ]
+        self.assertThat(self.client, MockNotCalled())
+        self.clock.advance(self.reporter.delay)
+        self.assertThat(
+            self.client,
+            MockCalledOnceWith(
+                region.UpdateNodePowerStates,
+                power_states=[
+                    {"system_id": system_id, "power_state": "on"}
+                    for system_id in system_ids
+                ],
+            ),
+        )
+        self.assertEqual([None] * 3, [extract_result(d) for d in updates])
+
+    def test_sends_full_batch_at_once(self):
+        self.reporter.batch_size = 2
+        self.reporter.update(factory.make_name("system_id"), "on")
+        self.reporter.update(factory.make_name("system_id"), "off")
+        self.assertThat(self.client, MockCalledOnceWith(ANY, power_states=ANY))
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_fails_updates_for_missing_nodes(self):
+        system_id = factory.make_name("system_id")
+        self.client.return_value = succeed({"missing": [system_id]})
+        d = self.reporter.update(system_id, "on")
+        self.reporter.flush()
+        self.assertRaises(exceptions.NoSuchNode, extract_result, d)
+
+    def test_fails_updates_when_region_call_fails(self):
+        self.client.return_value = fail(ZeroDivisionError())
+        d = self.reporter.update(factory.make_name("system_id"), "on")
+        self.reporter.flush()
+        self.assertRaises(ZeroDivisionError, extract_result, d)
+
+    def test_falls_back_to_UpdateNodePowerState(self):
+        self.client.return_value = fail(UnhandledCommand())
+        power_state_update = self.patch(power, "power_state_update")
+        power_state_update.return_value = succeed({})
+        system_id = factory.make_name("system_id")
+        d = self.reporter.update(system_id, "off")
+        self.reporter.flush()
+        self.assertIsNone(extract_result(d))
+        self.assertFalse(self.reporter.batched)
+        self.assertThat(
+            power_state_update, MockCalledOnceWith(system_id, "off")
+        )
+        self.reporter.update(system_id, "on")
+        self.reporter.flush()
+        self.assertThat(self.client, MockCalledOnceWith(ANY, power_states=ANY))
@@ -5,24 +5,32 @@
 
 __all__ = []
 
+import json
+import os
 import random
-from unittest.mock import ANY, sentinel
+from unittest.mock import ANY, call, Mock, sentinel
 
 from testtools import ExpectedException
 from testtools.matchers import AllMatch, Equals, HasLength, Is, IsInstance
 from twisted.internet.defer import fail, inlineCallbacks, succeed
+from twisted.internet.task import Clock, deferLater
+from twisted.protocols.amp import UnhandledCommand
 
 from maastesting.factory import factory
 from maastesting.matchers import (
     MockCalledOnce,
     MockCalledOnceWith,
+    MockCallsMatch,
     MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase, MAASTwistedRunTest
+from maastesting.twisted import extract_result, TwistedLoggerFixture
+from provisioningserver import events
 from provisioningserver.events import (
     EVENT_DETAILS,
     EVENT_TYPES,
     EventDetail,
+    NodeEventBuffer,
     nodeEventHub,
     NodeEventHub,
     send_node_event,
@@ -31,7 +39,11 @@ from provisioningserver.events import (
     send_rack_event,
 )
 from provisioningserver.rpc import region
-from provisioningserver.rpc.exceptions import NoSuchEventType, NoSuchNode
+from provisioningserver.rpc.exceptions import (
+    NoConnectionsAvailable,
+    NoSuchEventType,
+    NoSuchNode,
+)
 from provisioningserver.rpc.testing import MockLiveClusterToRegionRPCFixture
 from provisioningserver.utils.enum import map_enum
 from provisioningserver.utils.testing import MAASIDFixture
@@ -439,3 +451,197 @@ class TestSendEventIPAddress(MAASTestCase):
             yield event_hub.logByIP(event_name, ip_address, description)
         # The event has been removed from the cache.
         self.assertThat(event_hub._types_registered, HasLength(0))
+
+
+class TestNodeEventBuffer(MAASTestCase):
+    """Tests for `NodeEventBuffer`."""
+
+    def setUp(self):
+        super(TestNodeEventBuffer, self).setUp()
+        self.clock = Clock()
+        self.clock.advance(random.randint(1, 1000000))
+        self.hub = NodeEventHub()
+        self.hub._types_registered.update(EVENT_DETAILS)
+        self.client = Mock(side_effect=lambda cmd, **kwargs: succeed({}))
+        self.getRegionClient = self.patch(events, "getRegionClient")
+        self.getRegionClient.return_value = self.client
+        self.spool_dir = os.path.join(self.make_dir(), "spool")
+        self.buffer = NodeEventBuffer(self.spool_dir, self.hub, self.clock)
+        self.hub.buffer = self.buffer
+
+    def log_event(self):
+        event = {
+            "system_id": factory.make_name("system_id"),
+            "type_name": random.choice(list(map_enum(EVENT_TYPES))),
+            "description": factory.make_name("description"),
+            "timestamp": self.clock.seconds(),
+        }
+        d = self.hub.logByID(
+            event["type_name"], event["system_id"], event["description"]
+        )
+        self.assertIsNone(extract_result(d))
+        return event
+
+    def read_spool(self):
+        spooled = []
+        for filename in sorted(os.listdir(self.spool_dir)):
+            with open(os.path.join(self.spool_dir, filename)) as fd:
+                spooled.append(json.load(fd))
+        return spooled
+
+    def test_logByID_queues_event(self):
+        event = self.log_event()
+        self.assertEqual([event], self.buffer.pending)
+        self.assertThat(self.client, MockNotCalled())
+
+    def test_logByMAC_queues_event(self):
+        mac_address = factory.make_mac_address()
+        self.hub.logByMAC(EVENT_TYPES.NODE_PXE_REQUEST, mac_address, "")
+        self.assertEqual(
+            [
+                {
+                    "mac_address": mac_address,
+                    "type_name": EVENT_TYPES.NODE_PXE_REQUEST,
+                    "description": "",
+                    "timestamp": self.clock.seconds(),
+                }
+            ],
+            self.buffer.pending,
+        )
+
+    def test_logByIP_queues_event(self):
+        ip_address = factory.make_ip_address()
+        self.hub.logByIP(EVENT_TYPES.NODE_TFTP_REQUEST, ip_address, "")
+        self.assertEqual(
+            [
+                {
+                    "ip_address": ip_address,
+                    "type_name": EVENT_TYPES.NODE_TFTP_REQUEST,
+                    "description": "",
+                    "timestamp": self.clock.seconds(),
+                }
+            ],
+            self.buffer.pending,
+        )
+
+    def test_sends_events_after_delay(self):
+        logged = [self.log_event() for _ in range(3)]
+        self.clock.advance(self.buffer.delay)
+        self.assertThat(
+            self.client, MockCalledOnceWith(region.SendEvents, events=logged)
+        )
+        self.assertEqual([], self.buffer.pending)
+
+    def test_sends_events_once_batch_is_full(self):
+        self.buffer.batch_size = 2
+        logged = [self.log_event() for _ in range(2)]
+        self.assertThat(
+            self.client, MockCalledOnceWith(region.SendEvents, events=logged)
+        )
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_registers_event_types_first(self):
+        self.hub._types_registered.clear()
+        # The hub expects the region to answer asynchronously.
+        self.client.side_effect = lambda cmd, **kwargs: deferLater(
+            self.clock, 0, dict
+        )
+        event = self.log_event()
+        d = self.buffer.flush()
+        self.clock.advance(0)
+        self.clock.advance(0)
+        extract_result(d)
+        self.assertThat(
+            self.client,
+            MockCallsMatch(
+                call(
+                    region.RegisterEventType,
+                    name=event["type_name"],
+                    description=EVENT_DETAILS[event["type_name"]].description,
+                    level=EVENT_DETAILS[event["type_name"]].level,
+                ),
+                call(region.SendEvents, events=[event]),
+            ),
+        )
+
+    def test_spools_events_if_region_not_available(self):
+        self.getRegionClient.side_effect = NoConnectionsAvailable()
+        logged = [self.log_event() for _ in range(3)]
+        extract_result(self.buffer.flush())
+        self.assertEqual([logged], self.read_spool())
+
+    def test_spools_events_if_sending_fails(self):
+        self.client.side_effect = lambda cmd, **kwargs: fail(
+            ZeroDivisionError()
+        )
+        event = self.log_event()
+        with TwistedLoggerFixture() as logger:
+            extract_result(self.buffer.flush())
+        self.assertEqual([[event]], self.read_spool())
+        self.assertIn("Failed to send node events", logger.output)
+
+    def test_sends_spooled_events_first(self):
+        self.getRegionClient.side_effect = NoConnectionsAvailable()
+        first = [self.log_event()]
+        extract_result(self.buffer.flush())
+        second = [self.log_event()]
+        extract_result(self.buffer.flush())
+        self.getRegionClient.side_effect = None
+        third = [self.log_event()]
+        extract_result(self.buffer.flush())
+        self.assertThat(
+            self.client,
+            MockCallsMatch(
+                call(region.SendEvents, events=first),
+                call(region.SendEvents, events=second),
+                call(region.SendEvents, events=third),
+            ),
+        )
+        self.assertEqual([], self.read_spool())
+
+    def test_keeps_spooled_events_until_sent(self):
+        self.getRegionClient.side_effect = NoConnectionsAvailable()
+        logged = [self.log_event()]
+        extract_result(self.buffer.flush())
+        extract_result(self.buffer.flush())
+        self.assertEqual([logged], self.read_spool())
+
+    def test_discards_oldest_spooled_events(self):
+        self.buffer.spool_limit = 2
+        self.getRegionClient.side_effect = NoConnectionsAvailable()
+        batches = []
+        for _ in range(3):
+            batches.append([self.log_event()])
+            extract_result(self.buffer.flush())
+        self.assertEqual(batches[1:], self.read_spool())
+
+    def test_sends_events_one_at_a_time_to_older_regions(self):
+        self.client.side_effect = [
+            fail(UnhandledCommand()),
+            succeed({}),
+            succeed({}),
+        ]
+        system_id = factory.make_name("system_id")
+        mac_address = factory.make_mac_address()
+        self.hub.logByID(EVENT_TYPES.NODE_POWERED_ON, system_id, "on")
+        self.hub.logByMAC(EVENT_TYPES.NODE_PXE_REQUEST, mac_address, "")
+        extract_result(self.buffer.flush())
+        self.assertThat(
+            self.client,
+            MockCallsMatch(
+                call(region.SendEvents, events=ANY),
+                call(
+                    region.SendEvent,
+                    system_id=system_id,
+                    type_name=EVENT_TYPES.NODE_POWERED_ON,
+                    description="on",
+                ),
+                call(
+                    region.SendEventMACAddress,
+                    mac_address=mac_address,
+                    type_name=EVENT_TYPES.NODE_PXE_REQUEST,
+                    description="",
+                ),
+            ),
+        )
+        self.assertFalse(self.buffer.batched)
@@ -46,6 +46,9 @@ from provisioningserver.rackdservices.lease_socket_service import (
 from provisioningserver.rackdservices.networks_monitoring_service import (
     RackNetworksMonitoringService,
 )
+from provisioningserver.rackdservices.node_event_buffer_service import (
+    NodeEventBufferService,
+)
 from provisioningserver.rackdservices.node_power_monitor_service import (
     NodePowerMonitorService,
 )
@@ -111,6 +114,7 @@ class TestProvisioningServiceMaker(MAASTestCase):
             "image_download",
             "lease_socket_service",
             "node_monitor",
+            "node_event_buffer",
             "external",
             "rpc",
             "rpc-ping",
@@ -150,6 +154,7 @@ class TestProvisioningServiceMaker(MAASTestCase):
             "image_download",
             "lease_socket_service",
             "node_monitor",
+            "node_event_buffer",
             "external",
             "rpc",
             "rpc-ping",
@@ -223,6 +228,13 @@ class TestProvisioningServiceMaker(MAASTestCase):
         node_monitor = service.getServiceNamed("node_monitor")
         self.assertIsInstance(node_monitor, NodePowerMonitorService)
 
+    def test_node_event_buffer_service(self):
+        options = Options()
+        service_maker = ProvisioningServiceMaker("Harry", "Hill")
+        service = service_maker.makeService(options, clock=None)
+        node_event_buffer = service.getServiceNamed("node_event_buffer")
+        self.assertIsInstance(node_event_buffer, NodeEventBufferService)
+
     def test_networks_monitor_service(self):
         options = Options()
         service_maker = ProvisioningServiceMaker("Spike", "Milligan")
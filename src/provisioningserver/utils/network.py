@@ -19,8 +19,10 @@ __all__ = [
     "ip_range_within_network",
 ]
 
+from bisect import bisect_left, bisect_right
 import codecs
 from collections import namedtuple
+from heapq import merge
 from operator import attrgetter
 import random
 import re
@@ -397,6 +399,13 @@ class IPRangeStatistics:
 
 
 class MAASIPSet(set):
+    """A set of `MAASIPRange` objects.
+
+    The ranges are kept in `ranges` as a sorted list of non-overlapping
+    ranges, alongside lists of their first and last addresses, so that
+    lookups can bisect rather than scan the list.
+    """
+
     def __init__(self, ranges, cidr=None):
         self.cidr = cidr
         self.ranges = ranges
@@ -413,14 +422,35 @@ class MAASIPSet(set):
         self.ranges = _normalize_ipranges(self.ranges)
         self.ranges = _combine_overlapping_maasipranges(self.ranges)
         self.ranges = _coalesce_adjacent_purposes(self.ranges)
+        self._firsts = [item.first for item in self.ranges]
+        self._lasts = [item.last for item in self.ranges]
 
     def __ior__(self, other):
-        """Return self |= other."""
-        self.ranges.extend(list(other.ranges))
-        self._condense()
-        # Replace the underlying set with the new ranges.
-        super().clear()
-        super().__ior__(set(self.ranges))
+        """Return self |= other.
+
+        Only the ranges that overlap or adjoin the span of `other` can
+        change, so only those are merged with the ranges of `other`.
+        """
+        if not isinstance(other, MAASIPSet):
+            other = MAASIPSet(other)
+        if len(other.ranges) == 0:
+            return self
+        # Take one more range on either side: combining ranges may leave
+        # them adjacent to a range with an identical purpose.
+        start = max(bisect_left(self._lasts, other.first - 1) - 1, 0)
+        end = min(
+            bisect_right(self._firsts, other.last + 1) + 1, len(self.ranges)
+        )
+        replaced = self.ranges[start:end]
+        merged = _coalesce_adjacent_purposes(
+            _combine_overlapping_maasipranges(merge(replaced, other.ranges))
+        )
+        self.ranges[start:end] = merged
+        self._firsts[start:end] = [item.first for item in merged]
+        self._lasts[start:end] = [item.last for item in merged]
+        # Replace the old ranges in the underlying set with the new ones.
+        super().difference_update(replaced)
+        super().update(merged)
         return self
 
     def find(self, search) -> Optional[MAASIPRange]:
@@ -431,18 +461,14 @@ class MAASIPSet(set):
         within that range.)
         """
         if isinstance(search, IPRange):
-            for item in self.ranges:
-                if (
-                    item.first <= search.first <= item.last
-                    and item.first <= search.last <= item.last
-                ):
-                    return item
+            first, last = search.first, search.last
         else:
-            addr = IPAddress(search)
-            addr = int(addr)
-            for item in self.ranges:
-                if item.first <= addr <= item.last:
-                    return item
+            first = last = int(IPAddress(search))
+        # The ranges do not overlap, so only the last range starting at or
+        # before `first` can contain it.
+        index = bisect_right(self._firsts, first) - 1
+        if index >= 0 and last <= self._lasts[index]:
+            return self.ranges[index]
         return None
 
     @property
@@ -534,7 +560,7 @@ class MAASIPSet(set):
         return self.find(item)
 
     def __contains__(self, item):
-        return bool(self.find(item))
+        return self.find(item) is not None
 
     def get_unused_ranges(
         self, outer_range: OuterRange, purpose=IPRANGE_TYPE.UNUSED
@@ -564,10 +590,21 @@ class MAASIPSet(set):
         else:
             # Otherwise, assume the first address is the start of the range
             start = outer_range.first
+        # Skip the broadcast address, if this is an IPv4 network
+        if type(outer_range) == IPNetwork:
+            prefixlen = outer_range.prefixlen
+            if outer_range.version == 4 and prefixlen not in (31, 32):
+                end = outer_range.last - 1
+            else:
+                end = outer_range.last
+        else:
+            end = outer_range.last
         candidate_start = start
-        # Note: by now, self.ranges is sorted from lowest
-        # to highest IP address.
-        for used_range in self.ranges:
+        # Note: self.ranges is sorted from lowest to highest IP address, so
+        # only the used ranges overlapping [start, end] need to be visited.
+        for used_range in self.ranges[
+            bisect_left(self._lasts, start) : bisect_right(self._firsts, end)
+        ]:
             candidate_end = used_range.first - 1
             # Check if there is a gap between the start of the current
             # candidate range, and the address just before the next used
@@ -577,21 +614,10 @@ class MAASIPSet(set):
                     make_iprange(candidate_start, candidate_end, purpose)
                 )
             candidate_start = used_range.last + 1
-        # Skip the broadcast address, if this is an IPv4 network
-        if type(outer_range) == IPNetwork:
-            prefixlen = outer_range.prefixlen
-            if outer_range.version == 4 and prefixlen not in (31, 32):
-                candidate_end = outer_range.last - 1
-            else:
-                candidate_end = outer_range.last
-        else:
-            candidate_end = outer_range.last
         # Check if there is a gap between the last used range and the end
         # of the range we're checking against.
-        if candidate_end - candidate_start >= 0:
-            unused_ranges.append(
-                make_iprange(candidate_start, candidate_end, purpose)
-            )
+        if end - candidate_start >= 0:
+            unused_ranges.append(make_iprange(candidate_start, end, purpose))
         return MAASIPSet(unused_ranges)
 
     def get_full_range(self, outer_range):
@@ -9,6 +9,7 @@ import itertools
 import random
 import socket
 from socket import EAI_BADFLAGS, EAI_NODATA, EAI_NONAME, gaierror, IPPROTO_TCP
+import time
 from typing import List
 from unittest import mock
 from unittest.mock import Mock
@@ -17,6 +18,7 @@ from netaddr import EUI, IPAddress, IPNetwork, IPRange
 import netifaces
 from netifaces import AF_INET, AF_INET6, AF_LINK
 from testtools import ExpectedException
+from testtools.content import text_content
 from testtools.matchers import (
     Contains,
     ContainsAll,
@@ -912,6 +914,139 @@ class TestMAASIPSet(MAASTestCase):
         self.assertThat(str(IPAddress(s1.first)), Equals("10.0.0.1"))
         self.assertThat(str(IPAddress(s1.last)), Equals("10.0.0.8"))
 
+    def test__find_returns_range_containing_address(self):
+        range1 = make_iprange("10.0.0.2", "10.0.0.10", purpose="foo")
+        range2 = make_iprange("10.0.0.11", "10.0.0.20", purpose="bar")
+        s = MAASIPSet([range2, range1])
+        self.assertThat(s.find("10.0.0.2"), Equals(range1))
+        self.assertThat(s.find(IPAddress("10.0.0.10")), Equals(range1))
+        self.assertThat(s.find(int(IPAddress("10.0.0.11"))), Equals(range2))
+        self.assertThat(s.find(IPRange("10.0.0.12", "10.0.0.20")), Is(range2))
+        self.assertThat(s.find(IPRange("10.0.0.10", "10.0.0.11")), Is(None))
+        self.assertThat(s.find("10.0.0.1"), Is(None))
+        self.assertThat(s.find("10.0.0.21"), Is(None))
+        self.assertThat(MAASIPSet([]).find("10.0.0.1"), Is(None))
+
+    def test__ior_matches_condensing_all_ranges(self):
+        def make_ranges(count):
+            ranges = []
+            for _ in range(count):
+                first = random.randint(0, 200)
+                ranges.append(
+                    make_iprange(
+                        "10.0.0.%d" % first,
+                        "10.0.0.%d" % random.randint(first, first + 5),
+                        purpose=random.choice(["foo", "bar"]),
+                    )
+                )
+            return ranges
+
+        for _ in range(50):
+            s1, s2 = MAASIPSet(make_ranges(20)), MAASIPSet(make_ranges(5))
+            expected = MAASIPSet(s1.ranges + s2.ranges)
+            s = s1
+            s |= s2
+            self.assertThat(
+                [(r.first, r.last, r.purpose) for r in s.ranges],
+                Equals(
+                    [(r.first, r.last, r.purpose) for r in expected.ranges]
+                ),
+            )
+            self.assertThat(set(s), Equals(set(expected)))
+            self.assertThat(s.find(s.last), Is(s.ranges[-1]))
+
+    def test__ior_accepts_iterable_of_ranges(self):
+        s = MAASIPSet([make_iprange("10.0.0.2")])
+        s |= {make_iprange("10.0.0.3")}
+        self.assertThat(s.ranges, HasLength(1))
+        self.assertThat(s, Contains("10.0.0.3"))
+
+    def test__calculates_unused_range_ignoring_ranges_outside(self):
+        s = MAASIPSet(["10.0.0.2", "10.0.0.4", "10.0.1.2", "10.0.1.4"])
+        u = s.get_unused_ranges("10.0.1.0/24")
+        self.assertThat(
+            [str(r) for r in u.ranges],
+            Equals(
+                [
+                    "10.0.1.1 purpose={'unused'}",
+                    "10.0.1.3 purpose={'unused'}",
+                    "10.0.1.5-10.0.1.254 num_addresses=250 "
+                    "purpose={'unused'}",
+                ]
+            ),
+        )
+
+
+class TestMAASIPSetLargeSubnets(MAASTestCase):
+    """Exercise `MAASIPSet` with subnets holding many allocations.
+
+    The time taken by each operation is recorded as a detail of the test, so
+    that it can be compared between implementations.
+    """
+
+    def time(self, name, func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        elapsed = time.monotonic() - started
+        self.addDetail(name, text_content("%.3fs" % elapsed))
+        return result
+
+    def make_addresses(self, network, count):
+        network = IPNetwork(network)
+        # Leave the network and broadcast addresses alone.
+        return set(
+            random.sample(range(network.first + 1, network.last), count)
+        )
+
+    def union_each(self, s, addresses):
+        for address in addresses:
+            s |= MAASIPSet([make_iprange(address, purpose="allocated")])
+        return s
+
+    def find_each(self, s, addresses):
+        return [s.find(address) for address in addresses]
+
+    def assertUsage(self, network, used, s):
+        network = IPNetwork(network)
+        unused = self.time("get_unused_ranges", s.get_unused_ranges, network)
+        # The network address, and the broadcast address for IPv4, are
+        # neither used nor unused.
+        excluded = 2 if network.version == 4 else 1
+        self.assertThat(
+            sum(r.num_addresses for r in s.ranges)
+            + sum(r.num_addresses for r in unused.ranges),
+            Equals(network.size - excluded),
+        )
+        found_unused = self.time("find unused", self.find_each, unused, used)
+        self.assertThat(set(found_unused), Equals({None}))
+        found_used = self.time("find used", self.find_each, s, used)
+        self.assertThat(
+            {frozenset(found.purpose) for found in found_used},
+            Equals({frozenset({"allocated"})}),
+        )
+
+    def test__ipv4_network_with_many_allocations(self):
+        network = "10.0.0.0/16"
+        used = sorted(self.make_addresses(network, 20000))
+        s = MAASIPSet(
+            make_iprange(address, purpose="allocated")
+            for address in used[:10000]
+        )
+        s = self.time("union", self.union_each, s, used[10000:])
+        self.assertThat(s, ContainsAll(used))
+        self.assertUsage(network, used, s)
+
+    def test__ipv6_network_with_many_allocations(self):
+        network = "2001:db8::/64"
+        used = sorted(self.make_addresses("2001:db8::/112", 20000))
+        s = MAASIPSet(
+            make_iprange(address, purpose="allocated")
+            for address in used[:10000]
+        )
+        s = self.time("union", self.union_each, s, used[10000:])
+        self.assertThat(s, ContainsAll(used))
+        self.assertUsage(network, used, s)
+
 
 class TestIPRangeStatistics(MAASTestCase):
     def test__statistics_are_accurate(self):